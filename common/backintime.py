@@ -19,6 +19,7 @@ import os
 import sys
 import gettext
 import argparse
+import json
 import atexit
 import subprocess
 from datetime import datetime
@@ -33,6 +34,10 @@ import mount
 import password
 import encfstools
 import cli
+import changejournal
+import changemanifest
+import runreport
+import smartremove
 from exceptions import MountException
 from applicationinstance import ApplicationInstance
 
@@ -259,6 +264,27 @@ def createParsers(app_name = 'backintime'):
                                                  nargs = '?',
                                                  help = 'File size used to for benchmark.')
 
+    command = 'changes'
+    description = 'Show which snapshots changed a file or folder.'
+    changesCP =            subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    changesCP.set_defaults(func = changes)
+    parsers[command] = changesCP
+    changesCP.add_argument                      ('--snapshot',
+                                                 metavar = 'SNAPSHOT_ID',
+                                                 type = str,
+                                                 action = 'store',
+                                                 help = 'Only show changes of SNAPSHOT_ID. This can be a snapshot ID or ' +\
+                                                 'an integer starting with 0 for the last snapshot, 1 for the overlast, ...')
+    changesCP.add_argument                      ('PATH',
+                                                 type = str,
+                                                 action = 'store',
+                                                 nargs = '?',
+                                                 default = '/',
+                                                 help = 'Show changes of PATH and everything inside PATH. Default is /')
+
     command = 'check-config'
     description = 'Check the profiles configuration and install crontab entries.'
     checkConfigCP =        subparsers.add_parser(command,
@@ -422,6 +448,14 @@ def createParsers(app_name = 'backintime'):
     smartRemoveCP.set_defaults(func = smartRemove)
     parsers[command] = smartRemoveCP
 
+    smartRemoveCP.add_argument                  ('--dry-run',
+                                                 action = 'store_true',
+                                                 help = 'Only show which snapshots would be removed.')
+
+    smartRemoveCP.add_argument                  ('--explain',
+                                                 action = 'store_true',
+                                                 help = 'Show why each snapshot will be kept or removed.')
+
     command = 'snapshots-list'
     nargs = 0
     aliases.append((command, nargs))
@@ -433,6 +467,10 @@ def createParsers(app_name = 'backintime'):
                                                  description = description)
     snapshotsListCP.set_defaults(func = snapshotsList)
     parsers[command] = snapshotsListCP
+    snapshotsListCP.add_argument                ('--details',
+                                                 action = 'store_true',
+                                                 help = 'Show number of new, modified, metadata-only changed and ' +\
+                                                 'deleted files and transferred size of each snapshot.')
 
     command = 'snapshots-list-path'
     nargs = 0
@@ -458,6 +496,24 @@ def createParsers(app_name = 'backintime'):
     snapshotsPathCP.set_defaults(func = snapshotsPath)
     parsers[command] = snapshotsPathCP
 
+    command = 'stats'
+    description = 'Show timing and transfer statistics of the last backup runs.'
+    statsCP =              subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    statsCP.set_defaults(func = stats)
+    parsers[command] = statsCP
+    statsCP.add_argument                        ('--last',
+                                                 metavar = 'N',
+                                                 type = int,
+                                                 action = 'store',
+                                                 default = 10,
+                                                 help = 'Show the last N runs. Default is 10')
+    statsCP.add_argument                        ('--json',
+                                                 action = 'store_true',
+                                                 help = 'Print the run reports as JSON lines.')
+
     command = 'unmount'
     nargs = 0
     aliases.append((command, nargs))
@@ -469,6 +525,21 @@ def createParsers(app_name = 'backintime'):
     unmountCP.set_defaults(func = unmount)
     parsers[command] = unmountCP
 
+    command = 'watch'
+    description = 'Control the watcher daemon which records changed files ' +\
+                  'of the profile so the next snapshot only needs to transfer those.'
+    watchCP =              subparsers.add_parser(command,
+                                                 epilog = epilogCommon,
+                                                 help = description,
+                                                 description = description)
+    watchCP.set_defaults(func = watch)
+    parsers[command] = watchCP
+    watchCP.add_argument                        ('ACTION',
+                                                 action = 'store',
+                                                 choices = ['start', 'stop', 'restart', 'status'],
+                                                 nargs = '?',
+                                                 help = 'Command to send to the watcher daemon.')
+
     #define aliases for all commands with trailing --
     group = parser.add_mutually_exclusive_group()
     for alias, nargs in aliases:
@@ -842,7 +913,12 @@ def snapshotsList(args):
     no_sids = True
     #use snapshots.listSnapshots instead of iterSnapshots because of sorting
     for sid in snapshots.listSnapshots(cfg, reverse = False):
-        print(msg.format(sid), file=force_stdout)
+        if args.details:
+            metrics = sid.transferMetrics()
+            details = runreport.formatTransfer(metrics) if metrics else 'no transfer metrics'
+            print(msg.format(sid) + '  ' + details, file=force_stdout)
+        else:
+            print(msg.format(sid), file=force_stdout)
         no_sids = False
     if no_sids:
         logger.error("There are no snapshots in '%s'" % cfg.profileName())
@@ -974,6 +1050,89 @@ def benchmarkCipher(args):
         logger.error("SSH is not configured for profile '%s'!" % cfg.profileName())
         sys.exit(RETURN_ERR)
 
+def changes(args):
+    """
+    Command for printing all changes of a file or folder from the change
+    manifests of all snapshots or of one snapshot.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0
+    """
+    force_stdout = setQuiet(args)
+    cfg = getConfig(args)
+    _mount(cfg)
+    path = os.fsencode(os.path.abspath(os.path.expanduser(args.PATH)))
+    sids = snapshots.listSnapshots(cfg)
+    if args.snapshot is not None:
+        sid = cli.selectSnapshot(sids, cfg, args.snapshot)
+        try:
+            with sid.changeManifest() as manifest:
+                for item, (flags, size) in manifest.subtree(path):
+                    print('{} {:>12} {}'.format(flags, size, os.fsdecode(item)), file = force_stdout)
+        except FileNotFoundError:
+            logger.error('Snapshot {} has no change manifest'.format(sid))
+    else:
+        with changemanifest.ChangeIndex(cfg) as index:
+            index.update(sids)
+            for item, entries in index.subtree(path):
+                for sid, flags, size in entries:
+                    print('{} {} {:>12} {}'.format(sid, flags, size, os.fsdecode(item)), file = force_stdout)
+    _umount(cfg)
+    sys.exit(RETURN_OK)
+
+def stats(args):
+    """
+    Command for printing the run reports of the last backups and the trend
+    of every phase.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0
+    """
+    force_stdout = setQuiet(args)
+    cfg = getConfig(args)
+    reports = runreport.history(cfg)
+    last = reports[-max(args.last, 1):]
+    if args.json:
+        for report in last:
+            print(json.dumps(report), file = force_stdout)
+        sys.exit(RETURN_OK)
+    if not reports:
+        print('No backup runs recorded for this profile.', file = force_stdout)
+        sys.exit(RETURN_OK)
+    print('{:<19} {:<20} {:<9} {:>9} {:>9} {:>12} {:>8}'.format(
+          'Start', 'Snapshot', 'Result', 'Wall', 'CPU', 'Literal', 'Speedup'),
+          file = force_stdout)
+    for report in last:
+        rsync = report.get('rsync', {})
+        print('{:<19} {:<20} {:<9} {:>8.1f}s {:>8.1f}s {:>12} {:>8}'.format(
+              report.get('start', ''),
+              report.get('snapshot') or '-',
+              report.get('result') or '-',
+              report.get('wall', 0),
+              report.get('cpu', 0),
+              rsync.get('literal_data', '-'),
+              rsync.get('speedup', '-')),
+              file = force_stdout)
+    print('', file = force_stdout)
+    print('{:<20} {:>10} {:>10} {:>8}'.format('Phase', 'Previous', 'Recent', 'Change'),
+          file = force_stdout)
+    for name, old, new, change in runreport.trends(reports):
+        print('{:<20} {:>10} {:>9.2f}s {:>8}'.format(
+              name,
+              '-' if old is None else '{:.2f}s'.format(old),
+              new,
+              '-' if change is None else '{:+.0f}%'.format(change)),
+              file = force_stdout)
+    sys.exit(RETURN_OK)
+
 def pwCache(args):
     """
     Command for starting password cache daemon.
@@ -1004,6 +1163,36 @@ def pwCache(args):
         daemon.run()
     sys.exit(ret)
 
+def watch(args):
+    """
+    Command for starting the change journal watcher daemon.
+
+    Args:
+        args (argparse.Namespace):
+                        previously parsed arguments
+
+    Raises:
+        SystemExit:     0 if daemon is running, 1 if not
+    """
+    force_stdout = setQuiet(args)
+    printHeader()
+    cfg = getConfig(args)
+    ret = RETURN_OK
+    daemon = changejournal.Watcher(cfg)
+    if args.ACTION and args.ACTION != 'status':
+        getattr(daemon, args.ACTION)()
+    elif args.ACTION == 'status':
+        print('%(app)s Watcher: ' % {'app': cfg.APP_NAME}, end=' ', file = force_stdout)
+        if daemon.status():
+            print(cli.bcolors.OKGREEN + 'running' + cli.bcolors.ENDC, file = force_stdout)
+            ret = RETURN_OK
+        else:
+            print(cli.bcolors.FAIL + 'not running' + cli.bcolors.ENDC, file = force_stdout)
+            ret = RETURN_ERR
+    else:
+        daemon.run()
+    sys.exit(ret)
+
 def decode(args):
     """
     Command for decoding paths given paths with 'encfsctl'.
@@ -1092,13 +1281,25 @@ def smartRemove(args):
     enabled, keep_all, keep_one_per_day, keep_one_per_week, keep_one_per_month = cfg.smartRemove()
     if enabled:
         _mount(cfg)
-        del_snapshots = sn.smartRemoveList(datetime.today(),
-                                           keep_all,
-                                           keep_one_per_day,
-                                           keep_one_per_week,
-                                           keep_one_per_month)
-        logger.info('Smart Remove will remove {} snapshots'.format(len(del_snapshots)))
-        sn.smartRemove(del_snapshots, log = logger.info)
+        planner = smartremove.SmartRemovePlanner(cfg,
+                                                 datetime.today(),
+                                                 keep_all,
+                                                 keep_one_per_day,
+                                                 keep_one_per_week,
+                                                 keep_one_per_month)
+        plan = planner.plan(snapshots.listSnapshots(cfg))
+        if args.explain:
+            for sid, keep, reasons in plan:
+                print('{:<20} {:<7} {}'.format(sid.sid,
+                                               'keep' if keep else 'remove',
+                                               ', '.join(reasons)))
+        del_snapshots = [sid for sid, keep, reasons in plan if not keep]
+        if args.dry_run:
+            logger.info('Smart Remove would remove {} snapshots: {}'.format(
+                        len(del_snapshots), ' '.join(sid.sid for sid in del_snapshots)))
+        else:
+            logger.info('Smart Remove will remove {} snapshots'.format(len(del_snapshots)))
+            sn.smartRemove(del_snapshots, log = logger.info)
         _umount(cfg)
         sys.exit(RETURN_OK)
     else:
@@ -0,0 +1,147 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Benchmark the snapshot engine on synthetic source trees with local targets.
+
+Usage: python3 benchmark/engine.py [--files N] [--huge N] [--depth N] [--snapshots N]
+                                   [--json FILE] [--compare BASELINE]
+
+Defaults are small enough for a quick check. Use e.g. ``--files 1000000
+--snapshots 30`` for a full size run. Save a baseline with ``--json`` and
+check for regressions with ``--compare``.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import datetime
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import config
+import logger
+import snapshots
+import harness
+import trees
+
+def setup(tmp, source):
+    """
+    Create a config with a local snapshot folder in ``tmp`` which includes
+    ``source``.
+    """
+    cfg = config.Config(os.path.join(tmp, 'config'), os.path.join(tmp, 'share'))
+    target = os.path.join(tmp, 'target')
+    os.makedirs(target)
+    if not cfg.setSnapshotsPath(target):
+        raise RuntimeError('Failed to set snapshots path {}'.format(target))
+    cfg.setInclude([(source, 0)])
+    cfg.setExclude([])
+    cfg.setSmartRemove(True, 1, 2, 1, 1)
+    cfg.save()
+    return cfg
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.strip().split('\n')[0])
+    parser.add_argument('--files', type = int, default = 10000,
+                        help = 'number of small files (default: %(default)s)')
+    parser.add_argument('--huge', type = int, default = 2,
+                        help = 'number of huge files (default: %(default)s)')
+    parser.add_argument('--huge-size', type = int, default = 256,
+                        help = 'size of huge files in MiB (default: %(default)s)')
+    parser.add_argument('--depth', type = int, default = 64,
+                        help = 'depth of the deep folder tree (default: %(default)s)')
+    parser.add_argument('--snapshots', type = int, default = 10,
+                        help = 'number of snapshots in the history (default: %(default)s)')
+    parser.add_argument('--change', type = float, default = 0.01,
+                        help = 'ratio of files changed between two snapshots (default: %(default)s)')
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--tmp', help = 'folder for source and snapshots (default: system temp)')
+    harness.addArguments(parser)
+    args = parser.parse_args()
+
+    logger.DEBUG = False
+    params = {'files':      args.files,
+              'huge':       args.huge,
+              'huge_size':  args.huge_size,
+              'depth':      args.depth,
+              'snapshots':  args.snapshots,
+              'change':     args.change}
+    results = harness.Results('engine', params)
+    with TemporaryDirectory(dir = args.tmp) as tmp:
+        source = os.path.join(tmp, 'source')
+        count = results.measure('generate',
+                                lambda: trees.smallFiles(source, args.files)
+                                        + trees.hugeFiles(source, args.huge, args.huge_size * 1024 * 1024)
+                                        + trees.deepTree(source, args.depth))
+        cfg = setup(tmp, source)
+        sn = snapshots.Snapshots(cfg)
+        include = cfg.include()
+
+        # hardlink heavy history with one snapshot every 6 hours
+        start = datetime.datetime(2022, 6, 1)
+        sids = []
+        runs = []
+        for i in range(args.snapshots):
+            now = start + datetime.timedelta(hours = 6 * i)
+            sid = snapshots.SID(now, cfg)
+            if i:
+                trees.modify(source, args.change, seed = i)
+            begin = time.perf_counter()
+            ok, error = sn.takeSnapshot(sid, now, include)
+            runs.append(time.perf_counter() - begin)
+            if not ok or error:
+                logger.error('Failed to take snapshot {}'.format(sid))
+                return 2
+            sids.append(sid)
+        results.add('takeSnapshot.full', runs[:1], files = count)
+        if len(runs) > 1:
+            results.add('takeSnapshot.incremental', runs[1:], snapshots = len(runs) - 1)
+        last = sids[-1]
+
+        results.measure('backupPermissions', lambda: sn.backupPermissions(last),
+                        repeat = args.repeat)
+        found = results.measure('listSnapshots', lambda: len(snapshots.listSnapshots(cfg)),
+                                repeat = args.repeat)
+        results.annotate('listSnapshots', snapshots = found)
+        entries = results.measure('fileInfo', lambda: len(last.fileInfo),
+                                  repeat = args.repeat)
+        results.annotate('fileInfo', entries = entries)
+
+        restoreTo = os.path.join(tmp, 'restore')
+        def cleanRestore():
+            shutil.rmtree(restoreTo, ignore_errors = True)
+            os.makedirs(restoreTo)
+        results.measure('restore',
+                        lambda: sn.restore(last, [source], restore_to = restoreTo, backup = False),
+                        repeat = args.repeat,
+                        setup = cleanRestore)
+
+        now = start + datetime.timedelta(hours = 6 * args.snapshots)
+        rules = cfg.smartRemove()[1:]
+        remove = results.measure('smartRemoveList', lambda: sn.smartRemoveList(now, *rules),
+                                 repeat = args.repeat)
+        results.annotate('smartRemoveList', remove = len(remove))
+        # freeSpace removes snapshots so it can only run once
+        results.measure('freeSpace', lambda: sn.freeSpace(now))
+        results.annotate('freeSpace', kept = len(snapshots.listSnapshots(cfg)))
+    return harness.finish(args, results)
+
+if __name__ == '__main__':
+    sys.exit(main())
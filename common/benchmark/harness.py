@@ -0,0 +1,234 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Shared helpers for benchmarks: time measurements, machine readable JSON
+results and comparing results with a baseline to catch regressions.
+
+Usage: python3 benchmark/harness.py BASELINE.json RESULT.json [--threshold PERCENT]
+"""
+
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+from collections import OrderedDict
+
+VERSION = 1
+#regressions smaller than this (in percent) are ignored
+THRESHOLD = 10.0
+#changes smaller than this (in seconds) are considered noise
+MIN_SECONDS = 0.01
+
+class Results(object):
+    """
+    Collect measurements of one benchmark run.
+
+    Args:
+        benchmark (str):    name of the benchmark
+        params (dict):      parameters of the run. Results are only
+                            comparable if their parameters are equal
+    """
+    def __init__(self, benchmark, params = None):
+        self.benchmark = benchmark
+        self.params = dict(params or {})
+        self.measurements = OrderedDict()
+
+    def measure(self, name, func, repeat = 1, setup = None, **info):
+        """
+        Run ``func`` ``repeat`` times and keep the best duration.
+
+        Args:
+            name (str):         name of the measurement
+            func (method):      called without arguments
+            repeat (int):       number of runs
+            setup (method):     called before every run, not measured
+            **info:             additional information stored with the
+                                measurement
+
+        Returns:
+            return value of the last call of ``func``
+        """
+        runs = []
+        result = None
+        for i in range(repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            result = func()
+            runs.append(time.perf_counter() - start)
+        self.add(name, runs, **info)
+        return result
+
+    def add(self, name, runs, **info):
+        """
+        Add durations which were measured somewhere else.
+
+        Args:
+            name (str):     name of the measurement
+            runs (list):    durations in seconds
+            **info:         additional information
+        """
+        self.measurements[name] = {'seconds':   min(runs),
+                                   'runs':      list(runs),
+                                   'info':      info}
+
+    def annotate(self, name, **info):
+        """
+        Add information to measurement ``name``, e.g. the size of a result.
+        """
+        self.measurements[name]['info'].update(info)
+
+    def print(self, out = sys.stdout):
+        """
+        Print the best duration of all measurements.
+        """
+        for name, measurement in self.measurements.items():
+            print('{:<28} {:>10.4f}s  {}'.format(
+                  name, measurement['seconds'],
+                  ', '.join('{} {}'.format(v, k) for k, v in sorted(measurement['info'].items()))),
+                  file = out)
+
+    def toDict(self):
+        return {'version':      VERSION,
+                'benchmark':    self.benchmark,
+                'date':         datetime.datetime.now().isoformat(timespec = 'seconds'),
+                'python':       platform.python_version(),
+                'platform':     platform.platform(),
+                'params':       self.params,
+                'results':      self.measurements}
+
+    def save(self, filename):
+        """
+        Write all measurements as JSON to ``filename`` ('-' for stdout).
+        """
+        data = json.dumps(self.toDict(), indent = 2)
+        if filename == '-':
+            print(data)
+            return
+        with open(filename, 'wt') as f:
+            f.write(data + '\n')
+
+def load(filename):
+    """
+    Read results written by :py:func:`Results.save`.
+
+    Returns:
+        dict:   results
+
+    Raises:
+        ValueError: if ``filename`` is not a benchmark result
+    """
+    with open(filename, 'rt') as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or data.get('version') != VERSION:
+        raise ValueError('{} is not a benchmark result version {}'.format(filename, VERSION))
+    return data
+
+def compare(baseline, current, threshold = THRESHOLD, minSeconds = MIN_SECONDS):
+    """
+    Compare all measurements which are in both results.
+
+    Args:
+        baseline (dict):    older results
+        current (dict):     new results
+        threshold (float):  slowdown in percent which is a regression
+        minSeconds (float): slowdowns smaller than this are never a
+                            regression
+
+    Returns:
+        list:               ``(name, old, new, change, regression)`` tuples
+                            with durations in seconds and change in percent
+    """
+    ret = []
+    old = baseline['results']
+    for name, measurement in current['results'].items():
+        if name not in old:
+            continue
+        before = old[name]['seconds']
+        after = measurement['seconds']
+        change = (after - before) / before * 100 if before else 0.0
+        regression = change > threshold and after - before >= minSeconds
+        ret.append((name, before, after, change, regression))
+    return ret
+
+def report(baseline, current, threshold = THRESHOLD, minSeconds = MIN_SECONDS, out = sys.stdout):
+    """
+    Print the comparison of ``baseline`` and ``current``.
+
+    Returns:
+        int:    number of regressions
+    """
+    if baseline.get('benchmark') != current.get('benchmark'):
+        print('WARNING: comparing different benchmarks {} and {}'.format(
+              baseline.get('benchmark'), current.get('benchmark')), file = out)
+    if baseline.get('params') != current.get('params'):
+        print('WARNING: benchmarks ran with different parameters', file = out)
+    regressions = 0
+    for name, before, after, change, regression in compare(baseline, current, threshold, minSeconds):
+        print('{:<28} {:>10.4f}s {:>10.4f}s {:>+8.1f}%{}'.format(
+              name, before, after, change, '  REGRESSION' if regression else ''),
+              file = out)
+        regressions += regression
+    return regressions
+
+def addArguments(parser):
+    """
+    Add common arguments ``--json``, ``--compare`` and ``--threshold`` to
+    ``parser``.
+    """
+    parser.add_argument('--json', metavar = 'FILE',
+                        help = "write results as JSON to FILE ('-' for stdout)")
+    parser.add_argument('--compare', metavar = 'BASELINE',
+                        help = 'compare results with an earlier JSON result')
+    parser.add_argument('--threshold', type = float, default = THRESHOLD,
+                        help = 'slowdown in percent which is reported as regression '
+                               '(default: %(default)s)')
+
+def finish(args, results):
+    """
+    Save ``results`` and compare them with the baseline as requested by
+    the arguments from :py:func:`addArguments`.
+
+    Returns:
+        int:    exit code. 1 if there were regressions
+    """
+    if args.json != '-':
+        results.print()
+    if args.json:
+        results.save(args.json)
+    if args.compare:
+        if report(load(args.compare), results.toDict(), args.threshold):
+            return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.strip().split('\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type = float, default = THRESHOLD,
+                        help = 'slowdown in percent which is reported as regression '
+                               '(default: %(default)s)')
+    args = parser.parse_args()
+    if report(load(args.baseline), load(args.current), args.threshold):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Benchmark Smart-Remove planning on synthetic snapshot histories.
+
+Usage: python3 benchmark/smartremove.py [--snapshots N] [--interval HOURS]
+                                        [--json FILE] [--compare BASELINE]
+"""
+
+import os
+import sys
+import random
+import argparse
+import datetime
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import config
+import logger
+import snapshots
+import smartremove
+import harness
+
+def history(cfg, count, interval, failedRatio, now):
+    """
+    Create ``count`` synthetic snapshots, one every ``interval`` hours back
+    from ``now``. Metadata is attached like it would come from the snapshot
+    catalog, so no snapshot folders are necessary.
+    """
+    rnd = random.Random(count)
+    sids = []
+    for i in range(count):
+        sid = snapshots.SID(now - datetime.timedelta(hours = i * interval), cfg)
+        sid.catalogEntry = {'name':        'named' if rnd.random() < 0.01 else '',
+                            'failed':      rnd.random() < failedRatio,
+                            'lastChecked': sid.date.timestamp()}
+        sids.append(sid)
+    return sids
+
+def legacy(sn, sids, now, keep_all, keep_one_per_day, keep_one_per_week, keep_one_per_month):
+    """
+    Smart-Remove as it was done before :py:class:`smartremove.SmartRemovePlanner`
+    with one scan of all snapshots per bucket.
+    """
+    now = now.date()
+    keep = set([sids[0]])
+    keep |= sn.smartRemoveKeepAll(sids,
+                                  now - datetime.timedelta(days = keep_all - 1),
+                                  now + datetime.timedelta(days = 1))
+    d = now
+    for i in range(keep_one_per_day):
+        keep |= sn.smartRemoveKeepFirst(sids, d, d + datetime.timedelta(days = 1), keep_healthy = True)
+        d -= datetime.timedelta(days = 1)
+    d = now - datetime.timedelta(days = now.weekday() + 1)
+    for i in range(keep_one_per_week):
+        keep |= sn.smartRemoveKeepFirst(sids, d, d + datetime.timedelta(days = 8), keep_healthy = True)
+        d -= datetime.timedelta(days = 7)
+    d1 = datetime.date(now.year, now.month, 1)
+    d2 = sn.incMonth(d1)
+    for i in range(keep_one_per_month):
+        keep |= sn.smartRemoveKeepFirst(sids, d1, d2, keep_healthy = True)
+        d2 = d1
+        d1 = sn.decMonth(d1)
+    for i in range(int(sids[-1].sid[:4]), now.year + 1):
+        keep |= sn.smartRemoveKeepFirst(sids, datetime.date(i, 1, 1), datetime.date(i + 1, 1, 1), keep_healthy = True)
+    return [sid for sid in sids if sid not in keep and not sid.name]
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.strip().split('\n')[0])
+    parser.add_argument('--snapshots', type = int, default = 10000)
+    parser.add_argument('--interval', type = float, default = 1,
+                        help = 'hours between two snapshots')
+    parser.add_argument('--failed', type = float, default = 0.05,
+                        help = 'ratio of failed snapshots')
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--skip-legacy', action = 'store_true')
+    harness.addArguments(parser)
+    args = parser.parse_args()
+
+    logger.DEBUG = False
+    results = harness.Results('smartremove',
+                              {'snapshots':     args.snapshots,
+                               'interval':      args.interval,
+                               'failed':        args.failed,
+                               'skip_legacy':   args.skip_legacy})
+    with TemporaryDirectory() as tmp:
+        cfg = config.Config(os.path.join(tmp, 'config'))
+        cfg.setDontRemoveNamedSnapshots(True)
+        sn = snapshots.Snapshots(cfg)
+        now = datetime.datetime(2022, 6, 15, 12, 17)
+        sids = history(cfg, args.snapshots, args.interval, args.failed, now)
+        rules = (7, 30, 52, 36)
+        planner = smartremove.SmartRemovePlanner(cfg, now, *rules)
+
+        planned = results.measure('planner', lambda: planner.removeList(sids), args.repeat,
+                                  snapshots = len(sids))
+        results.annotate('planner', remove = len(planned))
+        if not args.skip_legacy:
+            old = results.measure('legacy', lambda: legacy(sn, sids, now, *rules), args.repeat,
+                                  snapshots = len(sids))
+            results.annotate('legacy', remove = len(old))
+            if old != planned:
+                print('WARNING: planner and legacy implementation disagree')
+                return 1
+    return harness.finish(args, results)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Generate synthetic source trees for benchmarks.
+"""
+
+import os
+import random
+
+def _write(path, size, block):
+    with open(path, 'wb') as f:
+        while size > 0:
+            f.write(block[:size])
+            size -= len(block)
+
+def smallFiles(path, count, size = 64, perFolder = 1000):
+    """
+    Create ``count`` files with ``size`` bytes in folders of ``perFolder``
+    files below ``path``.
+
+    Returns:
+        int:    number of files
+    """
+    data = os.urandom(size)
+    for i in range(count):
+        folder = os.path.join(path, 'small', '{:06}'.format(i // perFolder))
+        if not i % perFolder:
+            os.makedirs(folder, exist_ok = True)
+        with open(os.path.join(folder, '{:08}'.format(i)), 'wb') as f:
+            f.write(data)
+    return count
+
+def hugeFiles(path, count, size):
+    """
+    Create ``count`` files with ``size`` bytes below ``path``.
+
+    Returns:
+        int:    number of files
+    """
+    folder = os.path.join(path, 'huge')
+    os.makedirs(folder, exist_ok = True)
+    block = os.urandom(1024 * 1024)
+    for i in range(count):
+        _write(os.path.join(folder, '{:04}'.format(i)), size, block)
+    return count
+
+def deepTree(path, depth, width = 2, branchLevels = 4, filesPerFolder = 1):
+    """
+    Create ``width ** branchLevels`` chains of folders which are ``depth``
+    levels deep below ``path``. Every folder gets ``filesPerFolder`` files.
+
+    Returns:
+        int:    number of files
+    """
+    count = 0
+    stack = [(os.path.join(path, 'deep'), 0)]
+    while stack:
+        folder, level = stack.pop()
+        os.makedirs(folder, exist_ok = True)
+        for i in range(filesPerFolder):
+            with open(os.path.join(folder, 'file{}'.format(i)), 'wb') as f:
+                f.write(b'x')
+            count += 1
+        if level < depth:
+            for i in range(width if level < branchLevels else 1):
+                stack.append((os.path.join(folder, 'd{}'.format(i)), level + 1))
+    return count
+
+def files(path):
+    """
+    All regular files below ``path`` sorted by name.
+    """
+    ret = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        ret.extend(os.path.join(root, name) for name in sorted(names))
+    return ret
+
+def modify(path, ratio, seed = 0):
+    """
+    Change the content of ``ratio`` of all files below ``path`` and add the
+    same number of new files. Used between snapshots to build a history
+    where most files are hardlinked.
+
+    Returns:
+        int:    number of changed files
+    """
+    rnd = random.Random(seed)
+    allFiles = files(path)
+    changed = rnd.sample(allFiles, int(len(allFiles) * ratio))
+    for filename in changed:
+        with open(filename, 'ab') as f:
+            f.write(b'+')
+    folder = os.path.join(path, 'new', '{:06}'.format(seed))
+    os.makedirs(folder, exist_ok = True)
+    for i in range(len(changed)):
+        with open(os.path.join(folder, '{:08}'.format(i)), 'wb') as f:
+            f.write(os.urandom(64))
+    return len(changed)
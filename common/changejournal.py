@@ -0,0 +1,549 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Record changed files between two snapshots so the next snapshot only needs
+to transfer those instead of letting rsync scan all included files.
+
+:py:class:`Watcher` is a daemon which uses inotify to watch all include
+folders of one profile and appends changed paths to the profiles journal.
+:py:func:`ChangeJournal.rotate` hands the collected paths over to
+:py:func:`snapshots.Snapshots.takeSnapshot`. The journal is only trusted if
+the same watcher session was running since the last successful snapshot and
+nothing got lost (inotify queue overflow, watch limit reached, journal too
+big). Otherwise a normal full snapshot is taken.
+
+Before the journal is rotated the watcher gets a ``SIGUSR1`` and has to
+write all changes it still holds in memory and acknowledge that. If it
+doesn't answer in time a full snapshot is taken.
+"""
+
+import os
+import sys
+import json
+import atexit
+import errno
+import fcntl
+import ctypes
+import ctypes.util
+import select
+import signal
+import struct
+import time
+
+import logger
+import tools
+from applicationinstance import ApplicationInstance
+
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_MOVE_SELF    = 0x00000800
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ONLYDIR      = 0x01000000
+IN_DONT_FOLLOW  = 0x02000000
+IN_EXCL_UNLINK  = 0x04000000
+IN_ISDIR        = 0x40000000
+IN_CLOEXEC      = 0o2000000
+IN_NONBLOCK     = 0o0004000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM        \
+             | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF        \
+             | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+
+_EVENT = struct.Struct('iIII')
+
+class Inotify(object):
+    """
+    Minimal wrapper around Linux inotify using ctypes.
+
+    Raises:
+        OSError:    if inotify is not available
+    """
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+        self.libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def addWatch(self, path, mask = WATCH_MASK):
+        """
+        Watch folder ``path``.
+
+        Args:
+            path (bytes):   full path to folder
+            mask (int):     inotify event mask
+
+        Returns:
+            int:            watch descriptor
+
+        Raises:
+            OSError:        if watch could not be added
+        """
+        wd = self.libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read(self, timeout = None, wakeup = None):
+        """
+        Wait up to ``timeout`` seconds for events.
+
+        Args:
+            timeout (float):    seconds to wait. Block if ``None``
+            wakeup (int):       optional file descriptor which will stop
+                                waiting as soon as it is readable. Used with
+                                :py:func:`signal.set_wakeup_fd`
+
+        Returns:
+            list:   list of tuple (wd, mask, cookie, name)
+        """
+        fds = [self.fd]
+        if wakeup is not None:
+            fds.append(wakeup)
+        try:
+            ready = select.select(fds, [], [], timeout)[0]
+        except InterruptedError:
+            return []
+        if wakeup in ready:
+            try:
+                while os.read(wakeup, 512):
+                    pass
+            except BlockingIOError:
+                pass
+        if self.fd not in ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(buf):
+            wd, mask, cookie, length = _EVENT.unpack_from(buf, pos)
+            pos += _EVENT.size
+            name = buf[pos:pos + length].rstrip(b'\0')
+            pos += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class ChangeJournal(object):
+    """
+    Journal of changed paths for one profile, stored in
+    '~/.local/share/backintime/changes<N>.journal'. Paths are separated by
+    ``\\0`` so they can be passed to ``rsync --from0 --files-from``.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID. Current profile if ``None``
+    """
+    OVERFLOW = b'//overflow'
+    MAX_SIZE = 64 * 1024 * 1024
+    FLUSH_TIMEOUT = 10
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        self.profileID = profile_id or cfg.currentProfile()
+        self.fileName = cfg.changeJournalFile(self.profileID)
+        self.pendingFile = self.fileName + '.pending'
+        self.sessionFile = self.fileName + '.session'
+        self.stateFile = self.fileName + '.state'
+        self.pidFile = self.fileName + '.pid'
+        self.ackFile = self.fileName + '.ack'
+        self.rotatedSession = None
+
+    def watcherPid(self):
+        """
+        Process ID of the running :py:class:`Watcher`.
+
+        Returns:
+            int:    PID or ``None`` if the watcher is not running
+        """
+        instance = ApplicationInstance(self.pidFile, autoExit = False)
+        if instance.check():
+            return None
+        return instance.pid
+
+    def session(self):
+        """
+        Session token of the currently running :py:class:`Watcher`.
+
+        Returns:
+            str:    token or ``None`` if the watcher is not running or has
+                    not finished watching all include folders yet
+        """
+        if self.watcherPid() is None:
+            return None
+        try:
+            with open(self.sessionFile, 'rt') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def setSession(self, token):
+        with open(self.sessionFile + '.tmp', 'wt') as f:
+            f.write(token)
+        os.replace(self.sessionFile + '.tmp', self.sessionFile)
+
+    def flushWatcher(self):
+        """
+        Make the running :py:class:`Watcher` write all changes it has seen
+        so far into the journal and wait until it acknowledged that.
+
+        Returns:
+            bool:   ``True`` if the watcher flushed its changes within
+                    :py:attr:`FLUSH_TIMEOUT` seconds
+        """
+        pid = self.watcherPid()
+        if pid is None:
+            return False
+        try:
+            os.remove(self.ackFile)
+        except FileNotFoundError:
+            pass
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except OSError as e:
+            logger.debug('Failed to signal watcher {}: {}'.format(pid, str(e)),
+                         self)
+            return False
+        deadline = time.monotonic() + self.FLUSH_TIMEOUT
+        while time.monotonic() < deadline:
+            if os.path.exists(self.ackFile):
+                return True
+            time.sleep(0.02)
+        logger.warning('Change journal watcher did not flush its changes '
+                       'within {} seconds'.format(self.FLUSH_TIMEOUT), self)
+        return False
+
+    def acknowledge(self):
+        """
+        Tell :py:func:`flushWatcher` that all changes are written. Used by
+        :py:class:`Watcher`.
+        """
+        with open(self.ackFile, 'wt') as f:
+            f.write(str(os.getpid()))
+
+    def loadState(self):
+        try:
+            with open(self.stateFile, 'rt') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def saveState(self, state):
+        try:
+            with open(self.stateFile + '.tmp', 'wt') as f:
+                json.dump(state, f)
+            os.replace(self.stateFile + '.tmp', self.stateFile)
+        except OSError as e:
+            logger.debug('Failed to write change journal state {}: {}'.format(
+                         self.stateFile, str(e)),
+                         self)
+
+    def append(self, paths, overflow = False):
+        """
+        Append ``paths`` to the journal. Used by :py:class:`Watcher`.
+
+        Args:
+            paths (iterable):   changed paths as :py:class:`bytes`
+            overflow (bool):    changes were lost and the journal
+                                can't be trusted
+        """
+        while True:
+            with open(self.fileName, 'ab') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # the journal might have been rotated while we were waiting
+                try:
+                    if os.fstat(f.fileno()).st_ino != os.stat(self.fileName).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue
+                if f.tell() > self.MAX_SIZE:
+                    overflow = True
+                    paths = ()
+                data = b''.join(path + b'\0' for path in paths)
+                if overflow:
+                    data += self.OVERFLOW + b'\0'
+                f.write(data)
+                return
+
+    def rotate(self, base, key):
+        """
+        Take over all changes recorded since the last snapshot. This must be
+        called before rsync starts. The previous state will be invalidated
+        until :py:func:`commit` is called after the snapshot succeeded.
+
+        Args:
+            base (str):     snapshot ID of the snapshot the next one will be
+                            based on
+            key (str):      fingerprint of the include/exclude settings
+
+        Returns:
+            list:           sorted list of changed paths as :py:class:`bytes`
+                            or ``None`` if a full snapshot is necessary
+        """
+        state = self.loadState()
+        self.saveState({})
+        self.rotatedSession = self.session()
+        if self.rotatedSession is not None and not self.flushWatcher():
+            self.rotatedSession = None
+        if self.rotatedSession is None:
+            try:
+                os.remove(self.fileName)
+            except FileNotFoundError:
+                pass
+            return None
+
+        data = b''
+        try:
+            with open(self.fileName, 'rb') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                os.replace(self.fileName, self.pendingFile)
+                data = f.read()
+        except FileNotFoundError:
+            pass
+
+        if state.get('session') != self.rotatedSession  \
+          or state.get('base') != base                  \
+          or state.get('key') != key:
+            logger.debug('Change journal is not valid for this snapshot', self)
+            return None
+        paths = set(data.split(b'\0'))
+        paths.discard(b'')
+        if self.OVERFLOW in paths:
+            logger.debug('Change journal overflowed', self)
+            return None
+        return sorted(paths)
+
+    def commit(self, base, key):
+        """
+        Mark the changes taken by :py:func:`rotate` as backed up in
+        snapshot ``base``.
+
+        Args:
+            base (str):     snapshot ID of the new (or unchanged last) snapshot
+            key (str):      fingerprint of the include/exclude settings
+        """
+        if self.rotatedSession is None:
+            return
+        self.saveState({'session': self.rotatedSession, 'base': base, 'key': key})
+        try:
+            os.remove(self.pendingFile)
+        except FileNotFoundError:
+            pass
+
+class Watcher(tools.Daemon):
+    """
+    Daemon which watches all include folders of one profile with inotify
+    and records changed paths in its :py:class:`ChangeJournal`.
+
+    Args:
+        cfg (config.Config):    current config
+    """
+    FLUSH_INTERVAL = 2
+
+    def __init__(self, cfg, *args, **kwargs):
+        self.config = cfg
+        self.journal = ChangeJournal(cfg)
+        super(Watcher, self).__init__(self.journal.pidFile, *args, **kwargs)
+        self.watches = {}
+        self.dirty = set()
+        self.overflow = False
+        self.watchLimit = False
+        self.flushRequested = False
+        self.skip = set()
+
+    def run(self):
+        """
+        Watch include folders until the daemon gets stopped.
+        """
+        if self.appInstance.check():
+            # running in foreground
+            atexit.register(self.appInstance.exitApplication)
+            self.appInstance.startApplication()
+        elif self.appInstance.pid != os.getpid():
+            logger.error('Watcher for profile {} is already running'.format(
+                         self.config.profileName()),
+                         self)
+            sys.exit(1)
+        signal.signal(signal.SIGTERM, self.cleanupHandler)
+        signal.signal(signal.SIGUSR1, self.flushHandler)
+        # wake up select() as soon as a signal arrives
+        wakeup, wakeupWrite = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        signal.set_wakeup_fd(wakeupWrite)
+        self.inotify = Inotify()
+        self.skip = {os.fsencode(i.rstrip('/')) for i in (
+                     self.config.snapshotsFullPath(),
+                     self.config._LOCAL_DATA_FOLDER,
+                     self.config._MOUNT_ROOT)}
+
+        for folder, folderType in self.config.include():
+            folder = os.fsencode(folder)
+            if folderType == 0:
+                self.addTree(folder)
+            else:
+                self.addWatch(os.path.dirname(folder))
+        # nothing changed before all folders are watched counts
+        self.dirty.clear()
+        self.journal.setSession('{}-{}'.format(os.getpid(), time.time_ns()))
+        logger.info('Watching {} folders'.format(len(self.watches)), self)
+
+        lastFlush = time.time()
+        while True:
+            for event in self.inotify.read(self.FLUSH_INTERVAL, wakeup):
+                self.handleEvent(*event)
+            if self.flushRequested:
+                self.flushRequested = False
+                self.sync()
+                lastFlush = time.time()
+            elif time.time() - lastFlush >= self.FLUSH_INTERVAL:
+                self.flush()
+                lastFlush = time.time()
+
+    def flush(self):
+        """
+        Write collected paths into the journal.
+
+        Returns:
+            bool:   ``True`` if successful
+        """
+        overflow = self.overflow or self.watchLimit
+        if not self.dirty and not overflow:
+            return True
+        try:
+            self.journal.append(sorted(self.dirty), overflow)
+        except OSError as e:
+            logger.error('Failed to write change journal: {}'.format(str(e)), self)
+            return False
+        self.dirty.clear()
+        self.overflow = False
+        return True
+
+    def sync(self):
+        """
+        Handle all events which are already queued, write them into the
+        journal and acknowledge that to :py:func:`ChangeJournal.flushWatcher`.
+        """
+        while True:
+            events = self.inotify.read(0)
+            if not events:
+                break
+            for event in events:
+                self.handleEvent(*event)
+        if not self.flush():
+            return
+        try:
+            self.journal.acknowledge()
+        except OSError as e:
+            logger.error('Failed to acknowledge change journal flush: {}'.format(
+                         str(e)),
+                         self)
+
+    def flushHandler(self, signum, frame):
+        self.flushRequested = True
+
+    def addWatch(self, path):
+        """
+        Watch a single folder.
+
+        Args:
+            path (bytes):   full path to folder
+
+        Returns:
+            bool:           ``True`` if successful
+        """
+        if path in self.skip:
+            return False
+        try:
+            wd = self.inotify.addWatch(path)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                if not self.watchLimit:
+                    logger.warning('inotify watch limit reached. Increase '
+                                   'fs.inotify.max_user_watches. Snapshots '
+                                   'will scan all files.', self)
+                self.watchLimit = True
+            elif e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                logger.debug('Failed to watch {}: {}'.format(path, str(e)), self)
+            return False
+        self.watches[wd] = path
+        return True
+
+    def addTree(self, path, record = False):
+        """
+        Watch ``path`` and all its subfolders.
+
+        Args:
+            path (bytes):   full path to folder
+            record (bool):  add all items inside ``path`` to the journal
+        """
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            if not self.addWatch(folder):
+                continue
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if record:
+                            self.dirty.add(entry.path)
+                        try:
+                            if entry.is_dir(follow_symlinks = False):
+                                stack.append(entry.path)
+                        except OSError:
+                            pass
+            except OSError:
+                pass
+
+    def handleEvent(self, wd, mask, cookie, name):
+        """
+        Record a single inotify event.
+        """
+        if mask & IN_Q_OVERFLOW:
+            logger.warning('inotify queue overflow', self)
+            self.overflow = True
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        folder = self.watches.get(wd)
+        if folder is None:
+            return
+        path = os.path.join(folder, name) if name else folder
+        self.dirty.add(path)
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            self.addTree(path, record = True)
+
+    def cleanupHandler(self, signum, frame):
+        try:
+            os.remove(self.journal.sessionFile)
+        except OSError:
+            pass
+        super(Watcher, self).cleanupHandler(signum, frame)
@@ -0,0 +1,686 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Indexed lists of changed files.
+
+Every snapshot gets a change manifest ('changes.idx') with path, rsync
+itemize flags and size of all files rsync transferred or deleted. The
+per-profile change index (:py:func:`config.Config.changeIndexFile`) maps each
+path to all snapshots which changed it.
+
+Both use the same layout as 'fileinfo.idx' (see :py:mod:`fileinfo`): zlib
+compressed blocks of path sorted records with shared prefix compression
+followed by a footer with some metadata and the first and last path of every
+block::
+
+    MAGIC
+    block 0 .. block N
+    footer (zlib compressed)
+    footer offset, footer length, MAGIC
+
+Single paths or whole subtrees can be looked up by decompressing only the
+affected blocks.
+"""
+
+import os
+import bisect
+import heapq
+import json
+import struct
+import zlib
+from collections import OrderedDict
+
+import logger
+import snapshots
+
+MAGIC = b'BITCM\x01'
+
+_RECORD = struct.Struct('<HHI')     # shared, suffix length, value length
+_BLOCK  = struct.Struct('<QII')     # offset, length, record count
+_TRAILER = struct.Struct('<QI')     # footer offset, footer length
+_CHANGE = struct.Struct('<11sQ')    # itemize flags, size
+_ENTRY  = struct.Struct('<I11sQ')   # snapshot number, itemize flags, size
+_LEN = struct.Struct('<I')
+
+class ChangeManifestFormatError(Exception):
+    pass
+
+def _packBytes(data):
+    return _LEN.pack(len(data)) + data
+
+def _unpackBytes(buf, pos):
+    length, = _LEN.unpack_from(buf, pos)
+    pos += _LEN.size
+    return buf[pos:pos + length], pos + length
+
+def _subtreeEnd(prefix):
+    """
+    Smallest path which is sorted behind all items inside ``prefix``.
+    """
+    return prefix.rstrip(b'/') + b'0'
+
+def _packChange(flags, size):
+    return _CHANGE.pack(flags.encode('ascii', 'replace'), size)
+
+def _unpackChange(value):
+    flags, size = _CHANGE.unpack(value)
+    return flags.decode('ascii'), size
+
+class _BlockWriter(object):
+    """
+    Write sorted (path, value) records into an indexed file.
+
+    Args:
+        filename (str):     file to write
+        meta (dict):        JSON serializable metadata stored in the footer
+        blockSize (int):    uncompressed size of one block in bytes
+    """
+    def __init__(self, filename, meta = None, blockSize = 64 * 1024):
+        self.blockSize = blockSize
+        self.meta = meta or {}
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.blocks = []
+        self.lastPath = None
+        self._resetBlock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def _resetBlock(self):
+        self.buf = []
+        self.bufSize = 0
+        self.count = 0
+        self.first = None
+        self.prev = b''
+
+    def write(self, path, value):
+        """
+        Add a record. Paths must be added in strictly ascending order.
+
+        Args:
+            path (bytes):   full path
+            value (bytes):  record data
+
+        Raises:
+            ValueError:     if ``path`` is not sorted behind the previous path
+        """
+        if self.lastPath is not None and path <= self.lastPath:
+            raise ValueError('{} is not sorted behind {}'.format(path, self.lastPath))
+        self.lastPath = path
+        if self.first is None:
+            self.first = path
+        prev = self.prev
+        shared = 0
+        maxShared = min(len(prev), len(path), 0xffff)
+        while shared < maxShared and prev[shared] == path[shared]:
+            shared += 1
+        suffix = path[shared:]
+        record = _RECORD.pack(shared, len(suffix), len(value)) + suffix + value
+        self.buf.append(record)
+        self.bufSize += len(record)
+        self.count += 1
+        self.prev = path
+        if self.bufSize >= self.blockSize:
+            self._flushBlock()
+
+    def _flushBlock(self):
+        if not self.count:
+            return
+        data = zlib.compress(b''.join(self.buf))
+        self.file.write(data)
+        self.blocks.append((self.offset, len(data), self.count, self.first, self.prev))
+        self.offset += len(data)
+        self._resetBlock()
+
+    def close(self):
+        """
+        Write remaining records and the index.
+        """
+        self._flushBlock()
+        footer = [_packBytes(json.dumps(self.meta).encode('utf-8')),
+                  _LEN.pack(len(self.blocks))]
+        for offset, length, count, first, last in self.blocks:
+            footer.append(_BLOCK.pack(offset, length, count))
+            footer.append(_packBytes(first))
+            footer.append(_packBytes(last))
+        data = zlib.compress(b''.join(footer))
+        self.file.write(data)
+        self.file.write(_TRAILER.pack(self.offset, len(data)) + MAGIC)
+        self.file.close()
+
+class _BlockReader(object):
+    """
+    Random access to records written by :py:class:`_BlockWriter`. Only the
+    index is loaded on open, blocks are decompressed on demand and a few of
+    them are kept in cache.
+
+    Args:
+        filename (str):     file to read or a seekable binary file object
+
+    Raises:
+        ChangeManifestFormatError:  if ``filename`` is not a valid file
+    """
+    CACHED_BLOCKS = 4
+
+    def __init__(self, filename):
+        if hasattr(filename, 'read'):
+            self.file = filename
+        else:
+            self.file = open(filename, 'rb')
+        try:
+            self._readIndex()
+        except (struct.error, zlib.error, ValueError, ChangeManifestFormatError) as e:
+            self.file.close()
+            raise ChangeManifestFormatError('{} is not a valid change manifest: {}'.format(
+                                            getattr(self.file, 'name', filename), str(e)))
+        self.cache = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _readIndex(self):
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ChangeManifestFormatError('wrong magic header')
+        trailerSize = _TRAILER.size + len(MAGIC)
+        self.file.seek(-trailerSize, 2)
+        trailer = self.file.read(trailerSize)
+        if trailer[_TRAILER.size:] != MAGIC:
+            raise ChangeManifestFormatError('wrong magic trailer')
+        offset, length = _TRAILER.unpack_from(trailer)
+        self.file.seek(offset)
+        buf = zlib.decompress(self.file.read(length))
+
+        meta, pos = _unpackBytes(buf, 0)
+        self.meta = json.loads(meta.decode('utf-8'))
+        count, = _LEN.unpack_from(buf, pos)
+        pos += _LEN.size
+        self.blocks = []
+        for i in range(count):
+            offset, length, records = _BLOCK.unpack_from(buf, pos)
+            pos += _BLOCK.size
+            first, pos = _unpackBytes(buf, pos)
+            last, pos = _unpackBytes(buf, pos)
+            self.blocks.append((offset, length, records, first, last))
+        self.firstPaths = [i[3] for i in self.blocks]
+
+    def __len__(self):
+        return sum(i[2] for i in self.blocks)
+
+    def _block(self, index):
+        """
+        Decompressed records of block number ``index``.
+
+        Returns:
+            list:   list of tuple (path, value)
+        """
+        try:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+        except KeyError:
+            pass
+        offset, length, count = self.blocks[index][:3]
+        self.file.seek(offset)
+        buf = zlib.decompress(self.file.read(length))
+        records = []
+        prev = b''
+        pos = 0
+        for i in range(count):
+            shared, suffixLen, valueLen = _RECORD.unpack_from(buf, pos)
+            pos += _RECORD.size
+            path = prev[:shared] + buf[pos:pos + suffixLen]
+            pos += suffixLen
+            records.append((path, buf[pos:pos + valueLen]))
+            pos += valueLen
+            prev = path
+        self.cache[index] = records
+        if len(self.cache) > self.CACHED_BLOCKS:
+            self.cache.popitem(last = False)
+        return records
+
+    def _candidates(self, start, end):
+        """
+        Number of all blocks which could contain paths in ``start <= path < end``.
+        """
+        first = max(bisect.bisect_right(self.firstPaths, start) - 1, 0)
+        last = bisect.bisect_left(self.firstPaths, end)
+        return range(first, last)
+
+    def getRaw(self, path):
+        for index in self._candidates(path, path + b'\0'):
+            for item, value in self._block(index):
+                if item == path:
+                    return value
+        return None
+
+    def itemsRaw(self):
+        for index in range(len(self.blocks)):
+            yield from self._block(index)
+
+    def subtreeRaw(self, prefix):
+        prefix = prefix.rstrip(b'/')
+        if not prefix:
+            yield from self.itemsRaw()
+            return
+        inside = prefix + b'/'
+        for index in self._candidates(prefix, _subtreeEnd(prefix)):
+            for item, value in self._block(index):
+                if item == prefix or item.startswith(inside):
+                    yield item, value
+
+class ChangeManifestReader(_BlockReader):
+    """
+    Changes of one snapshot stored in 'changes.idx'.
+
+    Args:
+        filename (str):     file to read or a seekable binary file object
+
+    Raises:
+        ChangeManifestFormatError:  if ``filename`` is not a valid manifest
+    """
+    def get(self, path, default = None):
+        """
+        Change of ``path``.
+
+        Args:
+            path (bytes):   full path
+            default:        value returned if ``path`` didn't change
+
+        Returns:
+            tuple:          (itemize flags, size)
+        """
+        value = self.getRaw(path)
+        if value is None:
+            return default
+        return _unpackChange(value)
+
+    def __contains__(self, path):
+        return self.getRaw(path) is not None
+
+    def items(self):
+        """
+        Iterate over all changes.
+
+        Yields:
+            tuple:  (path, (itemize flags, size))
+        """
+        for path, value in self.itemsRaw():
+            yield path, _unpackChange(value)
+
+    def subtree(self, prefix):
+        """
+        Iterate over changes of ``prefix`` and everything inside ``prefix``.
+
+        Args:
+            prefix (bytes): full path of a folder or file
+
+        Yields:
+            tuple:          (path, (itemize flags, size))
+        """
+        for path, value in self.subtreeRaw(prefix):
+            yield path, _unpackChange(value)
+
+class ChangeManifestWriter(object):
+    """
+    Collect changes reported by rsync while a snapshot is taken and write
+    them sorted into 'changes.idx' on :py:func:`close`. Changes are kept in
+    memory up to :py:data:`CHUNK` records, larger sets are spilled to sorted
+    temporary files next to ``filename`` and merged at the end. If
+    ``filename`` already exists (resumed snapshot) its changes are merged as
+    well. A path reported more than once keeps its latest change.
+
+    Args:
+        filename (str):     manifest file
+        decode (method):    called with a list of paths (str) and returns
+                            the decoded paths (e.g.
+                            :py:func:`encfstools.Decode.paths` for mode
+                            'ssh_encfs')
+        chunk (int):        number of changes kept in memory
+    """
+    CHUNK = 100000
+
+    def __init__(self, filename, decode = None, chunk = CHUNK):
+        self.filename = filename
+        self.decode = decode
+        self.chunk = chunk
+        self.pending = []
+        self.runs = []
+        self.count = 0
+
+    def add(self, path, flags, size):
+        """
+        Add a change.
+
+        Args:
+            path (str):     path relative to the snapshot's backup folder as
+                            printed by rsync. A trailing slash is removed.
+            flags (str):    rsync itemize flags (``%i``)
+            size (int):     file size
+        """
+        self.pending.append((path, flags, size))
+        if len(self.pending) >= self.chunk:
+            self._spill()
+
+    def _sorted(self):
+        """
+        Decode and sort pending changes. Sort is stable so the latest change
+        of a path comes last.
+        """
+        pending, self.pending = self.pending, []
+        paths = [i[0].rstrip('/') for i in pending]
+        if self.decode is not None:
+            paths = self.decode(paths)
+        records = []
+        for path, (_, flags, size) in zip(paths, pending):
+            if not path.startswith('/'):
+                path = '/' + path
+            records.append((os.fsencode(path), self.count, flags, size))
+            self.count += 1
+        records.sort(key = lambda i: i[0])
+        return records
+
+    def _spill(self):
+        if not self.pending:
+            return
+        run = '{}.run{}'.format(self.filename, len(self.runs))
+        with open(run, 'wb') as f:
+            for path, count, flags, size in self._sorted():
+                f.write(_packBytes(path) + _LEN.pack(count) + _packChange(flags, size))
+        self.runs.append(run)
+
+    def _readRun(self, run):
+        with open(run, 'rb') as f:
+            while True:
+                data = f.read(_LEN.size)
+                if not data:
+                    break
+                path = f.read(_LEN.unpack(data)[0])
+                count, = _LEN.unpack(f.read(_LEN.size))
+                yield (path, count) + _unpackChange(f.read(_CHANGE.size))
+
+    def _previous(self):
+        """
+        Changes of the existing manifest of a resumed snapshot.
+        """
+        try:
+            reader = ChangeManifestReader(self.filename)
+        except FileNotFoundError:
+            return
+        except ChangeManifestFormatError as e:
+            logger.warning('Ignore invalid change manifest: {}'.format(str(e)), self)
+            return
+        with reader:
+            for path, (flags, size) in reader.items():
+                # sort in front of all new changes
+                yield path, -1, flags, size
+
+    def close(self):
+        """
+        Merge all changes and write the manifest.
+
+        Returns:
+            int:    number of changed paths in the manifest
+        """
+        iterables = [self._previous(), self._sorted()]
+        iterables.extend(self._readRun(run) for run in self.runs)
+        tmp = self.filename + '.tmp'
+        count = 0
+        try:
+            with _BlockWriter(tmp, {'version': 1}) as writer:
+                last = None
+                for record in heapq.merge(*iterables, key = lambda i: i[:2]):
+                    if last is not None and record[0] != last[0]:
+                        writer.write(last[0], _packChange(*last[2:]))
+                        count += 1
+                    last = record
+                if last is not None:
+                    writer.write(last[0], _packChange(*last[2:]))
+                    count += 1
+            os.replace(tmp, self.filename)
+        finally:
+            for run in self.runs:
+                try:
+                    os.remove(run)
+                except OSError:
+                    pass
+            self.runs = []
+        return count
+
+class ChangeIndex(object):
+    """
+    Cross-snapshot index of changes for the current profile. It maps every
+    path to the snapshots which changed it and is built from the change
+    manifests of all snapshots. Snapshots taken before change manifests were
+    introduced are not covered.
+
+    Args:
+        cfg (config.Config):    current config
+        filename (str):         index file. Default is
+                                :py:func:`config.Config.changeIndexFile`
+    """
+    VERSION = 1
+
+    def __init__(self, cfg, filename = None):
+        self.config = cfg
+        if filename is None:
+            filename = cfg.changeIndexFile()
+        self.filename = filename
+        self.reader = None
+        self.snapshots = []
+        self.covered = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def _open(self):
+        self.close()
+        try:
+            reader = _BlockReader(self.filename)
+        except FileNotFoundError:
+            self.snapshots, self.covered = [], []
+            return
+        except ChangeManifestFormatError as e:
+            logger.warning('Ignore invalid change index: {}'.format(str(e)), self)
+            self.snapshots, self.covered = [], []
+            return
+        meta = reader.meta
+        if meta.get('version') != self.VERSION:
+            reader.close()
+            self.snapshots, self.covered = [], []
+            return
+        self.reader = reader
+        self.snapshots = meta['snapshots']
+        self.covered = meta['covered']
+
+    def update(self, sids):
+        """
+        Add changes of new snapshots and drop removed snapshots. The index is
+        only rewritten if snapshots were added or removed.
+
+        Args:
+            sids (list):    all current :py:class:`snapshots.SID`. Root
+                            and new snapshot are ignored
+
+        Returns:
+            bool:           ``True`` if the index was rewritten
+        """
+        self._open()
+        current = {sid.sid: sid for sid in sids
+                   if not isinstance(sid, snapshots.GenericNonSnapshot)}
+        known = set(self.snapshots)
+        new = sorted(i for i in current if i not in known)
+        if not new and known <= set(current):
+            return False
+
+        ids = sorted(current)
+        number = {sid: i for i, sid in enumerate(ids)}
+        covered = [False] * len(ids)
+        for sid, cov in zip(self.snapshots, self.covered):
+            if sid in number:
+                covered[number[sid]] = cov
+
+        iterables = []
+        if self.reader is not None:
+            iterables.append(self._remapped(number))
+        readers = []
+        for sid in new:
+            try:
+                reader = current[sid].changeManifest()
+            except FileNotFoundError:
+                continue
+            except (OSError, ChangeManifestFormatError) as e:
+                logger.warning('Failed to read change manifest of {}: {}'.format(sid, str(e)), self)
+                continue
+            readers.append(reader)
+            covered[number[sid]] = True
+            iterables.append(self._entries(reader, number[sid]))
+
+        logger.debug('Update change index with {} new snapshots'.format(len(readers)), self)
+        tmp = self.filename + '.tmp'
+        meta = {'version':   self.VERSION,
+                'snapshots': ids,
+                'covered':   covered}
+        try:
+            with _BlockWriter(tmp, meta) as writer:
+                path, entries = None, []
+                for item, entry in heapq.merge(*iterables, key = lambda i: i[0]):
+                    if item != path:
+                        if entries:
+                            writer.write(path, self._join(entries))
+                        path, entries = item, []
+                    entries.append(entry)
+                if entries:
+                    writer.write(path, self._join(entries))
+        finally:
+            for reader in readers:
+                reader.close()
+            self.close()
+        os.replace(tmp, self.filename)
+        self._open()
+        return True
+
+    def _remapped(self, number):
+        """
+        Entries of the current index with snapshot numbers of the new index.
+        Entries of removed snapshots are dropped.
+        """
+        for path, value in self.reader.itemsRaw():
+            for pos in range(0, len(value), _ENTRY.size):
+                i, flags, size = _ENTRY.unpack_from(value, pos)
+                new = number.get(self.snapshots[i])
+                if new is not None:
+                    yield path, _ENTRY.pack(new, flags, size)
+
+    def _join(self, entries):
+        entries.sort(key = lambda i: _ENTRY.unpack(i)[0])
+        return b''.join(entries)
+
+    def _entries(self, reader, i):
+        for path, value in reader.itemsRaw():
+            yield (path, _ENTRY.pack(i, *_CHANGE.unpack(value)))
+
+    def _unpack(self, value):
+        for pos in range(0, len(value), _ENTRY.size):
+            i, flags, size = _ENTRY.unpack_from(value, pos)
+            yield self.snapshots[i], flags.decode('ascii'), size
+
+    def _ensureOpen(self):
+        if self.reader is None and not self.snapshots:
+            self._open()
+
+    def coveredSnapshots(self):
+        """
+        Snapshots whose changes are in the index.
+
+        Returns:
+            set:    snapshot IDs (str)
+        """
+        self._ensureOpen()
+        return {sid for sid, cov in zip(self.snapshots, self.covered) if cov}
+
+    def history(self, path):
+        """
+        All changes of ``path``.
+
+        Args:
+            path (bytes):   full path
+
+        Returns:
+            list:           list of tuple (snapshot ID, itemize flags, size)
+                            sorted from oldest to newest snapshot
+        """
+        self._ensureOpen()
+        if self.reader is None:
+            return []
+        value = self.reader.getRaw(path.rstrip(b'/') or b'/')
+        if value is None:
+            return []
+        return list(self._unpack(value))
+
+    def subtree(self, prefix):
+        """
+        Changes of ``prefix`` and everything inside ``prefix``.
+
+        Args:
+            prefix (bytes): full path of a folder or file
+
+        Yields:
+            tuple:          (path, list of tuple (snapshot ID, itemize
+                            flags, size))
+        """
+        self._ensureOpen()
+        if self.reader is None:
+            return
+        for path, value in self.reader.subtreeRaw(prefix):
+            yield path, list(self._unpack(value))
+
+    def changedSnapshots(self, prefix):
+        """
+        Snapshots which changed ``prefix`` or anything inside ``prefix``.
+
+        Args:
+            prefix (bytes): full path of a folder or file
+
+        Returns:
+            set:            snapshot IDs (str)
+        """
+        ret = set()
+        for path, entries in self.subtree(prefix):
+            ret.update(i[0] for i in entries)
+        return ret
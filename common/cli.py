@@ -52,7 +52,7 @@ def remove(cfg, snapshot_ids = None, force = None):
             return
 
     s = snapshots.Snapshots(cfg)
-    [s.remove(sid) for sid in sids]
+    s.removeMany(sids)
 
 def checkConfig(cfg, crontab = True):
     import mount
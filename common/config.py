@@ -278,6 +278,11 @@ class Config(configfile.ConfigFileWithProfiles):
         self.xWindowId = None
         self.inhibitCookie = None
         self.setupUdev = tools.SetupUdev()
+        # ssh master connections started by sshtools.SSH
+        # (user, host, port, private key) -> ControlPath
+        self.sshControlPaths = {}
+        # remotehelper.RemoteHelper instances for 'ssh' profiles
+        self.remoteHelpers = {}
 
     def save(self):
         self.setIntValue('config.version', self.CONFIG_VERSION)
@@ -584,6 +589,30 @@ class Config(configfile.ConfigFileWithProfiles):
         args += ['-o', 'IdentityFile={}'.format(self.sshPrivateKeyFile(profile_id))]
         return args
 
+    def sshControlArgs(self, profile_id = None):
+        """
+        Arguments to reuse the ssh master connection started by
+        :py:class:`sshtools.SSH` for the remote host of this profile. If the
+        master isn't running (anymore) ``ssh`` will silently open a new
+        connection.
+
+        Args:
+            profile_id (str):   profile ID that should  be used in config
+
+        Returns:
+            list:               arguments for ssh or an empty list if there
+                                is no master connection for this host
+        """
+        key = (self.sshUser(profile_id),
+               self.sshHost(profile_id),
+               str(self.sshPort(profile_id)),
+               self.sshPrivateKeyFile(profile_id))
+        path = self.sshControlPaths.get(key)
+        if path is None:
+            return []
+        return ['-o', 'ControlMaster=no',
+                '-o', 'ControlPath={}'.format(path)]
+
     def sshCommand(self,
                    cmd = None,
                    custom_args = None,
@@ -594,6 +623,7 @@ class Config(configfile.ConfigFileWithProfiles):
                    nice = True,
                    quote = False,
                    prefix = True,
+                   control = True,
                    profile_id = None):
         """
         Return SSH command with all arguments.
@@ -608,6 +638,8 @@ class Config(configfile.ConfigFileWithProfiles):
             nice (bool):        use nice if configured
             quote (bool):       quote remote command
             prefix (bool):      use prefix from config before remote command
+            control (bool):     reuse the ssh master connection for the
+                                host from config
             profile_id (str):   profile ID that should  be used in config
 
         Returns:
@@ -617,6 +649,9 @@ class Config(configfile.ConfigFileWithProfiles):
         assert custom_args is None or isinstance(custom_args, list), "custom_args '{}' is not list instance".format(custom_args)
         ssh  = ['ssh']
         ssh += self.sshDefaultArgs(profile_id)
+        # shared master connection
+        if control:
+            ssh += self.sshControlArgs(profile_id)
         # remote port
         if port:
             ssh += ['-p', str(self.sshPort(profile_id))]
@@ -1108,6 +1143,31 @@ class Config(configfile.ConfigFileWithProfiles):
         self.setProfileBoolValue('snapshots.bwlimit.enabled', enabled, profile_id)
         self.setProfileIntValue('snapshots.bwlimit.value', value, profile_id)
 
+    def rsyncWorkers(self, profile_id = None):
+        #?Number of rsync processes which run in parallel while taking a
+        #?snapshot. Include folders (or their top-level subfolders if there are
+        #?less include folders than workers) will be split across all workers.
+        #?1 will use a single rsync process.;1-99
+        return self.profileIntValue('snapshots.rsync_workers', 1, profile_id)
+
+    def setRsyncWorkers(self, value, profile_id = None):
+        self.setProfileIntValue('snapshots.rsync_workers', value, profile_id)
+
+    def dedupEnabled(self, profile_id = None):
+        #?Replace files which were transferred into a new snapshot but are
+        #?identical to a file in an older snapshot (e.g. renamed or moved
+        #?files) with hardlinks. Only for mode Local.
+        return self.profileBoolValue('snapshots.dedup.enabled', False, profile_id)
+
+    def dedupTimeBudget(self, profile_id = None):
+        #?Maximum minutes spent on deduplication after a snapshot. This is
+        #?further limited to half of the schedule interval.;0-99999
+        return self.profileIntValue('snapshots.dedup.time_budget', 10, profile_id)
+
+    def setDedup(self, enabled, budget, profile_id = None):
+        self.setProfileBoolValue('snapshots.dedup.enabled', enabled, profile_id)
+        self.setProfileIntValue('snapshots.dedup.time_budget', budget, profile_id)
+
     def noSnapshotOnBattery(self, profile_id = None):
         #?Don't take snapshots if the Computer runs on battery.
         return self.profileBoolValue('snapshots.no_on_battery', False, profile_id)
@@ -1251,12 +1311,36 @@ class Config(configfile.ConfigFileWithProfiles):
     def takeSnapshotMessageFile(self, profile_id = None):
         return os.path.join(self._LOCAL_DATA_FOLDER, "worker%s.message" % self.fileId(profile_id))
 
+    def takeSnapshotMessageSocket(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "worker%s.message.sock" % self.fileId(profile_id))
+
     def takeSnapshotProgressFile(self, profile_id = None):
         return os.path.join(self._LOCAL_DATA_FOLDER, "worker%s.progress" % self.fileId(profile_id))
 
     def takeSnapshotInstanceFile(self, profile_id = None):
         return os.path.join(self._LOCAL_DATA_FOLDER, "worker%s.lock" % self.fileId(profile_id))
 
+    def snapshotCatalogFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "snapshots%s.catalog" % self.fileId(profile_id))
+
+    def changeJournalFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "changes%s.journal" % self.fileId(profile_id))
+
+    def changeIndexFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "changes%s.index" % self.fileId(profile_id))
+
+    def digestCacheFile(self):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "digests.cache")
+
+    def runReportHistoryFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "runreport%s.history" % self.fileId(profile_id))
+
+    def dedupIndexFile(self, profile_id = None):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "dedup%s.db" % self.fileId(profile_id))
+
+    def encfsPathCacheFile(self, fingerprint):
+        return os.path.join(self._LOCAL_DATA_FOLDER, "encfs_%s.cache" % fingerprint)
+
     def takeSnapshotUserCallback(self):
         return os.path.join(self._LOCAL_CONFIG_FOLDER, "user-callback")
 
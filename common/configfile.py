@@ -18,21 +18,127 @@
 import os
 import collections
 import re
+from types import MappingProxyType
 
 import gettext
 import logger
 
 _=gettext.gettext
 
+#marker for options which are not set or can't be converted
+_MISSING = object()
+_EMPTY_VIEW = MappingProxyType({})
+
+def _toInt(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return _MISSING
+
+def _toBool(value):
+    if value is _MISSING:
+        return _MISSING
+    try:
+        return "1" == value or "TRUE" == value.upper()
+    except AttributeError:
+        return _MISSING
+
+class _ConfigDict(dict):
+    """
+    dict which calls ``changed`` after every modification. Used by
+    :py:class:`ConfigFile` to drop cached values, even if options are
+    changed directly in ``ConfigFile.dict``.
+    """
+    __slots__ = ('changed',)
+
+    def __init__(self, changed, *args, **kwargs):
+        super(_ConfigDict, self).__init__(*args, **kwargs)
+        self.changed = changed
+
+    def __setitem__(self, key, value):
+        super(_ConfigDict, self).__setitem__(key, value)
+        self.changed()
+
+    def __delitem__(self, key):
+        super(_ConfigDict, self).__delitem__(key)
+        self.changed()
+
+    def clear(self):
+        super(_ConfigDict, self).clear()
+        self.changed()
+
+    def pop(self, *args):
+        ret = super(_ConfigDict, self).pop(*args)
+        self.changed()
+        return ret
+
+    def popitem(self):
+        ret = super(_ConfigDict, self).popitem()
+        self.changed()
+        return ret
+
+    def setdefault(self, key, default = None):
+        ret = super(_ConfigDict, self).setdefault(key, default)
+        self.changed()
+        return ret
+
+    def update(self, *args, **kwargs):
+        super(_ConfigDict, self).update(*args, **kwargs)
+        self.changed()
+
 class ConfigFile(object):
     """
     Store options in a plain text file in form of: key=value
+
+    Converted int, bool and list values are cached until any option changes.
     """
     def __init__(self):
+        self._cache = {}
         self.dict = {}
         self.errorHandler = None
         self.questionHandler = None
 
+    @property
+    def dict(self):
+        """
+        All options as raw strings.
+        """
+        return self._dict
+
+    @dict.setter
+    def dict(self, value):
+        self._dict = _ConfigDict(self.clearCache, value)
+        self.clearCache()
+
+    def clearCache(self):
+        """
+        Drop all cached values. This is called automatically whenever an
+        option changes.
+        """
+        self._cache.clear()
+
+    def _cachedValue(self, cacheKey, compute, default):
+        """
+        Return the result of ``compute`` which is cached as ``cacheKey``.
+
+        Args:
+            cacheKey (tuple):   key for the cache
+            compute (method):   called without arguments if ``cacheKey`` is
+                                not cached yet. Return ``_MISSING`` if the
+                                value is not set or invalid
+            default:            return this if the value is ``_MISSING``
+
+        Returns:
+            cached value or ``default``
+        """
+        try:
+            value = self._cache[cacheKey]
+        except KeyError:
+            value = self._cache[cacheKey] = compute()
+        if value is _MISSING:
+            return default
+        return value
+
     def setErrorHandler(self, handler):
         """
         Register a function that should be called for notifying errors.
@@ -221,10 +327,9 @@ class ConfigFile(object):
             int:                    value of ``key`` or ``default``
                                     if ``key`` is not set.
         """
-        try:
-            return int(self.dict[key])
-        except:
-            return default
+        return self._cachedValue(('int', key),
+                                 lambda: _toInt(self.dict.get(key, _MISSING)),
+                                 default)
 
     def setIntValue(self, key, value):
         """
@@ -248,13 +353,9 @@ class ConfigFile(object):
             bool:                   value of 'key' or 'default'
                                     if 'key' is not set.
         """
-        try:
-            val = self.dict[key]
-            if "1" == val or "TRUE" == val.upper():
-                return True
-            return False
-        except:
-            return default
+        return self._cachedValue(('bool', key),
+                                 lambda: _toBool(self.dict.get(key, _MISSING)),
+                                 default)
 
     def setBoolValue(self, key, value):
         """
@@ -293,6 +394,20 @@ class ConfigFile(object):
             ('str:value', 'int:type') => return tuple of values
 
         """
+        value = self._cachedValue(('list', key, type_key),
+                                  lambda: self._listValue(key, type_key),
+                                  _MISSING)
+        if value is _MISSING:
+            return default
+        return list(value)
+
+    def _listValue(self, key, type_key):
+        """
+        Uncached version of :py:func:`listValue`.
+
+        Returns:
+            tuple:  all values or ``_MISSING`` if the list is not set
+        """
         def typeKeySplit(tk):
             t, k = '', ''
             if isinstance(tk, str):
@@ -308,7 +423,7 @@ class ConfigFile(object):
 
         size = self.intValue('%s.size' %key, -1)
         if size < 0:
-            return default
+            return _MISSING
 
         ret = []
         for i in range(1, size + 1):
@@ -325,7 +440,7 @@ class ConfigFile(object):
                 ret.append(tuple(items))
             else:
                 raise TypeError('Invalid type_key: %s' %type_key)
-        return ret
+        return tuple(ret)
 
     def setListValue(self, key, type_key, value):
         """
@@ -721,11 +836,40 @@ class ConfigFileWithProfiles(ConfigFile):
         Returns:
             str:                    key with prefix 'profile1.key'
         """
+        return 'profile' + self._profileId(profile_id) + '.' + key
+
+    def _profileId(self, profile_id):
         if isinstance(profile_id, int):
-            profile_id = str(profile_id)
+            return str(profile_id)
         if profile_id is None:
-            profile_id = self.current_profile_id
-        return 'profile' + profile_id + '.' + key
+            return self.current_profile_id
+        return profile_id
+
+    def profileView(self, profile_id = None):
+        """
+        Immutable view on all options of one profile with keys without the
+        'profile<N>.' prefix. Views of all profiles are built in a single
+        pass over all options and cached until any option changes.
+
+        Args:
+            profile_id (str, int):  valid profile ID
+
+        Returns:
+            types.MappingProxyType: options of the profile
+        """
+        try:
+            views = self._cache['profiles']
+        except KeyError:
+            options = {}
+            for key, value in self.dict.items():
+                if not key.startswith('profile'):
+                    continue
+                pid, sep, name = key[7:].partition('.')
+                if sep and pid.isdigit():
+                    options.setdefault(pid, {})[name] = value
+            views = {pid: MappingProxyType(view) for pid, view in options.items()}
+            self._cache['profiles'] = views
+        return views.get(self._profileId(profile_id), _EMPTY_VIEW)
 
     def removeProfileKey(self, key, profile_id = None):
         """
@@ -771,22 +915,28 @@ class ConfigFileWithProfiles(ConfigFile):
         Returns:
             bool:                   ``True`` if ``key`` is set.
         """
-        return self.profileKey(key, profile_id) in self.dict
+        return key in self.profileView(profile_id)
 
     def profileStrValue(self, key, default = '', profile_id = None):
-        return self.strValue(self.profileKey(key, profile_id), default)
+        return self.profileView(profile_id).get(key, default)
 
     def setProfileStrValue(self, key, value, profile_id = None):
         self.setStrValue(self.profileKey(key, profile_id), value)
 
     def profileIntValue(self, key, default = 0, profile_id = None):
-        return self.intValue(self.profileKey(key, profile_id), default)
+        profile_id = self._profileId(profile_id)
+        return self._cachedValue(('int', profile_id, key),
+                                 lambda: _toInt(self.profileView(profile_id).get(key, _MISSING)),
+                                 default)
 
     def setProfileIntValue(self, key, value, profile_id = None):
         self.setIntValue(self.profileKey(key, profile_id), value)
 
     def profileBoolValue(self, key, default = False, profile_id = None):
-        return self.boolValue(self.profileKey(key, profile_id), default)
+        profile_id = self._profileId(profile_id)
+        return self._cachedValue(('bool', profile_id, key),
+                                 lambda: _toBool(self.profileView(profile_id).get(key, _MISSING)),
+                                 default)
 
     def setProfileBoolValue(self, key, value, profile_id = None):
         self.setBoolValue(self.profileKey(key, profile_id), value)
@@ -0,0 +1,487 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import json
+import stat
+import time
+import sqlite3
+
+import logger
+import tools
+import snapshots
+import changemanifest
+import freespace
+
+
+def scheduleInterval(cfg, profile_id = None):
+    """
+    Seconds between two scheduled snapshots.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID
+
+    Returns:
+        int:                    interval or ``None`` if snapshots are not
+                                taken periodically
+    """
+    hour = 3600
+    day = 24 * hour
+    units = {cfg.HOUR:  hour,
+             cfg.DAY:   day,
+             cfg.WEEK:  7 * day,
+             cfg.MONTH: 28 * day}
+    intervals = {cfg._5_MIN:        5 * 60,
+                 cfg._10_MIN:       10 * 60,
+                 cfg._30_MIN:       30 * 60,
+                 cfg._1_HOUR:       hour,
+                 cfg._2_HOURS:      2 * hour,
+                 cfg._4_HOURS:      4 * hour,
+                 cfg._6_HOURS:      6 * hour,
+                 cfg._12_HOURS:     12 * hour,
+                 # custom hours can be one hour apart
+                 cfg.CUSTOM_HOUR:   hour,
+                 cfg.DAY:           day,
+                 cfg.WEEK:          7 * day,
+                 cfg.MONTH:         28 * day,
+                 cfg.YEAR:          365 * day}
+    mode = cfg.scheduleMode(profile_id)
+    if mode == cfg.REPEATEDLY:
+        return cfg.scheduleRepeatedPeriod(profile_id) \
+               * units.get(cfg.scheduleRepeatedUnit(profile_id), day)
+    return intervals.get(mode)
+
+class DedupIndex(object):
+    """
+    Persistent index of files in all snapshots of one profile stored in a
+    SQLite database. Each inode is listed only once with size, inode number
+    and mtime. Checksums are only calculated when another file with the
+    same size shows up and are stored next to the file.
+
+    Args:
+        filename (str): database file
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            sid     TEXT NOT NULL,
+            path    TEXT NOT NULL,
+            size    INTEGER NOT NULL,
+            ino     INTEGER NOT NULL,
+            mtime   INTEGER NOT NULL,
+            digest  TEXT,
+            PRIMARY KEY (sid, path));
+        CREATE INDEX IF NOT EXISTS files_size ON files (size);
+        CREATE INDEX IF NOT EXISTS files_ino ON files (ino);
+        CREATE TABLE IF NOT EXISTS meta (
+            key     TEXT PRIMARY KEY,
+            value   TEXT NOT NULL);
+        """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        self.conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Commit all changes and close the database.
+        """
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+    def commit(self):
+        self.conn.commit()
+
+    def meta(self, key, default = None):
+        """
+        Read a JSON value from table 'meta'.
+        """
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def setMeta(self, key, value):
+        """
+        Store a JSON value in table 'meta'.
+        """
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                          (key, json.dumps(value)))
+
+    def snapshots(self):
+        """
+        IDs of all snapshots with files in the index.
+        """
+        return [row[0] for row in self.conn.execute('SELECT DISTINCT sid FROM files')]
+
+    def files(self, sid):
+        """
+        All files of snapshot ``sid``.
+
+        Returns:
+            list:   ``(rowid, path, ino)`` tuples
+        """
+        return self.conn.execute('SELECT rowid, path, ino FROM files WHERE sid = ?',
+                                 (sid,)).fetchall()
+
+    def hasInode(self, ino):
+        return self.conn.execute('SELECT 1 FROM files WHERE ino = ? LIMIT 1',
+                                 (ino,)).fetchone() is not None
+
+    def bySize(self, size):
+        """
+        All files with ``size``.
+
+        Returns:
+            list:   ``(rowid, sid, path, ino, mtime, digest)`` tuples
+        """
+        return self.conn.execute('SELECT rowid, sid, path, ino, mtime, digest FROM files '
+                                 'WHERE size = ? ORDER BY sid', (size,)).fetchall()
+
+    def add(self, sid, path, st, digest = None):
+        """
+        Add a file.
+
+        Args:
+            sid (str):                  snapshot ID
+            path (str):                 path inside the 'backup' folder
+            st (os.stat_result):        ``lstat`` of the file
+            digest (str):               checksum or ``None``
+        """
+        self.conn.execute('INSERT OR REPLACE INTO files (sid, path, size, ino, mtime, digest) '
+                          'VALUES (?, ?, ?, ?, ?, ?)',
+                          (sid, path, st.st_size, st.st_ino, st.st_mtime_ns, digest))
+
+    def setDigest(self, rowid, digest):
+        self.conn.execute('UPDATE files SET digest = ? WHERE rowid = ?', (digest, rowid))
+
+    def move(self, rowid, sid):
+        self.conn.execute('UPDATE OR REPLACE files SET sid = ? WHERE rowid = ?', (sid, rowid))
+
+    def remove(self, rowid):
+        self.conn.execute('DELETE FROM files WHERE rowid = ?', (rowid,))
+
+class Deduplicator(object):
+    """
+    Replace files which rsync transferred into a new snapshot with hardlinks
+    to identical files in older snapshots. ``rsync --link-dest`` only links
+    files at the same path so renamed or moved files are stored again.
+
+    Candidates are all regular files of the new snapshot with only one link.
+    They are taken from the change manifest (or by walking the snapshot if
+    there is none). A candidate is only hashed if :py:class:`DedupIndex`
+    knows another file with the same size. Files are only linked if mode,
+    owner, group, mtime (and extended attributes if ACL or xattr are
+    preserved) are equal because hardlinks share all of them.
+
+    The first run indexes the previous snapshot. All work stops when the
+    time budget is exhausted. Snapshots which were not finished are
+    continued by the next run.
+
+    Args:
+        cfg (config.Config):    current config
+        budget (float):         seconds which can be spent. Default is
+                                :py:func:`timeBudget`
+    """
+    MIN_SIZE = 1024
+    COMMIT = 1000
+
+    def __init__(self, cfg, budget = None):
+        self.config = cfg
+        if budget is None:
+            budget = self.timeBudget()
+        self.budget = budget
+        self.deadline = None
+        self.linked = 0
+        self.saved = 0
+        self.planner = freespace.FreeSpacePlanner(cfg)
+        self.compareXattr = cfg.preserveAcl() or cfg.preserveXattr()
+
+    def timeBudget(self):
+        """
+        Configured time budget limited to half of the schedule interval so
+        deduplication never delays the next snapshot.
+
+        Returns:
+            int:    seconds
+        """
+        budget = self.config.dedupTimeBudget() * 60
+        interval = scheduleInterval(self.config)
+        if interval:
+            budget = min(budget, interval // 2)
+        return budget
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def run(self, sid):
+        """
+        Deduplicate ``sid`` and all snapshots which were not finished in an
+        earlier run.
+
+        Args:
+            sid (snapshots.SID):    new snapshot
+
+        Returns:
+            bool:                   ``True`` if all snapshots were finished
+                                    within the time budget
+        """
+        self.deadline = time.monotonic() + self.budget
+        try:
+            return self._run(sid)
+        except sqlite3.Error as e:
+            logger.error('Failed to deduplicate {}: {}'.format(sid, str(e)), self)
+            return False
+
+    def _run(self, sid):
+        sids = snapshots.listSnapshots(self.config)
+        existing = {i.sid: i for i in sids}
+        with DedupIndex(self.config.dedupIndexFile()) as index:
+            queue = [existing[i] for i in index.meta('pending', []) if i in existing and i != sid.sid]
+            queue.append(sid)
+            if not self.prune(index, sids):
+                index.setMeta('pending', [i.sid for i in queue])
+                return False
+            older = [i for i in sids if i < queue[0]]
+            if older and not index.meta('seeded') and not self.seed(index, older[0]):
+                index.setMeta('pending', [i.sid for i in queue])
+                return False
+            while queue:
+                if not self.deduplicate(index, queue[0]):
+                    break
+                queue.pop(0)
+            index.setMeta('pending', [i.sid for i in queue])
+        logger.info('Deduplication linked {} files ({} bytes){}'.format(
+                    self.linked, self.saved, ', time budget exhausted' if queue else ''),
+                    self)
+        return not queue
+
+    def prune(self, index, sids):
+        """
+        Remove files of snapshots which don't exist anymore from ``index``.
+        ``rsync --link-dest`` keeps unchanged files at the same path so they
+        are moved to the next newer snapshot if they are still there.
+
+        Args:
+            index (DedupIndex): index
+            sids (list):        all existing :py:class:`snapshots.SID`
+
+        Returns:
+            bool:   ``True`` if all removed snapshots were pruned
+        """
+        existing = sorted(sids)
+        for removed in sorted(set(index.snapshots()) - set(i.sid for i in sids)):
+            newer = [i for i in existing if i > removed]
+            for rowid, path, ino in index.files(removed):
+                if self.expired():
+                    return False
+                try:
+                    if newer and os.lstat(newer[0].pathBackup(path)).st_ino == ino:
+                        index.move(rowid, newer[0].sid)
+                        continue
+                except OSError:
+                    pass
+                index.remove(rowid)
+            index.commit()
+        return True
+
+    def seed(self, index, sid):
+        """
+        Add all files of ``sid`` to ``index`` without hashing them.
+
+        Returns:
+            bool:   ``True`` if ``sid`` was indexed completely
+        """
+        logger.debug('Index files of {}'.format(sid), self)
+        for count, (path, st) in enumerate(self.walk(sid)):
+            if self.expired():
+                return False
+            if stat.S_ISREG(st.st_mode) and st.st_size >= self.MIN_SIZE \
+                    and not index.hasInode(st.st_ino):
+                index.add(sid.sid, path, st)
+            if not count % self.COMMIT:
+                index.commit()
+        index.setMeta('seeded', sid.sid)
+        return True
+
+    def deduplicate(self, index, sid):
+        """
+        Link all candidates in ``sid`` to identical files in ``index`` and
+        add the others to ``index``.
+
+        Returns:
+            bool:   ``True`` if ``sid`` was finished
+        """
+        for count, (path, st) in enumerate(self.candidates(sid)):
+            if self.expired():
+                return False
+            if index.hasInode(st.st_ino):
+                # already done in an earlier run
+                continue
+            full = sid.pathBackup(path)
+            digest = None
+            inodes = set()
+            for rowid, other_sid, other_path, ino, mtime, other_digest in index.bySize(st.st_size):
+                if ino in inodes:
+                    # another path of a file which was already checked
+                    continue
+                inodes.add(ino)
+                other = snapshots.SID(other_sid, self.config).pathBackup(other_path)
+                try:
+                    other_st = os.lstat(other)
+                except OSError:
+                    other_st = None
+                if other_st is None or other_st.st_ino != ino \
+                        or other_st.st_mtime_ns != mtime or other_st.st_size != st.st_size:
+                    # file was removed or changed
+                    index.remove(rowid)
+                    continue
+                if not self.sameMetadata(full, st, other, other_st):
+                    continue
+                try:
+                    if digest is None:
+                        digest = tools.blake2sum(full)
+                    if other_digest is None:
+                        other_digest = tools.blake2sum(other)
+                        index.setDigest(rowid, other_digest)
+                except OSError as e:
+                    logger.debug('Failed to hash {} or {}: {}'.format(full, other, str(e)), self)
+                    continue
+                if digest == other_digest and self.link(other, full):
+                    self.linked += 1
+                    self.saved += st.st_size
+                    # removing the other snapshot doesn't free this file anymore
+                    self.planner.invalidate(snapshots.SID(other_sid, self.config))
+                    # keep the inode in the index if the other snapshot is removed
+                    index.add(sid.sid, path, other_st, digest)
+                    break
+            else:
+                index.add(sid.sid, path, st, digest)
+            if not count % self.COMMIT:
+                index.commit()
+        return True
+
+    def candidates(self, sid):
+        """
+        Regular files which were transferred into ``sid`` and have only one
+        link.
+
+        Yields:
+            tuple:  path inside the 'backup' folder and ``lstat`` result
+        """
+        try:
+            with sid.changeManifest() as manifest:
+                paths = [os.fsdecode(path) for path, (flags, size) in manifest.items()
+                         if flags[:2] in ('>f', '<f') and size >= self.MIN_SIZE]
+        except (OSError, changemanifest.ChangeManifestFormatError) as e:
+            logger.debug('No change manifest in {}, walk through all files: {}'.format(
+                         sid, str(e)),
+                         self)
+            items = self.walk(sid)
+        else:
+            items = self.lstat(sid, paths)
+        for path, st in items:
+            if stat.S_ISREG(st.st_mode) and st.st_nlink == 1 and st.st_size >= self.MIN_SIZE:
+                yield path, st
+
+    def lstat(self, sid, paths):
+        for path in paths:
+            try:
+                yield path, os.lstat(sid.pathBackup(path))
+            except OSError:
+                pass
+
+    def walk(self, sid):
+        """
+        Walk through all files of ``sid`` without following symlinks.
+
+        Yields:
+            tuple:  path inside the 'backup' folder and ``lstat`` result
+        """
+        root = sid.pathBackup()
+        stack = ['']
+        while stack:
+            folder = stack.pop()
+            try:
+                it = os.scandir(os.path.join(root, folder))
+            except OSError as e:
+                logger.debug('Failed to list {}: {}'.format(folder, str(e)), self)
+                continue
+            with it:
+                for entry in it:
+                    path = os.path.join(folder, entry.name)
+                    try:
+                        st = entry.stat(follow_symlinks = False)
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(st.st_mode):
+                        stack.append(path)
+                    yield path, st
+
+    def sameMetadata(self, path1, st1, path2, st2):
+        """
+        ``True`` if both files can share one inode without changing the
+        metadata of either of them.
+        """
+        if (st1.st_mode, st1.st_uid, st1.st_gid, st1.st_mtime_ns) \
+                != (st2.st_mode, st2.st_uid, st2.st_gid, st2.st_mtime_ns):
+            return False
+        if self.compareXattr:
+            return self.xattr(path1) == self.xattr(path2)
+        return True
+
+    def xattr(self, path):
+        try:
+            return {name: os.getxattr(path, name, follow_symlinks = False)
+                    for name in os.listxattr(path, follow_symlinks = False)}
+        except OSError:
+            return None
+
+    def link(self, source, path):
+        """
+        Atomically replace ``path`` with a hardlink to ``source``.
+
+        Returns:
+            bool:   ``True`` if ``path`` was replaced
+        """
+        tmp = '{}.{}.dedup'.format(path, os.getpid())
+        try:
+            os.link(source, tmp)
+        except OSError as e:
+            # e.g. too many links
+            logger.debug('Failed to link {} to {}: {}'.format(path, source, str(e)), self)
+            return False
+        try:
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.debug('Failed to replace {}: {}'.format(path, str(e)), self)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        return True
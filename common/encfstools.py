@@ -21,6 +21,10 @@ import subprocess
 import re
 import shutil
 import tempfile
+import json
+import zlib
+import hashlib
+from collections import OrderedDict
 from datetime import datetime
 from distutils.version import StrictVersion
 
@@ -342,6 +346,9 @@ class Encode(object):
         self.re_asterisk = re.compile(r'\*')
         self.re_separate_asterisk = re.compile(r'(.*?)(\*+)(.*)')
 
+        self.cache = PathCache(self.encfs.config, 'encode',
+                               self.encfs.configFile())
+
     def __del__(self):
         self.close()
 
@@ -367,20 +374,43 @@ class Encode(object):
         """
         write plain path to encfsctl stdin and read encrypted path from stdout
         """
-        if not 'p' in vars(self):
-            self.startProcess()
-        if not self.p.returncode is None:
-            logger.warning('\'encfsctl encode\' process terminated. Restarting.', self)
-            del self.p
-            self.startProcess()
-        self.p.stdin.write(path + '\n')
-        ret = self.p.stdout.readline().strip('\n')
-        if not len(ret) and len(path):
-            logger.debug('Failed to encode %s. Got empty string'
-                         %path, self)
-            raise EncodeValueError()
+        ret = self.cache.get(path)
+        if ret is None:
+            ret = self.paths([path])[0]
+        return ret
+
+    def paths(self, paths):
+        """
+        encrypt multiple paths. Paths which are not cached will be sent
+        to encfsctl in batches.
+        """
+        ret = [self.cache.get(path) for path in paths]
+        missing = [path for path, enc in zip(paths, ret) if enc is None]
+        if missing:
+            if not 'p' in vars(self):
+                self.startProcess()
+            if not self.p.returncode is None:
+                logger.warning('\'encfsctl encode\' process terminated. Restarting.', self)
+                del self.p
+                self.startProcess()
+            encoded = {}
+            for path, enc in zip(missing, translate(self.p, missing, '\n')):
+                if not len(enc) and len(path):
+                    logger.debug('Failed to encode %s. Got empty string'
+                                 %path, self)
+                    raise EncodeValueError()
+                self.cache.set(path, enc)
+                encoded[path] = enc
+            ret = [enc if enc is not None else encoded[path]
+                   for path, enc in zip(paths, ret)]
         return ret
 
+    def prefetch(self, paths):
+        """
+        encrypt and cache all ``paths`` with as few requests as possible
+        """
+        self.paths(list(OrderedDict.fromkeys(paths)))
+
     def exclude(self, path):
         """
         encrypt paths for snapshots.takeSnapshot exclude list.
@@ -444,6 +474,8 @@ class Encode(object):
         if 'p' in vars(self) and self.p.returncode is None:
             logger.debug('stop \'encfsctl encode\' process', self)
             self.p.communicate()
+        if 'cache' in vars(self):
+            self.cache.save()
 
 class Bounce(object):
     """
@@ -456,6 +488,12 @@ class Bounce(object):
     def path(self, path):
         return path
 
+    def paths(self, paths):
+        return list(paths)
+
+    def prefetch(self, paths):
+        pass
+
     def exclude(self, path):
         return path
 
@@ -565,6 +603,9 @@ class Decode(object):
         else:
             self.newline = b'\n'
 
+        self.cache = PathCache(cfg, 'decode', self.encfs.configFile())
+        self.collected = None
+
     def __del__(self):
         self.close()
 
@@ -596,28 +637,81 @@ class Decode(object):
             assert isinstance(path, str), 'path is not str type: %s' % path
         else:
             assert isinstance(path, bytes), 'path is not bytes type: %s' % path
+        ret = self.cache.get(self.cacheKey(path))
+        if ret is not None:
+            return self.cacheValue(ret)
+        if self.collected is not None:
+            # only collect paths for prefetchLog
+            self.collected.append(path)
+            return path
+        return self.paths([path])[0]
+
+    def paths(self, paths):
+        """
+        decode multiple paths. Paths which are not cached will be sent
+        to encfsctl in batches. Paths which couldn't be decoded are
+        returned unchanged.
+        """
+        keys = [self.cacheKey(path) for path in paths]
+        ret = [self.cache.get(key) for key in keys]
+        missing = [path for path, dec in zip(paths, ret) if dec is None]
+        if not missing:
+            return [self.cacheValue(dec) for dec in ret]
         if not 'p' in vars(self):
             self.startProcess()
         if not self.p.returncode is None:
             logger.warning('\'encfsctl decode\' process terminated. Restarting.', self)
             del self.p
             self.startProcess()
-        self.p.stdin.write(path + self.newline)
-        ret = self.p.stdout.readline()
-        ret = ret.strip(self.newline)
-        if ret:
-            return ret
-        return path
+        decoded = {}
+        for path, dec in zip(missing, translate(self.p, missing, self.newline)):
+            if dec:
+                self.cache.set(self.cacheKey(path), self.cacheKey(dec))
+                decoded[path] = dec
+        return [self.cacheValue(dec) if dec is not None else decoded.get(path, path)
+                for path, dec in zip(paths, ret)]
+
+    def prefetch(self, paths):
+        """
+        decode and cache all ``paths`` with as few requests as possible
+        """
+        self.paths(list(OrderedDict.fromkeys(paths)))
+
+    def prefetchLog(self, lines):
+        """
+        decode and cache all paths in takesnapshot.log ``lines`` with as few
+        requests as possible, so :py:func:`log` will only hit the cache
+        """
+        self.collected = []
+        try:
+            for line in lines:
+                self.log(line)
+        finally:
+            collected, self.collected = self.collected, None
+        self.prefetch(collected)
+
+    def cacheKey(self, path):
+        """
+        the cache always uses :py:class:`str`
+        """
+        if self.string:
+            return path
+        return os.fsdecode(path)
+
+    def cacheValue(self, value):
+        """
+        convert cached value back to the type used by this instance
+        """
+        if self.string:
+            return value
+        return os.fsencode(value)
 
     #TODO: rename this, 'list' is corrupting sphinx doc
     def list(self, list_):
         """
         decode a list of paths
         """
-        output = []
-        for path in list_:
-            output.append(self.path(path))
-        return output
+        return self.paths(list_)
 
     def log(self, line):
         """
@@ -692,3 +786,147 @@ class Decode(object):
         if 'p' in vars(self) and self.p.returncode is None:
             logger.debug('stop \'encfsctl decode\' process', self)
             self.p.communicate()
+        if 'cache' in vars(self):
+            self.cache.save()
+
+BATCH_SIZE = 4096
+
+def translate(proc, paths, newline):
+    """
+    Send ``paths`` to a running ``encfsctl encode`` or ``encfsctl decode``
+    process in pipe mode. Many paths are written at once and the answers are
+    read afterwards. Batches are limited to :py:data:`BATCH_SIZE` so encfsctl
+    can't block on a full stdout pipe while we are still writing.
+
+    Args:
+        proc (subprocess.Popen):    encfsctl process
+        paths (list):               paths (:py:class:`str` or
+                                    :py:class:`bytes` depending on ``newline``)
+        newline (str):              ``'\\n'`` or ``b'\\n'``
+
+    Returns:
+        list:                       translated paths in the same order
+    """
+    ret = []
+    start = 0
+    while start < len(paths):
+        end = start
+        size = 0
+        while end < len(paths) and (end == start or size + len(paths[end]) < BATCH_SIZE):
+            size += len(paths[end]) + 1
+            end += 1
+        batch = paths[start:end]
+        proc.stdin.write(newline.join(batch) + newline)
+        for path in batch:
+            ret.append(proc.stdout.readline().strip(newline))
+        start = end
+    return ret
+
+class PathCache(object):
+    """
+    LRU bounded cache for paths translated by encfsctl. The cache is stored
+    in :py:func:`config.Config.encfsPathCacheFile` and reused in later runs.
+
+    The file name is a fingerprint of the encfs config (which contains the
+    volume key) so a new volume never sees entries of an old one. Like all
+    other local state the file is kept unencrypted in the users data folder,
+    readable only by the user (mode 0600). If the encfs config can't be read
+    the cache will only be kept in memory.
+
+    Args:
+        cfg (config.Config):    current config
+        name (str):             ``'encode'`` or ``'decode'``
+        configFile (str):       full path to encfs config
+        maxEntries (int):       maximum number of cached paths
+    """
+    MAGIC = b'BITC'
+    VERSION = 2
+    MAX_ENTRIES = 100000
+
+    def __init__(self, cfg, name, configFile, maxEntries = MAX_ENTRIES):
+        self.config = cfg
+        self.maxEntries = maxEntries
+        self.cache = OrderedDict()
+        self.changed = False
+        self.filename = None
+        try:
+            with open(configFile, 'rb') as f:
+                fingerprint = hashlib.blake2b(name.encode() + b'\0' + f.read(),
+                                              digest_size = 16)
+        except OSError as e:
+            logger.debug('Failed to read encfs config %s, keep path cache '
+                         'in memory only: %s' %(configFile, str(e)), self)
+            return
+        self.filename = cfg.encfsPathCacheFile(fingerprint.hexdigest())
+        self.load()
+
+    def __len__(self):
+        return len(self.cache)
+
+    def get(self, path):
+        """
+        Cached translation of ``path`` or ``None``.
+        """
+        ret = self.cache.get(path)
+        if ret is not None:
+            self.cache.move_to_end(path)
+        return ret
+
+    def set(self, path, translated):
+        """
+        Add a translation and drop the least recently used one if the cache
+        is full.
+        """
+        self.cache[path] = translated
+        self.cache.move_to_end(path)
+        if len(self.cache) > self.maxEntries:
+            self.cache.popitem(last = False)
+        self.changed = True
+
+    def load(self):
+        """
+        Read cached paths from disk. Invalid or foreign files are ignored.
+        """
+        try:
+            with open(self.filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.debug('Failed to read encfs path cache %s: %s'
+                         %(self.filename, str(e)), self)
+            return
+        header = self.MAGIC + bytes((self.VERSION,))
+        if not data.startswith(header):
+            logger.debug('Ignore invalid encfs path cache %s' %self.filename, self)
+            return
+        try:
+            items = json.loads(zlib.decompress(data[len(header):]).decode())
+        except (ValueError, zlib.error) as e:
+            logger.debug('Failed to load encfs path cache %s: %s'
+                         %(self.filename, str(e)), self)
+            return
+        for path, translated in items[-self.maxEntries:]:
+            self.cache[path] = translated
+        logger.debug('Loaded %s paths from encfs path cache %s'
+                     %(len(self.cache), self.filename), self)
+
+    def save(self):
+        """
+        Write cached paths to disk if they changed.
+        """
+        if not self.changed or self.filename is None:
+            return
+        header = self.MAGIC + bytes((self.VERSION,))
+        data = zlib.compress(json.dumps(list(self.cache.items())).encode())
+        tmp = self.filename + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                os.fchmod(f.fileno(), 0o600)
+                f.write(header + data)
+            os.replace(tmp, self.filename)
+        except OSError as e:
+            logger.debug('Failed to save encfs path cache %s: %s'
+                         %(self.filename, str(e)), self)
+            return
+        self.changed = False
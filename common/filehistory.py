@@ -0,0 +1,254 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+import logger
+import tools
+import remotehelper
+
+
+class FileHistory(object):
+    """
+    Find all versions of one file or folder in a list of snapshots. Every
+    snapshot needs only a single ``lstat`` which runs in a thread pool (or
+    in batches through :py:class:`remotehelper.RemoteHelper` in mode 'ssh').
+    Results are yielded in the order of the snapshot list as soon as they
+    are available.
+
+    Hardlinked files share ``(st_dev, st_ino)`` so a run of snapshots
+    which didn't change the file is recognized without reading or hashing
+    it again.
+
+    Args:
+        cfg (config.Config):    current config
+        workers (int):          number of threads for ``lstat``
+    """
+    WORKERS = 16
+    BATCH = 256
+
+    def __init__(self, cfg, workers = WORKERS):
+        self.config = cfg
+        self.workers = workers
+
+    def lstat(self, path):
+        try:
+            return os.lstat(path)
+        except OSError:
+            return None
+
+    def statLocal(self, sids, path):
+        """
+        ``lstat`` ``path`` in all ``sids`` through the local (or mounted)
+        filesystem.
+
+        Args:
+            sids (list):    :py:class:`snapshots.SID` objects
+            path (str):     path on root filesystem
+
+        Yields:
+            tuple:          (sid, os.stat_result or ``None`` if ``path``
+                            doesn't exist in sid)
+        """
+        if self.workers <= 1 or len(sids) <= 1:
+            for sid in sids:
+                yield sid, self.lstat(sid.pathBackup(path))
+            return
+        with ThreadPoolExecutor(self.workers) as executor:
+            results = executor.map(self.lstat, [sid.pathBackup(path) for sid in sids])
+            try:
+                yield from zip(sids, results)
+            finally:
+                # cancel pending stats if the caller stopped early
+                results.close()
+
+    def statRemote(self, helper, sids, path):
+        """
+        ``lstat`` ``path`` in all ``sids`` on the remote host in batches of
+        :py:data:`BATCH` paths.
+
+        Args:
+            helper (remotehelper.RemoteHelper): helper for the remote host
+            sids (list):    :py:class:`snapshots.SID` objects
+            path (str):     path on root filesystem
+
+        Yields:
+            tuple:          (sid, os.stat_result or ``None`` if ``path``
+                            doesn't exist in sid)
+        """
+        for i in range(0, len(sids), self.BATCH):
+            batch = sids[i:i + self.BATCH]
+            paths = [sid.pathBackup(path, use_mode = ['ssh']) for sid in batch]
+            for sid, st in zip(batch, helper.stat(paths, follow_symlinks = False)):
+                if st is not None:
+                    mode, size, mtime_ns, atime, ino, nlink = st
+                    # all snapshots are on the same remote device
+                    st = os.stat_result((mode, ino, 0, nlink, 0, 0, size,
+                                         atime, mtime_ns / 1e9, mtime_ns / 1e9))
+                yield sid, st
+
+    def stat(self, sids, path):
+        """
+        ``lstat`` ``path`` in all ``sids``.
+
+        Args:
+            sids (list):    :py:class:`snapshots.SID` objects
+            path (str):     path on root filesystem
+
+        Yields:
+            tuple:          (sid, os.stat_result or ``None`` if ``path``
+                            doesn't exist in sid) in the order of ``sids``
+        """
+        helper = remotehelper.helper(self.config)
+        if helper is None:
+            yield from self.statLocal(sids, path)
+            return
+        # RootSnapshot is always local
+        done = len([sid for sid in sids[:1] if sid.isRoot])
+        yield from self.statLocal(sids[:done], path)
+        try:
+            for ret in self.statRemote(helper, sids[done:], path):
+                yield ret
+                done += 1
+        except OSError as e:
+            logger.warning('Failed to stat {} through remote helper, using sshfs instead: {}'.format(
+                           path, str(e)),
+                           self)
+            yield from self.statLocal(sids[done:], path)
+
+    def filter(self,
+               sids,
+               path,
+               base_st,
+               list_diff_only = False,
+               flag_deep_check = False,
+               list_equal_to = ''):
+        """
+        Yield all snapshots which contain ``path`` with the same type as
+        ``base_st``. See :py:func:`snapshots.Snapshots.filter` for details.
+
+        Args:
+            sids (list):            :py:class:`snapshots.SID` objects
+            path (str):             path on root filesystem
+            base_st (os.stat_result):   ``lstat`` of the original file
+            list_diff_only (bool):  only yield snapshots with a different
+                                    version of ``path``
+            flag_deep_check (bool): use checksums to check uniqueness of
+                                    files. All ``lstat`` results are
+                                    collected first so files which need a
+                                    checksum can be hashed in parallel
+            list_equal_to (str):    full path to a file. Only yield
+                                    snapshots with exactly the same file
+
+        Yields:
+            snapshots.SID:          matching snapshots
+        """
+        uniqueness = None
+        if stat.S_ISLNK(base_st.st_mode):
+            check = self.linkCheck(list_diff_only)
+            isType = stat.S_ISLNK
+        elif stat.S_ISDIR(base_st.st_mode):
+            check = None
+            isType = stat.S_ISDIR
+        else:
+            if list_diff_only or list_equal_to:
+                uniqueness = tools.UniquenessSet(flag_deep_check,
+                                                 follow_symlink = False,
+                                                 list_equal_to = list_equal_to,
+                                                 cache = self.digestCache())
+                check = self.fileCheck(uniqueness, list_equal_to)
+            else:
+                check = None
+            isType = stat.S_ISREG
+
+        results = self.stat(sids, path)
+        if uniqueness is not None and flag_deep_check:
+            results = [(sid, st) for sid, st in results
+                       if st is not None and isType(st.st_mode)]
+            uniqueness.prefetch([(sid.pathBackup(path), st) for sid, st in results])
+
+        try:
+            for sid, st in results:
+                if st is None or not isType(st.st_mode):
+                    continue
+                if check is None or check(sid.pathBackup(path), st):
+                    yield sid
+        finally:
+            if uniqueness is not None and uniqueness.cache is not None:
+                uniqueness.cache.save()
+
+    def digestCache(self):
+        """
+        Persistent checksum cache for deep checks. Only used in mode 'local'
+        because inode numbers on FUSE filesystems like sshfs are not stable.
+
+        Returns:
+            tools.DigestCache:  cache or ``None``
+        """
+        if self.config.snapshotsMode() != 'local':
+            return None
+        return tools.DigestCache(self.config.digestCacheFile())
+
+    def linkCheck(self, list_diff_only):
+        """
+        Check for symlinks which point to a new target.
+
+        Returns:
+            method:     called with full path and ``lstat`` result
+        """
+        if not list_diff_only:
+            return None
+        targets = set()
+        identities = set()
+        def check(path, st):
+            identity = (st.st_dev, st.st_ino)
+            if identity in identities:
+                # hardlink to a link we already know
+                return False
+            identities.add(identity)
+            target = os.readlink(path)
+            if target in targets:
+                return False
+            targets.add(target)
+            return True
+        return check
+
+    def fileCheck(self, uniqueness, list_equal_to):
+        """
+        Check files for uniqueness or equality with ``uniqueness``.
+        Hardlinks to a file which was already checked get the same result
+        without asking ``uniqueness`` again.
+
+        Args:
+            uniqueness (tools.UniquenessSet):   uniqueness checker
+            list_equal_to (str):    full path to a file or empty
+
+        Returns:
+            method:     called with full path and ``lstat`` result
+        """
+        results = {}
+        def check(path, st):
+            identity = (st.st_dev, st.st_ino)
+            if identity in results:
+                # unique files are only listed once, equal files every time
+                return bool(list_equal_to) and results[identity]
+            ret = uniqueness.check(path, st)
+            results[identity] = ret
+            return ret
+        return check
@@ -0,0 +1,341 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Indexed storage for snapshot permissions ('fileinfo.idx').
+
+The file consists of zlib compressed blocks of records followed by a footer
+which holds the user and group name tables and an index with the smallest
+and largest path of every block. Records inside a block store the path with the
+length of the prefix shared with the previous path, the mode and indices
+into the user and group tables::
+
+    MAGIC
+    block 0 .. block N
+    footer (zlib compressed)
+    footer offset, footer length, MAGIC
+
+If records are written in sorted order single paths or whole subtrees can be
+looked up by decompressing only the affected blocks.
+"""
+
+import bisect
+import struct
+import zlib
+from collections import OrderedDict
+
+MAGIC = b'BITFI\x01'
+
+_RECORD = struct.Struct('<HHIII')   # shared, suffix length, mode, user, group
+_BLOCK  = struct.Struct('<QII')     # offset, length, record count
+_TRAILER = struct.Struct('<QI')     # footer offset, footer length
+_LEN = struct.Struct('<I')
+
+class FileInfoFormatError(Exception):
+    pass
+
+def _packBytes(data):
+    return _LEN.pack(len(data)) + data
+
+def _unpackBytes(buf, pos):
+    length, = _LEN.unpack_from(buf, pos)
+    pos += _LEN.size
+    return buf[pos:pos + length], pos + length
+
+def _subtreeEnd(prefix):
+    """
+    Smallest path which is sorted behind all items inside ``prefix``.
+    """
+    return prefix.rstrip(b'/') + b'0'
+
+class FileInfoWriter(object):
+    """
+    Write permissions into an indexed 'fileinfo.idx' file. Records should be
+    added in sorted order to get an efficient index but any order works.
+
+    Args:
+        filename (str):     file to write
+        blockSize (int):    uncompressed size of one block in bytes
+    """
+    def __init__(self, filename, blockSize = 64 * 1024):
+        self.blockSize = blockSize
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.users = OrderedDict()
+        self.groups = OrderedDict()
+        self.blocks = []
+        self.isSorted = True
+        self.lastPath = None
+        self._resetBlock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def _resetBlock(self):
+        self.buf = []
+        self.bufSize = 0
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.prev = b''
+
+    def _index(self, table, name):
+        try:
+            return table[name]
+        except KeyError:
+            table[name] = len(table)
+            return table[name]
+
+    def write(self, path, mode, user, group):
+        """
+        Add permissions for ``path``.
+
+        Args:
+            path (bytes):   full path
+            mode (int):     st_mode
+            user (bytes):   owner name
+            group (bytes):  group name
+        """
+        if self.lastPath is not None and path <= self.lastPath:
+            self.isSorted = False
+        self.lastPath = path
+        if self.first is None or path < self.first:
+            self.first = path
+        if self.last is None or path > self.last:
+            self.last = path
+        prev = self.prev
+        shared = 0
+        maxShared = min(len(prev), len(path), 0xffff)
+        while shared < maxShared and prev[shared] == path[shared]:
+            shared += 1
+        suffix = path[shared:]
+        record = _RECORD.pack(shared, len(suffix), mode,
+                              self._index(self.users, user),
+                              self._index(self.groups, group)) + suffix
+        self.buf.append(record)
+        self.bufSize += len(record)
+        self.count += 1
+        self.prev = path
+        if self.bufSize >= self.blockSize:
+            self._flushBlock()
+
+    def _flushBlock(self):
+        if not self.count:
+            return
+        data = zlib.compress(b''.join(self.buf))
+        self.file.write(data)
+        self.blocks.append((self.offset, len(data), self.count, self.first, self.last))
+        self.offset += len(data)
+        self._resetBlock()
+
+    def close(self):
+        """
+        Write remaining records and the index.
+        """
+        self._flushBlock()
+        footer = [struct.pack('<BI', self.isSorted, len(self.users))]
+        footer.extend(_packBytes(i) for i in self.users)
+        footer.append(_LEN.pack(len(self.groups)))
+        footer.extend(_packBytes(i) for i in self.groups)
+        footer.append(_LEN.pack(len(self.blocks)))
+        for offset, length, count, first, last in self.blocks:
+            footer.append(_BLOCK.pack(offset, length, count))
+            footer.append(_packBytes(first))
+            footer.append(_packBytes(last))
+        data = zlib.compress(b''.join(footer))
+        self.file.write(data)
+        self.file.write(_TRAILER.pack(self.offset, len(data)) + MAGIC)
+        self.file.close()
+
+class FileInfoReader(object):
+    """
+    Random access to permissions stored in 'fileinfo.idx'. Only the index is
+    loaded on open, blocks are decompressed on demand and a few of them are
+    kept in cache.
+
+    Args:
+        filename (str):     file to read or a seekable binary file object
+
+    Raises:
+        FileInfoFormatError:    if ``filename`` is not a valid fileinfo file
+    """
+    CACHED_BLOCKS = 4
+
+    def __init__(self, filename):
+        if hasattr(filename, 'read'):
+            self.file = filename
+        else:
+            self.file = open(filename, 'rb')
+        try:
+            self._readIndex()
+        except (struct.error, zlib.error, FileInfoFormatError) as e:
+            self.file.close()
+            raise FileInfoFormatError('{} is not a valid fileinfo file: {}'.format(
+                                      getattr(self.file, 'name', filename), str(e)))
+        self.cache = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _readIndex(self):
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise FileInfoFormatError('wrong magic header')
+        trailerSize = _TRAILER.size + len(MAGIC)
+        self.file.seek(-trailerSize, 2)
+        trailer = self.file.read(trailerSize)
+        if trailer[_TRAILER.size:] != MAGIC:
+            raise FileInfoFormatError('wrong magic trailer')
+        offset, length = _TRAILER.unpack_from(trailer)
+        self.file.seek(offset)
+        buf = zlib.decompress(self.file.read(length))
+
+        self.isSorted, count = struct.unpack_from('<BI', buf)
+        pos = struct.calcsize('<BI')
+        self.users = []
+        for i in range(count):
+            name, pos = _unpackBytes(buf, pos)
+            self.users.append(name)
+        count, = _LEN.unpack_from(buf, pos)
+        pos += _LEN.size
+        self.groups = []
+        for i in range(count):
+            name, pos = _unpackBytes(buf, pos)
+            self.groups.append(name)
+        count, = _LEN.unpack_from(buf, pos)
+        pos += _LEN.size
+        self.blocks = []
+        for i in range(count):
+            offset, length, records = _BLOCK.unpack_from(buf, pos)
+            pos += _BLOCK.size
+            first, pos = _unpackBytes(buf, pos)
+            last, pos = _unpackBytes(buf, pos)
+            self.blocks.append((offset, length, records, first, last))
+        self.firstPaths = [i[3] for i in self.blocks]
+
+    def __len__(self):
+        return sum(i[2] for i in self.blocks)
+
+    def _block(self, index):
+        """
+        Decompressed records of block number ``index``.
+
+        Returns:
+            list:   list of tuple (path, (mode, user, group))
+        """
+        try:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+        except KeyError:
+            pass
+        offset, length, count = self.blocks[index][:3]
+        self.file.seek(offset)
+        buf = zlib.decompress(self.file.read(length))
+        records = []
+        prev = b''
+        pos = 0
+        users, groups = self.users, self.groups
+        for i in range(count):
+            shared, suffixLen, mode, user, group = _RECORD.unpack_from(buf, pos)
+            pos += _RECORD.size
+            path = prev[:shared] + buf[pos:pos + suffixLen]
+            pos += suffixLen
+            records.append((path, (mode, users[user], groups[group])))
+            prev = path
+        self.cache[index] = records
+        if len(self.cache) > self.CACHED_BLOCKS:
+            self.cache.popitem(last = False)
+        return records
+
+    def _candidates(self, start, end):
+        """
+        Number of all blocks which could contain paths in ``start <= path < end``.
+        """
+        if self.isSorted:
+            first = max(bisect.bisect_right(self.firstPaths, start) - 1, 0)
+            last = bisect.bisect_left(self.firstPaths, end)
+            return range(first, last)
+        return [i for i, block in enumerate(self.blocks)
+                if block[4] >= start and block[3] < end]
+
+    def get(self, path, default = None):
+        """
+        Permissions for ``path``.
+
+        Args:
+            path (bytes):   full path
+            default:        value returned if ``path`` is unknown
+
+        Returns:
+            tuple:          (mode, user, group)
+        """
+        for index in self._candidates(path, path + b'\0'):
+            for item, value in self._block(index):
+                if item == path:
+                    return value
+        return default
+
+    def __getitem__(self, path):
+        value = self.get(path)
+        if value is None:
+            raise KeyError(path)
+        return value
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def items(self):
+        """
+        Iterate over all records.
+
+        Yields:
+            tuple:  (path, (mode, user, group))
+        """
+        for index in range(len(self.blocks)):
+            yield from self._block(index)
+
+    def subtree(self, prefix):
+        """
+        Iterate over ``prefix`` and all records inside ``prefix``.
+
+        Args:
+            prefix (bytes): full path of a folder or file
+
+        Yields:
+            tuple:          (path, (mode, user, group))
+        """
+        prefix = prefix.rstrip(b'/')
+        if not prefix:
+            yield from self.items()
+            return
+        inside = prefix + b'/'
+        for index in self._candidates(prefix, _subtreeEnd(prefix)):
+            for item, value in self._block(index):
+                if item == prefix or item.startswith(inside):
+                    yield item, value
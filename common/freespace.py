@@ -0,0 +1,253 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import json
+import shlex
+import subprocess
+
+import logger
+import snapshots
+
+
+class FreeSpacePlanner(object):
+    """
+    Predict how much space and how many inodes will be freed by removing the
+    oldest snapshots, so :py:func:`snapshots.Snapshots.freeSpace` can remove
+    all necessary snapshots in one batch instead of checking free space after
+    every single snapshot.
+
+    The footprint of a snapshot is everything that is not hardlinked into the
+    next newer snapshot: folders, files with only one link and files whose
+    inode doesn't show up in the next snapshot. As long as all older
+    snapshots are removed first this is exactly what removing the snapshot
+    will free. Files which are still linked from a kept older snapshot (e.g.
+    a named one) are counted although they won't be freed, so the prediction
+    never removes more snapshots than checking after every removal would.
+
+    Footprints are stored in :py:data:`snapshots.SID.FOOTPRINT` inside each
+    snapshot together with the ID of the next snapshot they were computed
+    against. They stay valid as long as that next snapshot exists.
+
+    Args:
+        cfg (config.Config):    current config
+    """
+    VERSION = 1
+
+    def __init__(self, cfg):
+        self.config = cfg
+
+    def load(self, sid, next_sid):
+        """
+        Read the cached footprint of ``sid``.
+
+        Args:
+            sid (snapshots.SID):        snapshot
+            next_sid (snapshots.SID):   next newer snapshot
+
+        Returns:
+            tuple:                      bytes and inodes or ``None`` if there
+                                        is no valid cache
+        """
+        try:
+            with open(sid.path(snapshots.SID.FOOTPRINT), 'rt') as f:
+                data = json.load(f)
+            if data['version'] == self.VERSION and data['next'] == next_sid.sid:
+                return data['bytes'], data['inodes']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def save(self, sid, next_sid, footprint):
+        """
+        Cache the footprint of ``sid``.
+
+        Args:
+            sid (snapshots.SID):        snapshot
+            next_sid (snapshots.SID):   next newer snapshot
+            footprint (tuple):          bytes and inodes
+        """
+        data = {'version':  self.VERSION,
+                'next':     next_sid.sid,
+                'bytes':    footprint[0],
+                'inodes':   footprint[1]}
+        try:
+            with open(sid.path(snapshots.SID.FOOTPRINT), 'wt') as f:
+                json.dump(data, f)
+        except OSError as e:
+            logger.debug('Failed to save footprint of {}: {}'.format(sid, str(e)), self)
+
+    def invalidate(self, sid):
+        """
+        Drop the cached footprint of ``sid`` because files inside it got
+        new hardlinks.
+
+        Args:
+            sid (snapshots.SID):        snapshot
+        """
+        try:
+            os.remove(sid.path(snapshots.SID.FOOTPRINT))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug('Failed to remove footprint of {}: {}'.format(sid, str(e)), self)
+
+    def iterLocal(self, path):
+        """
+        Walk through ``path`` without following symlinks.
+
+        Args:
+            path (str): full path to a snapshot
+
+        Yields:
+            os.DirEntry:    all files and folders below ``path``
+        """
+        stack = [path]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks = False):
+                        stack.append(entry.path)
+                    yield entry
+
+    def scanLocal(self, sid, next_sid):
+        """
+        Calculate the footprint of ``sid`` on a local or mounted filesystem.
+
+        Args:
+            sid (snapshots.SID):        snapshot
+            next_sid (snapshots.SID):   next newer snapshot
+
+        Returns:
+            tuple:                      bytes and inodes
+        """
+        shared = set(entry.inode() for entry in self.iterLocal(next_sid.path())
+                     if not entry.is_dir(follow_symlinks = False))
+        st = os.lstat(sid.path())
+        size, inodes = st.st_blocks * 512, 1
+        for entry in self.iterLocal(sid.path()):
+            st = entry.stat(follow_symlinks = False)
+            if entry.is_dir(follow_symlinks = False) \
+                    or st.st_nlink == 1 \
+                    or st.st_ino not in shared:
+                size += st.st_blocks * 512
+                inodes += 1
+        return size, inodes
+
+    def remoteFind(self, sid, printf):
+        """
+        Run ``find`` on the remote host for snapshot ``sid``.
+
+        Args:
+            sid (snapshots.SID):    snapshot
+            printf (str):           format for find's ``-printf``
+
+        Yields:
+            list:                   fields of each line
+        """
+        path = sid.path(use_mode = ['ssh', 'ssh_encfs'])
+        cmd = self.config.sshCommand(['find', shlex.quote(path), '-printf', shlex.quote(printf)],
+                                     nice = False,
+                                     ionice = False)
+        proc = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+        for line in proc.stdout:
+            yield line.split()
+        proc.stdout.close()
+        if proc.wait():
+            raise OSError('find on remote host failed for {}'.format(path))
+
+    def scanRemote(self, sid, next_sid):
+        """
+        Calculate the footprint of ``sid`` on the remote host, because sshfs
+        doesn't show real inode numbers and link counts.
+
+        Args:
+            sid (snapshots.SID):        snapshot
+            next_sid (snapshots.SID):   next newer snapshot
+
+        Returns:
+            tuple:                      bytes and inodes
+        """
+        shared = set(ino for type_, ino in self.remoteFind(next_sid, r'%y %i\n')
+                     if type_ != b'd')
+        size = inodes = 0
+        for type_, ino, nlink, blocks in self.remoteFind(sid, r'%y %i %n %b\n'):
+            if type_ == b'd' or nlink == b'1' or ino not in shared:
+                size += int(blocks) * 512
+                inodes += 1
+        return size, inodes
+
+    def footprint(self, sid, next_sid):
+        """
+        Space and inodes which will be freed by removing ``sid`` after all
+        older snapshots have been removed.
+
+        Args:
+            sid (snapshots.SID):        snapshot
+            next_sid (snapshots.SID):   next newer snapshot
+
+        Returns:
+            tuple:                      bytes and inodes
+        """
+        footprint = self.load(sid, next_sid)
+        if footprint is None:
+            logger.debug('Calculate footprint of {}'.format(sid), self)
+            if self.config.snapshotsMode() in ('ssh', 'ssh_encfs'):
+                footprint = self.scanRemote(sid, next_sid)
+            else:
+                footprint = self.scanLocal(sid, next_sid)
+            self.save(sid, next_sid, footprint)
+        return footprint
+
+    def plan(self, sids, size = 0, inodes = 0, keep = None):
+        """
+        Choose the oldest snapshots which need to be removed to free ``size``
+        bytes and ``inodes`` inodes. The newest snapshot is never removed.
+
+        Args:
+            sids (list):        all :py:class:`snapshots.SID` sorted from
+                                oldest to newest
+            size (int):         bytes which should be freed
+            inodes (int):       inodes which should be freed
+            keep (method):      called with a :py:class:`snapshots.SID`,
+                                return ``True`` if it must not be removed
+
+        Returns:
+            list:               snapshots which should be removed, oldest first
+        """
+        ret = []
+        freedSize = freedInodes = 0
+        for sid, next_sid in zip(sids, sids[1:]):
+            if freedSize >= size and freedInodes >= inodes:
+                break
+            if keep and keep(sid):
+                continue
+            try:
+                s, i = self.footprint(sid, next_sid)
+            except OSError as e:
+                logger.warning('Failed to calculate footprint of {}: {}'.format(sid, str(e)), self)
+                # fall back to removing one snapshot at a time
+                # and check free space again afterwards
+                ret.append(sid)
+                break
+            ret.append(sid)
+            freedSize += s
+            freedInodes += i
+        logger.debug('Removing {} will free about {:.1f} MiB and {} inodes'.format(
+                     ret, freedSize / 1024 / 1024, freedInodes),
+                     self)
+        return ret
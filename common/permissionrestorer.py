@@ -0,0 +1,228 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+import gettext
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import logger
+
+_ = gettext.gettext
+
+
+class PermissionRestorer(object):
+    """
+    Restore owner, group and mode of restored files with a pool of worker
+    threads. Items are grouped by their parent folder which is opened once
+    with ``O_PATH``, so every item only needs one ``fstatat`` and the
+    necessary ``fchownat``/``fchmodat`` relative to that folder. The result
+    of ``chown`` is derived from the first ``stat`` instead of checking the
+    file again. Items which already have the right owner, group and mode are
+    skipped without any further syscall.
+
+    Items are consumed as a stream in chunks of :py:data:`BATCH`, so they can
+    come straight from :py:func:`snapshots.SID.iterFileInfo`. Folders
+    (recognized by the mode from fileinfo) are held back and restored after
+    all files, deepest first, so changing the mode of a folder can't lock out
+    the workers from items inside it.
+    Symlinks only get their owner restored because Linux has no mode for
+    symlinks.
+
+    Args:
+        report (method):    called with ``ok`` and a message like
+                            ``chmod /foo 0644`` for every change.
+                            Calls are serialized.
+        workers (int):      number of worker threads
+    """
+    DIRFLAGS = getattr(os, 'O_PATH', os.O_RDONLY) | os.O_DIRECTORY
+    WORKERS = 8
+    BATCH = 1024
+    SETID = stat.S_ISUID | stat.S_ISGID
+
+    def __init__(self, report = None, workers = WORKERS):
+        self.reportCallback = report
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.items = 0
+        self.changed = 0
+        self.skipped = 0
+
+    def report(self, ok, msg):
+        with self.lock:
+            if ok:
+                self.changed += 1
+            if self.reportCallback is not None:
+                self.reportCallback(ok, msg)
+
+    def restore(self, items, dirs = ()):
+        """
+        Restore permissions of all files in ``items`` and then of all
+        folders in ``items`` and ``dirs``.
+
+        Args:
+            items (iterable):   ``(path, mode, uid, gid)`` tuples with full
+                                path as :py:class:`bytes`. ``uid`` or ``gid``
+                                of -1 will not be changed
+            dirs (iterable):    additional folders in the same format
+        """
+        folders = {}
+        def files():
+            for item in items:
+                if stat.S_ISDIR(item[1]):
+                    folders[item[0]] = item
+                else:
+                    yield item
+        with ThreadPoolExecutor(max(self.workers, 1)) as executor:
+            self.restoreParallel(executor, files())
+            for item in dirs:
+                folders[item[0]] = item
+            byDepth = {}
+            for path, item in folders.items():
+                byDepth.setdefault(path.rstrip(b'/').count(b'/'), []).append(item)
+            for depth in sorted(byDepth, reverse = True):
+                self.restoreParallel(executor, byDepth[depth])
+        logger.debug('Restored permissions of {} items: {} changes, {} already up to date'.format(
+                     self.items, self.changed, self.skipped),
+                     self)
+
+    def restoreParallel(self, executor, items):
+        """
+        Restore ``items`` in ``executor`` and wait until all are done.
+        Items are taken in chunks of :py:data:`BATCH` and grouped by their
+        parent folder. Only a few chunks are queued at once.
+        """
+        pending = deque()
+        for chunk in self.chunks(items):
+            for folder, entries in self.groupByFolder(chunk).items():
+                pending.append(executor.submit(self.restoreFolder, folder, entries))
+            while len(pending) > 2 * self.workers:
+                pending.popleft().result()
+        while pending:
+            pending.popleft().result()
+
+    def chunks(self, items):
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= self.BATCH:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def groupByFolder(self, items):
+        """
+        Group ``items`` by their parent folder.
+
+        Returns:
+            dict:   full folder path as key and list of ``(name, mode, uid,
+                    gid)`` as value
+        """
+        folders = OrderedDict()
+        for path, mode, uid, gid in items:
+            self.items += 1
+            folder, name = os.path.split(path.rstrip(b'/') or b'/')
+            if not name:
+                folder, name = path, b'.'
+            folders.setdefault(folder, []).append((name, mode, uid, gid))
+        return folders
+
+    def restoreFolder(self, folder, entries):
+        """
+        Restore all ``entries`` inside ``folder``.
+
+        Args:
+            folder (bytes): full path of the parent folder
+            entries (list): ``(name, mode, uid, gid)`` tuples
+        """
+        try:
+            fd = os.open(folder, self.DIRFLAGS)
+        except OSError as e:
+            logger.debug('Failed to open {}: {}'.format(folder, str(e)), self)
+            return
+        try:
+            for entry in entries:
+                self.restoreItem(fd, folder, *entry)
+        finally:
+            os.close(fd)
+
+    def restoreItem(self, fd, folder, name, mode, uid, gid):
+        """
+        Restore one item. If ``chown`` fails (most probably because we are
+        not running as root) try to at least ``chgrp`` to the new group.
+
+        Args:
+            fd (int):       file descriptor of ``folder``
+            folder (bytes): full path of the parent folder
+            name (bytes):   name of the item inside ``folder``
+            mode (int):     mode from fileinfo
+            uid (int):      new owner or -1
+            gid (int):      new group or -1
+        """
+        try:
+            st = os.stat(name, dir_fd = fd, follow_symlinks = False)
+        except OSError:
+            return
+        path = os.path.join(folder, name).decode(errors = 'ignore')
+        curGid = st.st_gid
+        curMode = stat.S_IMODE(st.st_mode)
+        isDir = stat.S_ISDIR(st.st_mode)
+        done = True
+
+        if uid != -1 or gid != -1:
+            ok = False
+            if uid != st.st_uid:
+                done = False
+                try:
+                    os.chown(name, uid, gid, dir_fd = fd, follow_symlinks = False)
+                    ok = True
+                except OSError:
+                    pass
+                self.report(ok, "chown %s %s : %s" % (path, uid, gid))
+                if ok and gid != -1:
+                    curGid = gid
+            #if restore uid/gid failed try to restore at least gid
+            if not ok and gid != curGid:
+                done = False
+                try:
+                    os.chown(name, -1, gid, dir_fd = fd, follow_symlinks = False)
+                    ok = True
+                except OSError:
+                    pass
+                self.report(ok, "chgrp %s %s" % (path, gid))
+            if ok and not isDir:
+                # the kernel drops setuid/setgid bits on chown
+                curMode &= ~self.SETID
+
+        #restore perms
+        if stat.S_ISLNK(st.st_mode):
+            pass
+        elif stat.S_IMODE(mode) != curMode:
+            done = False
+            ok = False
+            try:
+                os.chmod(name, stat.S_IMODE(mode), dir_fd = fd)
+                ok = True
+            except OSError:
+                pass
+            self.report(ok, "chmod %s %04o" % (path, mode))
+        if done:
+            with self.lock:
+                self.skipped += 1
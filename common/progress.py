@@ -15,25 +15,279 @@
 #    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 import os
+import re
+import mmap
+import time
+import struct
+import threading
+from collections import namedtuple
 
-import configfile
+#: Current progress of a running rsync.
+#:
+#: ``sent`` (bytes), ``speed`` (bytes per second), ``eta`` (seconds, ``-1`` if
+#: unknown) and ``files`` (transferred files) are parsed from rsync's output
+#: and therefore only approximate. ``sentText``, ``speedText`` and
+#: ``etaText`` are the unchanged strings as rsync printed them.
+Progress = namedtuple('Progress', ('status', 'percent', 'sent', 'speed', 'eta',
+                                   'files', 'sentText', 'speedText', 'etaText'))
 
-class ProgressFile(configfile.ConfigFile):
+RSYNC = 50
 
-    RSYNC           = 50
+MAGIC = b'BITP'
+VERSION = 1
+# magic, version, sequence counter
+_HEADER = struct.Struct('<4sIQ')
+_SEQ_OFFSET = 8
+_PAYLOAD = struct.Struct('<iiqdqq16s16s16s')
+SIZE = _HEADER.size + _PAYLOAD.size
+
+_UNITS = {'': 1, 'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3, 'T': 1000 ** 4}
+_reSize = re.compile(r'^(-?[\d,\.]*\d)([KkMGT]?)')
+_reXfr = re.compile(r'xfr#(\d+)')
+
+def parseSize(value):
+    """
+    Convert a size printed by rsync (with ``--human-readable``) into bytes.
+
+    Args:
+        value (str):    size like '517.38K', '1,234' or '14.46MB/s'
+
+    Returns:
+        float:          size in bytes
+    """
+    m = _reSize.match(value.strip())
+    if not m:
+        return 0.0
+    number, unit = m.groups()
+    if unit:
+        # a separator in front of a unit is always the decimal point
+        number = number.replace(',', '.')
+    else:
+        number = number.replace(',', '').replace('.', '')
+    try:
+        return float(number) * _UNITS[unit.upper()]
+    except ValueError:
+        return 0.0
+
+def parseEta(value):
+    """
+    Convert rsync's estimated time of arrival into seconds.
+
+    Args:
+        value (str):    time like '0:02:36' or '??:??:??'
+
+    Returns:
+        int:            seconds or ``-1`` if unknown
+    """
+    try:
+        h, m, s = value.split(':')
+        return int(h) * 3600 + int(m) * 60 + int(s)
+    except ValueError:
+        return -1
+
+def fromRsync(match):
+    """
+    Create a :py:data:`Progress` from a match of
+    :py:data:`snapshots.Snapshots.reRsyncProgress`.
+
+    Args:
+        match (re.Match):   match with groups sent, percent, speed, ETA and
+                            the rest of the line
+
+    Returns:
+        Progress:           current progress. Lines printed after a file was
+                            transferred show the run time instead of the ETA,
+                            in that case the ETA is ``-1``
+    """
+    sent, percent, speed, eta, tail = match.groups()
+    xfr = _reXfr.search(tail)
+    if xfr:
+        files = int(xfr.group(1))
+        eta = ''
+    else:
+        files = -1
+    return Progress(RSYNC,
+                    int(percent or 0),
+                    int(parseSize(sent)),
+                    parseSize(speed),
+                    parseEta(eta),
+                    files,
+                    sent,
+                    speed,
+                    eta)
+
+class ProgressPublisher(object):
+    """
+    Publish the progress of a running snapshot to the GUI and systray icon.
+
+    The progress is written into a fixed-layout record in a memory mapped
+    file ('~/.local/share/backintime/worker<N>.progress'). Updates are rate
+    limited to :py:data:`RATE` per second, rsync can print hundreds of
+    progress lines per second. The record is protected by a sequence counter
+    (odd while writing) so :py:class:`ProgressReader` never sees a half
+    written record.
+
+    Args:
+        cfg (config.Config):    current config
+        filename (str):         file for the record. Default is
+                                :py:func:`config.Config.takeSnapshotProgressFile`
+                                for the current profile
+        rate (float):           maximum updates per second
+    """
+    RATE = 4
+
+    def __init__(self, cfg, filename = None, rate = RATE):
+        self.config = cfg
+        self.filename = filename
+        self.current = None
+        self.interval = 1.0 / rate
+        self.mmap = None
+        self.seq = 0
+        self.last = 0.0
+        self.pending = None
+
+    def open(self):
+        """
+        Create the record file and map it into memory. The file is created
+        under a temporary name and renamed, so readers which still have an
+        old file mapped never see it shrinking.
+        """
+        self.current = self.filename or self.config.takeSnapshotProgressFile()
+        tmp = self.current + '.tmp'
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, SIZE)
+            self.mmap = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+        self.seq = 0
+        _HEADER.pack_into(self.mmap, 0, MAGIC, VERSION, self.seq)
+        os.replace(tmp, self.current)
+
+    def close(self):
+        """
+        Unmap the record. The file is left for the caller to remove.
+        """
+        self.pending = None
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def update(self, pg):
+        """
+        Set new progress. It will be published immediately unless the last
+        update was less than 1 / :py:data:`RATE` seconds ago. Otherwise it is
+        kept until the next call of :py:func:`update` or :py:func:`flush`.
+
+        Args:
+            pg (Progress):  current progress
+        """
+        self.pending = pg
+        if time.monotonic() - self.last >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Publish pending progress now.
+        """
+        pg = self.pending
+        if pg is None:
+            return
+        if self.mmap is None or not os.path.exists(self.current):
+            self.close()
+            self.open()
+        self.pending = None
+        self.last = time.monotonic()
+        self.seq += 1
+        struct.pack_into('<Q', self.mmap, _SEQ_OFFSET, self.seq)
+        _PAYLOAD.pack_into(self.mmap, _HEADER.size,
+                           pg.status, pg.percent, pg.sent, pg.speed, pg.eta, pg.files,
+                           pg.sentText.encode('utf-8')[:16],
+                           pg.speedText.encode('utf-8')[:16],
+                           pg.etaText.encode('utf-8')[:16])
+        self.seq += 1
+        struct.pack_into('<Q', self.mmap, _SEQ_OFFSET, self.seq)
+
+class ProgressReader(object):
+    """
+    Read the progress published by :py:class:`ProgressPublisher` without
+    parsing any file. The mapping is kept open as long as the file exists.
+
+    Args:
+        cfg (config.Config):    current config
+        filename (str):         file with the record. Default is
+                                :py:func:`config.Config.takeSnapshotProgressFile`
+                                for the current profile
+    """
+    RETRIES = 100
 
     def __init__(self, cfg, filename = None):
-        super(ProgressFile, self).__init__()
         self.config = cfg
         self.filename = filename
-        if self.filename is None:
-            self.filename = self.config.takeSnapshotProgressFile()
+        self.mmap = None
+        self.mapped = None
+        self.lock = threading.Lock()
+
+    def close(self):
+        """
+        Unmap the record.
+        """
+        if self.mmap is not None:
+            self.mmap.close()
+        self.mmap = None
+        self.mapped = None
+
+    def map(self, filename):
+        """
+        Map ``filename`` if it isn't mapped already.
+
+        Args:
+            filename (str): file with the record
 
-    def save(self):
-        return super(ProgressFile, self).save(self.filename)
+        Returns:
+            bool:           ``True`` if the record is mapped
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            self.close()
+            return False
+        if self.mapped == (filename, st.st_dev, st.st_ino):
+            return True
+        self.close()
+        if st.st_size < SIZE:
+            return False
+        try:
+            with open(filename, 'rb') as f:
+                self.mmap = mmap.mmap(f.fileno(), SIZE, access = mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        self.mapped = (filename, st.st_dev, st.st_ino)
+        return True
 
-    def load(self):
-        return super(ProgressFile, self).load(self.filename)
+    def read(self):
+        """
+        Current progress.
 
-    def fileReadable(self):
-        return os.access(self.filename, os.R_OK)
+        Returns:
+            Progress:   current progress or ``None`` if there is no snapshot
+                        or restore running which published its progress
+        """
+        filename = self.filename or self.config.takeSnapshotProgressFile()
+        with self.lock:
+            if not self.map(filename):
+                return None
+            for i in range(self.RETRIES):
+                magic, version, seq = _HEADER.unpack_from(self.mmap, 0)
+                if magic != MAGIC or version != VERSION or not seq:
+                    return None
+                if seq % 2:
+                    time.sleep(0.0001)
+                    continue
+                values = _PAYLOAD.unpack_from(self.mmap, _HEADER.size)
+                if struct.unpack_from('<Q', self.mmap, _SEQ_OFFSET)[0] == seq:
+                    break
+            else:
+                return None
+        texts = [i.rstrip(b'\0').decode('utf-8', 'replace') for i in values[6:]]
+        return Progress(*(values[:6] + tuple(texts)))
@@ -0,0 +1,495 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import io
+import os
+import json
+import time
+import base64
+import threading
+import subprocess
+
+import logger
+
+# Helper running on the remote host. It reads one JSON request per line from
+# stdin and answers with one JSON line on stdout. Keep this compatible with
+# old Python 3 versions on the remote host.
+HELPER = r'''
+import os
+import re
+import sys
+import json
+import base64
+
+VERSION = 1
+SID = re.compile(r'^(\d{8}-\d{6}(?:-\d{3})?|new_snapshot)$')
+
+def doStat(paths, follow = True):
+    ret = []
+    for path in paths:
+        try:
+            st = os.stat(path) if follow else os.lstat(path)
+        except OSError:
+            ret.append(None)
+            continue
+        ret.append([st.st_mode, st.st_size, st.st_mtime_ns,
+                    st.st_atime, st.st_ino, st.st_nlink])
+    return ret
+
+def doListdir(path):
+    return sorted(os.listdir(path))
+
+def doRead(path, offset = 0, size = -1):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return base64.b64encode(f.read(size)).decode('ascii')
+
+def doSnapshot(path):
+    entry = {'exists': os.path.isdir(os.path.join(path, 'backup')),
+             'name':   '',
+             'failed': os.path.isfile(os.path.join(path, 'failed')),
+             'info':   None,
+             'transfer': None}
+    try:
+        with open(os.path.join(path, 'name'), 'rb') as f:
+            entry['name'] = f.read().decode('utf-8', 'surrogateescape')
+    except OSError:
+        pass
+    try:
+        entry['info'] = os.stat(os.path.join(path, 'info')).st_atime
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(path, 'transfer.json'), 'rb') as f:
+            entry['transfer'] = json.loads(f.read().decode('utf-8'))
+    except (OSError, ValueError):
+        pass
+    return entry
+
+def doSnapshots(path):
+    st = os.stat(path)
+    names = doListdir(path)
+    entries = {}
+    for name in names:
+        if SID.match(name):
+            entries[name] = doSnapshot(os.path.join(path, name))
+    return {'stamp':   [st.st_mtime_ns, st.st_nlink],
+            'names':   names,
+            'entries': entries}
+
+def doVersion():
+    return VERSION
+
+COMMANDS = {'stat':      doStat,
+            'listdir':   doListdir,
+            'read':      doRead,
+            'snapshot':  doSnapshot,
+            'snapshots': doSnapshots,
+            'version':   doVersion}
+
+def main():
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+    while True:
+        line = stdin.readline()
+        if not line:
+            break
+        try:
+            request = json.loads(line.decode('utf-8'))
+            ret = {'result': COMMANDS[request['cmd']](**request['args'])}
+        except OSError as e:
+            ret = {'errno': e.errno, 'error': str(e)}
+        except Exception as e:
+            ret = {'errno': None, 'error': repr(e)}
+        stdout.write(json.dumps(ret).encode('utf-8') + b'\n')
+        stdout.flush()
+
+main()
+'''
+
+class RemoteHelper(object):
+    """
+    Answer listing, stat and read requests for the remote snapshot path over
+    one ssh channel instead of going through the ``sshfs`` mount, which needs
+    at least one SFTP round trip for every single file. The helper is a small
+    Python script (:py:data:`HELPER`) which is sent to the remote host on
+    start and reads batched requests from stdin.
+
+    All requests raise :py:class:`OSError` (or the matching subclass like
+    :py:class:`FileNotFoundError`) on failure. If the helper died it will be
+    restarted once.
+
+    Metadata of all snapshots read with :py:func:`snapshots` is kept for
+    :py:data:`ENTRIES_TTL` seconds so :py:func:`cachedSnapshot` can answer
+    lookups for single snapshots without another round trip.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID that should be used
+    """
+    BUFFER_SIZE = 1024 * 1024
+    ENTRIES_TTL = 2
+
+    def __init__(self, cfg, profile_id = None):
+        self.config = cfg
+        self.profile_id = profile_id
+        self.proc = None
+        self.lock = threading.Lock()
+        self.entriesCache = {}
+
+    def command(self, size):
+        """
+        Command to start the helper on the remote host.
+
+        Args:
+            size (int): length of :py:data:`HELPER` in bytes
+
+        Returns:
+            list:       ssh command
+        """
+        bootstrap = 'import sys;exec(sys.stdin.buffer.read({}))'.format(size)
+        return self.config.sshCommand(['python3', '-c', "'{}'".format(bootstrap)],
+                                      nice = False,
+                                      ionice = False,
+                                      profile_id = self.profile_id)
+
+    def start(self):
+        """
+        Start the helper on the remote host.
+        """
+        src = HELPER.encode('utf-8')
+        cmd = self.command(len(src))
+        logger.debug('Start remote helper: {}'.format(' '.join(cmd)), self)
+        self.proc = subprocess.Popen(cmd,
+                                     stdin = subprocess.PIPE,
+                                     stdout = subprocess.PIPE,
+                                     stderr = subprocess.DEVNULL)
+        self.proc.stdin.write(src)
+        self.proc.stdin.flush()
+
+    def close(self):
+        """
+        Stop the helper.
+        """
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout = 5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def request(self, cmd, **kwargs):
+        """
+        Send one request to the helper and wait for the answer.
+
+        Args:
+            cmd (str):      command
+            **kwargs:       arguments for the command
+
+        Returns:
+            result of the command
+
+        Raises:
+            OSError:        if the command failed on the remote host or the
+                            helper is not available
+        """
+        data = json.dumps({'cmd': cmd, 'args': kwargs}).encode('utf-8') + b'\n'
+        with self.lock:
+            for retry in (True, False):
+                if self.proc is None or self.proc.poll() is not None:
+                    self.start()
+                try:
+                    self.proc.stdin.write(data)
+                    self.proc.stdin.flush()
+                    line = self.proc.stdout.readline()
+                except OSError:
+                    line = b''
+                if line:
+                    break
+                self.close()
+                if not retry:
+                    raise OSError('Remote helper is not available')
+        ret = json.loads(line.decode('utf-8'))
+        if 'error' in ret:
+            raise OSError(ret['errno'], ret['error'])
+        return ret['result']
+
+    def version(self):
+        """
+        Protocol version of the helper. Used to check if the helper works.
+
+        Returns:
+            int:    version
+        """
+        return self.request('version')
+
+    def stat(self, paths, follow_symlinks = True):
+        """
+        Stat many files with one request.
+
+        Args:
+            paths (list):           full remote paths
+            follow_symlinks (bool): if ``False`` use ``lstat``
+
+        Returns:
+            list:                   for each path either ``None`` if it
+                                    doesn't exist or a list of
+                                    ``[mode, size, mtime in ns, atime, inode,
+                                    number of links]``
+        """
+        return self.request('stat', paths = list(paths), follow = follow_symlinks)
+
+    def listdir(self, path):
+        """
+        Sorted content of a remote folder.
+
+        Args:
+            path (str): full remote path
+
+        Returns:
+            list:       file and folder names
+        """
+        return self.request('listdir', path = path)
+
+    def read(self, path, offset = 0, size = -1):
+        """
+        Read (part of) a remote file.
+
+        Args:
+            path (str):     full remote path
+            offset (int):   start reading at this position
+            size (int):     number of bytes to read. ``-1`` read until the end
+
+        Returns:
+            bytes:          file content
+        """
+        return base64.b64decode(self.request('read', path = path, offset = offset, size = size))
+
+    def open(self, path):
+        """
+        Open a remote file for (buffered) binary reading.
+
+        Args:
+            path (str): full remote path
+
+        Returns:
+            io.BufferedReader:  file object
+
+        Raises:
+            FileNotFoundError:  if ``path`` doesn't exist
+        """
+        return io.BufferedReader(RemoteFile(self, path), self.BUFFER_SIZE)
+
+    def entry(self, sid, raw):
+        """
+        Convert snapshot metadata from the helper into the format used by
+        :py:class:`snapshotcatalog.SnapshotCatalog`.
+
+        Args:
+            sid (snapshots.SID):    snapshot
+            raw (dict):             metadata from the helper
+
+        Returns:
+            dict:                   'name', 'failed', 'lastChecked' and
+                                    'transfer'
+        """
+        if raw['info'] is None:
+            lastChecked = sid.displayID
+        else:
+            lastChecked = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(raw['info']))
+        return {'name':        raw['name'],
+                'failed':      raw['failed'],
+                'lastChecked': lastChecked,
+                'transfer':    raw.get('transfer')}
+
+    def snapshot(self, path):
+        """
+        Metadata of one snapshot.
+
+        Args:
+            path (str): full remote path of the snapshot
+
+        Returns:
+            dict:       'exists', 'name', 'failed', 'info' (atime of the
+                        info file or ``None``) and 'transfer' (content of
+                        'transfer.json' or ``None``)
+        """
+        return self.request('snapshot', path = path)
+
+    def snapshots(self, path):
+        """
+        Metadata of all snapshots in the snapshot path with one request.
+
+        Args:
+            path (str): full remote snapshot path
+
+        Returns:
+            dict:       'stamp' (mtime in ns and number of links of ``path``),
+                        'names' (sorted content of ``path``) and 'entries'
+                        (metadata from :py:func:`snapshot` for all snapshot
+                        folders)
+        """
+        ret = self.request('snapshots', path = path)
+        self.entriesCache[path.rstrip('/')] = (time.monotonic(), ret['entries'])
+        return ret
+
+    def cachedSnapshot(self, path):
+        """
+        Metadata of one snapshot like :py:func:`snapshot`. All snapshots in
+        the same folder are read with one :py:func:`snapshots` request which
+        is reused for :py:data:`ENTRIES_TTL` seconds.
+
+        Args:
+            path (str): full remote path of the snapshot
+
+        Returns:
+            dict:       same as :py:func:`snapshot`
+        """
+        parent, name = os.path.split(path.rstrip('/'))
+        cached = self.entriesCache.get(parent)
+        if cached is None or time.monotonic() - cached[0] > self.ENTRIES_TTL:
+            entries = self.snapshots(parent)['entries']
+        else:
+            entries = cached[1]
+        entry = entries.get(name)
+        if entry is None:
+            return {'exists':   False,
+                    'name':     '',
+                    'failed':   False,
+                    'info':     None,
+                    'transfer': None}
+        return entry
+
+    def invalidate(self):
+        """
+        Drop metadata cached by :py:func:`snapshots`.
+        """
+        self.entriesCache.clear()
+
+class RemoteFile(io.RawIOBase):
+    """
+    Unbuffered read-only file object for a remote file. Use
+    :py:func:`RemoteHelper.open` to get a buffered version.
+
+    Args:
+        helper (RemoteHelper):  helper used for reading
+        path (str):             full remote path
+
+    Raises:
+        FileNotFoundError:      if ``path`` doesn't exist
+    """
+    def __init__(self, helper, path):
+        super(RemoteFile, self).__init__()
+        self.helper = helper
+        self.name = path
+        self.pos = 0
+        st = helper.stat([path])[0]
+        if st is None:
+            raise FileNotFoundError(2, 'No such file or directory', path)
+        self.size = st[1]
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence = io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def readinto(self, b):
+        data = self.helper.read(self.name, self.pos, len(b))
+        b[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+def helper(cfg):
+    """
+    :py:class:`RemoteHelper` for the current profile. The helper is started
+    once and reused for all later calls.
+
+    Args:
+        cfg (config.Config):    current config
+
+    Returns:
+        RemoteHelper:           helper or ``None`` if the current profile
+                                doesn't use mode 'ssh' or the helper couldn't
+                                be started (e.g. no ``python3`` on the remote
+                                host). Callers should fall back to the
+                                ``sshfs`` mount then.
+    """
+    profile_id = cfg.currentProfile()
+    if cfg.snapshotsMode(profile_id) != 'ssh':
+        return None
+    key = (profile_id,
+           cfg.sshUser(profile_id),
+           cfg.sshHost(profile_id),
+           str(cfg.sshPort(profile_id)))
+    ret = cfg.remoteHelpers.get(key)
+    if ret is None:
+        ret = RemoteHelper(cfg, profile_id)
+        try:
+            ret.version()
+        except OSError as e:
+            logger.warning('Failed to start remote helper, using sshfs instead: {}'.format(str(e)))
+            ret.close()
+            ret = False
+        cfg.remoteHelpers[key] = ret
+    return ret or None
+
+def invalidate(cfg):
+    """
+    Drop cached snapshot metadata of all running helpers. Must be called
+    after snapshots were added, removed or changed.
+
+    Args:
+        cfg (config.Config):    current config
+    """
+    for ret in cfg.remoteHelpers.values():
+        if ret:
+            ret.invalidate()
+
+def close(cfg, user, host, port):
+    """
+    Stop and forget all helpers which use the ssh connection to
+    ``user@host:port``. Used before the ssh master connection is stopped.
+
+    Args:
+        cfg (config.Config):    current config
+        user (str):             remote user
+        host (str):             remote host
+        port (int):             ssh port
+    """
+    for key in [i for i in cfg.remoteHelpers if i[1:] == (user, host, str(port))]:
+        ret = cfg.remoteHelpers.pop(key)
+        if ret:
+            ret.close()
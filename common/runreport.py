@@ -0,0 +1,436 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import re
+import json
+import time
+import datetime
+import resource
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import logger
+import snapshots
+
+#rsync --stats lines (older rsync versions have no thousands separators and
+#call transferred files 'Number of files transferred')
+RSYNC_STATS = (('files',             re.compile(r'^Number of files: ([\d,.]+)')),
+               ('created',           re.compile(r'^Number of created files: ([\d,.]+)')),
+               ('deleted',           re.compile(r'^Number of deleted files: ([\d,.]+)')),
+               ('transferred',       re.compile(r'^Number of (?:regular )?files transferred: ([\d,.]+)')),
+               ('total_size',        re.compile(r'^Total file size: ([\d,.]+) bytes')),
+               ('transferred_size',  re.compile(r'^Total transferred file size: ([\d,.]+) bytes')),
+               ('literal_data',      re.compile(r'^Literal data: ([\d,.]+) bytes')),
+               ('matched_data',      re.compile(r'^Matched data: ([\d,.]+) bytes')),
+               ('file_list_size',    re.compile(r'^File list size: ([\d,.]+)')),
+               ('sent',              re.compile(r'^Total bytes sent: ([\d,.]+)')),
+               ('received',          re.compile(r'^Total bytes received: ([\d,.]+)')))
+#summary lines of rsync -v which are already covered by --stats
+RSYNC_SUMMARY = re.compile(r'^(sent [\d,.]+ bytes\s+received|total size is [\d,.]+\s+speedup is)')
+
+def parseRsyncStats(line):
+    """
+    Parse one line of ``rsync --stats`` output.
+
+    Args:
+        line (str): stdout line from rsync
+
+    Returns:
+        tuple:      ``(key, int)`` for statistic lines, ``(None, None)`` for
+                    summary lines which can be ignored or ``None`` if
+                    ``line`` is no statistic at all
+    """
+    if not line[:1] in ('N', 'T', 'L', 'M', 'F', 's', 't'):
+        return None
+    for key, regex in RSYNC_STATS:
+        m = regex.match(line)
+        if m:
+            return key, int(re.sub(r'[,.]', '', m.group(1)))
+    if RSYNC_SUMMARY.match(line):
+        return None, None
+    return None
+
+#change types counted by TransferMetrics
+CHANGE_TYPES = ('new', 'modified', 'metadata', 'deleted')
+
+def changeType(item):
+    """
+    Classify one change reported by rsync ``--itemize-changes``.
+
+    Args:
+        item (str): itemize flags and file name (``%i %n%L``)
+
+    Returns:
+        str:        one of :py:data:`CHANGE_TYPES` or ``None`` for folders
+                    and other messages
+    """
+    flags, name = item[:11], item[12:]
+    if flags.startswith('*deleting'):
+        if name.endswith('/'):
+            return None
+        return 'deleted'
+    if len(flags) < 11 or flags[1] == 'd' or flags[0] not in '<>ch.':
+        return None
+    if not flags[2:].strip('+'):
+        return 'new'
+    if flags[0] == '.':
+        return 'metadata'
+    return 'modified'
+
+def formatSize(size):
+    """
+    Human readable ``size``.
+
+    Args:
+        size (int): size in bytes
+
+    Returns:
+        str:        size in KiB, MiB or GiB
+    """
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            break
+        size /= 1024
+    if unit == 'B':
+        return '{} B'.format(size)
+    return '{:.1f} {}'.format(size, unit)
+
+def _usage():
+    """
+    Current wall time, CPU time and block I/O of this process and all
+    waited-for child processes (e.g. rsync).
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (time.perf_counter(),
+            own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+            (own.ru_inblock + children.ru_inblock) * 512,
+            (own.ru_oublock + children.ru_oublock) * 512)
+
+class RunReport(object):
+    """
+    Time all phases of one backup run. Every phase records wall time, CPU
+    time and bytes read and written (of Back In Time and rsync, as far as
+    the kernel accounts them to block devices). Statistics reported by
+    ``rsync --stats`` are summed over all rsync processes.
+
+    The report is stored as :py:data:`snapshots.SID.RUNREPORT` inside the
+    new snapshot and appended to a rolling history of the profile
+    (:py:func:`config.Config.runReportHistoryFile`) which is shown by
+    'backintime stats'.
+
+    Args:
+        cfg (config.Config):    current config
+    """
+    VERSION = 1
+    #number of runs kept in history
+    HISTORY = 500
+
+    def __init__(self, cfg):
+        self.config = cfg
+        self.profileID = cfg.currentProfile()
+        self.start = datetime.datetime.now()
+        self.begin = _usage()
+        self.phases = OrderedDict()
+        self.rsync = OrderedDict()
+        self.sid = None
+        self.result = None
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager which measures everything inside as phase ``name``.
+        Phases which run more than once are summed up.
+
+        Args:
+            name (str): name of the phase
+        """
+        start = _usage()
+        try:
+            yield
+        finally:
+            end = _usage()
+            phase = self.phases.setdefault(name, OrderedDict((('wall', 0.0),
+                                                              ('cpu', 0.0),
+                                                              ('read', 0),
+                                                              ('written', 0),
+                                                              ('count', 0))))
+            for key, before, after in zip(('wall', 'cpu', 'read', 'written'), start, end):
+                phase[key] += after - before
+            phase['count'] += 1
+
+    def addRsyncStat(self, key, value):
+        """
+        Add one statistic from :py:func:`parseRsyncStats`.
+        """
+        self.rsync[key] = self.rsync.get(key, 0) + value
+
+    def toDict(self):
+        """
+        Report as dict which can be stored as JSON.
+        """
+        end = _usage()
+        rsync = OrderedDict(self.rsync)
+        transferred = rsync.get('sent', 0) + rsync.get('received', 0)
+        if 'total_size' in rsync and transferred:
+            rsync['speedup'] = round(rsync['total_size'] / transferred, 2)
+        phases = OrderedDict()
+        for name, phase in self.phases.items():
+            phases[name] = OrderedDict((key, round(value, 3) if isinstance(value, float) else value)
+                                       for key, value in phase.items())
+        return OrderedDict((('version',     self.VERSION),
+                            ('profile',     self.profileID),
+                            ('snapshot',    str(self.sid) if self.sid else None),
+                            ('result',      self.result),
+                            ('start',       self.start.isoformat(timespec = 'seconds')),
+                            ('wall',        round(end[0] - self.begin[0], 3)),
+                            ('cpu',         round(end[1] - self.begin[1], 3)),
+                            ('read',        end[2] - self.begin[2]),
+                            ('written',     end[3] - self.begin[3]),
+                            ('maxrss',      resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024),
+                            ('phases',      phases),
+                            ('rsync',       rsync)))
+
+    def save(self, sid):
+        """
+        Write the report into snapshot ``sid``.
+
+        Args:
+            sid (snapshots.SID):    new snapshot
+        """
+        self.sid = sid
+        try:
+            with open(sid.path(snapshots.SID.RUNREPORT), 'wt') as f:
+                json.dump(self.toDict(), f, indent = 2)
+        except OSError as e:
+            logger.warning('Failed to write run report into {}: {}'.format(sid, str(e)), self)
+
+    def appendHistory(self):
+        """
+        Append the report to the history file of the profile. The history is
+        rewritten with only the last :py:data:`HISTORY` runs if it grew to
+        twice that size.
+        """
+        filename = self.config.runReportHistoryFile(self.profileID)
+        line = json.dumps(self.toDict()) + '\n'
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok = True)
+            with open(filename, 'at') as f:
+                f.write(line)
+            with open(filename, 'rt') as f:
+                lines = f.readlines()
+            if len(lines) > 2 * self.HISTORY:
+                tmp = filename + '.tmp'
+                with open(tmp, 'wt') as f:
+                    f.writelines(lines[-self.HISTORY:])
+                os.replace(tmp, filename)
+        except OSError as e:
+            logger.warning('Failed to write run report history {}: {}'.format(filename, str(e)), self)
+
+class TransferMetrics(object):
+    """
+    Size and churn of one snapshot: number and size of new, modified,
+    metadata-only changed and deleted files reported by rsync's itemized
+    output plus the totals of ``rsync --stats``. Folders are not counted.
+    Sizes are only summed for new and modified files because nothing else
+    was transferred.
+
+    The metrics are stored as :py:data:`snapshots.SID.TRANSFER` in every
+    snapshot and kept in the snapshot catalog, so listings can show them
+    without reading the snapshot log. A resumed snapshot merges the
+    metrics of the interrupted session first (see :py:func:`merge`).
+    """
+    VERSION = 1
+    # describe the source, not the transfer. Only the last session counts
+    SOURCE_STATS = ('files', 'total_size')
+
+    def __init__(self):
+        self.changes = OrderedDict((i, OrderedDict((('count', 0), ('size', 0))))
+                                   for i in CHANGE_TYPES)
+        self.rsync = OrderedDict()
+
+    def addChange(self, item, size):
+        """
+        Count one change reported by rsync.
+
+        Args:
+            item (str):     itemize flags and file name (``%i %n%L``)
+            size (int):     file size
+        """
+        kind = changeType(item)
+        if kind is None:
+            return
+        self.add(kind, size)
+
+    def add(self, kind, size = 0):
+        """
+        Count one change of type ``kind``.
+
+        Args:
+            kind (str):     one of :py:data:`CHANGE_TYPES`
+            size (int):     file size
+        """
+        change = self.changes[kind]
+        change['count'] += 1
+        if kind in ('new', 'modified'):
+            change['size'] += size
+
+    def addRsyncStat(self, key, value):
+        """
+        Add one statistic from :py:func:`parseRsyncStats`.
+        """
+        self.rsync[key] = self.rsync.get(key, 0) + value
+
+    def merge(self, filename):
+        """
+        Add the metrics of an earlier session of the same snapshot stored in
+        ``filename``. Statistics in :py:data:`SOURCE_STATS` are not merged
+        because the current session will report them again.
+
+        Args:
+            filename (str): full path of :py:data:`snapshots.SID.TRANSFER`
+
+        Returns:
+            bool:           ``True`` if there were valid metrics to merge
+        """
+        try:
+            with open(filename, 'rt') as f:
+                metrics = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning('Failed to read transfer metrics {}: {}'.format(filename, str(e)), self)
+            return False
+        if not isinstance(metrics, dict) or metrics.get('version') != self.VERSION:
+            return False
+        for kind, change in metrics.get('changes', {}).items():
+            if kind in self.changes:
+                self.changes[kind]['count'] += change.get('count', 0)
+                self.changes[kind]['size'] += change.get('size', 0)
+        for key, value in metrics.get('rsync', {}).items():
+            if key not in self.SOURCE_STATS:
+                self.addRsyncStat(key, value)
+        return True
+
+    def toDict(self):
+        """
+        Metrics as dict which can be stored as JSON.
+        """
+        return OrderedDict((('version', self.VERSION),
+                            ('changes', self.changes),
+                            ('rsync',   self.rsync)))
+
+    def save(self, filename):
+        """
+        Write the metrics to ``filename``.
+
+        Args:
+            filename (str): full path of :py:data:`snapshots.SID.TRANSFER`
+        """
+        try:
+            with open(filename, 'wt') as f:
+                json.dump(self.toDict(), f)
+        except OSError as e:
+            logger.warning('Failed to write transfer metrics {}: {}'.format(filename, str(e)), self)
+
+def formatTransfer(metrics):
+    """
+    One line summary of transfer metrics.
+
+    Args:
+        metrics (dict): metrics from :py:func:`snapshots.SID.transferMetrics`
+
+    Returns:
+        str:            summary like '12 new, 3 modified (4.2 MiB),
+                        1 metadata, 0 deleted of 2.1 GiB'
+    """
+    changes = metrics.get('changes', {})
+    count = lambda kind: changes.get(kind, {}).get('count', 0)
+    churn = sum(changes.get(kind, {}).get('size', 0) for kind in ('new', 'modified'))
+    ret = '{} new, {} modified ({}), {} metadata, {} deleted'.format(
+          count('new'), count('modified'), formatSize(churn),
+          count('metadata'), count('deleted'))
+    total = metrics.get('rsync', {}).get('total_size')
+    if total is not None:
+        ret += ' of {}'.format(formatSize(total))
+    return ret
+
+def history(cfg, profile_id = None):
+    """
+    All runs from the history file of a profile.
+
+    Args:
+        cfg (config.Config):    current config
+        profile_id (str):       profile ID
+
+    Returns:
+        list:                   reports as dict, oldest first
+    """
+    ret = []
+    try:
+        with open(cfg.runReportHistoryFile(profile_id), 'rt') as f:
+            for line in f:
+                try:
+                    report = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(report, dict) and report.get('version') == RunReport.VERSION:
+                    ret.append(report)
+    except FileNotFoundError:
+        pass
+    return ret
+
+def trends(reports, window = 5):
+    """
+    Compare average wall time of every phase in the last ``window`` runs
+    with the ``window`` runs before.
+
+    Args:
+        reports (list): reports from :py:func:`history`, oldest first
+        window (int):   number of runs to average
+
+    Returns:
+        list:           ``(phase, previous, recent, change)`` tuples with
+                        average seconds and change in percent (``None`` if
+                        there is no previous average)
+    """
+    recent = reports[-window:]
+    previous = reports[-2 * window:-window]
+    def average(runs, name):
+        values = [r['wall'] if name == 'total' else r['phases'][name]['wall']
+                  for r in runs if name == 'total' or name in r.get('phases', {})]
+        if not values:
+            return None
+        return sum(values) / len(values)
+    names = ['total']
+    for report in reports:
+        for name in report.get('phases', {}):
+            if name not in names:
+                names.append(name)
+    ret = []
+    for name in names:
+        new = average(recent, name)
+        if new is None:
+            continue
+        old = average(previous, name)
+        change = None
+        if old:
+            change = (new - old) / old * 100
+        ret.append((name, old, new, change))
+    return ret
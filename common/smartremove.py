@@ -0,0 +1,190 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import datetime
+
+import logger
+
+
+class SmartRemovePlanner(object):
+    """
+    Decide which snapshots Smart-Remove will keep and which it will remove.
+
+    Every snapshot is assigned to all its day, week, month and year buckets
+    in a single pass over the sorted snapshot list. For each bucket the
+    newest healthy snapshot (or the newest at all, if every snapshot in that
+    bucket failed) is kept. 'failed' and 'name' flags are loaded only once per
+    snapshot (which is free for snapshots listed from the snapshot catalog).
+
+    Weeks start on Sunday and span eight days up to the following Monday, so
+    a snapshot taken on Sunday or Monday can be in two week buckets.
+
+    Args:
+        cfg (config.Config):            current config
+        now (datetime.datetime):        date and time when takeSnapshot was
+                                        started
+        keep_all (int):                 keep all snapshots for the
+                                        last ``keep_all`` days
+        keep_one_per_day (int):         keep one snapshot per day for the
+                                        last ``keep_one_per_day`` days
+        keep_one_per_week (int):        keep one snapshot per week for the
+                                        last ``keep_one_per_week`` weeks
+        keep_one_per_month (int):       keep one snapshot per month for the
+                                        last ``keep_one_per_month`` months
+    """
+    DAY   = 'day'
+    WEEK  = 'week'
+    MONTH = 'month'
+    YEAR  = 'year'
+
+    def __init__(self,
+                 cfg,
+                 now,
+                 keep_all,
+                 keep_one_per_day,
+                 keep_one_per_week,
+                 keep_one_per_month):
+        self.config = cfg
+        if now is None:
+            now = datetime.datetime.today()
+        self.now = now.date()
+        self.keepAll = keep_all
+        self.keepOnePerDay = keep_one_per_day
+        self.keepOnePerWeek = keep_one_per_week
+        self.keepOnePerMonth = keep_one_per_month
+
+        # Sunday before today, start of the most recent week bucket
+        self.firstWeek = self.now - datetime.timedelta(days = self.now.weekday() + 1)
+
+    def buckets(self, date):
+        """
+        All buckets ``date`` belongs to.
+
+        Args:
+            date (datetime.date):   date of a snapshot
+
+        Yields:
+            tuple:                  bucket type and its start date
+                                    (or year for year buckets)
+        """
+        age = (self.now - date).days
+        if 0 <= age < self.keepOnePerDay:
+            yield (self.DAY, date)
+
+        # week k spans 'firstWeek - 7k' to 'firstWeek - 7k + 8 days'
+        offset = (self.firstWeek - date).days
+        for k in range(max(0, -(-offset // 7)), min(self.keepOnePerWeek, (offset + 7) // 7 + 1)):
+            yield (self.WEEK, self.firstWeek - datetime.timedelta(days = 7 * k))
+
+        months = (self.now.year - date.year) * 12 + self.now.month - date.month
+        if 0 <= months < self.keepOnePerMonth:
+            yield (self.MONTH, datetime.date(date.year, date.month, 1))
+
+        if date.year <= self.now.year:
+            yield (self.YEAR, date.year)
+
+    def describe(self, bucket):
+        """
+        Human readable reason for keeping the snapshot of ``bucket``.
+
+        Args:
+            bucket (tuple): bucket from :py:func:`buckets`
+
+        Returns:
+            str:            reason
+        """
+        kind, start = bucket
+        if kind == self.DAY:
+            return 'first of day {}'.format(start)
+        if kind == self.WEEK:
+            return 'first of week {} - {}'.format(start, start + datetime.timedelta(days = 7))
+        if kind == self.MONTH:
+            return 'first of month {:%Y-%m}'.format(start)
+        return 'first of year {}'.format(start)
+
+    def plan(self, snapshots):
+        """
+        Decide for every snapshot in ``snapshots`` whether it should be kept.
+
+        Args:
+            snapshots (list):   :py:class:`snapshots.SID` objects in any order
+
+        Returns:
+            list:               tuples of (:py:class:`snapshots.SID`, bool
+                                keep, list of str reasons), newest snapshot
+                                first
+        """
+        sids = sorted(snapshots, reverse = True)
+        if not sids:
+            return []
+        failed = [sid.failed for sid in sids]
+        reasons = [[] for sid in sids]
+        reasons[0].append('last snapshot')
+
+        if self.keepAll > 0:
+            minDate = self.now - datetime.timedelta(days = self.keepAll - 1)
+            reason = 'keep all for the last {} days'.format(self.keepAll)
+
+        # bucket: [index of newest snapshot, index of newest healthy snapshot]
+        buckets = {}
+        for i, sid in enumerate(sids):
+            date = sid.date.date()
+            if self.keepAll > 0 and minDate <= date <= self.now:
+                reasons[i].append(reason)
+            for bucket in self.buckets(date):
+                first = buckets.get(bucket)
+                if first is None:
+                    first = buckets[bucket] = [i, None]
+                if first[1] is None and not failed[i]:
+                    first[1] = i
+
+        for bucket, (newest, healthy) in buckets.items():
+            if healthy is None:
+                reasons[newest].append(self.describe(bucket) + ' (all failed)')
+            else:
+                reasons[healthy].append(self.describe(bucket))
+
+        dontRemoveNamed = self.config.dontRemoveNamedSnapshots()
+        ret = []
+        for i, sid in enumerate(sids):
+            keep = bool(reasons[i])
+            if not keep:
+                if dontRemoveNamed and sid.name:
+                    logger.debug("Keep snapshot: %s, it has a name" %sid, self)
+                    reasons[i].append('has a name')
+                    keep = True
+                elif failed[i]:
+                    reasons[i].append('failed and not needed for any interval')
+                else:
+                    reasons[i].append('not needed for any interval')
+            ret.append((sid, keep, reasons[i]))
+        return ret
+
+    def removeList(self, snapshots):
+        """
+        Snapshots which should be removed.
+
+        Args:
+            snapshots (list):   :py:class:`snapshots.SID` objects in any order
+
+        Returns:
+            list:               :py:class:`snapshots.SID` objects which should
+                                be removed, newest snapshot first
+        """
+        plan = self.plan(snapshots)
+        logger.debug("Keep snapshots: %s" %[sid for sid, keep, reasons in plan if keep], self)
+        return [sid for sid, keep, reasons in plan if not keep]
@@ -0,0 +1,445 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import json
+import time
+
+import logger
+import snapshots
+import remotehelper
+from exceptions import LastSnapshotSymlink
+
+
+class SnapshotCatalog(object):
+    """
+    Persistent index of all snapshots in the current snapshot path, stored in
+    '~/.local/share/backintime/snapshots<N>.catalog'.
+
+    Listing snapshots from the catalog only costs one ``stat`` on the snapshot
+    path. The catalog is rebuilt with a full scan if the mtime or link count
+    of the snapshot path changed since it was written (e.g. snapshots were
+    removed by a different machine). Changes done by Back In Time itself are
+    applied with :py:func:`commit` so no rescan is necessary.
+
+    In mode 'ssh' the snapshot path is scanned with one request through
+    :py:class:`remotehelper.RemoteHelper` instead of the ``sshfs`` mount.
+
+    If the snapshot path was changed less than :py:data:`RACY_SECONDS` before
+    the catalog was written, a change within the same timestamp granularity
+    would not be visible in mtime. In that case the catalog is marked 'racy'
+    and will be verified with a single ``listdir`` on next load.
+
+    Args:
+        cfg (config.Config):    current config
+    """
+    VERSION = 2
+    RACY_SECONDS = 2
+
+    def __init__(self, cfg):
+        self.config = cfg
+        self.profileID = cfg.currentProfile()
+        self.fileName = cfg.snapshotCatalogFile(self.profileID)
+
+    def path(self):
+        """
+        Full path to the folder which contains all snapshots.
+
+        Returns:
+            str:    snapshot path
+        """
+        return self.config.snapshotsFullPath(self.profileID)
+
+    def remotePath(self):
+        """
+        Full path to the folder which contains all snapshots on the remote
+        host.
+
+        Returns:
+            str:    snapshot path
+        """
+        return self.config.sshSnapshotsFullPath(self.profileID)
+
+    def listdir(self):
+        """
+        Content of the snapshot path.
+
+        Returns:
+            list:   file and folder names
+        """
+        helper = remotehelper.helper(self.config)
+        if helper is not None:
+            try:
+                return helper.listdir(self.remotePath())
+            except OSError as e:
+                logger.debug('Failed to list snapshot path with remote helper: {}'.format(str(e)), self)
+        return os.listdir(self.path())
+
+    def identity(self):
+        """
+        Identify the destination independent of the mountpoint, which changes
+        on every run for modes that need to be mounted.
+
+        Returns:
+            str:    destination identifier
+        """
+        mode = self.config.snapshotsMode(self.profileID)
+        host, user, profile = self.config.hostUserProfile(self.profileID)
+        if mode in ('ssh', 'ssh_encfs'):
+            dest = '{}@{}:{}:{}'.format(self.config.sshUser(self.profileID),
+                                        self.config.sshHost(self.profileID),
+                                        self.config.sshPort(self.profileID),
+                                        self.config.sshSnapshotsPath(self.profileID))
+        elif mode == 'local_encfs':
+            dest = self.config.localEncfsPath(self.profileID)
+        else:
+            dest = self.config.snapshotsPath(self.profileID)
+        return '|'.join((mode, dest, host, user, profile))
+
+    def stamp(self):
+        """
+        Current state of the snapshot path.
+
+        Returns:
+            list:   two items list of ``[mtime in ns, number of links]``
+                    or ``None`` if the snapshot path can not be accessed
+        """
+        helper = remotehelper.helper(self.config)
+        if helper is not None:
+            try:
+                st = helper.stat([self.remotePath()])[0]
+                if st is None:
+                    return None
+                return [st[2], st[5]]
+            except OSError as e:
+                logger.debug('Failed to stat snapshot path with remote helper: {}'.format(str(e)), self)
+        try:
+            st = os.stat(self.path())
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_nlink]
+
+    def isRacy(self, stamp):
+        """
+        Check if ``stamp`` is too recent to rely on mtime alone.
+
+        Args:
+            stamp (list):   stamp from :py:func:`stamp`
+
+        Returns:
+            bool:           ``True`` if catalog needs an extra verification
+        """
+        return time.time() - stamp[0] / 1e9 < self.RACY_SECONDS
+
+    def load(self):
+        """
+        Load the catalog from disk.
+
+        Returns:
+            dict:   catalog data or ``None`` if there is no catalog for
+                    the current destination
+        """
+        try:
+            with open(self.fileName, 'rt') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug('Failed to load snapshot catalog {}: {}'.format(
+                         self.fileName, str(e)),
+                         self)
+            return None
+        if not isinstance(data, dict)                   \
+          or data.get('version') != self.VERSION        \
+          or data.get('identity') != self.identity():
+            return None
+        return data
+
+    def save(self, data):
+        """
+        Atomically write catalog ``data`` to disk.
+
+        Args:
+            data (dict):    catalog data
+        """
+        tmp = self.fileName + '.tmp'
+        try:
+            with open(tmp, 'wt') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.fileName)
+        except Exception as e:
+            logger.debug('Failed to write snapshot catalog {}: {}'.format(
+                         self.fileName, str(e)),
+                         self)
+
+    def invalidate(self):
+        """
+        Remove the catalog so the next listing will do a full scan.
+        """
+        try:
+            os.remove(self.fileName)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug('Failed to remove snapshot catalog {}: {}'.format(
+                         self.fileName, str(e)),
+                         self)
+
+    def entry(self, sid):
+        """
+        Read metadata of snapshot ``sid`` from disk.
+
+        Args:
+            sid (snapshots.SID):    snapshot
+
+        Returns:
+            dict:                   metadata stored in the catalog
+        """
+        sid.catalogEntry = None
+        raw = sid.remoteEntry()
+        if raw is not None:
+            return sid.remoteHelper().entry(sid, raw)
+        return {'name':        sid.name or '',
+                'failed':      sid.failed,
+                'lastChecked': sid.lastChecked,
+                'transfer':    sid.transferMetrics()}
+
+    def scan(self, stamp):
+        """
+        Scan the snapshot path and create new catalog data.
+
+        Args:
+            stamp (list):   stamp from :py:func:`stamp` taken before scanning
+
+        Returns:
+            dict:           catalog data
+        """
+        helper = remotehelper.helper(self.config)
+        if helper is not None:
+            try:
+                return self.scanRemote(helper, stamp)
+            except OSError as e:
+                logger.debug('Failed to scan snapshot path with remote helper: {}'.format(str(e)), self)
+        names = os.listdir(self.path())
+        sids = {}
+        incomplete = []
+        newSnapshot = False
+        for item in names:
+            if item == snapshots.NewSnapshot.NEWSNAPSHOT:
+                newSnapshot = snapshots.NewSnapshot(self.config).exists()
+                if not newSnapshot:
+                    incomplete.append(item)
+                continue
+            try:
+                sid = snapshots.SID(item, self.config)
+            except Exception as e:
+                if not isinstance(e, LastSnapshotSymlink):
+                    logger.debug("'{}' is no snapshot ID: {}".format(item, str(e)))
+                continue
+            if sid.exists():
+                sids[item] = self.entry(sid)
+            else:
+                incomplete.append(item)
+        return self.build(stamp, names, incomplete, newSnapshot, sids)
+
+    def scanRemote(self, helper, stamp):
+        """
+        Scan the snapshot path on the remote host with a single request.
+
+        Args:
+            helper (remotehelper.RemoteHelper): helper for the current profile
+            stamp (list):   stamp from :py:func:`stamp` taken before scanning
+
+        Returns:
+            dict:           catalog data
+        """
+        remote = helper.snapshots(self.remotePath())
+        sids = {}
+        incomplete = []
+        newSnapshot = False
+        for item in remote['names']:
+            raw = remote['entries'].get(item)
+            if raw is None:
+                # no snapshot folder
+                continue
+            if item == snapshots.NewSnapshot.NEWSNAPSHOT:
+                newSnapshot = raw['exists']
+                if not newSnapshot:
+                    incomplete.append(item)
+                continue
+            if raw['exists']:
+                sids[item] = helper.entry(snapshots.SID(item, self.config), raw)
+            else:
+                incomplete.append(item)
+        return self.build(stamp, remote['names'], incomplete, newSnapshot, sids)
+
+    def build(self, stamp, names, incomplete, newSnapshot, sids):
+        """
+        Assemble catalog data.
+
+        Args:
+            stamp (list):       stamp from :py:func:`stamp`
+            names (list):       content of the snapshot path
+            incomplete (list):  snapshot folders without 'backup' folder
+            newSnapshot (bool): ``True`` if 'new_snapshot' exists
+            sids (dict):        metadata of all snapshots
+
+        Returns:
+            dict:               catalog data
+        """
+        return {'version':      self.VERSION,
+                'identity':     self.identity(),
+                'stamp':        stamp,
+                'racy':         self.isRacy(stamp),
+                'names':        sorted(names),
+                'incomplete':   incomplete,
+                'newSnapshot':  newSnapshot,
+                'snapshots':    sids}
+
+    def isValid(self, data, stamp):
+        """
+        Check if catalog ``data`` still match the snapshot path.
+
+        Args:
+            data (dict):    catalog data
+            stamp (list):   current stamp from :py:func:`stamp`
+
+        Returns:
+            bool:           ``True`` if catalog can be used
+        """
+        if data is None or data['stamp'] != stamp:
+            return False
+        # snapshots which were incomplete during last scan
+        # might have been finished without changing the snapshot path
+        for item in data['incomplete']:
+            if item == snapshots.NewSnapshot.NEWSNAPSHOT:
+                sid = snapshots.NewSnapshot(self.config)
+            else:
+                sid = snapshots.SID(item, self.config)
+            if sid.exists():
+                return False
+        if data['racy']:
+            if sorted(self.listdir()) != data['names']:
+                return False
+            if not self.isRacy(stamp):
+                data['racy'] = False
+                self.save(data)
+        return True
+
+    def data(self):
+        """
+        Current catalog data. Will rescan the snapshot path if the stored
+        catalog is outdated.
+
+        Returns:
+            dict:   catalog data or ``None`` if the snapshot path doesn't exist
+        """
+        stamp = self.stamp()
+        if stamp is None:
+            return None
+        data = self.load()
+        if not self.isValid(data, stamp):
+            logger.debug('Scan snapshot path {}'.format(self.path()), self)
+            data = self.scan(stamp)
+            self.save(data)
+        return data
+
+    def iterSnapshots(self, includeNewSnapshot = False):
+        """
+        Iterate over snapshots stored in the catalog.
+
+        Args:
+            includeNewSnapshot (bool):  include a NewSnapshot instance if
+                                        'new_snapshot' folder is available.
+
+        Yields:
+            snapshots.SID:              snapshot IDs
+        """
+        data = self.data()
+        if data is None:
+            return
+        if includeNewSnapshot and data['newSnapshot']:
+            yield snapshots.NewSnapshot(self.config)
+        for item, entry in data['snapshots'].items():
+            sid = snapshots.SID(item, self.config)
+            sid.catalogEntry = entry
+            yield sid
+
+    def commit(self, stamp, add = (), discard = ()):
+        """
+        Apply changes done to the snapshot path by ourself. ``stamp`` must be
+        taken right before the change. If the catalog was outdated already it
+        will be left untouched and rebuilt on next listing.
+
+        Args:
+            stamp (list):   stamp from :py:func:`stamp` taken before changing
+                            the snapshot path
+            add (list):     :py:class:`snapshots.SID` instances or other
+                            folder/file names which were added
+            discard (list): :py:class:`snapshots.SID` instances or other
+                            folder/file names which were removed
+        """
+        remotehelper.invalidate(self.config)
+        data = self.load()
+        if data is None or stamp is None or data['stamp'] != stamp:
+            return
+        newStamp = self.stamp()
+        if newStamp is None:
+            return
+        names = set(data['names'])
+        for item in discard:
+            name = getattr(item, 'sid', item)
+            names.discard(name)
+            data['snapshots'].pop(name, None)
+            if name in data['incomplete']:
+                data['incomplete'].remove(name)
+            if name == snapshots.NewSnapshot.NEWSNAPSHOT:
+                data['newSnapshot'] = False
+        for item in add:
+            name = getattr(item, 'sid', item)
+            names.add(name)
+            if isinstance(item, snapshots.NewSnapshot):
+                data['newSnapshot'] = item.exists()
+                if not data['newSnapshot'] and name not in data['incomplete']:
+                    data['incomplete'].append(name)
+            elif isinstance(item, snapshots.SID):
+                if item.exists():
+                    data['snapshots'][name] = self.entry(item)
+                    item.catalogEntry = data['snapshots'][name]
+                elif name not in data['incomplete']:
+                    data['incomplete'].append(name)
+        data['names'] = sorted(names)
+        data['stamp'] = newStamp
+        # we can't be sure nobody else changed the path in the meantime
+        data['racy'] = True
+        self.save(data)
+
+    def update(self, sid, **kwargs):
+        """
+        Update metadata of snapshot ``sid`` after changing its name, failed
+        flag or last checked time. This doesn't change the snapshot path itself.
+
+        Args:
+            sid (snapshots.SID):    snapshot which has changed
+            **kwargs:               new values for 'name', 'failed' or
+                                    'lastChecked'
+        """
+        data = self.load()
+        if data is None or sid.sid not in data['snapshots']:
+            return
+        data['snapshots'][sid.sid].update(kwargs)
+        self.save(data)
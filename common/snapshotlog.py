@@ -17,7 +17,10 @@
 
 import os
 import re
+import bz2
+import json
 import gettext
+import itertools
 
 import logger
 import snapshots
@@ -89,6 +92,276 @@ class LogFilter(object):
         else:
             return line
 
+    def prefetch(self, lines):
+        """
+        Decode all paths in ``lines`` with as few requests to encfsctl as
+        possible so :py:func:`filter` will find them in the cache.
+
+        Args:
+            lines (list):   log lines read from disk
+        """
+        if self.decode:
+            self.decode.prefetchLog([line for line in lines
+                                     if line and (not self.regex or self.regex.match(line))])
+
+class LogReader(object):
+    """
+    Stream a (possibly huge) snapshot log without loading it into memory.
+
+    An index with the byte offset of every :py:data:`PAGE_SIZE`'th line for
+    each :py:class:`LogFilter` mode is built with one pass over the log and
+    stored in ``indexFile``. With that index :py:func:`lines` and
+    :py:func:`page` can start at any filtered line and :py:func:`count` is
+    known without reading the log again. If the log only grew since the
+    index was built, only the new part will be scanned.
+
+    Args:
+        opener (method):    return a new binary file object with the
+                            (uncompressed) log
+        indexFile (str):    full path where the index should be stored or
+                            ``None`` to keep it in memory only
+        stamp (list):       anything that changes when the log is replaced
+                            (not just appended)
+        complete (bool):    ``True`` if the log won't grow anymore. Otherwise
+                            an incomplete last line is not indexed yet
+    """
+    PAGE_SIZE = 1000
+    VERSION = 1
+    MODES = (LogFilter.NO_FILTER,
+             LogFilter.ERROR,
+             LogFilter.CHANGES,
+             LogFilter.INFORMATION,
+             LogFilter.ERROR_AND_CHANGES)
+
+    def __init__(self, opener, indexFile = None, stamp = None, complete = True):
+        self.opener = opener
+        self.indexFile = indexFile
+        self.stamp = stamp
+        self.complete = complete
+        self.idx = None
+        self.file = None
+        self.pos = 0
+
+    def close(self):
+        """
+        Close the file used by :py:func:`page`.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def loadIndex(self):
+        try:
+            with open(self.indexFile, 'rt') as f:
+                idx = json.load(f)
+            if idx['version'] == self.VERSION \
+                    and idx['pageSize'] == self.PAGE_SIZE \
+                    and idx['stamp'] == self.stamp:
+                return idx
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def saveIndex(self, idx):
+        tmp = self.indexFile + '.tmp'
+        try:
+            with open(tmp, 'wt') as f:
+                json.dump(idx, f)
+            os.replace(tmp, self.indexFile)
+        except OSError as e:
+            logger.debug('Failed to save log index {}: {}'.format(self.indexFile, str(e)), self)
+
+    def index(self):
+        """
+        Load the index or build it if it is missing, outdated or the log has
+        grown.
+
+        Returns:
+            dict:   'end' (offset of the first byte not indexed yet) and
+                    'modes' with 'count' (number of lines) and 'offsets'
+                    (offset of every :py:data:`PAGE_SIZE`'th line) for every
+                    mode in :py:data:`MODES`
+        """
+        idx = self.idx
+        if idx is None and self.indexFile:
+            idx = self.loadIndex()
+        if idx is not None and idx['end'] and self.complete:
+            # complete logs don't grow
+            self.idx = idx
+            return idx
+        if idx is None:
+            idx = {'version':   self.VERSION,
+                   'pageSize':  self.PAGE_SIZE,
+                   'stamp':     self.stamp,
+                   'end':       0,
+                   'modes':     {str(mode): {'count': 0, 'offsets': []}
+                                 for mode in self.MODES}}
+        end = idx['end']
+        with self.opener() as f:
+            if end:
+                f.seek(end)
+            modes = [(LogFilter.REGEX[mode], idx['modes'][str(mode)]) for mode in self.MODES]
+            pos = end
+            for line in f:
+                if not line.endswith(b'\n') and not self.complete:
+                    break
+                text = line.decode('utf-8', 'replace').rstrip('\n')
+                for regex, m in modes:
+                    if text and regex and not regex.match(text):
+                        continue
+                    if not m['count'] % self.PAGE_SIZE:
+                        m['offsets'].append(pos)
+                    m['count'] += 1
+                pos += len(line)
+        if pos != end:
+            idx['end'] = pos
+            if self.indexFile:
+                self.saveIndex(idx)
+        self.idx = idx
+        return idx
+
+    def count(self, mode = None):
+        """
+        Number of lines which match filter ``mode``.
+
+        Args:
+            mode (int): filter mode like in :py:class:`LogFilter`
+
+        Returns:
+            int:        number of lines
+        """
+        return self.index()['modes'][str(mode or 0)]['count']
+
+    def startOffset(self, mode, start):
+        """
+        Offset to start reading from and number of matching lines which
+        need to be skipped to reach line ``start``.
+        """
+        if self.idx is None:
+            self.index()
+        offsets = self.idx['modes'][str(mode or 0)]['offsets']
+        page = min(start // self.PAGE_SIZE, len(offsets) - 1)
+        if page < 0:
+            return 0, start
+        return offsets[page], start - page * self.PAGE_SIZE
+
+    def iterLines(self, f, mode, decode, skip):
+        logFilter = LogFilter(mode, decode)
+        while True:
+            batch = [line.decode('utf-8', 'replace').rstrip('\n')
+                     for line in itertools.islice(f, SnapshotLog.PREFETCH)]
+            if not batch:
+                break
+            logFilter.prefetch(batch)
+            for line in batch:
+                line = logFilter.filter(line)
+                if line is None:
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                yield line
+
+    def lines(self, mode = None, decode = None, start = 0):
+        """
+        Filter and decode the log and yield its lines.
+
+        Args:
+            mode (int):                 filter mode like in :py:class:`LogFilter`
+            decode (encfstools.Decode): instance used for decoding lines or
+                                        ``None``
+            start (int):                skip the first ``start`` matching lines
+
+        Yields:
+            str:                        filtered and decoded log lines
+        """
+        offset, skip = self.startOffset(mode, start)
+        with self.opener() as f:
+            if offset:
+                f.seek(offset)
+            yield from self.iterLines(f, mode, decode, skip)
+
+    def page(self, number, mode = None, decode = None):
+        """
+        Filtered and decoded lines of page ``number``. The file is kept open
+        so reading the following page won't need to seek again.
+
+        Args:
+            number (int):               page number
+            mode (int):                 filter mode like in :py:class:`LogFilter`
+            decode (encfstools.Decode): instance used for decoding lines or
+                                        ``None``
+
+        Returns:
+            list:                       up to :py:data:`PAGE_SIZE` lines
+        """
+        offset, skip = self.startOffset(mode, number * self.PAGE_SIZE)
+        if self.file is None:
+            self.file = self.opener()
+            self.pos = 0
+        if offset != self.pos:
+            self.file.seek(offset)
+        regex = LogFilter.REGEX[mode]
+        ret = []
+        pos = offset
+        # read raw lines first to know the offset where the next page starts
+        raw = []
+        for line in self.file:
+            pos += len(line)
+            text = line.decode('utf-8', 'replace').rstrip('\n')
+            if text and regex and not regex.match(text):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            raw.append(text)
+            if len(raw) >= self.PAGE_SIZE:
+                break
+        self.pos = pos
+        logFilter = LogFilter(mode, decode)
+        logFilter.prefetch(raw)
+        for line in raw:
+            ret.append(logFilter.filter(line))
+        return ret
+
+    def search(self, text, mode = None, decode = None, start = 0):
+        """
+        Find the next line containing ``text`` (case insensitive).
+
+        Args:
+            text (str):                 search text
+            mode (int):                 filter mode like in :py:class:`LogFilter`
+            decode (encfstools.Decode): instance used for decoding lines or
+                                        ``None``
+            start (int):                first line to search in
+
+        Returns:
+            int:                        number of the matching line or
+                                        ``None``
+        """
+        text = text.lower()
+        for number, line in enumerate(self.lines(mode, decode, start), start):
+            if text in line.lower():
+                return number
+        return None
+
+class Bz2Reader(bz2.BZ2File):
+    """
+    :py:class:`bz2.BZ2File` which also closes the underlying file object.
+
+    Args:
+        raw (io.IOBase):    compressed file
+    """
+    def __init__(self, raw):
+        super(Bz2Reader, self).__init__(raw, 'rb')
+        self.raw = raw
+
+    def close(self):
+        try:
+            super(Bz2Reader, self).close()
+        finally:
+            self.raw.close()
+
 class SnapshotLog(object):
     """
     Read and write Snapshot log to "~/.local/share/backintime/takesnapshot_<N>.log".
@@ -104,6 +377,9 @@ class SnapshotLog(object):
     CHANGES_AND_ERRORS  = 2
     ALL                 = 3
 
+    #number of lines decoded at once
+    PREFETCH            = 1000
+
     def __init__(self, cfg, profile = None):
         self.config = cfg
         if profile:
@@ -112,6 +388,7 @@ class SnapshotLog(object):
             self.profile = cfg.currentProfile()
         self.logLevel = cfg.logLevel()
         self.logFileName = cfg.takeSnapshotLogFile(self.profile)
+        self.indexFileName = self.logFileName + '.idx'
         self.logFile = None
 
         self.timer = tools.Alarm(self.flush, overwrite = False)
@@ -138,22 +415,30 @@ class SnapshotLog(object):
         logFilter = LogFilter(mode, decode)
         count = logFilter.header.count('\n')
         try:
-            with open(self.logFileName, 'rt') as f:
-                if logFilter.header and not skipLines:
-                    yield logFilter.header
-                for line in f.readlines():
-                    line = logFilter.filter(line.rstrip('\n'))
-                    if not line is None:
-                        count += 1
-                        if count <= skipLines:
-                            continue
-                        yield line
+            reader = self.reader()
+            if logFilter.header and not skipLines:
+                yield logFilter.header
+            yield from reader.lines(mode, decode, max(skipLines - count, 0))
         except Exception as e:
             msg = ('Failed to get take_snapshot log from {}:'.format(self.logFile), str(e))
             logger.debug(' '.join(msg), self)
             for line in msg:
                 yield line
 
+    def reader(self):
+        """
+        :py:class:`LogReader` for the current log. The index is stored next
+        to the log.
+
+        Returns:
+            LogReader:  reader
+        """
+        st = os.stat(self.logFileName)
+        return LogReader(lambda: open(self.logFileName, 'rb'),
+                         self.indexFileName,
+                         [st.st_dev, st.st_ino],
+                         complete = False)
+
     def new(self, date):
         """
         Create a new log file or - if the last new_snapshot can be continued -
@@ -171,6 +456,8 @@ class SnapshotLog(object):
                     self.logFile.close()
                     self.logFile = None
                 os.remove(self.logFileName)
+            if os.path.exists(self.indexFileName):
+                os.remove(self.indexFileName)
             msg = "========== Take snapshot (profile %s): %s ==========\n"
         self.append(msg %(self.profile, date.strftime('%c')), 1)
 
@@ -0,0 +1,274 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import stat
+import threading
+from collections import deque
+
+import logger
+
+
+class SnapshotRemover(object):
+    """
+    Remove local snapshots with a single ``scandir``/``unlinkat`` walk per
+    snapshot. Multiple snapshots are removed in parallel with a number of
+    worker threads per disk (see :py:func:`deviceWorkers`).
+
+    Freed bytes only count files which had no other hardlink left when they
+    were unlinked (plus the folders themselves). Unlinking a file is
+    serialized with all other workers removing the same inode, so a file
+    which is only shared between snapshots removed at the same time is
+    counted exactly once.
+
+    Args:
+        cfg (config.Config):    current config
+        callback (method):      called with (:py:class:`snapshots.SID`, files,
+                                freed bytes) after each removed snapshot.
+                                Calls are serialized.
+    """
+    DIRFLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+    LOCKS = 64
+    WORKERS_ROTATIONAL = 1
+    WORKERS_NONROTATIONAL = 4
+    WORKERS_DEFAULT = 2
+
+    def __init__(self, cfg, callback = None):
+        self.config = cfg
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.inodeLocks = [threading.Lock() for i in range(self.LOCKS)]
+        self.files = 0
+        self.freed = 0
+        self.removed = []
+        self.errors = []
+
+    def deviceWorkers(self, dev):
+        """
+        Number of snapshots that should be removed in parallel on device
+        ``dev``. Spinning disks would only seek back and forth with more than
+        one worker.
+
+        Args:
+            dev (int):  device number from ``os.stat().st_dev``
+
+        Returns:
+            int:        number of workers
+        """
+        sysfs = '/sys/dev/block/{}:{}'.format(os.major(dev), os.minor(dev))
+        # partitions don't have a queue, use the one of the parent device
+        for path in (os.path.join(sysfs, 'queue', 'rotational'),
+                     os.path.join(sysfs, '..', 'queue', 'rotational')):
+            try:
+                with open(path, 'rt') as f:
+                    if f.read().strip() == '1':
+                        return self.WORKERS_ROTATIONAL
+                    return self.WORKERS_NONROTATIONAL
+            except OSError:
+                pass
+        return self.WORKERS_DEFAULT
+
+    def openDir(self, name, dirFd):
+        """
+        Open folder ``name`` in ``dirFd``. Read-only folders will be made
+        accessible first.
+
+        Args:
+            name (str):     folder name
+            dirFd (int):    file descriptor of the parent folder
+
+        Returns:
+            int:            file descriptor
+        """
+        try:
+            return os.open(name, self.DIRFLAGS, dir_fd = dirFd)
+        except PermissionError:
+            os.chmod(name, stat.S_IRWXU, dir_fd = dirFd)
+            return os.open(name, self.DIRFLAGS, dir_fd = dirFd)
+
+    def unlink(self, name, dirFd):
+        """
+        Unlink the file ``name`` in ``dirFd``.
+
+        Args:
+            name (str):     file name
+            dirFd (int):    file descriptor of the parent folder
+
+        Returns:
+            int:            freed bytes
+        """
+        st = os.stat(name, dir_fd = dirFd, follow_symlinks = False)
+        if st.st_nlink > 1:
+            with self.inodeLocks[st.st_ino % self.LOCKS]:
+                # stat again because an other worker might have
+                # removed a link in the meantime
+                st = os.stat(name, dir_fd = dirFd, follow_symlinks = False)
+                os.unlink(name, dir_fd = dirFd)
+        else:
+            os.unlink(name, dir_fd = dirFd)
+        if st.st_nlink == 1:
+            return st.st_blocks * 512
+        return 0
+
+    def removeTree(self, path):
+        """
+        Remove ``path`` and everything inside it.
+
+        Args:
+            path (str): full path to the folder
+
+        Returns:
+            tuple:      number of removed files and freed bytes
+        """
+        parent, name = os.path.split(path.rstrip(os.sep))
+        files = freed = 0
+        stack = []
+        parentFd = os.open(parent, self.DIRFLAGS)
+        try:
+            fd = self.openDir(name, parentFd)
+            stack.append((parentFd, name, fd, self.listDir(fd)))
+            while stack:
+                dirFd, name, fd, entries = stack[-1]
+                if entries:
+                    entry = entries.pop()
+                    if entry.is_dir(follow_symlinks = False):
+                        child = self.openDir(entry.name, fd)
+                        stack.append((fd, entry.name, child, self.listDir(child)))
+                        continue
+                    try:
+                        freed += self.unlink(entry.name, fd)
+                    except PermissionError:
+                        os.fchmod(fd, stat.S_IRWXU)
+                        freed += self.unlink(entry.name, fd)
+                    files += 1
+                    continue
+                stack.pop()
+                try:
+                    freed += os.fstat(fd).st_blocks * 512
+                finally:
+                    os.close(fd)
+                try:
+                    os.rmdir(name, dir_fd = dirFd)
+                except PermissionError:
+                    if dirFd == parentFd:
+                        raise
+                    os.fchmod(dirFd, stat.S_IRWXU)
+                    os.rmdir(name, dir_fd = dirFd)
+        finally:
+            for dirFd, name, fd, entries in stack:
+                os.close(fd)
+            os.close(parentFd)
+        return files, freed
+
+    def listDir(self, fd):
+        """
+        All entries of the folder opened as ``fd``.
+
+        Args:
+            fd (int):   file descriptor of the folder
+
+        Returns:
+            list:       :py:class:`os.DirEntry` objects
+        """
+        with os.scandir(fd) as it:
+            return list(it)
+
+    def worker(self, queue):
+        """
+        Remove snapshots from ``queue`` until it is empty.
+
+        Args:
+            queue (collections.deque):  :py:class:`snapshots.SID` objects
+        """
+        while True:
+            try:
+                sid = queue.popleft()
+            except IndexError:
+                return
+            logger.debug('Remove snapshot {}'.format(sid), self)
+            try:
+                files, freed = self.removeTree(sid.path())
+            except FileNotFoundError:
+                if os.path.lexists(sid.path()):
+                    raise
+                self.alreadyRemoved(sid)
+                continue
+            except Exception as e:
+                logger.error('Failed to remove snapshot {}: {}'.format(sid, str(e)), self)
+                with self.lock:
+                    self.errors.append((sid, e))
+                continue
+            with self.lock:
+                self.files += files
+                self.freed += freed
+                self.removed.append(sid)
+                if self.callback:
+                    self.callback(sid, files, freed)
+
+    def alreadyRemoved(self, sid):
+        """
+        Count snapshot ``sid`` which doesn't exist (anymore) as removed.
+
+        Args:
+            sid (snapshots.SID):    missing snapshot
+        """
+        logger.debug('Snapshot {} is already removed'.format(sid), self)
+        with self.lock:
+            self.removed.append(sid)
+            if self.callback:
+                self.callback(sid, 0, 0)
+
+    def remove(self, sids):
+        """
+        Remove all snapshots in ``sids``. Snapshots on the same disk are
+        removed by up to :py:func:`deviceWorkers` threads in parallel.
+        Snapshots which don't exist count as removed. Failed snapshots are
+        logged and stored in ``errors``.
+
+        Args:
+            sids (list):    :py:class:`snapshots.SID` objects
+
+        Returns:
+            int:            freed bytes
+        """
+        devices = {}
+        for sid in sids:
+            try:
+                dev = os.stat(sid.path()).st_dev
+            except FileNotFoundError:
+                self.alreadyRemoved(sid)
+                continue
+            except OSError as e:
+                logger.error('Failed to remove snapshot {}: {}'.format(sid, str(e)), self)
+                self.errors.append((sid, e))
+                continue
+            devices.setdefault(dev, deque()).append(sid)
+
+        threads = []
+        for dev, queue in devices.items():
+            for i in range(min(len(queue), self.deviceWorkers(dev))):
+                threads.append(threading.Thread(target = self.worker,
+                                                args = (queue,),
+                                                daemon = True))
+        if len(threads) == 1:
+            threads[0].run()
+        else:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return self.freed
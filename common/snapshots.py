@@ -29,6 +29,10 @@ import shutil
 import time
 import re
 import fcntl
+import hashlib
+import errno
+import heapq
+import functools
 from tempfile import TemporaryDirectory
 
 import config
@@ -40,6 +44,19 @@ import mount
 import progress
 import bcolors
 import snapshotlog
+import snapshotcatalog
+import smartremove
+import snapshotremover
+import freespace
+import fileinfo
+import permissionrestorer
+import changejournal
+import changemanifest
+import filehistory
+import dedup
+import runreport
+import remotehelper
+import statusmessage
 from applicationinstance import ApplicationInstance
 from exceptions import MountException, LastSnapshotSymlink
 
@@ -53,7 +70,7 @@ class Snapshots:
     Args:
         cfg (config.Config): current config
     """
-    SNAPSHOT_VERSION = 3
+    SNAPSHOT_VERSION = 4
     GLOBAL_FLOCK = '/tmp/backintime.lock'
 
     def __init__(self, cfg = None):
@@ -61,6 +78,9 @@ class Snapshots:
         if self.config is None:
             self.config = config.Config()
         self.snapshotLog = snapshotlog.SnapshotLog(self.config)
+        self.changeManifest = None
+        self.transferMetrics = None
+        self.runReport = runreport.RunReport(self.config)
 
         self.clearIdCache()
         self.clearNameCache()
@@ -77,12 +97,18 @@ class Snapshots:
                                           r'([\d\?]+:[\d\?]{2}:[\d\?]{2})'  #estimated time of arrival
                                           r'(.*$)')                         #trash at the end
 
+        self.progressPublisher = progress.ProgressPublisher(self.config)
+        self.messagePublisher = statusmessage.MessagePublisher(self.config,
+                                                               self.writeTakeSnapshotMessage)
+        self.messageSubscriber = statusmessage.MessageSubscriber(self.config)
+
         self.lastBusyCheck = datetime.datetime(1,1,1)
         self.flock = None
         self.restorePermissionFailed = False
 
     #TODO: make own class for takeSnapshotMessage
     def clearTakeSnapshotMessage(self):
+        self.messagePublisher.clear()
         files = (self.config.takeSnapshotMessageFile(), \
                  self.config.takeSnapshotProgressFile())
         for f in files:
@@ -98,6 +124,10 @@ class Snapshots:
                 self.clearTakeSnapshotMessage()
                 return None
 
+        message = self.messageSubscriber.read()
+        if message is not None:
+            return message
+
         if not os.path.exists(self.config.takeSnapshotMessageFile()):
             return None
         try:
@@ -127,6 +157,34 @@ class Snapshots:
 
     #TODO: make own class for takeSnapshotMessage
     def setTakeSnapshotMessage(self, type_id, message, timeout = -1):
+        """
+        Set the status message of the running snapshot. The message is
+        always added to the snapshot log. Writing the message file and
+        notifying plugins and GUI subscribers is coalesced by
+        :py:class:`statusmessage.MessagePublisher`, errors are forwarded
+        immediately.
+
+        Args:
+            type_id (int):  0 for info, 1 for error
+            message (str):  message
+            timeout (int):  timeout for plugins showing the message
+        """
+        if 1 == type_id:
+            self.snapshotLog.append('[E] ' + message, 1)
+        else:
+            self.snapshotLog.append('[I] '  + message, 3)
+        self.messagePublisher.publish(type_id, message, timeout)
+
+    def writeTakeSnapshotMessage(self, type_id, message, timeout = -1):
+        """
+        Write the status message into the message file and send it to
+        plugins. Called by :py:class:`statusmessage.MessagePublisher`.
+
+        Args:
+            type_id (int):  0 for info, 1 for error
+            message (str):  message
+            timeout (int):  timeout for plugins showing the message
+        """
         data = str(type_id) + '\n' + message
 
         try:
@@ -137,11 +195,6 @@ class Snapshots:
                          %(self.config.takeSnapshotMessageFile(), str(e)),
                          self)
 
-        if 1 == type_id:
-            self.snapshotLog.append('[E] ' + message, 1)
-        else:
-            self.snapshotLog.append('[I] '  + message, 3)
-
         try:
             profile_id =self.config.currentProfile()
             profile_name = self.config.profileName(profile_id)
@@ -340,57 +393,69 @@ class Snapshots:
         assert isinstance(key_path, bytes), 'key_path is not bytes type: %s' % key_path
         assert isinstance(path, bytes), 'path is not bytes type: %s' % path
         assert isinstance(fileInfoDict, FileInfoDict), 'fileInfoDict is not FileInfoDict type: %s' % fileInfoDict
-        if key_path not in fileInfoDict or not os.path.exists(path):
+        item = self.permissionItem(key_path, path, fileInfoDict, callback)
+        if item is None:
             return
-        info = fileInfoDict[key_path]
-
-        #restore uid/gid
-        uid = self.uid(info[1], callback)
-        gid = self.gid(info[2], callback)
-
-        #current file stats
-        st = os.stat(path)
-
-        # logger.debug('%(path)s: uid %(target_uid)s/%(cur_uid)s, gid %(target_gid)s/%(cur_gid)s, mod %(target_mod)s/%(cur_mod)s'
-        #              %{'path': path.decode(),
-        #                'target_uid': uid,
-        #                'cur_uid': st.st_uid,
-        #                'target_gid': gid,
-        #                'cur_gid': st.st_gid,
-        #                'target_mod': info[0],
-        #                'cur_mod': st.st_mode
-        #                })
-
-        if uid != -1 or gid != -1:
-            ok = False
-            if uid != st.st_uid:
-                try:
-                    os.chown(path, uid, gid)
-                    ok = True
-                except:
-                    pass
-                self.restoreCallback(callback, ok, "chown %s %s : %s" % (path.decode(errors = 'ignore'), uid, gid))
-                st = os.stat(path)
+        restorer = permissionrestorer.PermissionRestorer(functools.partial(self.restoreCallback, callback),
+                                                         workers = 1)
+        restorer.restore((item,))
 
-            #if restore uid/gid failed try to restore at least gid
-            if not ok and gid != st.st_gid:
-                try:
-                    os.chown(path, -1, gid)
-                    ok = True
-                except:
-                    pass
-                self.restoreCallback(callback, ok, "chgrp %s %s" % (path.decode(errors = 'ignore'), gid))
-                st = os.stat(path)
+    def permissionItem(self, key_path, path, fileInfoDict, callback = None):
+        """
+        Look up the permissions of ``key_path`` for
+        :py:class:`permissionrestorer.PermissionRestorer`.
 
-        #restore perms
-        ok = False
-        if info[0] != st.st_mode:
-            try:
-                os.chmod(path, info[0])
-                ok = True
-            except:
-                pass
-            self.restoreCallback(callback, ok, "chmod %s %04o" % (path.decode(errors = 'ignore'), info[0]))
+        Args:
+            key_path (bytes):       original path during backup.
+                                    Same as in fileInfoDict.
+            path (bytes):           current path of file that should be changed.
+            fileInfoDict (FileInfoDict):    FileInfoDict
+            callback (method):      callable which will handle messages
+
+        Returns:
+            tuple:                  ``(path, mode, uid, gid)`` or ``None``
+                                    if ``key_path`` is not in fileInfoDict
+        """
+        info = fileInfoDict.get(key_path)
+        if info is None:
+            return None
+        return (path, info[0], self.uid(info[1], callback), self.gid(info[2], callback))
+
+    def restoreBatches(self, sid, paths, restore_to = ''):
+        """
+        Group ``paths`` into as few rsync runs as possible. Restoring to the
+        original destination needs only one run for all paths. With
+        ``restore_to`` every path is copied without its parent folders, so
+        all paths which share the same parent folder are restored together.
+
+        Args:
+            sid (SID):          snapshot from whom to restore
+            paths (list):       full paths that should be restored
+            restore_to (str):   full path to restore to or empty
+
+        Returns:
+            list:               ``(source folder, paths relative to source
+                                folder, src_delta)`` tuples. ``src_delta``
+                                is the length of the parent folder which is
+                                cut off from restored paths
+        """
+        src_root = sid.pathBackup(use_mode = ['ssh'])
+        if not src_root.endswith(os.sep):
+            src_root += os.sep
+        batches = {}
+        for path in paths:
+            path = path.rstrip(os.sep) or os.sep
+            if restore_to:
+                parent, name = os.path.split(path)
+                src_base = os.path.join(src_root, parent.lstrip(os.sep))
+                if not src_base.endswith(os.sep):
+                    src_base += os.sep
+                src_delta = 0 if parent == os.sep else len(parent)
+                item = name or '.'
+            else:
+                src_base, src_delta, item = src_root, 0, path.lstrip(os.sep) or '.'
+            batches.setdefault((src_base, src_delta), []).append(item)
+        return [(src_base, items, src_delta) for (src_base, src_delta), items in batches.items()]
 
     def restore(self,
                 sid,
@@ -403,16 +468,18 @@ class Snapshots:
         """
         Restore one or more files from snapshot ``sid`` to either original
         or a different destination. Restore is done with rsync. If available
-        permissions will be restored from ``fileinfo.bz2``.
+        permissions will be restored from ``fileinfo.idx``.
 
         Args:
             sid (SID):                  snapshot from whom to restore
             paths (:py:class:`list`, :py:class:`tuple` or :py:class:`str`):
                                         single path (str) or multiple
                                         paths (list, tuple) that should be
-                                        restored. For every path this will run
-                                        a new rsync process. Permissions will be
-                                        restored for all paths in one run
+                                        restored. Paths are batched into
+                                        rsync runs with ``--files-from`` (see
+                                        :py:func:`restoreBatches`).
+                                        Permissions will be restored for all
+                                        paths in one run
             callback (method):          callable instance which will handle
                                         messages
             restore_to (str):           full path to restore to. If empty
@@ -459,34 +526,28 @@ class Snapshots:
         restored_paths = []
         for path in paths:
             tools.makeDirs(os.path.dirname(path))
-            src_path = path
-            src_delta = 0
-            src_base = sid.pathBackup(use_mode = ['ssh'])
-            if not src_base.endswith(os.sep):
-                src_base += os.sep
-            cmd = cmd_prefix[:]
-            if restore_to:
-                items = os.path.split(src_path)
-                aux = items[0].lstrip(os.sep)
-                #bugfix: restore system root ended in <src_base>//.<src_path>
-                if aux:
-                    src_base = os.path.join(src_base, aux) + '/'
-                src_path = '/' + items[1]
-                if items[0] == '/':
-                    src_delta = 0
-                else:
-                    src_delta = len(items[0])
-
-            cmd.append(self.rsyncRemotePath('%s.%s' %(src_base, src_path), use_mode = ['ssh']))
-            cmd.append('%s/' %restore_to)
-            proc = tools.Execute(cmd,
-                                 callback = callback,
-                                 filters = (self.filterRsyncProgress,),
-                                 parent = self)
-            self.restoreCallback(callback, True, proc.printable_cmd)
-            proc.run()
-            self.restoreCallback(callback, True, ' ')
-            restored_paths.append((path, src_delta))
+        with TemporaryDirectory() as tmp:
+            for src_base, items, src_delta in self.restoreBatches(sid, paths, restore_to):
+                files_from = os.path.join(tmp, 'files')
+                with open(files_from, 'wb') as f:
+                    for item in items:
+                        f.write(os.fsencode(item) + b'\0')
+                cmd = cmd_prefix[:]
+                cmd.extend(('--from0', '--files-from=' + files_from))
+                cmd.append(self.rsyncRemotePath(src_base, use_mode = ['ssh']))
+                cmd.append('%s/' %restore_to)
+                proc = tools.Execute(cmd,
+                                     callback = callback,
+                                     filters = (self.filterRsyncProgress,),
+                                     parent = self,
+                                     batched = True)
+                self.restoreCallback(callback, True, proc.printable_cmd)
+                proc.run()
+                self.restoreCallback(callback, True, ' ')
+        for path in paths:
+            parent = os.path.dirname(path.rstrip(os.sep) or os.sep)
+            restored_paths.append((path, 0 if not restore_to or parent == os.sep else len(parent)))
+        self.progressPublisher.close()
         try:
             os.remove(self.config.takeSnapshotProgressFile())
         except Exception as e:
@@ -499,55 +560,32 @@ class Snapshots:
         self.restoreCallback(callback, True, ' ')
         self.restoreCallback(callback, True, _("Restore permissions:"))
         self.restorePermissionFailed = False
-        fileInfoDict = sid.fileInfo
-
         #cache uids/gids
         for uid, name in info.listValue('user', ('int:uid', 'str:name')):
             self.uid(name.encode(), callback = callback, backup = uid)
         for gid, name in info.listValue('group', ('int:gid', 'str:name')):
             self.gid(name.encode(), callback = callback, backup = gid)
 
-        if fileInfoDict:
-            all_dirs = [] #restore dir permissions after all files are done
-            for path, src_delta in restored_paths:
-                #explore items
-                snapshot_path_to = sid.pathBackup(path).rstrip('/')
-                root_snapshot_path_to = sid.pathBackup().rstrip('/')
-                #use bytes instead of string from here
-                if isinstance(path, str):
-                    path = path.encode()
-                if isinstance(restore_to, str):
-                    restore_to = restore_to.encode()
-
-                if not restore_to:
-                    path_items = path.strip(b'/').split(b'/')
-                    curr_path = b'/'
-                    for path_item in path_items:
-                        curr_path = os.path.join(curr_path, path_item)
-                        if curr_path not in all_dirs:
-                            all_dirs.append(curr_path)
-                else:
-                    if path not in all_dirs:
-                        all_dirs.append(path)
-
-                if os.path.isdir(snapshot_path_to) and not os.path.islink(snapshot_path_to):
-                    head = len(root_snapshot_path_to.encode())
-                    for explore_path, dirs, files in os.walk(snapshot_path_to.encode()):
-                        for item in dirs:
-                            item_path = os.path.join(explore_path, item)[head:]
-                            if item_path not in all_dirs:
-                                all_dirs.append(item_path)
-
-                        for item in files:
-                            item_path = os.path.join(explore_path, item)[head:]
-                            real_path = restore_to + item_path[src_delta:]
-                            self.restorePermission(item_path, real_path, fileInfoDict, callback)
-
-            all_dirs.reverse()
-            for item_path in all_dirs:
-                real_path = restore_to + item_path[src_delta:]
-                self.restorePermission(item_path, real_path, fileInfoDict, callback)
-
+        if isinstance(restore_to, str):
+            restore_to = restore_to.encode()
+        groups = {}
+        for path, src_delta in restored_paths:
+            groups.setdefault(src_delta, []).append(os.fsencode(path))
+
+        def items():
+            #only stream permissions for restored paths (and their parent
+            #folders if they were restored to the original destination)
+            for src_delta, prefixes in groups.items():
+                for item_path, (mode, user, group) in sid.iterFileInfo(prefixes, parents = not restore_to):
+                    yield (restore_to + item_path[src_delta:],
+                           mode,
+                           self.uid(user, callback),
+                           self.gid(group, callback))
+
+        restorer = permissionrestorer.PermissionRestorer(functools.partial(self.restoreCallback, callback))
+        restorer.restore(items())
+
+        if restorer.items:
             self.restoreCallback(callback, True, '')
             if self.restorePermissionFailed:
                 status = _('FAILED')
@@ -575,12 +613,67 @@ class Snapshots:
         """
         if isinstance(sid, RootSnapshot):
             return
+        if self.config.snapshotsMode() in ('local', 'local_encfs'):
+            try:
+                self.removeMany([sid])
+            except OSError as e:
+                logger.error('Failed to remove snapshot {}: {}'.format(sid, str(e)), self)
+            return
+        catalog = snapshotcatalog.SnapshotCatalog(self.config)
+        stamp = catalog.stamp()
         rsync = tools.rsyncRemove(self.config)
         with TemporaryDirectory() as d:
             rsync.append(d + os.sep)
             rsync.append(self.rsyncRemotePath(sid.path(use_mode = ['ssh', 'ssh_encfs'])))
             tools.Execute(rsync).run()
             shutil.rmtree(sid.path())
+        catalog.commit(stamp, discard = (sid,))
+
+    def removeMany(self, sids, progress = None):
+        """
+        Remove multiple snapshots. In local modes this will remove snapshots
+        in parallel with :py:class:`snapshotremover.SnapshotRemover`. All
+        other modes remove one snapshot after the other with :py:func:`remove`.
+
+        Args:
+            sids (list):            :py:class:`SID` objects that should be
+                                    removed
+            progress (method):      called with number of removed snapshots
+                                    and number of all snapshots after each
+                                    snapshot
+
+        Raises:
+            OSError:                if a local snapshot could not be removed
+        """
+        sids = [sid for sid in sids if not isinstance(sid, RootSnapshot)]
+        if not sids:
+            return
+        if self.config.snapshotsMode() not in ('local', 'local_encfs'):
+            for i, sid in enumerate(sids, 1):
+                self.remove(sid)
+                if progress:
+                    progress(i, len(sids))
+            return
+
+        def callback(sid, files, freed):
+            logger.debug('Removed snapshot {}: {} files, {:.1f} MiB freed'.format(
+                         sid, files, freed / 1024 / 1024),
+                         self)
+            if progress:
+                progress(len(remover.removed), len(sids))
+
+        catalog = snapshotcatalog.SnapshotCatalog(self.config)
+        stamp = catalog.stamp()
+        remover = snapshotremover.SnapshotRemover(self.config, callback)
+        try:
+            remover.remove(sids)
+        finally:
+            catalog.commit(stamp, discard = remover.removed)
+        logger.info('Removed {} snapshots, {:.1f} MiB freed'.format(
+                    len(remover.removed), remover.freed / 1024 / 1024),
+                    self)
+        if remover.errors:
+            raise remover.errors[0][1]
 
     def backup(self, force = False):
         """
@@ -632,6 +725,8 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 instance.startApplication()
                 self.flockExclusive()
                 logger.info('Lock', self)
+                self.messagePublisher.listen()
+                self.runReport = runreport.RunReport(self.config)
 
                 now = datetime.datetime.today()
 
@@ -640,9 +735,11 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
                 #mount
                 try:
-                    hash_id = mount.Mount(cfg = self.config).mount()
+                    with self.runReport.phase('mount'):
+                        hash_id = mount.Mount(cfg = self.config).mount()
                 except MountException as ex:
                     logger.error(str(ex), self)
+                    self.messagePublisher.close()
                     instance.exitApplication()
                     logger.info('Unlock', self)
                     time.sleep(2)
@@ -710,9 +807,19 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                             ret_error = False
 
                         if not ret_error:
-                            self.freeSpace(now)
+                            if ret_val:
+                                with self.runReport.phase('dedup'):
+                                    self.deduplicate(sid)
+                            with self.runReport.phase('freeSpace'):
+                                self.freeSpace(now)
                             self.setTakeSnapshotMessage(0, _('Finalizing'))
 
+                        if ret_val:
+                            self.runReport.result = 'error' if ret_error else 'ok'
+                            self.runReport.save(sid)
+                        else:
+                            self.runReport.result = 'error' if ret_error else 'unchanged'
+
                     time.sleep(2)
                     sleep = False
 
@@ -730,10 +837,14 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
                 #unmount
                 try:
-                    mount.Mount(cfg = self.config).umount(self.config.current_hash_id)
+                    with self.runReport.phase('umount'):
+                        mount.Mount(cfg = self.config).umount(self.config.current_hash_id)
                 except MountException as ex:
                     logger.error(str(ex), self)
+                if self.runReport.result is not None:
+                    self.runReport.appendHistory()
 
+                self.messagePublisher.close()
                 instance.exitApplication()
                 self.flockRelease()
                 logger.info('Unlock', self)
@@ -747,10 +858,27 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
         return ret_error
 
+    def deduplicate(self, sid):
+        """
+        Replace files in ``sid`` which are identical to files in older
+        snapshots with hardlinks if this is enabled for the current profile.
+        See :py:class:`dedup.Deduplicator`.
+
+        Args:
+            sid (SID):  new snapshot
+        """
+        if not self.config.dedupEnabled():
+            return
+        if self.config.snapshotsMode() != 'local':
+            logger.debug('Deduplication is only available in mode local', self)
+            return
+        self.setTakeSnapshotMessage(0, _('Deduplicating'))
+        dedup.Deduplicator(self.config).run(sid)
+
     def filterRsyncProgress(self, line):
         """
-        Filter rsync's stdout for progress informations and store them in
-        '~/.local/share/backintime/worker<N>.progress' file.
+        Filter rsync's stdout for progress informations and publish them
+        with :py:class:`progress.ProgressPublisher`.
 
         Args:
             line (str): stdout line from rsync
@@ -763,16 +891,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         for l in line.split('\n'):
             m = self.reRsyncProgress.match(l)
             if m:
-                # if m.group(5).strip():
-                #     return
-                pg = progress.ProgressFile(self.config)
-                pg.setIntValue('status', pg.RSYNC)
-                pg.setStrValue('sent', m.group(1))
-                pg.setIntValue('percent', int(m.group(2)))
-                pg.setStrValue('speed', m.group(3))
-                #pg.setStrValue('eta', m.group(4))
-                pg.save()
-                del(pg)
+                self.progressPublisher.update(progress.fromRsync(m))
             else:
                 ret.append(l)
         return '\n'.join(ret)
@@ -793,6 +912,26 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         """
         if not line:
             return
+        # hand over coalesced messages from the main thread
+        self.messagePublisher.poll()
+
+        rsyncStat = runreport.parseRsyncStats(line)
+        if rsyncStat is not None:
+            if rsyncStat[0] is not None:
+                self.runReport.addRsyncStat(*rsyncStat)
+                if self.transferMetrics is not None:
+                    self.transferMetrics.addRsyncStat(*rsyncStat)
+            return
+
+        change = None
+        if line.startswith('BACKINTIME: '):
+            # '--out-format' puts the file size in front of itemize flags
+            size, sep, item = line[12:].partition(' ')
+            if sep and size.isdigit():
+                line = 'BACKINTIME: ' + item
+                change = (item, int(size))
+                if self.transferMetrics is not None:
+                    self.transferMetrics.addChange(*change)
 
         self.setTakeSnapshotMessage(0, _('Take snapshot') + " (rsync: %s)" % line)
 
@@ -807,6 +946,22 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 if line[12] != '.' and line[12:14] != 'cd':
                     params[1] = True
                     self.snapshotLog.append('[C] ' + line[12:], 2)
+                    if change is not None and self.changeManifest is not None:
+                        self.addChange(*change)
+
+    def addChange(self, item, size):
+        """
+        Add a change reported by rsync to the change manifest of the new
+        snapshot.
+
+        Args:
+            item (str):     itemize flags and file name (``%i %n%L``)
+            size (int):     file size
+        """
+        flags, name = item[:11], item[12:]
+        if flags[1] == 'L':
+            name = name.partition(' -> ')[0]
+        self.changeManifest.add(name, flags, size if flags[0] != '*' else 0)
 
     def makeDirs(self, path):
         """
@@ -873,53 +1028,305 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         i.setStrValue('filesystem_mounts', json.dumps(tools.filesystemMountInfo()))
         sid.info = i
 
-    def backupPermissions(self, sid):
+    def backupPermissions(self, sid, prev_sid = None, changed = None):
         """
         Save permissions (owner, group, read-, write- and executable)
-        for all files in Snapshot ``sid`` into snapshots fileInfoDict.
+        for all files in Snapshot ``sid`` into snapshots fileinfo.
+
+        Local snapshots are scanned with a single sorted ``os.scandir`` walk.
+        Remote snapshots are listed with ``rsync --dry-run``. Permissions
+        are written to disk while scanning so memory usage does not grow with
+        the number of files.
+
+        If ``sid`` was created from ``prev_sid`` with only ``changed`` paths
+        transferred, permissions of all other paths are copied from
+        ``prev_sid``.
 
         Args:
-            sid (SID):  snapshot that should be scanned
+            sid (SID):          snapshot that should be scanned
+            prev_sid (SID):     snapshot ``sid`` is based on
+            changed (list):     sorted list of changed paths from
+                                :py:class:`changejournal.ChangeJournal`
         """
         logger.info('Save permissions', self)
         self.setTakeSnapshotMessage(0, _('Saving permissions...'))
 
-        fileInfoDict = FileInfoDict()
+        prev = None
+        if changed is not None and prev_sid:
+            try:
+                prev = fileinfo.FileInfoReader(prev_sid.path(prev_sid.FILEINFO))
+            except (OSError, fileinfo.FileInfoFormatError) as e:
+                logger.debug('Can not reuse permissions from {}: {}'.format(prev_sid, str(e)), self)
+            else:
+                if not prev.isSorted:
+                    prev.close()
+                    prev = None
+
+        try:
+            with fileinfo.FileInfoWriter(sid.path(sid.FILEINFO)) as writer:
+                if prev is not None:
+                    with prev:
+                        self.backupPermissionsChanged(sid, prev, changed, writer)
+                    return
+
+                # backup permissions of /
+                # bugfix for https://github.com/bit-team/backintime/issues/708
+                self.collectPermission(writer, b'/')
+
+                if self.config.snapshotsMode() in ('ssh', 'ssh_encfs'):
+                    self.backupPermissionsRemote(sid, writer)
+                else:
+                    for path in self.iterSnapshotTree(sid):
+                        self.collectPermission(writer, path)
+        except PermissionError as e:
+            logger.error('Failed to write {}: {}'.format(sid.FILEINFO, str(e)), self)
+
+    def backupPermissionsChanged(self, sid, prev, changed, writer):
+        """
+        Merge permissions of ``changed`` paths with all unchanged paths from
+        the previous snapshot.
+
+        Args:
+            sid (SID):                          new snapshot
+            prev (fileinfo.FileInfoReader):     fileinfo of previous snapshot
+            changed (list):                     sorted list of changed paths
+            writer (fileinfo.FileInfoWriter):   destination for permissions
+        """
+        root = sid.pathBackup().encode()
+        changedSet = set(changed)
+        # paths which are no folders anymore. Their old content is gone.
+        gone = set()
+        records = []
+        for path in changed:
+            try:
+                st = os.lstat(root + path)
+            except OSError:
+                gone.add(path)
+                continue
+            if not stat.S_ISDIR(st.st_mode):
+                gone.add(path)
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+            info = self.permission(path)
+            if info is not None:
+                records.append((path, info))
+
+        def unchanged():
+            for path, info in prev.items():
+                if path in changedSet:
+                    continue
+                if gone:
+                    parent = path
+                    while parent != b'/':
+                        parent = os.path.dirname(parent)
+                        if parent in gone:
+                            break
+                    else:
+                        yield path, info
+                    continue
+                yield path, info
+
+        for path, info in heapq.merge(unchanged(), records, key = lambda x: x[0]):
+            writer.write(path, *info)
+
+    def linkSnapshot(self, prev_sid, new_snapshot, changed):
+        """
+        Fill ``new_snapshot`` with hardlinks to all files in ``prev_sid``
+        which are not in ``changed``. Folders are created as new folders.
+        Changed paths are left out so rsync will transfer them with
+        ``--link-dest`` like in a normal snapshot.
+
+        Args:
+            prev_sid (SID):             previous snapshot
+            new_snapshot (NewSnapshot): new snapshot
+            changed (list):             changed paths
+
+        Returns:
+            bool:                       ``True`` if items have been removed
+                                        since ``prev_sid``, ``None`` if
+                                        linking failed
+        """
+        changed = set(changed)
+        removed = False
+        src_root = prev_sid.pathBackup().encode()
+        dst_root = new_snapshot.pathBackup().encode()
+        head = len(src_root)
+        dirs = []
+        stack = [src_root]
+        try:
+            while stack:
+                folder = stack.pop()
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        path = entry.path[head:]
+                        dst = dst_root + path
+                        isDir = entry.is_dir(follow_symlinks = False)
+                        if path in changed:
+                            if not os.path.lexists(path):
+                                removed = True
+                                self.snapshotLog.append('[C] *deleting   ' + path.decode(errors = 'replace').lstrip('/'), 2)
+                                if self.changeManifest is not None:
+                                    self.changeManifest.add(os.fsdecode(path), '*deleting  ', 0)
+                                if self.transferMetrics is not None:
+                                    self.transferMetrics.add('deleted')
+                                continue
+                            if not isDir or os.path.islink(path) or not os.path.isdir(path):
+                                continue
+                        if isDir:
+                            os.mkdir(dst)
+                            dirs.append((entry.path, dst))
+                            stack.append(entry.path)
+                            continue
+                        try:
+                            os.link(entry.path, dst, follow_symlinks = False)
+                        except OSError as e:
+                            if e.errno != errno.EMLINK:
+                                raise
+                            shutil.copy2(entry.path, dst, follow_symlinks = False)
+            for src, dst in reversed(dirs):
+                st = os.lstat(src)
+                try:
+                    os.chown(dst, st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+                shutil.copystat(src, dst, follow_symlinks = False)
+        except OSError as e:
+            logger.error('Failed to link previous snapshot {}. Take a full snapshot instead: {}'.format(
+                         prev_sid, str(e)),
+                         self)
+            # hardlinks must not be modified by a full rsync run
+            shutil.rmtree(dst_root, ignore_errors = True)
+            new_snapshot.makeDirs()
+            return None
+        return removed
+
+    def backupPermissionsRemote(self, sid, writer):
+        """
+        List all files in remote snapshot ``sid`` with rsync and collect
+        their permissions.
+
+        Args:
+            sid (SID):                          snapshot that should be scanned
+            writer (fileinfo.FileInfoWriter):   destination for permissions
+        """
         if self.config.snapshotsMode() == 'ssh_encfs':
             decode = encfstools.Decode(self.config, False)
         else:
             decode = encfstools.Bounce()
 
-        # backup permissions of /
-        # bugfix for https://github.com/bit-team/backintime/issues/708
-        self.backupPermissionsCallback(b'/', (fileInfoDict, decode))
-
         rsync = ['rsync', '--dry-run', '-r', '--out-format=%n']
         rsync.extend(tools.rsyncSshArgs(self.config))
         rsync.append(self.rsyncRemotePath(sid.pathBackup(use_mode = ['ssh', 'ssh_encfs'])) + os.sep)
         with TemporaryDirectory() as d:
             rsync.append(d + os.sep)
+            pending = []
             proc = tools.Execute(rsync,
                                  callback = self.backupPermissionsCallback,
-                                 user_data = (fileInfoDict, decode),
+                                 user_data = (writer, decode, pending),
                                  parent = self,
                                  conv_str = False,
-                                 join_stderr = False)
+                                 join_stderr = False,
+                                 batched = True)
             proc.run()
-
-        sid.fileInfo = fileInfoDict
+            self.backupPermissionsFlush(writer, decode, pending)
+        decode.close()
 
     def backupPermissionsCallback(self, line, user_data):
         """
-        Rsync callback for :py:func:`Snapshots.backupPermissions`.
+        Rsync callback for :py:func:`Snapshots.backupPermissionsRemote`.
+        Lines are decoded in batches by :py:func:`backupPermissionsFlush`.
 
         Args:
             line(bytes):        output from rsync command
-            user_data (tuple):  two item tuple of (:py:class:`FileInfoDict`,
-                                :py:class:`encfstools.Decode`)
+            user_data (tuple):  three item tuple of
+                                (:py:class:`fileinfo.FileInfoWriter`,
+                                :py:class:`encfstools.Decode`,
+                                list of pending lines)
+        """
+        writer, decode, pending = user_data
+        pending.append(line)
+        if len(pending) >= 1000:
+            self.backupPermissionsFlush(writer, decode, pending)
+
+    def backupPermissionsFlush(self, writer, decode, pending):
+        """
+        Decode all ``pending`` paths at once and collect their permissions.
+
+        Args:
+            writer (fileinfo.FileInfoWriter):   destination for permissions
+            decode (encfstools.Decode):         decode instance
+            pending (list):                     rsync output lines. Will be
+                                                cleared
+        """
+        for path in decode.paths(pending):
+            self.collectPermission(writer, b'/' + path.rstrip(b'/'))
+        pending.clear()
+
+    def iterSnapshotTree(self, sid):
+        """
+        Walk through all folders and regular files inside the backup folder
+        of a local snapshot ``sid``. Symlinks and special files are skipped
+        like ``rsync -r`` would do.
+
+        Paths are yielded in the byte order of their full path (not depth
+        first by name) so they can be written to
+        :py:class:`fileinfo.FileInfoWriter` without sorting them in memory.
+
+        Args:
+            sid (SID):  snapshot that should be scanned
+
+        Yields:
+            bytes:      original full path of each item
+        """
+        # each stack item is a list of (sort key, full path, folder to scan)
+        # in reversed order. Folders are added twice, once as item and once
+        # with a trailing slash as key for their content.
+        stack = [[(b'', b'', sid.pathBackup().encode())]]
+        while stack:
+            if not stack[-1]:
+                stack.pop()
+                continue
+            key, path, folder = stack[-1].pop()
+            if folder is None:
+                yield path
+                continue
+            items = []
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        item = path + b'/' + entry.name
+                        try:
+                            if entry.is_dir(follow_symlinks = False):
+                                items.append((entry.name, item, None))
+                                items.append((entry.name + b'/', item, entry.path))
+                            elif entry.is_file(follow_symlinks = False):
+                                items.append((entry.name, item, None))
+                        except OSError:
+                            pass
+            except OSError as e:
+                logger.error('Failed to scan {}: {}'.format(folder, str(e)), self)
+                continue
+            items.sort(reverse = True)
+            stack.append(items)
+
+    def permission(self, path):
         """
-        fileInfoDict, decode = user_data
-        self.collectPermission(fileInfoDict, b'/' + decode.path(line).rstrip(b'/'))
+        Get permissions of ``path``.
+
+        Args:
+            path (bytes):   full path to file or folder
+
+        Returns:
+            tuple:          (mode, user, group) or ``None`` if ``path``
+                            doesn't exist
+        """
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        return (info.st_mode,
+                self.userName(info.st_uid).encode('utf-8', 'replace'),
+                self.groupName(info.st_gid).encode('utf-8', 'replace'))
 
     def collectPermission(self, fileinfo, path):
         """
@@ -927,24 +1334,27 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         ``fileinfo``.
 
         Args:
-            fileinfo (FileInfoDict):
+            fileinfo (FileInfoDict or fileinfo.FileInfoWriter):
                             dict of: {path: (permission, user, group)}
                             Using sideefect on changing dict item will change
                             original dict, too.
             path (bytes):   full path to file or folder
         """
         assert isinstance(path, bytes), 'path is not bytes type: %s' % path
-        if path and os.path.exists(path):
-            info = os.stat(path)
-            mode = info.st_mode
-            user = self.userName(info.st_uid).encode('utf-8', 'replace')
-            group = self.groupName(info.st_gid).encode('utf-8', 'replace')
-            fileinfo[path] = (mode, user, group)
+        if not path:
+            return
+        info = self.permission(path)
+        if info is None:
+            return
+        if isinstance(fileinfo, FileInfoDict):
+            fileinfo[path] = info
+        else:
+            fileinfo.write(path, *info)
 
     def takeSnapshot(self, sid, now, include_folders):
         """
         This is the main backup routine. It will take a new snapshot and store
-        permissions of included files and folders into ``fileinfo.bz2``.
+        permissions of included files and folders into ``fileinfo.idx``.
 
         Args:
             sid (SID):                  snapshot ID which the new snapshot
@@ -969,8 +1379,10 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         new_snapshot = NewSnapshot(self.config)
         encode = self.config.ENCODE
         params = [False, False] # [error, changes]
+        resume = False
 
         if new_snapshot.exists() and new_snapshot.saveToContinue:
+            resume = True
             logger.info("Found leftover '%s' which can be continued." %new_snapshot.displayID, self)
             self.setTakeSnapshotMessage(0, _("Found leftover '%s' which can be continued.") %new_snapshot.displayID)
             #fix permissions
@@ -994,8 +1406,12 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 time.sleep(2) #max 1 backup / second
                 return [False, True]
 
-        if not new_snapshot.saveToContinue and not new_snapshot.makeDirs():
-            return [False, True]
+        if not new_snapshot.saveToContinue:
+            catalog = snapshotcatalog.SnapshotCatalog(self.config)
+            stamp = catalog.stamp()
+            if not new_snapshot.makeDirs():
+                return [False, True]
+            catalog.commit(stamp, add = (new_snapshot,))
 
         prev_sid = None
         snapshots = listSnapshots(self.config)
@@ -1007,12 +1423,14 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         if self.config.excludeBySizeEnabled():
             rsync_prefix.append('--max-size=%sM' %self.config.excludeBySize())
         rsync_suffix = self.rsyncSuffix(include_folders)
+        # changes in the journal are only valid for the same settings
+        journal_key = hashlib.md5('\0'.join(rsync_prefix + rsync_suffix).encode()).hexdigest()
 
         # When there is no snapshots it takes the last snapshot from the other folders
         # It should delete the excluded folders then
         rsync_prefix.extend(('--delete', '--delete-excluded'))
-        rsync_prefix.append('-v')
-        rsync_prefix.extend(('-i', '--out-format=BACKINTIME: %i %n%L'))
+        rsync_prefix.extend(('-v', '--stats'))
+        rsync_prefix.extend(('-i', '--out-format=BACKINTIME: %l %i %n%L'))
         if prev_sid:
             link_dest = encode.path(os.path.join(prev_sid.sid, 'backup'))
             link_dest = os.path.join(os.pardir, os.pardir, link_dest)
@@ -1026,16 +1444,102 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
         self.setTakeSnapshotMessage(0, _('Taking snapshot'))
 
+        #collect changes reported by rsync
+        if self.config.snapshotsMode() == 'ssh_encfs':
+            decode = encfstools.Decode(self.config)
+        else:
+            decode = encfstools.Bounce()
+        self.changeManifest = changemanifest.ChangeManifestWriter(new_snapshot.path(SID.CHANGES),
+                                                                  decode = decode.paths)
+        self.transferMetrics = runreport.TransferMetrics()
+        if resume:
+            # same as the change manifest, keep what the last session did
+            self.transferMetrics.merge(new_snapshot.path(SID.TRANSFER))
+
+        #changes recorded by changejournal.Watcher since last snapshot
+        journal = changejournal.ChangeJournal(self.config)
+        changed = journal.rotate(prev_sid.sid if prev_sid else None, journal_key)
+        if resume or self.config.snapshotsMode() != 'local':
+            changed = None
+        if changed is not None:
+            logger.info('Found {} changed items in change journal'.format(len(changed)), self)
+            self.setTakeSnapshotMessage(0, _('Linking unchanged files from previous snapshot'))
+            with self.runReport.phase('linkSnapshot'):
+                removed = self.linkSnapshot(prev_sid, new_snapshot, changed)
+            if removed is None:
+                changed = None
+            elif removed:
+                params[1] = True
+
         #run rsync
-        proc = tools.Execute(cmd,
-                             callback = self.rsyncCallback,
-                             user_data = params,
-                             filters = (self.filterRsyncProgress,),
-                             parent = self)
-        self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
-        proc.run()
+        with self.runReport.phase('rsync'):
+            workers = self.config.rsyncWorkers()
+            shards = [include_folders]
+            if changed is None and workers > 1:
+                shards = self.rsyncShards(include_folders, workers)
+            if changed is not None:
+                files_from = journal.pendingFile + '.files'
+                with open(files_from, 'wb') as f:
+                    for path in changed:
+                        if os.path.lexists(path):
+                            f.write(path + b'\0')
+                # deleted items were already skipped by linkSnapshot
+                cmd = [i for i in rsync_prefix if i not in ('--delete', '--delete-excluded')]
+                cmd.extend(('--from0', '--files-from=' + files_from))
+                cmd.extend(rsync_suffix)
+                cmd.append(self.rsyncRemotePath(new_snapshot.pathBackup()))
+                proc = tools.Execute(cmd,
+                                     callback = self.rsyncCallback,
+                                     user_data = params,
+                                     filters = (self.filterRsyncProgress,),
+                                     parent = self,
+                                     batched = True)
+                self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
+                proc.run()
+                os.remove(files_from)
+            elif len(shards) > 1:
+                logger.info('Split rsync into {} workers'.format(len(shards)), self)
+                procs = []
+                for shard in shards:
+                    others = [item for i in shards if i is not shard for item in i]
+                    cmd = rsync_prefix + self.rsyncProtect(others) + self.rsyncSuffix(shard)
+                    cmd.append(self.rsyncRemotePath(new_snapshot.pathBackup(use_mode = ['ssh', 'ssh_encfs'])))
+                    proc = tools.Execute(cmd,
+                                         callback = self.rsyncCallback,
+                                         user_data = params,
+                                         filters = (self.filterRsyncProgress,),
+                                         parent = self,
+                                         batched = True)
+                    self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
+                    procs.append(proc)
+                tools.ExecuteGroup(procs, parent = self).run()
+            else:
+                proc = tools.Execute(cmd,
+                                     callback = self.rsyncCallback,
+                                     user_data = params,
+                                     filters = (self.filterRsyncProgress,),
+                                     parent = self,
+                                     batched = True)
+                self.snapshotLog.append('[I] ' + proc.printable_cmd, 3)
+                proc.run()
+
+        #write change manifest
+        try:
+            count = self.changeManifest.close()
+            logger.debug('{} changes in change manifest'.format(count), self)
+        except OSError as e:
+            logger.warning('Failed to write change manifest {}: {}'.format(
+                           new_snapshot.path(SID.CHANGES), str(e)),
+                           self)
+        self.changeManifest = None
+        decode.close()
+
+        #write transfer metrics
+        self.transferMetrics.save(new_snapshot.path(SID.TRANSFER))
+        self.transferMetrics = None
 
         #cleanup
+        self.progressPublisher.close()
         try:
             os.remove(self.config.takeSnapshotProgressFile())
         except Exception as e:
@@ -1061,18 +1565,23 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             self.snapshotLog.append('[I] ' + _('Nothing changed, no new snapshot necessary'), 3)
             if prev_sid:
                 prev_sid.setLastChecked()
+            if not has_errors:
+                journal.commit(prev_sid.sid if prev_sid else None, journal_key)
             if not has_errors and not list(self.config.anacrontabFiles()):
                 tools.writeTimeStamp(self.config.anacronSpoolFile())
             return [False, False]
 
-        self.backupConfig(new_snapshot)
-        self.backupPermissions(new_snapshot)
+        with self.runReport.phase('backupConfig'):
+            self.backupConfig(new_snapshot)
+        with self.runReport.phase('backupPermissions'):
+            self.backupPermissions(new_snapshot, prev_sid, changed)
 
         #copy snapshot log
         try:
-            self.snapshotLog.flush()
-            with open(self.snapshotLog.logFileName, 'rb') as logfile:
-                new_snapshot.setLog(logfile.read())
+            with self.runReport.phase('copyLog'):
+                self.snapshotLog.flush()
+                with open(self.snapshotLog.logFileName, 'rb') as logfile:
+                    new_snapshot.setLog(logfile.read())
         except Exception as e:
             logger.debug('Failed to write takeSnapshot log %s into compressed file %s: %s'
                          %(self.config.takeSnapshotLogFile(), new_snapshot.path(SID.LOG), str(e)),
@@ -1080,7 +1589,11 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
         new_snapshot.saveToContinue = False
         #rename snapshot
-        os.rename(new_snapshot.path(), sid.path())
+        with self.runReport.phase('rename'):
+            catalog = snapshotcatalog.SnapshotCatalog(self.config)
+            stamp = catalog.stamp()
+            os.rename(new_snapshot.path(), sid.path())
+            catalog.commit(stamp, add = (sid,), discard = (new_snapshot,))
 
         if not sid.exists():
             logger.error("Can't rename %s to %s" % (new_snapshot.path(), sid.path()), self)
@@ -1090,16 +1603,33 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             time.sleep(2) #max 1 backup / second
             return [False, True]
 
-        self.backupInfo(sid)
+        with self.runReport.phase('backupInfo'):
+            self.backupInfo(sid)
 
+        if not has_errors:
+            journal.commit(sid.sid, journal_key)
         if not has_errors and not list(self.config.anacrontabFiles()):
             tools.writeTimeStamp(self.config.anacronSpoolFile())
 
         #create last_snapshot symlink
         self.createLastSnapshotSymlink(sid)
 
+        with self.runReport.phase('changeIndex'):
+            self.updateChangeIndex()
+
         return [True, has_errors]
 
+    def updateChangeIndex(self):
+        """
+        Add the change manifests of new snapshots to the cross-snapshot
+        change index and drop removed snapshots from it.
+        """
+        try:
+            with changemanifest.ChangeIndex(self.config) as index:
+                index.update(listSnapshots(self.config))
+        except (OSError, changemanifest.ChangeManifestFormatError) as e:
+            logger.warning('Failed to update change index: {}'.format(str(e)), self)
+
     def smartRemoveKeepAll(self,
                            snapshots,
                            min_date,
@@ -1230,74 +1760,15 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         logger.debug("Considered: %s" %snapshots, self)
         if len(snapshots) <= 1:
             logger.debug("There is only one snapshots, so keep it", self)
-            return
-
-        if now_full is None:
-            now_full = datetime.datetime.today()
-
-        now = now_full.date()
-
-        #keep the last snapshot
-        keep = set([snapshots[0]])
-
-        #keep all for the last keep_all days
-        if keep_all > 0:
-            keep |= self.smartRemoveKeepAll(snapshots,
-                                            now - datetime.timedelta(days=keep_all-1),
-                                            now + datetime.timedelta(days=1))
-
-        #keep one per day for the last keep_one_per_day days
-        if keep_one_per_day > 0:
-            d = now
-            for i in range(0, keep_one_per_day):
-                keep |= self.smartRemoveKeepFirst(snapshots,
-                                                  d,
-                                                  d + datetime.timedelta(days=1),
-                                                  keep_healthy = True)
-                d -= datetime.timedelta(days=1)
-
-        #keep one per week for the last keep_one_per_week weeks
-        if keep_one_per_week > 0:
-            d = now - datetime.timedelta(days = now.weekday() + 1)
-            for i in range(0, keep_one_per_week):
-                keep |= self.smartRemoveKeepFirst(snapshots,
-                                                  d,
-                                                  d + datetime.timedelta(days=8),
-                                                  keep_healthy = True)
-                d -= datetime.timedelta(days=7)
-
-        #keep one per month for the last keep_one_per_month months
-        if keep_one_per_month > 0:
-            d1 = datetime.date(now.year, now.month, 1)
-            d2 = self.incMonth(d1)
-            for i in range(0, keep_one_per_month):
-                keep |= self.smartRemoveKeepFirst(snapshots, d1, d2,
-                                                  keep_healthy = True)
-                d2 = d1
-                d1 = self.decMonth(d1)
-
-        #keep one per year for all years
-        first_year = int(snapshots[-1].sid[ : 4])
-        for i in range(first_year, now.year+1):
-            keep |= self.smartRemoveKeepFirst(snapshots,
-                                              datetime.date(i,1,1),
-                                              datetime.date(i+1,1,1),
-                                              keep_healthy = True)
-
-        logger.debug("Keep snapshots: %s" %keep, self)
-
-        del_snapshots = []
-        for sid in snapshots:
-            if sid in keep:
-                continue
-
-            if self.config.dontRemoveNamedSnapshots():
-                if sid.name:
-                    logger.debug("Keep snapshot: %s, it has a name" %sid, self)
-                    continue
+            return []
 
-            del_snapshots.append(sid)
-        return del_snapshots
+        planner = smartremove.SmartRemovePlanner(self.config,
+                                                 now_full,
+                                                 keep_all,
+                                                 keep_one_per_day,
+                                                 keep_one_per_week,
+                                                 keep_one_per_month)
+        return planner.removeList(snapshots)
 
     def smartRemove(self, del_snapshots, log = None):
         """
@@ -1374,9 +1845,9 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         else:
             logger.info("[smart remove] remove snapshots: %s"
                         %del_snapshots, self)
-            for i, sid in enumerate(del_snapshots, 1):
-                log(_('Smart remove') + ' %s/%s' %(i, len(del_snapshots)))
-                self.remove(sid)
+            log(_('Smart remove') + ' 0/%s' %len(del_snapshots))
+            self.removeMany(del_snapshots,
+                            lambda i, count: log(_('Smart remove') + ' %s/%s' %(i, count)))
 
     def freeSpace(self, now):
         """
@@ -1407,6 +1878,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
             oldBackupId = SID(self.config.removeOldSnapshotsDate(), self.config)
             logger.debug("Remove snapshots older than: {}".format(oldBackupId.withoutTag), self)
 
+            old_snapshots = []
             while True:
                 if len(snapshots) <= 1:
                     break
@@ -1420,8 +1892,9 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
                 msg = 'Remove snapshot {} because it is older than {}'
                 logger.debug(msg.format(snapshots[0].withoutTag, oldBackupId.withoutTag), self)
-                self.remove(snapshots[0])
+                old_snapshots.append(snapshots[0])
                 del snapshots[0]
+            self.removeMany(old_snapshots)
 
         #smart remove
         enabled, keep_all, keep_one_per_day, keep_one_per_week, keep_one_per_month = self.config.smartRemove()
@@ -1432,7 +1905,11 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                                                  keep_one_per_day,
                                                  keep_one_per_week,
                                                  keep_one_per_month)
-            self.smartRemove(del_snapshots)
+            with self.runReport.phase('smartRemove'):
+                self.smartRemove(del_snapshots)
+
+        planner = freespace.FreeSpacePlanner(self.config)
+        keep = lambda sid: self.config.dontRemoveNamedSnapshots() and sid.name
 
         #try to keep min free space
         if self.config.minFreeSpaceEnabled():
@@ -1460,15 +1937,16 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 if free_space >= minFreeSpace:
                     break
 
-                if self.config.dontRemoveNamedSnapshots():
-                    if snapshots[0].name:
-                        del snapshots[0]
-                        continue
+                del_snapshots = planner.plan(snapshots,
+                                             size = (minFreeSpace - free_space) * 1024 * 1024,
+                                             keep = keep)
+                if not del_snapshots:
+                    break
 
-                msg = "free disk space: {} MiB. Remove snapshot {}"
-                logger.debug(msg.format(free_space, snapshots[0].withoutTag), self)
-                self.remove(snapshots[0])
-                del snapshots[0]
+                msg = "free disk space: {} MiB. Remove snapshots {}"
+                logger.debug(msg.format(free_space, [sid.withoutTag for sid in del_snapshots]), self)
+                self.removeMany(del_snapshots)
+                snapshots = [sid for sid in snapshots if sid not in del_snapshots]
 
         #try to keep free inodes
         if self.config.minFreeInodesEnabled():
@@ -1495,16 +1973,17 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 if free_inodes >= max_inodes * (minFreeInodes / 100.0):
                     break
 
-                if self.config.dontRemoveNamedSnapshots():
-                    if snapshots[0].name:
-                        del snapshots[0]
-                        continue
+                del_snapshots = planner.plan(snapshots,
+                                             inodes = max_inodes * (minFreeInodes / 100.0) - free_inodes,
+                                             keep = keep)
+                if not del_snapshots:
+                    break
 
-                logger.debug("free inodes: %.2f%%. Remove snapshot %s"
-                            %((100.0 / max_inodes * free_inodes), snapshots[0].withoutTag),
+                logger.debug("free inodes: %.2f%%. Remove snapshots %s"
+                            %((100.0 / max_inodes * free_inodes), [sid.withoutTag for sid in del_snapshots]),
                             self)
-                self.remove(snapshots[0])
-                del snapshots[0]
+                self.removeMany(del_snapshots)
+                snapshots = [sid for sid in snapshots if sid not in del_snapshots]
 
         #set correct last snapshot again
         if last_snapshot is not snapshots[-1]:
@@ -1583,7 +2062,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                                     Which means if a file is exactly the same in
                                     different snapshots only the first snapshot
                                     will be listed
-            flag_deep_check (bool): use md5sum to check uniqueness of files.
+            flag_deep_check (bool): use checksums to check uniqueness of files.
                                     More acurate but slow
             list_equal_to (str):    full path to file. If not empty only return
                                     snapshots which have exactly the same file
@@ -1591,60 +2070,44 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         Returns:
             list:                   filtered list of :py:class:`SID` objects
         """
-        snapshotsFiltered = []
+        return list(self.iterFilter(base_sid,
+                                    base_path,
+                                    snapshotsList,
+                                    list_diff_only,
+                                    flag_deep_check,
+                                    list_equal_to))
+
+    def iterFilter(self,
+                   base_sid,
+                   base_path,
+                   snapshotsList,
+                   list_diff_only  = False,
+                   flag_deep_check = False,
+                   list_equal_to = ''):
+        """
+        Same as :py:func:`filter` but yield matching snapshots as soon as
+        they were checked. Uses :py:class:`filehistory.FileHistory` which
+        needs only one ``lstat`` per snapshot.
 
-        base_full_path = base_sid.pathBackup(base_path)
-        if not os.path.lexists(base_full_path):
-            return []
+        Yields:
+            SID:    matching snapshots in the order of ``snapshotsList``
+                    with :py:class:`RootSnapshot` first
+        """
+        try:
+            base_st = os.lstat(base_sid.pathBackup(base_path))
+        except OSError:
+            return
 
         allSnapshotsList = [RootSnapshot(self.config)]
         allSnapshotsList.extend(snapshotsList)
 
-        #links
-        if os.path.islink(base_full_path):
-            targets = []
-
-            for sid in allSnapshotsList:
-                path = sid.pathBackup(base_path)
-
-                if os.path.lexists(path) and os.path.islink(path):
-                    if list_diff_only:
-                        target = os.readlink(path)
-                        if target in targets:
-                            continue
-                        targets.append(target)
-                    snapshotsFiltered.append(sid)
-
-            return snapshotsFiltered
-
-        #directories
-        if os.path.isdir(base_full_path):
-            for sid in allSnapshotsList:
-                path = sid.pathBackup(base_path)
-
-                if os.path.exists(path) and not os.path.islink(path) and os.path.isdir(path):
-                    snapshotsFiltered.append(sid)
-
-            return snapshotsFiltered
-
-        #files
-        if not list_diff_only and not list_equal_to:
-            for sid in allSnapshotsList:
-                path = sid.pathBackup(base_path)
-
-                if os.path.exists(path) and not os.path.islink(path) and os.path.isfile(path):
-                    snapshotsFiltered.append(sid)
-
-            return snapshotsFiltered
-
-        # check for duplicates
-        uniqueness = tools.UniquenessSet(flag_deep_check, follow_symlink = False, list_equal_to = list_equal_to)
-        for sid in allSnapshotsList:
-            path = sid.pathBackup(base_path)
-            if os.path.exists(path) and not os.path.islink(path) and os.path.isfile(path) and uniqueness.check(path):
-                snapshotsFiltered.append(sid)
-
-        return snapshotsFiltered
+        history = filehistory.FileHistory(self.config)
+        yield from history.filter(allSnapshotsList,
+                                  base_path,
+                                  base_st,
+                                  list_diff_only,
+                                  flag_deep_check,
+                                  list_equal_to)
 
     #TODO: move this to config.Config
     def rsyncRemotePath(self, path, use_mode = ['ssh', 'ssh_encfs'], quote = '"'):
@@ -1727,6 +2190,8 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         if sid is None:
             return
         symlink = self.config.lastSnapshotSymlink()
+        catalog = snapshotcatalog.SnapshotCatalog(self.config)
+        stamp = catalog.stamp()
         try:
             if os.path.islink(symlink):
                 if os.path.basename(os.path.realpath(symlink)) == sid.sid:
@@ -1737,6 +2202,7 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
                 return False
             logger.debug('Create symlink %s => %s' %(symlink, sid), self)
             os.symlink(sid.sid, symlink)
+            catalog.commit(stamp, add = (os.path.basename(symlink),))
             return True
         except Exception as e:
             logger.error('Failed to create symlink %s: %s' %(symlink, str(e)), self)
@@ -1782,6 +2248,20 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         Returns:
             list:                   rsync include and exclude options
         """
+        if includeFolders is None:
+            includeFolders = self.config.include()
+        if excludeFolders is None:
+            excludeFolders = self.config.exclude()
+
+        #encode all plain paths with as few requests to encfsctl as possible
+        plain = [self.config.snapshotsPath(),
+                 self.config._LOCAL_DATA_FOLDER,
+                 self.config._MOUNT_ROOT]
+        plain.extend(i[0] for i in includeFolders if i[0] != '/')
+        plain.extend(i for i in excludeFolders
+                     if '*' not in i and not tools.patternHasNotEncryptableWildcard(i))
+        self.config.ENCODE.prefetch(plain)
+
         #create exclude patterns string
         rsync_exclude = self.rsyncExclude(excludeFolders)
 
@@ -1835,8 +2315,9 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         Args:
             includeFolders (list):  folders to include. list of
                                     tuples (item, int) where ``int`` is ``0``
-                                    if ``item`` is a folder or ``1`` if ``item``
-                                    is a file
+                                    if ``item`` is a folder, ``1`` if ``item``
+                                    is a file or ``2`` for only the files
+                                    directly inside folder ``item``
 
         Returns:
             tuple:                  two item tuple of
@@ -1852,6 +2333,21 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
         for include_folder in includeFolders:
             folder = include_folder[0]
 
+            if include_folder[1] == 2:
+                # only files directly inside folder (see rsyncShards)
+                if folder == '/':
+                    folder = ''
+                else:
+                    folder = encode.include(folder)
+                items2.add('--exclude={}/*/'.format(folder))
+                items2.add('--include={}/*'.format(folder))
+                while True:
+                    if len(folder) <= 1:
+                        break
+                    items1.add('--include={}/'.format(folder))
+                    folder = os.path.split(folder)[0]
+                continue
+
             if folder == "/":	# If / is selected as included folder it should be changed to ""
                 #folder = ""	# because an extra / is added below. Patch thanks to Martin Hoefling
                 items2.add('--include=/')
@@ -1873,6 +2369,102 @@ restore is done. The pid of the already running restore is in %s.  Maybe delete
 
         return (items1, items2)
 
+    def rsyncShards(self, includeFolders, workers):
+        """
+        Split ``includeFolders`` into up to ``workers`` groups which can be
+        transferred by independent rsync processes. If there are less include
+        folders than workers, folders will be split into their top-level
+        subfolders plus one item of type ``2`` for all files directly inside
+        the folder.
+
+        Args:
+            includeFolders (list):  folders to include. list of tuples
+                                    (item, int) like in :py:func:`rsyncInclude`
+            workers (int):          maximum number of groups
+
+        Returns:
+            list:                   list of include lists
+        """
+        # folders nested inside other include folders would be
+        # transferred by two workers at the same time
+        folders = [i[0].rstrip('/') + '/' for i in includeFolders if i[1] == 0]
+        items = []
+        for item in includeFolders:
+            if item in items:
+                continue
+            if any(item[0].startswith(folder) and item[0] != folder
+                   for folder in folders):
+                continue
+            items.append(item)
+
+        if len(items) < workers:
+            split = []
+            for item in items:
+                if item[1] == 0:
+                    split.extend(self.rsyncSplitFolder(item[0]))
+                else:
+                    split.append(item)
+            items = split
+
+        count = max(min(workers, len(items)), 1)
+        shards = [[] for i in range(count)]
+        for index, item in enumerate(items):
+            shards[index % count].append(item)
+        return shards
+
+    def rsyncSplitFolder(self, folder):
+        """
+        Split include ``folder`` into its top-level subfolders.
+
+        Args:
+            folder (str):   include folder
+
+        Returns:
+            list:           list of tuples (item, int) like in
+                            :py:func:`rsyncInclude`
+        """
+        items = []
+        hasFiles = False
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks = False):
+                        items.append((entry.path, 0))
+                    else:
+                        hasFiles = True
+        except OSError as e:
+            logger.debug('Failed to split include folder {}: {}'.format(folder, str(e)), self)
+            return [(folder, 0)]
+        items.sort()
+        if hasFiles or not items:
+            items.append((folder, 2))
+        return items
+
+    def rsyncProtect(self, includeFolders):
+        """
+        Protect items transferred by other rsync workers from being deleted
+        by ``--delete-excluded``.
+
+        Args:
+            includeFolders (list):  folders to protect. list of tuples
+                                    (item, int) like in :py:func:`rsyncInclude`
+
+        Returns:
+            list:                   rsync filter options
+        """
+        encode = self.config.ENCODE
+        ret = []
+        for folder, folderType in includeFolders:
+            if folderType == 2:
+                folder = '' if folder == '/' else encode.include(folder)
+                ret.append('--filter=P {}/*'.format(folder))
+                continue
+            folder = encode.include(folder)
+            ret.append('--filter=P {}'.format(folder))
+            if folderType == 0:
+                ret.append('--filter=P {}/**'.format(folder))
+        return ret
+
 class FileInfoDict(dict):
     """
     A :py:class:`dict` that maps a path (as :py:class:`bytes`) to a
@@ -1880,7 +2472,7 @@ class FileInfoDict(dict):
     """
     def __init__(self):
         # default permissions for /
-        # only used if fileinfo.bz2 does not contain a value for /
+        # only used if fileinfo does not contain a value for /
         # when it was created with version <= 1.1.12
         # bugfix for https://github.com/bit-team/backintime/issues/708
         self[b'/'] = (16877, b'root', b'root')
@@ -1917,8 +2509,18 @@ class SID(object):
     INFO     = 'info'
     NAME     = 'name'
     FAILED   = 'failed'
-    FILEINFO = 'fileinfo.bz2'
+    FILEINFO = 'fileinfo.idx'
+    FILEINFO_BZ2 = 'fileinfo.bz2'
+    FOOTPRINT = 'footprint'
+    CHANGES  = 'changes.idx'
     LOG      = 'takesnapshot.log.bz2'
+    LOG_INDEX = 'takesnapshot.log.idx'
+    RUNREPORT = 'runreport.json'
+    TRANSFER = 'transfer.json'
+
+    # metadata from snapshotcatalog.SnapshotCatalog if this instance
+    # was created while listing snapshots
+    catalogEntry = None
 
     def __init__(self, date, cfg):
         self.config = cfg
@@ -2143,8 +2745,125 @@ class SID(object):
         Returns:
             bool:   ``True`` if exists
         """
+        entry = self.remoteEntry()
+        if entry is not None:
+            return entry['exists']
         return os.path.isdir(self.path()) and os.path.isdir(self.pathBackup())
 
+    def remoteHelper(self):
+        """
+        Helper for reading metadata of this snapshot directly on the remote
+        host instead of going through the ``sshfs`` mount.
+
+        Returns:
+            remotehelper.RemoteHelper:  helper or ``None`` if not available
+        """
+        if self.isRoot:
+            return None
+        return remotehelper.helper(self.config)
+
+    def remoteEntry(self):
+        """
+        Read all metadata of this snapshot through :py:func:`remoteHelper`.
+        Metadata of all snapshots is fetched with one request and shared
+        between :py:class:`SID` instances for a short time. Only
+        :py:class:`NewSnapshot` is always read directly.
+
+        Returns:
+            dict:   'exists', 'name', 'failed' and 'info' or ``None`` if the
+                    remote helper is not available
+        """
+        helper = self.remoteHelper()
+        if helper is None:
+            return None
+        path = self.path(use_mode = ['ssh'])
+        try:
+            if isinstance(self, NewSnapshot):
+                return helper.snapshot(path)
+            return helper.cachedSnapshot(path)
+        except OSError as e:
+            logger.debug('Failed to read snapshot {} with remote helper: {}'.format(
+                         self.sid, str(e)),
+                         self)
+            return None
+
+    def openFile(self, name):
+        """
+        Open file ``name`` inside the snapshot folder for binary reading.
+
+        Args:
+            name (str):     file name like :py:data:`FILEINFO`
+
+        Returns:
+            file object
+
+        Raises:
+            FileNotFoundError:  if the file doesn't exist
+        """
+        helper = self.remoteHelper()
+        if helper is not None:
+            return helper.open(self.path(name, use_mode = ['ssh']))
+        return open(self.path(name), 'rb')
+
+    def changeManifest(self):
+        """
+        Open the change manifest of this snapshot.
+
+        Returns:
+            changemanifest.ChangeManifestReader:    manifest
+
+        Raises:
+            FileNotFoundError:      if the snapshot has no manifest
+            changemanifest.ChangeManifestFormatError:
+                                    if the manifest is invalid
+        """
+        return changemanifest.ChangeManifestReader(self.openFile(self.CHANGES))
+
+    def transferMetrics(self):
+        """
+        Size and churn of this snapshot recorded by
+        :py:class:`runreport.TransferMetrics`. Taken from the snapshot
+        catalog if this instance was created while listing snapshots.
+
+        Returns:
+            dict:   metrics or ``None`` if the snapshot has no (valid)
+                    metrics
+        """
+        if self.catalogEntry is not None:
+            return self.catalogEntry.get('transfer')
+        entry = self.remoteEntry()
+        if entry is not None:
+            return entry.get('transfer')
+        try:
+            with open(self.path(self.TRANSFER), 'rt') as f:
+                metrics = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to read transfer metrics of {}: {}'.format(self, str(e)), self)
+            return None
+        if not isinstance(metrics, dict) or metrics.get('version') != runreport.TransferMetrics.VERSION:
+            return None
+        return metrics
+
+    def runReport(self):
+        """
+        Read the run report of the backup which created this snapshot.
+
+        Returns:
+            dict:   report from :py:class:`runreport.RunReport` or ``None``
+                    if the snapshot has no (valid) report
+        """
+        try:
+            with self.openFile(self.RUNREPORT) as f:
+                report = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            logger.debug('Failed to read run report of {}: {}'.format(self, str(e)), self)
+            return None
+        if not isinstance(report, dict):
+            return None
+        return report
+
     def canOpenPath(self, path):
         """
         ``True`` if path is a file inside this snapshot
@@ -2176,6 +2895,11 @@ class SID(object):
         Returns:
             str:        name of this snapshot
         """
+        if self.catalogEntry is not None:
+            return self.catalogEntry['name']
+        entry = self.remoteEntry()
+        if entry is not None:
+            return entry['name']
         nameFile = self.path(self.NAME)
         if not os.path.isfile(nameFile):
             return ''
@@ -2199,6 +2923,7 @@ class SID(object):
             logger.debug('Failed to set snapshot {} name: {}'.format(
                          self.sid, str(e)),
                          self)
+        self.updateCatalog(name = name)
 
     @property
     def lastChecked(self):
@@ -2210,6 +2935,11 @@ class SID(object):
         Returns:
             str:    date and time of last check (YYYY-MM-DD HH:MM:SS)
         """
+        if self.catalogEntry is not None:
+            return self.catalogEntry['lastChecked']
+        entry = self.remoteEntry()
+        if entry is not None:
+            return self.remoteHelper().entry(self, entry)['lastChecked']
         info = self.path(self.INFO)
         if os.path.exists(info):
             return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getatime(info)))
@@ -2224,6 +2954,7 @@ class SID(object):
         info = self.path(self.INFO)
         if os.path.exists(info):
             os.utime(info, None)
+            self.updateCatalog(lastChecked = time.strftime('%Y-%m-%d %H:%M:%S'))
 
     @property
     def failed(self):
@@ -2236,6 +2967,11 @@ class SID(object):
         Returns:
             bool:           ``True`` if flag is set
         """
+        if self.catalogEntry is not None:
+            return self.catalogEntry['failed']
+        entry = self.remoteEntry()
+        if entry is not None:
+            return entry['failed']
         failedFile = self.path(self.FAILED)
         return os.path.isfile(failedFile)
 
@@ -2253,6 +2989,19 @@ class SID(object):
                              self)
         elif os.path.exists(failedFile):
             os.remove(failedFile)
+        self.updateCatalog(failed = bool(enable))
+
+    def updateCatalog(self, **kwargs):
+        """
+        Forward changed metadata to the snapshot catalog.
+
+        Args:
+            **kwargs:   new values for 'name', 'failed' or 'lastChecked'
+        """
+        if self.catalogEntry is not None:
+            self.catalogEntry.update(kwargs)
+        remotehelper.invalidate(self.config)
+        snapshotcatalog.SnapshotCatalog(self.config).update(self, **kwargs)
 
     @property
     def info(self):
@@ -2274,11 +3023,13 @@ class SID(object):
     def info(self, i):
         assert isinstance(i, configfile.ConfigFile), 'i is not configfile.ConfigFile type: {}'.format(i)
         i.save(self.path(self.INFO))
+        self.updateCatalog(lastChecked = time.strftime('%Y-%m-%d %H:%M:%S'))
 
     @property
     def fileInfo(self):
         """
-        Load/save "fileinfo.bz2"
+        Load/save "fileinfo.idx". Snapshots taken with older versions which
+        only have "fileinfo.bz2" are still readable.
 
         Args:
             d (FileInfoDict): dict of: {path: (permission, user, group)}
@@ -2286,45 +3037,133 @@ class SID(object):
         Returns:
             FileInfoDict:     dict of: {path: (permission, user, group)}
         """
+        return self.fileInfoFor()
+
+    @fileInfo.setter
+    def fileInfo(self, d):
+        assert isinstance(d, FileInfoDict), 'd is not FileInfoDict type: {}'.format(d)
+        try:
+            with fileinfo.FileInfoWriter(self.path(self.FILEINFO)) as f:
+                for path in sorted(d):
+                    info = d[path]
+                    f.write(path, info[0], info[1], info[2])
+        except PermissionError as e:
+            logger.error('Failed to write {}: {}'.format(self.FILEINFO, str(e)))
+
+    def fileInfoFor(self, paths = None):
+        """
+        Load permissions only for ``paths``, everything inside them and all
+        their parent folders. With "fileinfo.idx" only the blocks which
+        contain those paths will be decompressed.
+
+        Args:
+            paths (list):   list of full paths as :py:class:`bytes`.
+                            ``None`` will load all permissions.
+
+        Returns:
+            FileInfoDict:   dict of: {path: (permission, user, group)}
+        """
         d = FileInfoDict()
-        infoFile = self.path(self.FILEINFO)
-        if not os.path.isfile(infoFile):
-            return d
+        # skip the type checks in FileInfoDict.__setitem__ for speed
+        setitem = dict.__setitem__
+        for path, info in self.iterFileInfo(paths):
+            setitem(d, path, info)
+        return d
+
+    def iterFileInfo(self, paths = None, parents = True):
+        """
+        Stream permissions for ``paths`` and everything inside them without
+        loading them into a dict. Paths inside other ``paths`` are dropped
+        first so every record is yielded only once. With "fileinfo.idx" only
+        the blocks which contain those paths will be decompressed and records
+        are yielded sorted by path.
+
+        Args:
+            paths (list):   list of full paths as :py:class:`bytes`.
+                            ``None`` will yield all permissions.
+            parents (bool): also yield all parent folders of ``paths``
+                            except ``/``
+
+        Yields:
+            tuple:          (path, (permission, user, group))
+        """
+        if paths is not None:
+            roots = []
+            # sorting by path components puts everything inside a path
+            # right behind it
+            for path in sorted((i.rstrip(b'/') or b'/' for i in paths),
+                               key = lambda i: i.split(b'/')):
+                if roots and (path == roots[-1] or path.startswith(roots[-1].rstrip(b'/') + b'/')):
+                    continue
+                roots.append(path)
+            paths = roots
+            parentPaths = set()
+            if parents:
+                # never yield the root folder itself
+                for path in paths:
+                    path = os.path.dirname(path)
+                    while path != b'/':
+                        parentPaths.add(path)
+                        path = os.path.dirname(path)
 
         try:
-            with bz2.BZ2File(infoFile, 'rb') as fileinfo:
-                for line in fileinfo:
+            reader = fileinfo.FileInfoReader(self.openFile(self.FILEINFO))
+        except FileNotFoundError:
+            reader = None
+        except (PermissionError, fileinfo.FileInfoFormatError) as e:
+            logger.error('Failed to load {} from snapshot {}: {}'.format(
+                         self.FILEINFO, self.sid, str(e)),
+                         self)
+            return
+        if reader is not None:
+            with reader:
+                if paths is None:
+                    yield from reader.items()
+                    return
+                for path in sorted(parentPaths):
+                    info = reader.get(path)
+                    if info is not None:
+                        yield path, info
+                for path in paths:
+                    yield from reader.subtree(path)
+            return
+
+        if paths is not None:
+            prefixes = tuple(i.rstrip(b'/') + b'/' for i in paths)
+            filterPaths = parentPaths.union(paths)
+
+        try:
+            infoFile = self.openFile(self.FILEINFO_BZ2)
+        except FileNotFoundError:
+            return
+        except PermissionError as e:
+            logger.error('Failed to load {} from snapshot {}: {}'.format(
+                         self.FILEINFO_BZ2, self.sid, str(e)),
+                         self)
+            return
+        try:
+            with infoFile, bz2.BZ2File(infoFile, 'rb') as f:
+                for line in f:
                     line = line.strip(b'\n')
                     if not line:
                         continue
                     index = line.find(b'/')
                     if index < 0:
                         continue
-                    f = line[index:]
-                    if not f:
+                    path = line[index:]
+                    if not path:
+                        continue
+                    if paths is not None \
+                      and path not in filterPaths \
+                      and not path.startswith(prefixes):
                         continue
                     info = line[:index].strip().split(b' ')
                     if len(info) == 3:
-                        d[f] = (int(info[0]), info[1], info[2]) #perms, user, group
+                        yield path, (int(info[0]), info[1], info[2]) #perms, user, group
         except (FileNotFoundError, PermissionError) as e:
             logger.error('Failed to load {} from snapshot {}: {}'.format(
-                         self.FILEINFO, self.sid, str(e)),
+                         self.FILEINFO_BZ2, self.sid, str(e)),
                          self)
-        return d
-
-    @fileInfo.setter
-    def fileInfo(self, d):
-        assert isinstance(d, FileInfoDict), 'd is not FileInfoDict type: {}'.format(d)
-        try:
-            with bz2.BZ2File(self.path(self.FILEINFO), 'wb') as f:
-                for path, info in d.items():
-                    f.write(b' '.join((str(info[0]).encode('utf-8', 'replace'),
-                                       info[1],
-                                       info[2],
-                                       path))
-                                       + b'\n')
-        except PermissionError as e:
-            logger.error('Failed to write {}: {}'.format(self.FILEINFO, str(e)))
 
     #TODO: use @property decorator
     def log(self, mode = None, decode = None):
@@ -2342,19 +3181,33 @@ class SID(object):
         logFile = self.path(self.LOG)
         logFilter = snapshotlog.LogFilter(mode, decode)
         try:
-            with bz2.BZ2File(logFile, 'rb') as f:
-                if logFilter.header:
-                    yield logFilter.header
-                for line in f.readlines():
-                    line = logFilter.filter(line.decode('utf-8').rstrip('\n'))
-                    if not line is None:
-                        yield line
+            reader = self.logReader()
+            if logFilter.header:
+                yield logFilter.header
+            yield from reader.lines(mode, decode)
         except Exception as e:
             msg = ('Failed to get snapshot log from {}:'.format(logFile), str(e))
             logger.debug(' '.join(msg), self)
             for line in msg:
                 yield line
 
+    def logReader(self):
+        """
+        :py:class:`snapshotlog.LogReader` for "takesnapshot.log.bz2". The
+        line index is stored in :py:data:`LOG_INDEX`.
+
+        Returns:
+            snapshotlog.LogReader:  reader
+
+        Raises:
+            FileNotFoundError:      if there is no log
+        """
+        with self.openFile(self.LOG) as raw:
+            size = raw.seek(0, os.SEEK_END)
+        return snapshotlog.LogReader(lambda: snapshotlog.Bz2Reader(self.openFile(self.LOG)),
+                                     self.path(self.LOG_INDEX),
+                                     [size])
+
     def setLog(self, log):
         """
         Write log to "takesnapshot.log.bz2"
@@ -2366,6 +3219,8 @@ class SID(object):
             log = log.encode('utf-8', 'replace')
         logFile = self.path(self.LOG)
         try:
+            if os.path.exists(self.path(self.LOG_INDEX)):
+                os.remove(self.path(self.LOG_INDEX))
             with bz2.BZ2File(logFile, 'wb') as f:
                 f.write(log)
         except Exception as e:
@@ -2470,11 +3325,20 @@ class NewSnapshot(GenericNonSnapshot):
     @property
     def hasChanges(self):
         """
-        Check if there where changes in previous sessions.
+        Check if there where changes in previous sessions. Use the change
+        manifest written by previous sessions and fall back to scanning the
+        log if there is none.
 
         Returns:
             bool:   ``True`` if there where changes
         """
+        try:
+            with self.changeManifest() as manifest:
+                return len(manifest) > 0
+        except FileNotFoundError:
+            pass
+        except changemanifest.ChangeManifestFormatError as e:
+            logger.warning(str(e), self)
         log = snapshotlog.SnapshotLog(self.config, self.profileID)
         c = re.compile(r'^\[C\] ')
         for line in log.get(mode = snapshotlog.LogFilter.CHANGES):
@@ -2553,22 +3417,8 @@ def iterSnapshots(cfg, includeNewSnapshot = False):
     Yields:
         SID:                        snapshot IDs
     """
-    path = cfg.snapshotsFullPath()
-    if not os.path.exists(path):
-        return None
-    for item in os.listdir(path):
-        if item == NewSnapshot.NEWSNAPSHOT:
-            newSid = NewSnapshot(cfg)
-            if newSid.exists() and includeNewSnapshot:
-                yield newSid
-            continue
-        try:
-            sid = SID(item, cfg)
-            if sid.exists():
-                yield sid
-        except Exception as e:
-            if not isinstance(e, LastSnapshotSymlink):
-                logger.debug("'{}' is no snapshot ID: {}".format(item, str(e)))
+    catalog = snapshotcatalog.SnapshotCatalog(cfg)
+    yield from catalog.iterSnapshots(includeNewSnapshot)
 
 def listSnapshots(cfg, includeNewSnapshot = False, reverse = True):
     """
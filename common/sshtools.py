@@ -31,6 +31,7 @@ import config
 import logger
 import tools
 import password_ipc
+import remotehelper
 from mount import MountControl
 from exceptions import MountException, NoPubKeyLogin, KnownHost
 import bcolors
@@ -90,6 +91,8 @@ class SSH(MountControl):
         the new values **before** storing them into :py:class:`config.Config`.
         This is why all values will be added as arguments.
     """
+    CONTROL_PERSIST = 60
+
     def __init__(self, *args, **kwargs):
         #init MountControl
         super(SSH, self).__init__(*args, **kwargs)
@@ -116,6 +119,7 @@ class SSH(MountControl):
         self.mountproc = 'sshfs'
         self.symlink_subfolder = None
         self.log_command = '%s: %s' % (self.mode, self.user_host_path)
+        self.control_path = os.path.join(self.hash_id_path, 'ssh.sock')
 
         self.private_key_fingerprint = sshKeyFingerprint(self.private_key_file)
         if not self.private_key_fingerprint:
@@ -137,6 +141,8 @@ class SSH(MountControl):
         """
         sshfs  = [self.mountproc]
         sshfs += self.config.sshDefaultArgs(self.profile_id)
+        if self.startMaster():
+            sshfs += self.controlArgs()
         sshfs += ['-p', str(self.port)]
         if not self.cipher == 'default':
             sshfs.extend(['-o', 'Ciphers=%s' % self.cipher])
@@ -163,6 +169,151 @@ class SSH(MountControl):
             raise MountException(_('Can\'t mount %s') % ' '.join(sshfs)
                                   + '\n\n' + err)
 
+    def mount(self, check = True):
+        """
+        Mount the remote path and make sure the ssh master connection is
+        running, even if the remote path was already mounted by an other
+        process.
+
+        Args:
+            check (bool):   if ``True`` run :py:func:`preMountCheck` before
+                            mounting
+
+        Returns:
+            str:            Hash ID used as mountpoint
+        """
+        hash_id = super(SSH, self).mount(check = check)
+        self.startMaster()
+        return hash_id
+
+    def _umount(self):
+        """
+        Unmount ``sshfs``, stop all remote helpers and the ssh master
+        connection.
+
+        Raises:
+            exceptions.MountException:  if unmount failed
+        """
+        try:
+            super(SSH, self)._umount()
+        finally:
+            remotehelper.close(self.config, self.user, self.host, self.port)
+            self.stopMaster()
+
+    def controlArgs(self):
+        """
+        Arguments for ``ssh`` and ``sshfs`` to run through the master
+        connection.
+
+        Returns:
+            list:   arguments for ssh
+        """
+        return ['-o', 'ControlMaster=no',
+                '-o', 'ControlPath={}'.format(self.control_path)]
+
+    def controlKey(self):
+        """
+        Key for :py:data:`config.Config.sshControlPaths`. Only ssh commands
+        for the same user, host, port and private key will use the master
+        connection.
+
+        Returns:
+            tuple:  user, host, port and private key
+        """
+        return (self.user, self.host, str(self.port), self.private_key_file)
+
+    def masterCommand(self, *args):
+        """
+        ``ssh`` command for starting or controlling the master connection.
+
+        Args:
+            *args (str):    additional arguments for ssh
+
+        Returns:
+            list:           ssh command
+        """
+        return self.config.sshCommand(custom_args = list(args) + ['-o', 'ControlPath={}'.format(self.control_path),
+                                                                  '-p', str(self.port),
+                                                                  self.user_host],
+                                      port = False,
+                                      cipher = False,
+                                      user_host = False,
+                                      control = False,
+                                      profile_id = self.profile_id)
+
+    def masterRunning(self):
+        """
+        Check if the master connection is running.
+
+        Returns:
+            bool:   ``True`` if the master is running
+        """
+        proc = subprocess.run(self.masterCommand('-O', 'check'),
+                              stdin = subprocess.DEVNULL,
+                              stdout = subprocess.DEVNULL,
+                              stderr = subprocess.DEVNULL)
+        return proc.returncode == 0
+
+    def startMaster(self):
+        """
+        Start a ssh master connection which is shared by ``sshfs``, ``rsync``
+        and all other ssh commands for this host, so only one connection has
+        to be set up and authenticated. The master runs in background until
+        :py:func:`stopMaster` is called on unmount or no client used it for
+        :py:data:`CONTROL_PERSIST` seconds. If the master can't be started
+        all commands will open their own connection as before.
+
+        Returns:
+            bool:   ``True`` if the master is running
+        """
+        # ssh binds to '<ControlPath>.<random>' first which must fit
+        # into sockaddr_un.sun_path (108 bytes)
+        if len(self.control_path) > 90:
+            logger.debug('ControlPath %s is too long. Don\'t use ssh master connection'
+                         %self.control_path, self)
+            return False
+        if not self.masterRunning():
+            if os.path.exists(self.control_path):
+                logger.debug('Remove stale ssh control socket %s' %self.control_path, self)
+                os.remove(self.control_path)
+            tools.mkdir(self.hash_id_path, 0o700)
+            args = ['-o', 'ControlMaster=yes',
+                    '-o', 'ControlPersist={}'.format(self.CONTROL_PERSIST),
+                    '-o', 'BatchMode=yes',
+                    '-f', '-N']
+            if not self.cipher == 'default':
+                args.extend(['-o', 'Ciphers=%s' % self.cipher])
+            ssh = self.masterCommand(*args)
+            logger.debug('Start ssh master connection: %s' %' '.join(ssh), self)
+            # the backgrounded master keeps stdout/stderr open,
+            # so don't use pipes here
+            proc = subprocess.run(ssh,
+                                  stdin = subprocess.DEVNULL,
+                                  stdout = subprocess.DEVNULL,
+                                  stderr = subprocess.DEVNULL)
+            if proc.returncode:
+                logger.debug('Failed to start ssh master connection for %s'
+                             %self.user_host, self)
+                return False
+        self.config.sshControlPaths[self.controlKey()] = self.control_path
+        return True
+
+    def stopMaster(self):
+        """
+        Stop the ssh master connection.
+        """
+        if self.config.sshControlPaths.get(self.controlKey()) == self.control_path:
+            del self.config.sshControlPaths[self.controlKey()]
+        if not os.path.exists(self.control_path):
+            return
+        logger.debug('Stop ssh master connection for %s' %self.user_host, self)
+        subprocess.run(self.masterCommand('-O', 'exit'),
+                       stdin = subprocess.DEVNULL,
+                       stdout = subprocess.DEVNULL,
+                       stderr = subprocess.DEVNULL)
+        if os.path.exists(self.control_path):
+            os.remove(self.control_path)
+
     def preMountCheck(self, first_run = False):
         """
         Check that everything is prepaired and ready for successfully mount the
@@ -185,6 +336,8 @@ class SSH(MountControl):
         if first_run:
             self.unlockSshAgent(force = True)
             self.checkKnownHosts()
+        # all following checks can reuse the master connection
+        self.startMaster()
         self.checkLogin()
         if first_run:
             self.checkCipher()
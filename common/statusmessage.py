@@ -0,0 +1,297 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import json
+import time
+import socket
+import threading
+
+import logger
+
+
+class MessagePublisher(object):
+    """
+    Coalesce status messages of a running snapshot. The latest message is
+    kept in memory and handed to ``callback`` at most once every
+    :py:data:`INTERVAL` seconds. Error messages (``type_id`` 1) are never
+    coalesced and flushed immediately.
+
+    ``callback`` is only called from the thread which calls
+    :py:func:`publish`, :py:func:`poll`, :py:func:`flush` or
+    :py:func:`close`, so plugins don't need to be thread-safe. A message
+    which is still pending is handed over on the next of those calls.
+
+    After :py:func:`listen` was called, flushed messages are also pushed to
+    all :py:class:`MessageSubscriber` connected to the UNIX socket
+    :py:func:`config.Config.takeSnapshotMessageSocket`. A message which is
+    still pending after :py:data:`INTERVAL` seconds is pushed to them by a
+    timer.
+
+    Args:
+        cfg (config.Config):    current config
+        callback (method):      called with ``type_id``, ``message`` and
+                                ``timeout`` for every flushed message
+        interval (float):       minimum seconds between two flushes
+    """
+    INTERVAL = 0.25
+
+    def __init__(self, cfg, callback, interval = INTERVAL):
+        self.config = cfg
+        self.callback = callback
+        self.interval = interval
+        self.lock = threading.RLock()
+        self.pending = None
+        self.pushed = False
+        self.last = 0.0
+        self.timer = None
+        self.server = None
+        self.socketPath = None
+        self.clients = []
+
+    def publish(self, type_id, message, timeout = -1):
+        """
+        Set a new status message.
+
+        Args:
+            type_id (int):  0 for info, 1 for error
+            message (str):  message
+            timeout (int):  timeout for plugins showing the message
+        """
+        with self.lock:
+            self.pending = (type_id, message, timeout)
+            self.pushed = False
+            wait = self.last + self.interval - time.monotonic()
+            if type_id == 1 or wait <= 0:
+                self._flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(wait, self.pushPending)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def poll(self):
+        """
+        Flush the pending message if it was held back for at least
+        ``interval`` seconds.
+        """
+        with self.lock:
+            if self.pending is not None \
+              and time.monotonic() >= self.last + self.interval:
+                self._flush()
+
+    def pushPending(self):
+        """
+        Push the pending message to subscribers only. Called by the timer
+        thread, the message stays pending for ``callback``.
+        """
+        with self.lock:
+            self.timer = None
+            if self.pending is None or self.pushed:
+                return
+            type_id, message, timeout = self.pending
+            self.push(type_id, message)
+            self.pushed = True
+
+    def flush(self):
+        """
+        Flush the pending message now.
+        """
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending is None:
+            return
+        type_id, message, timeout = self.pending
+        self.pending = None
+        self.last = time.monotonic()
+        self.callback(type_id, message, timeout)
+        if not self.pushed:
+            self.push(type_id, message)
+
+    def clear(self):
+        """
+        Drop the pending message.
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.pending = None
+
+    def close(self):
+        """
+        Flush the pending message, disconnect all subscribers and remove the
+        socket.
+        """
+        with self.lock:
+            self._flush()
+            for client in self.clients:
+                client.close()
+            self.clients = []
+            if self.server is not None:
+                self.server.close()
+                self.server = None
+                try:
+                    os.remove(self.socketPath)
+                except OSError:
+                    pass
+
+    def listen(self):
+        """
+        Create the UNIX socket for subscribers.
+
+        Returns:
+            bool:   ``True`` if the socket is listening
+        """
+        if self.server is not None:
+            return True
+        path = self.config.takeSnapshotMessageSocket()
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(8)
+            server.setblocking(False)
+        except OSError as e:
+            logger.debug('Failed to create message socket {}: {}'.format(path, str(e)), self)
+            return False
+        self.server = server
+        self.socketPath = path
+        return True
+
+    def push(self, type_id, message):
+        """
+        Send a message to all subscribers. New subscribers are accepted
+        first. Subscribers which can't keep up are disconnected.
+
+        Args:
+            type_id (int):  0 for info, 1 for error
+            message (str):  message
+        """
+        if self.server is None:
+            return
+        while True:
+            try:
+                client = self.server.accept()[0]
+            except OSError:
+                break
+            client.setblocking(False)
+            self.clients.append(client)
+        data = json.dumps({'type': type_id, 'message': message}).encode('utf-8') + b'\n'
+        for client in self.clients[:]:
+            try:
+                client.sendall(data)
+            except OSError:
+                client.close()
+                self.clients.remove(client)
+
+class MessageSubscriber(object):
+    """
+    Receive status messages pushed by :py:class:`MessagePublisher` of a
+    running snapshot.
+
+    Args:
+        cfg (config.Config):    current config
+    """
+    def __init__(self, cfg):
+        self.config = cfg
+        self.sock = None
+        self.socketPath = None
+        self.buffer = b''
+        self.message = None
+
+    def connect(self):
+        """
+        Connect to the socket of the current profile.
+
+        Returns:
+            bool:   ``True`` if connected
+        """
+        path = self.config.takeSnapshotMessageSocket()
+        if self.sock is not None:
+            if path == self.socketPath:
+                return True
+            self.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            return False
+        sock.setblocking(False)
+        self.sock = sock
+        self.socketPath = path
+        return True
+
+    def close(self):
+        """
+        Disconnect from the socket.
+        """
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.buffer = b''
+        self.message = None
+
+    def fileno(self):
+        """
+        File descriptor of the socket for use with ``select`` or
+        ``QSocketNotifier``.
+
+        Returns:
+            int:    file descriptor or ``None`` if not connected
+        """
+        if self.sock is None:
+            return None
+        return self.sock.fileno()
+
+    def read(self):
+        """
+        Receive all pending messages without blocking.
+
+        Returns:
+            tuple:  latest message as ``(type_id, message)`` or ``None`` if
+                    there is no snapshot running or no message was
+                    received yet
+        """
+        if not self.connect():
+            return None
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                data = b''
+            if not data:
+                # snapshot has finished
+                self.close()
+                return None
+            self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        for line in lines:
+            try:
+                data = json.loads(line.decode('utf-8'))
+                self.message = (int(data['type']), data['message'])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.debug('Invalid status message {}: {}'.format(line, str(e)), self)
+        return self.message
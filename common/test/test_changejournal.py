@@ -0,0 +1,211 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import signal
+import time
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import changejournal
+
+class TestChangeJournal(generic.TestCaseCfg):
+    def setUp(self):
+        super(TestChangeJournal, self).setUp()
+        self.journal = changejournal.ChangeJournal(self.cfg)
+        patcher = patch.object(changejournal.ChangeJournal, 'session', return_value = 'foo')
+        self.session = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.flushPatcher = patch.object(changejournal.ChangeJournal, 'flushWatcher', return_value = True)
+        self.flushWatcher = self.flushPatcher.start()
+        self.addCleanup(self.flushPatcher.stop)
+
+    def test_no_watcher(self):
+        self.session.return_value = None
+        self.journal.append([b'/foo'])
+        self.assertIsNone(self.journal.rotate('20151219-010324-123', 'key'))
+        self.assertNotExists(self.journal.fileName)
+
+    def test_rotate(self):
+        # first snapshot after watcher started needs to be a full snapshot
+        self.journal.append([b'/foo'])
+        self.assertIsNone(self.journal.rotate('20151219-010324-123', 'key'))
+        self.journal.commit('20151219-020324-123', 'key')
+        self.assertNotExists(self.journal.pendingFile)
+
+        self.journal.append([b'/foo/bar', b'/baz'])
+        self.journal.append([b'/baz'])
+        self.assertListEqual(self.journal.rotate('20151219-020324-123', 'key'),
+                             [b'/baz', b'/foo/bar'])
+        self.assertNotExists(self.journal.fileName)
+        self.journal.commit('20151219-030324-123', 'key')
+
+        # nothing changed
+        self.assertListEqual(self.journal.rotate('20151219-030324-123', 'key'), [])
+
+    def test_rotate_invalid(self):
+        self.journal.rotate(None, 'key')
+        self.journal.commit('20151219-010324-123', 'key')
+        # rotate without commit invalidates the state
+        self.assertListEqual(self.journal.rotate('20151219-010324-123', 'key'), [])
+        self.assertIsNone(self.journal.rotate('20151219-010324-123', 'key'))
+
+        # different base snapshot
+        self.journal.commit('20151219-010324-123', 'key')
+        self.assertIsNone(self.journal.rotate('20151219-020324-123', 'key'))
+
+        # different settings
+        self.journal.commit('20151219-010324-123', 'key')
+        self.assertIsNone(self.journal.rotate('20151219-010324-123', 'other'))
+
+        # watcher restarted
+        self.journal.commit('20151219-010324-123', 'key')
+        self.session.return_value = 'bar'
+        self.assertIsNone(self.journal.rotate('20151219-010324-123', 'key'))
+
+    def test_flush_timeout(self):
+        self.journal.rotate(None, 'key')
+        self.journal.commit('20151219-010324-123', 'key')
+        self.journal.append([b'/foo'])
+        self.flushWatcher.return_value = False
+        self.assertIsNone(self.journal.rotate('20151219-010324-123', 'key'))
+        self.assertNotExists(self.journal.fileName)
+        # state stays invalid until the next full snapshot
+        self.journal.commit('20151219-020324-123', 'key')
+        self.flushWatcher.return_value = True
+        self.assertIsNone(self.journal.rotate('20151219-020324-123', 'key'))
+
+    def test_flush_no_watcher(self):
+        self.flushPatcher.stop()
+        journal = changejournal.ChangeJournal(self.cfg)
+        self.assertFalse(journal.flushWatcher())
+
+    def test_overflow(self):
+        self.journal.rotate(None, 'key')
+        self.journal.commit('20151219-010324-123', 'key')
+        self.journal.append([b'/foo'], overflow = True)
+        self.assertIsNone(self.journal.rotate('20151219-010324-123', 'key'))
+
+    def test_max_size(self):
+        self.journal.rotate(None, 'key')
+        self.journal.commit('20151219-010324-123', 'key')
+        with patch.object(changejournal.ChangeJournal, 'MAX_SIZE', 10):
+            self.journal.append([b'/foo/bar/baz'])
+            self.journal.append([b'/foo'])
+        self.assertIsNone(self.journal.rotate('20151219-010324-123', 'key'))
+
+class TestWatcher(generic.TestCaseCfg):
+    def setUp(self):
+        super(TestWatcher, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.addCleanup(self.tmpDir.cleanup)
+        self.root = self.tmpDir.name.encode()
+        os.mkdir(os.path.join(self.root, b'foo'))
+        self.watcher = changejournal.Watcher(self.cfg)
+        self.watcher.inotify = changejournal.Inotify()
+        self.addCleanup(self.watcher.inotify.close)
+        self.watcher.addTree(self.root)
+
+    def events(self):
+        for event in self.watcher.inotify.read(1):
+            self.watcher.handleEvent(*event)
+        return self.watcher.dirty
+
+    def test_watch_tree(self):
+        self.assertCountEqual(self.watcher.watches.values(),
+                              [self.root, os.path.join(self.root, b'foo')])
+
+    def test_modify(self):
+        path = os.path.join(self.root, b'foo', b'bar')
+        with open(path, 'wt') as f:
+            f.write('bar')
+        self.assertIn(path, self.events())
+
+    def test_new_folder(self):
+        with TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, 'bar', 'baz'))
+            with open(os.path.join(tmp, 'bar', 'baz', 'file'), 'wt'):
+                pass
+            new = os.path.join(self.root, b'foo', b'bar')
+            os.rename(os.path.join(tmp, 'bar'), new)
+            dirty = self.events()
+        self.assertIn(new, dirty)
+        self.assertIn(os.path.join(new, b'baz'), dirty)
+        self.assertIn(os.path.join(new, b'baz', b'file'), dirty)
+        self.assertIn(os.path.join(new, b'baz'), self.watcher.watches.values())
+
+    def test_flush(self):
+        with patch.object(changejournal.ChangeJournal, 'append') as append:
+            self.watcher.dirty.update((b'/foo', b'/bar'))
+            self.watcher.flush()
+            append.assert_called_once_with([b'/bar', b'/foo'], False)
+            self.assertFalse(self.watcher.dirty)
+
+    def test_overflow(self):
+        self.watcher.handleEvent(-1, changejournal.IN_Q_OVERFLOW, 0, b'')
+        with patch.object(changejournal.ChangeJournal, 'append') as append:
+            self.watcher.flush()
+            append.assert_called_once_with([], True)
+        self.assertFalse(self.watcher.overflow)
+
+class TestWatcherFlush(generic.TestCaseCfg):
+    """
+    Run a real :py:class:`changejournal.Watcher` in a child process.
+    """
+    def setUp(self):
+        super(TestWatcherFlush, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.addCleanup(self.tmpDir.cleanup)
+        self.cfg.setInclude([(self.tmpDir.name, 0)])
+        self.journal = changejournal.ChangeJournal(self.cfg)
+
+        pid = os.fork()
+        if not pid:
+            try:
+                changejournal.Watcher(self.cfg).run()
+            finally:
+                os._exit(1)
+        self.addCleanup(self.stopWatcher, pid)
+        for _ in range(500):
+            if self.journal.session():
+                break
+            time.sleep(0.01)
+        else:
+            self.fail('Watcher did not start')
+
+    def stopWatcher(self, pid):
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+    def test_rotate_flushes_watcher(self):
+        self.assertIsNone(self.journal.rotate(None, 'key'))
+        self.journal.commit('20151219-010324-123', 'key')
+
+        path = os.path.join(self.tmpDir.name, 'foo')
+        with open(path, 'wt') as f:
+            f.write('foo')
+        # without the flush barrier this would still be in the watchers memory
+        self.assertIn(os.fsencode(path),
+                      self.journal.rotate('20151219-010324-123', 'key'))
+        self.assertExists(self.journal.ackFile)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import changemanifest
+
+class TestChangeManifest(generic.TestCaseCfg):
+    def setUp(self):
+        super(TestChangeManifest, self).setUp()
+        self.filename = os.path.join(self.sharePath, 'changes.idx')
+
+    def write(self, changes, **kwargs):
+        writer = changemanifest.ChangeManifestWriter(self.filename, **kwargs)
+        for change in changes:
+            writer.add(*change)
+        return writer.close()
+
+    def test_roundtrip(self):
+        self.assertEqual(self.write([('foo/bar', '>f+++++++++', 3),
+                                     ('foo/', 'cd+++++++++', 4096),
+                                     ('baz', '*deleting  ', 0)]), 3)
+        with changemanifest.ChangeManifestReader(self.filename) as manifest:
+            self.assertEqual(len(manifest), 3)
+            self.assertListEqual(list(manifest.items()),
+                                 [(b'/baz', ('*deleting  ', 0)),
+                                  (b'/foo', ('cd+++++++++', 4096)),
+                                  (b'/foo/bar', ('>f+++++++++', 3))])
+            self.assertTupleEqual(manifest.get(b'/foo/bar'), ('>f+++++++++', 3))
+            self.assertIsNone(manifest.get(b'/foo/baz'))
+            self.assertIn(b'/baz', manifest)
+
+    def test_subtree(self):
+        changes = [('foo/{:05}'.format(i), '>f+++++++++', i) for i in range(5000)]
+        changes.extend((('foo', 'cd+++++++++', 0),
+                        ('foo.bar', '>f+++++++++', 1),
+                        ('bar', '>f+++++++++', 2)))
+        self.write(changes)
+        with changemanifest.ChangeManifestReader(self.filename) as manifest:
+            self.assertGreater(len(manifest.blocks), 1)
+            subtree = [i[0] for i in manifest.subtree(b'/foo/')]
+            self.assertEqual(len(subtree), 5001)
+            self.assertEqual(subtree[0], b'/foo')
+            self.assertNotIn(b'/foo.bar', subtree)
+            self.assertEqual(len(list(manifest.subtree(b'/'))), 5003)
+
+    def test_spill(self):
+        changes = [('file{}'.format(i % 7), '>f.st......', i) for i in range(20)]
+        self.write(changes, chunk = 3)
+        # temporary runs were removed
+        self.assertListEqual([i for i in os.listdir(self.sharePath) if '.run' in i], [])
+        with changemanifest.ChangeManifestReader(self.filename) as manifest:
+            self.assertEqual(len(manifest), 7)
+            # latest change wins
+            self.assertTupleEqual(manifest.get(b'/file0'), ('>f.st......', 14))
+            self.assertTupleEqual(manifest.get(b'/file6'), ('>f.st......', 13))
+
+    def test_resume(self):
+        self.write([('foo', '>f+++++++++', 1), ('bar', '>f+++++++++', 2)])
+        self.write([('foo', '>f.st......', 3), ('baz', '>f+++++++++', 4)])
+        with changemanifest.ChangeManifestReader(self.filename) as manifest:
+            self.assertListEqual(list(manifest.items()),
+                                 [(b'/bar', ('>f+++++++++', 2)),
+                                  (b'/baz', ('>f+++++++++', 4)),
+                                  (b'/foo', ('>f.st......', 3))])
+
+    def test_decode(self):
+        self.write([('a', '>f+++++++++', 1), ('b', '>f+++++++++', 2)],
+                   decode = lambda paths: [p.upper() for p in paths])
+        with changemanifest.ChangeManifestReader(self.filename) as manifest:
+            self.assertListEqual([i[0] for i in manifest.items()], [b'/A', b'/B'])
+
+    def test_invalid(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'foo')
+        with self.assertRaises(changemanifest.ChangeManifestFormatError):
+            changemanifest.ChangeManifestReader(self.filename)
+
+class TestChangeIndex(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestChangeIndex, self).setUp()
+        self.sids = []
+        for i, changes in enumerate(([('foo/bar', '>f+++++++++', 1), ('foo/baz', '>f+++++++++', 2)],
+                                     [('foo/bar', '>f.st......', 3)],
+                                     None,
+                                     [('foo/bar', '*deleting  ', 0), ('other', '>f+++++++++', 4)])):
+            sid = snapshots.SID('2016042{}-215134-123'.format(i), self.cfg)
+            sid.makeDirs()
+            if changes is not None:
+                writer = changemanifest.ChangeManifestWriter(sid.path(snapshots.SID.CHANGES))
+                for change in changes:
+                    writer.add(*change)
+                writer.close()
+            self.sids.append(sid)
+        self.indexFile = os.path.join(self.sharePath, 'changes.index')
+
+    def test_history(self):
+        with changemanifest.ChangeIndex(self.cfg, self.indexFile) as index:
+            self.assertTrue(index.update(self.sids))
+            self.assertListEqual(index.history(b'/foo/bar'),
+                                 [(self.sids[0].sid, '>f+++++++++', 1),
+                                  (self.sids[1].sid, '>f.st......', 3),
+                                  (self.sids[3].sid, '*deleting  ', 0)])
+            self.assertListEqual(index.history(b'/missing'), [])
+            self.assertSetEqual(index.coveredSnapshots(),
+                                {self.sids[i].sid for i in (0, 1, 3)})
+            self.assertSetEqual(index.changedSnapshots(b'/foo'),
+                                {self.sids[i].sid for i in (0, 1, 3)})
+            self.assertSetEqual(index.changedSnapshots(b'/foo/baz'),
+                                {self.sids[0].sid})
+
+    def test_update(self):
+        with changemanifest.ChangeIndex(self.cfg, self.indexFile) as index:
+            self.assertTrue(index.update(self.sids[:2]))
+            with patch.object(snapshots.SID, 'changeManifest') as changeManifest:
+                self.assertFalse(index.update(self.sids[:2]))
+                changeManifest.assert_not_called()
+                # only the new snapshots are read
+                self.assertTrue(index.update(self.sids))
+                self.assertEqual(changeManifest.call_count, 2)
+
+    def test_update_removed(self):
+        with changemanifest.ChangeIndex(self.cfg, self.indexFile) as index:
+            index.update(self.sids)
+            self.assertTrue(index.update(self.sids[1:]))
+            self.assertListEqual(index.history(b'/foo/bar'),
+                                 [(self.sids[1].sid, '>f.st......', 3),
+                                  (self.sids[3].sid, '*deleting  ', 0)])
+            self.assertListEqual(index.history(b'/foo/baz'), [])
+        # reopen
+        with changemanifest.ChangeIndex(self.cfg, self.indexFile) as index:
+            self.assertSetEqual(index.changedSnapshots(b'/'),
+                                {self.sids[i].sid for i in (1, 3)})
+
+    def test_ignore_non_snapshots(self):
+        with changemanifest.ChangeIndex(self.cfg, self.indexFile) as index:
+            index.update(self.sids + [snapshots.RootSnapshot(self.cfg)])
+            self.assertListEqual(index.snapshots, [sid.sid for sid in self.sids])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -166,3 +166,21 @@ class TestSshCommand(generic.SSHTestCase):
                                    '-o', 'ServerAliveInterval=240',
                                    '-o', 'LogLevel=Error',
                                    '-o', 'IdentityFile={}'.format(generic.PRIV_KEY_FILE)])
+
+    def test_control(self):
+        self.cfg.sshControlPaths[(self.cfg.user(), 'localhost', '22', generic.PRIV_KEY_FILE)] = '/tmp/ssh.sock'
+        cmd = self.cfg.sshCommand(cmd = ['echo', 'foo'])
+        self.assertListEqual(cmd, ['ssh',
+                                   '-o', 'ServerAliveInterval=240',
+                                   '-o', 'LogLevel=Error',
+                                   '-o', 'IdentityFile={}'.format(generic.PRIV_KEY_FILE),
+                                   '-o', 'ControlMaster=no',
+                                   '-o', 'ControlPath=/tmp/ssh.sock',
+                                   '-p', '22',
+                                   '{}@localhost'.format(self.cfg.user()),
+                                   'echo', 'foo'])
+
+        # master connection is for a different host
+        self.cfg.setSshHost('foo')
+        cmd = self.cfg.sshCommand(cmd = ['echo', 'foo'])
+        self.assertNotIn('ControlPath=/tmp/ssh.sock', cmd)
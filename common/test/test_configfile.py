@@ -433,6 +433,45 @@ class TestConfigFile(generic.TestCase):
                                         'baz': 'false',
                                         'bla': '0'})
 
+    ############################################################################
+    ###                               cache                                  ###
+    ############################################################################
+
+    def test_cache_set_value(self):
+        cfg = configfile.ConfigFile()
+        cfg.setIntValue('foo', 1)
+        self.assertEqual(cfg.intValue('foo'), 1)
+        cfg.setIntValue('foo', 2)
+        self.assertEqual(cfg.intValue('foo'), 2)
+        cfg.removeKey('foo')
+        self.assertEqual(cfg.intValue('foo', 3), 3)
+
+    def test_cache_dict(self):
+        cfg = configfile.ConfigFile()
+        cfg.dict = {'foo': 'true', 'bar': 'invalid'}
+        self.assertTrue(cfg.boolValue('foo'))
+        self.assertEqual(cfg.intValue('bar', 5), 5)
+        # direct changes are noticed, too
+        cfg.dict['foo'] = 'false'
+        cfg.dict.update(bar = '6')
+        self.assertFalse(cfg.boolValue('foo'))
+        self.assertEqual(cfg.intValue('bar', 5), 6)
+        cfg.dict = {}
+        self.assertTrue(cfg.boolValue('foo', True))
+
+    def test_cache_listValue(self):
+        cfg = configfile.ConfigFile()
+        cfg.setListValue('foo', ('str:value', 'int:type'), [('a', 1), ('b', 2)])
+        ret = cfg.listValue('foo', ('str:value', 'int:type'))
+        self.assertListEqual(ret, [('a', 1), ('b', 2)])
+        # modifying the result doesn't change the cache
+        ret.append(('c', 3))
+        self.assertListEqual(cfg.listValue('foo', ('str:value', 'int:type')),
+                             [('a', 1), ('b', 2)])
+        cfg.setListValue('foo', ('str:value', 'int:type'), [('c', 3)])
+        self.assertListEqual(cfg.listValue('foo', ('str:value', 'int:type')),
+                             [('c', 3)])
+
 class TestConfigFileWithProfiles(generic.TestCase):
     def setUp(self):
         super(TestConfigFileWithProfiles, self).setUp()
@@ -630,6 +669,22 @@ class TestConfigFileWithProfiles(generic.TestCase):
         self.assertTrue(self.cfg.hasProfileKey('foo', '3'))
         self.assertFalse(self.cfg.hasProfileKey('baz', '3'))
 
+    def test_profileView(self):
+        self.cfg.setProfileStrValue('foo', 'bar', 2)
+        self.cfg.setProfileIntValue('foo.size', 3, 2)
+        view = self.cfg.profileView(2)
+        self.assertEqual(view['foo'], 'bar')
+        self.assertEqual(view['foo.size'], '3')
+        self.assertNotIn('foo', self.cfg.profileView())
+        with self.assertRaises(TypeError):
+            view['foo'] = 'baz'
+        # views are cached until options change
+        self.assertIs(self.cfg.profileView('2'), view)
+        self.cfg.setProfileStrValue('foo', 'baz', 2)
+        self.assertEqual(self.cfg.profileView(2)['foo'], 'baz')
+        self.assertEqual(self.cfg.profileIntValue('foo.size', 0, 2), 3)
+        self.assertEqual(self.cfg.profileView(5), {})
+
     def test_set_profile_value(self):
         methods =  {'str':  ('foo', 'FOO'),
                     'int':  ('bar', 123),
@@ -0,0 +1,167 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import changemanifest
+import dedup
+import freespace
+
+class TestDeduplicator(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestDeduplicator, self).setUp()
+        self.indexFile = os.path.join(self.sharePath, 'dedup.db')
+        patcher = patch.object(self.cfg, 'dedupIndexFile', return_value = self.indexFile)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sids = []
+        for i in range(2):
+            sid = snapshots.SID('2016042{}-215134-123'.format(i), self.cfg)
+            sid.makeDirs('foo')
+            sid.makeDirs('bar')
+            self.sids.append(sid)
+        # foo/a was moved to bar/a
+        self.write(self.sids[0], 'foo/a', 'x' * 2000)
+        self.write(self.sids[1], 'bar/a', 'x' * 2000)
+
+    def write(self, sid, path, data, mtime = 1000):
+        with open(sid.pathBackup(path), 'wt') as f:
+            f.write(data)
+        os.utime(sid.pathBackup(path), times = (mtime, mtime))
+
+    def ino(self, sid, path):
+        return os.lstat(sid.pathBackup(path)).st_ino
+
+    def test_moved(self):
+        deduplicator = dedup.Deduplicator(self.cfg, budget = 60)
+        self.assertTrue(deduplicator.run(self.sids[1]))
+        self.assertEqual(self.ino(self.sids[0], 'foo/a'), self.ino(self.sids[1], 'bar/a'))
+        self.assertEqual(deduplicator.linked, 1)
+        self.assertEqual(deduplicator.saved, 2000)
+        self.assertListEqual(sorted(os.listdir(self.sids[1].pathBackup('bar'))), ['a'])
+
+    def test_footprint_invalidated(self):
+        planner = freespace.FreeSpacePlanner(self.cfg)
+        planner.save(self.sids[0], self.sids[1], (2000, 1))
+        self.assertIsNotNone(planner.load(self.sids[0], self.sids[1]))
+        deduplicator = dedup.Deduplicator(self.cfg, budget = 60)
+        self.assertTrue(deduplicator.run(self.sids[1]))
+        self.assertEqual(deduplicator.linked, 1)
+        self.assertNotExists(self.sids[0].path(snapshots.SID.FOOTPRINT))
+
+    def test_different(self):
+        # same size but different content
+        self.write(self.sids[1], 'bar/b', 'y' * 2000)
+        # same content but different mtime
+        self.write(self.sids[1], 'bar/c', 'x' * 2000, mtime = 2000)
+        # too small
+        self.write(self.sids[0], 'foo/d', 'z')
+        self.write(self.sids[1], 'bar/d', 'z')
+        deduplicator = dedup.Deduplicator(self.cfg, budget = 60)
+        self.assertTrue(deduplicator.run(self.sids[1]))
+        self.assertEqual(deduplicator.linked, 1)
+        for path in ('bar/b', 'bar/c', 'bar/d'):
+            self.assertEqual(os.lstat(self.sids[1].pathBackup(path)).st_nlink, 1)
+
+    def test_manifest(self):
+        self.write(self.sids[1], 'bar/b', 'x' * 2000)
+        writer = changemanifest.ChangeManifestWriter(self.sids[1].path(snapshots.SID.CHANGES))
+        writer.add('bar/b', '>f+++++++++', 2000)
+        writer.close()
+        deduplicator = dedup.Deduplicator(self.cfg, budget = 60)
+        self.assertTrue(deduplicator.run(self.sids[1]))
+        # only files from the manifest are candidates
+        self.assertEqual(self.ino(self.sids[0], 'foo/a'), self.ino(self.sids[1], 'bar/b'))
+        self.assertEqual(os.lstat(self.sids[1].pathBackup('bar/a')).st_nlink, 1)
+
+    def test_hash_on_demand(self):
+        self.write(self.sids[1], 'bar/b', 'y' * 3000)
+        with patch('tools.blake2sum', side_effect = lambda path: 'x') as blake2sum:
+            dedup.Deduplicator(self.cfg, budget = 60).run(self.sids[1])
+            # bar/b has a unique size
+            self.assertEqual(blake2sum.call_count, 2)
+
+    def test_budget(self):
+        deduplicator = dedup.Deduplicator(self.cfg, budget = 0)
+        self.assertFalse(deduplicator.run(self.sids[1]))
+        self.assertEqual(os.lstat(self.sids[1].pathBackup('bar/a')).st_nlink, 1)
+        with dedup.DedupIndex(self.indexFile) as index:
+            self.assertListEqual(index.meta('pending'), [self.sids[1].sid])
+        # unfinished snapshots are continued
+        sid = snapshots.SID('20160422-215134-123', self.cfg)
+        sid.makeDirs()
+        self.assertTrue(dedup.Deduplicator(self.cfg, budget = 60).run(sid))
+        self.assertEqual(self.ino(self.sids[0], 'foo/a'), self.ino(self.sids[1], 'bar/a'))
+        with dedup.DedupIndex(self.indexFile) as index:
+            self.assertListEqual(index.meta('pending'), [])
+
+    def test_removed_snapshot(self):
+        dedup.Deduplicator(self.cfg, budget = 60).run(self.sids[1])
+        self.sn.remove(self.sids[0])
+        sid = snapshots.SID('20160422-215134-123', self.cfg)
+        sid.makeDirs('baz')
+        self.write(sid, 'baz/a', 'x' * 2000)
+        self.assertTrue(dedup.Deduplicator(self.cfg, budget = 60).run(sid))
+        self.assertEqual(self.ino(self.sids[1], 'bar/a'), self.ino(sid, 'baz/a'))
+        with dedup.DedupIndex(self.indexFile) as index:
+            # foo/a of the removed snapshot is gone
+            self.assertListEqual([i[1:3] for i in index.bySize(2000)],
+                                 [(self.sids[1].sid, 'bar/a'), (sid.sid, 'baz/a')])
+
+    def test_prune_link_dest(self):
+        dedup.Deduplicator(self.cfg, budget = 60).run(self.sids[0])
+        # hardlinked by rsync --link-dest
+        sid = snapshots.SID('20160422-215134-123', self.cfg)
+        sid.makeDirs('foo')
+        os.link(self.sids[0].pathBackup('foo/a'), sid.pathBackup('foo/a'))
+        self.sn.remove(self.sids[0])
+        deduplicator = dedup.Deduplicator(self.cfg, budget = 60)
+        self.assertTrue(deduplicator.run(sid))
+        with dedup.DedupIndex(self.indexFile) as index:
+            self.assertListEqual([i[1:3] for i in index.bySize(2000)],
+                                 [(self.sids[1].sid, 'bar/a'), (sid.sid, 'foo/a')])
+
+    def test_timeBudget(self):
+        self.cfg.setDedup(True, 10)
+        self.cfg.setScheduleMode(self.cfg._10_MIN)
+        self.assertEqual(dedup.Deduplicator(self.cfg).budget, 300)
+        self.cfg.setScheduleMode(self.cfg.DAY)
+        self.assertEqual(dedup.Deduplicator(self.cfg).budget, 600)
+        self.cfg.setScheduleMode(self.cfg.REPEATEDLY)
+        self.cfg.setScheduleRepeatedPeriod(2)
+        self.cfg.setScheduleRepeatedUnit(self.cfg.HOUR)
+        self.assertEqual(dedup.scheduleInterval(self.cfg), 7200)
+        self.cfg.setScheduleMode(self.cfg.UDEV)
+        self.assertIsNone(dedup.scheduleInterval(self.cfg))
+
+    def test_deduplicate_disabled(self):
+        with patch('dedup.Deduplicator.run') as run:
+            self.sn.deduplicate(self.sids[1])
+            run.assert_not_called()
+            self.cfg.setDedup(True, 10)
+            self.sn.deduplicate(self.sids[1])
+            run.assert_called_once_with(self.sids[1])
+
+if __name__ == '__main__':
+    unittest.main()
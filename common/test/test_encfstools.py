@@ -17,8 +17,11 @@
 
 import os
 import sys
+import stat
+import subprocess
 from test import generic
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import encfstools
 
 class TestEncFS_mount(generic.TestCase):
 
@@ -35,3 +38,87 @@ class TestEncFS_mount(generic.TestCase):
 
     def test_dummy(self):
         self.assertTrue(True)
+
+class TestTranslate(generic.TestCase):
+    def setUp(self):
+        super(TestTranslate, self).setUp()
+        # answer each line immediately like encfsctl in pipe mode
+        self.proc = subprocess.Popen(['sed', '-u', 's/^/enc_/'],
+                                     stdin = subprocess.PIPE,
+                                     stdout = subprocess.PIPE,
+                                     universal_newlines = True,
+                                     bufsize = 0)
+
+    def tearDown(self):
+        self.proc.communicate()
+        super(TestTranslate, self).tearDown()
+
+    def test_translate(self):
+        paths = ['foo/bar', 'baz', '']
+        self.assertListEqual(encfstools.translate(self.proc, paths, '\n'),
+                             ['enc_foo/bar', 'enc_baz', 'enc_'])
+
+    def test_translate_batches(self):
+        paths = ['/foo/{:05}'.format(i) for i in range(5000)]
+        self.assertListEqual(encfstools.translate(self.proc, paths, '\n'),
+                             ['enc_' + path for path in paths])
+
+class TestPathCache(generic.TestCaseCfg):
+    def setUp(self):
+        super(TestPathCache, self).setUp()
+        self.encfsConfig = os.path.join(self.cfg._LOCAL_DATA_FOLDER, '.encfs6.xml')
+        with open(self.encfsConfig, 'wt') as f:
+            f.write('<encfs>volume key</encfs>')
+
+    def cache(self, **kwargs):
+        return encfstools.PathCache(self.cfg, 'decode', self.encfsConfig, **kwargs)
+
+    def test_lru(self):
+        cache = self.cache(maxEntries = 2)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        self.assertEqual(cache.get('a'), 'A')
+        cache.set('c', 'C')
+        # 'b' was least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(cache.get('c'), 'C')
+
+    def test_save_load(self):
+        cache = self.cache()
+        cache.set('foo/bar', 'enc/enc')
+        cache.set('bäz', 'encbaz')
+        cache.save()
+        self.assertExists(cache.filename)
+        self.assertEqual(stat.S_IMODE(os.stat(cache.filename).st_mode), 0o600)
+        self.assertTrue(cache.filename.startswith(self.cfg._LOCAL_DATA_FOLDER))
+
+        cache = self.cache()
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('foo/bar'), 'enc/enc')
+        self.assertEqual(cache.get('bäz'), 'encbaz')
+
+    def test_invalid(self):
+        cache = self.cache()
+        cache.set('foo', 'bar')
+        cache.save()
+        with open(cache.filename, 'r+b') as f:
+            f.seek(10)
+            f.write(b'x')
+        self.assertEqual(len(self.cache()), 0)
+
+    def test_new_volume(self):
+        cache = self.cache()
+        cache.set('foo', 'bar')
+        cache.save()
+        with open(self.encfsConfig, 'wt') as f:
+            f.write('<encfs>new volume key</encfs>')
+        self.assertEqual(len(self.cache()), 0)
+
+    def test_memory_only(self):
+        os.remove(self.encfsConfig)
+        cache = self.cache()
+        cache.set('foo', 'bar')
+        cache.save()
+        self.assertIsNone(cache.filename)
+        self.assertEqual(cache.get('foo'), 'bar')
@@ -0,0 +1,162 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import stat
+import unittest
+from unittest.mock import patch, Mock
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import tools
+import filehistory
+
+class TestFileHistory(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestFileHistory, self).setUp()
+        self.path = '/foo/bar'
+        # bar is changed in the third snapshot, all others are hardlinks
+        self.sids = []
+        for i in range(4):
+            sid = snapshots.SID('2016042{}-215134-123'.format(i), self.cfg)
+            sid.makeDirs('foo')
+            if i in (1, 3):
+                os.link(self.sids[-1].pathBackup(self.path), sid.pathBackup(self.path))
+            else:
+                with open(sid.pathBackup(self.path), 'wt') as f:
+                    f.write('x' * (i + 1))
+                os.utime(sid.pathBackup(self.path), times = (i, i))
+            self.sids.append(sid)
+        self.history = filehistory.FileHistory(self.cfg)
+        self.base_st = os.lstat(self.sids[0].pathBackup(self.path))
+
+    def test_stat(self):
+        os.remove(self.sids[1].pathBackup(self.path))
+        ret = list(self.history.stat(self.sids, self.path))
+        self.assertListEqual([i[0] for i in ret], self.sids)
+        self.assertIsNone(ret[1][1])
+        self.assertEqual(ret[3][1].st_ino, ret[2][1].st_ino)
+
+    def test_filter(self):
+        self.assertListEqual(list(self.history.filter(self.sids, self.path, self.base_st)),
+                             self.sids)
+        # wrong type
+        os.remove(self.sids[1].pathBackup(self.path))
+        os.mkdir(self.sids[1].pathBackup(self.path))
+        self.assertListEqual(list(self.history.filter(self.sids, self.path, self.base_st)),
+                             [self.sids[i] for i in (0, 2, 3)])
+
+    def test_filter_dir(self):
+        base_st = os.lstat(self.sids[0].pathBackup('/foo'))
+        self.assertListEqual(list(self.history.filter(self.sids, '/foo', base_st)),
+                             self.sids)
+
+    def test_filter_diff_only(self):
+        with patch.object(tools.UniquenessSet, 'check', autospec = True,
+                          side_effect = tools.UniquenessSet.check) as check:
+            self.assertListEqual(list(self.history.filter(self.sids, self.path, self.base_st,
+                                                          list_diff_only = True)),
+                                 [self.sids[0], self.sids[2]])
+            # hardlinks are skipped without checking them again
+            self.assertEqual(check.call_count, 2)
+
+    def test_filter_diff_only_deep_check(self):
+        with patch('tools.blake2sum', side_effect = tools.blake2sum) as blake2sum:
+            self.assertListEqual(list(self.history.filter(self.sids, self.path, self.base_st,
+                                                          list_diff_only = True,
+                                                          flag_deep_check = True)),
+                                 [self.sids[0], self.sids[2]])
+            # different sizes need no checksum
+            blake2sum.assert_not_called()
+
+    def test_filter_deep_check_cache(self):
+        # same size and content but different mtime
+        for sid in self.sids[2:]:
+            os.remove(sid.pathBackup(self.path))
+        with open(self.sids[2].pathBackup(self.path), 'wt') as f:
+            f.write('x')
+        os.link(self.sids[2].pathBackup(self.path), self.sids[3].pathBackup(self.path))
+        cacheFile = os.path.join(self.sharePath, 'digests.cache')
+        with patch.object(self.cfg, 'digestCacheFile', return_value = cacheFile):
+            with patch('tools.blake2sum', side_effect = tools.blake2sum) as blake2sum:
+                self.assertListEqual(list(self.history.filter(self.sids, self.path, self.base_st,
+                                                              list_diff_only = True,
+                                                              flag_deep_check = True)),
+                                     [self.sids[0]])
+                # one checksum per inode
+                self.assertEqual(blake2sum.call_count, 2)
+            self.assertIsFile(cacheFile)
+            with patch('tools.blake2sum') as blake2sum:
+                self.assertListEqual(list(self.history.filter(self.sids, self.path, self.base_st,
+                                                              list_diff_only = True,
+                                                              flag_deep_check = True)),
+                                     [self.sids[0]])
+                blake2sum.assert_not_called()
+
+    def test_filter_equal_to(self):
+        equal_to = self.sids[2].pathBackup(self.path)
+        self.assertListEqual(list(self.history.filter(self.sids, self.path, self.base_st,
+                                                      list_equal_to = equal_to)),
+                             self.sids[2:])
+
+    def test_filter_links(self):
+        path = '/foo/link'
+        for sid, target in zip(self.sids, ('a', 'a', 'b', 'a')):
+            os.symlink(target, sid.pathBackup(path))
+        base_st = os.lstat(self.sids[0].pathBackup(path))
+        self.assertListEqual(list(self.history.filter(self.sids, path, base_st)),
+                             self.sids)
+        self.assertListEqual(list(self.history.filter(self.sids, path, base_st,
+                                                      list_diff_only = True)),
+                             self.sids[:1] + self.sids[2:3])
+
+    def test_stat_remote(self):
+        helper = Mock()
+        helper.stat.return_value = [[stat.S_IFREG | 0o644, 3, 2 * 10**9, 1, 42, 2],
+                                    None]
+        root = snapshots.RootSnapshot(self.cfg)
+        with patch('remotehelper.helper', return_value = helper), \
+             patch.object(self.cfg, 'sshSnapshotsFullPath', return_value = self.snapshotPath):
+            ret = list(self.history.stat([root] + self.sids[:2], self.path))
+        self.assertListEqual([i[0] for i in ret], [root] + self.sids[:2])
+        # root snapshot is always local
+        self.assertIsNone(ret[0][1])
+        self.assertEqual(helper.stat.call_count, 1)
+        self.assertEqual(ret[1][1].st_ino, 42)
+        self.assertEqual(ret[1][1].st_size, 3)
+        self.assertEqual(ret[1][1].st_mtime, 2)
+        self.assertIsNone(ret[2][1])
+
+    def test_stat_remote_failed(self):
+        helper = Mock()
+        helper.stat.side_effect = OSError('Remote helper is not available')
+        with patch('remotehelper.helper', return_value = helper):
+            ret = list(self.history.stat(self.sids, self.path))
+        self.assertListEqual([i[0] for i in ret], self.sids)
+        self.assertTrue(all(i[1] is not None for i in ret))
+
+    def test_iterFilter(self):
+        ret = list(self.sn.iterFilter(self.sids[0], self.path, self.sids,
+                                      list_diff_only = True))
+        self.assertListEqual(ret, [self.sids[0], self.sids[2]])
+        self.assertListEqual(self.sn.filter(self.sids[0], self.path, self.sids), self.sids)
+        self.assertListEqual(self.sn.filter(self.sids[0], '/missing', self.sids), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import fileinfo
+
+class TestFileInfo(generic.TestCase):
+    def setUp(self):
+        super(TestFileInfo, self).setUp()
+        self.tmpDir = TemporaryDirectory()
+        self.fileName = os.path.join(self.tmpDir.name, 'fileinfo.idx')
+        self.items = [(b'/', (16877, b'root', b'root'))]
+        for i in range(50):
+            folder = '/foo/dir{:02}'.format(i).encode()
+            self.items.append((folder, (16877, b'user', b'users')))
+            for j in range(20):
+                self.items.append((folder + '/file{:02}'.format(j).encode(),
+                                   (33188, 'user{}'.format(j % 3).encode(), b'users')))
+        self.items.sort()
+
+    def tearDown(self):
+        super(TestFileInfo, self).tearDown()
+        self.tmpDir.cleanup()
+
+    def write(self, items, blockSize = 512):
+        with fileinfo.FileInfoWriter(self.fileName, blockSize = blockSize) as f:
+            for path, info in items:
+                f.write(path, *info)
+
+    def test_write_read(self):
+        self.write(self.items)
+        with fileinfo.FileInfoReader(self.fileName) as reader:
+            self.assertTrue(reader.isSorted)
+            self.assertGreater(len(reader.blocks), 1)
+            self.assertEqual(len(reader), len(self.items))
+            self.assertListEqual(list(reader.items()), self.items)
+            self.assertCountEqual(reader.users, [b'root', b'user', b'user0', b'user1', b'user2'])
+
+    def test_get(self):
+        self.write(self.items)
+        with fileinfo.FileInfoReader(self.fileName) as reader:
+            self.assertEqual(reader[b'/foo/dir25/file07'], (33188, b'user1', b'users'))
+            self.assertEqual(reader.get(b'/'), (16877, b'root', b'root'))
+            self.assertIn(b'/foo/dir49/file19', reader)
+            self.assertNotIn(b'/foo/dir50', reader)
+            self.assertIsNone(reader.get(b'/foo/dir2'))
+            with self.assertRaises(KeyError):
+                reader[b'/bar']
+
+    def test_get_decompress_only_needed_blocks(self):
+        self.write(self.items)
+        with fileinfo.FileInfoReader(self.fileName) as reader:
+            with patch('zlib.decompress', wraps = fileinfo.zlib.decompress) as decompress:
+                reader.get(b'/foo/dir25/file07')
+                self.assertLessEqual(decompress.call_count, 2)
+
+    def test_subtree(self):
+        self.write(self.items)
+        expected = [i for i in self.items
+                    if i[0] == b'/foo/dir10' or i[0].startswith(b'/foo/dir10/')]
+        with fileinfo.FileInfoReader(self.fileName) as reader:
+            self.assertListEqual(list(reader.subtree(b'/foo/dir10/')), expected)
+            self.assertEqual(len(list(reader.subtree(b'/foo/dir10/file05'))), 1)
+            self.assertListEqual(list(reader.subtree(b'/foo/dir1')), [])
+            self.assertListEqual(list(reader.subtree(b'/')), self.items)
+
+    def test_unsorted(self):
+        items = list(reversed(self.items))
+        self.write(items)
+        with fileinfo.FileInfoReader(self.fileName) as reader:
+            self.assertFalse(reader.isSorted)
+            self.assertListEqual(list(reader.items()), items)
+            self.assertEqual(reader[b'/foo/dir25/file07'], (33188, b'user1', b'users'))
+            self.assertEqual(len(list(reader.subtree(b'/foo/dir10'))), 21)
+
+    def test_empty(self):
+        self.write([])
+        with fileinfo.FileInfoReader(self.fileName) as reader:
+            self.assertEqual(len(reader), 0)
+            self.assertIsNone(reader.get(b'/'))
+            self.assertListEqual(list(reader.subtree(b'/foo')), [])
+
+    def test_invalid_file(self):
+        with open(self.fileName, 'wb') as f:
+            f.write(b'foo bar /baz\n')
+        with self.assertRaises(fileinfo.FileInfoFormatError):
+            fileinfo.FileInfoReader(self.fileName)
+
+if __name__ == '__main__':
+    unittest.main()
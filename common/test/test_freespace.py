@@ -0,0 +1,117 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import freespace
+
+class TestFreeSpacePlanner(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestFreeSpacePlanner, self).setUp()
+        self.planner = freespace.FreeSpacePlanner(self.cfg)
+        # three snapshots oldest first, 'shared' is hardlinked into all of them
+        self.sids = []
+        for i in range(3):
+            sid = snapshots.SID('2016042{}-215134-123'.format(i), self.cfg)
+            sid.makeDirs('foo')
+            with open(sid.pathBackup('foo/own'), 'wb') as f:
+                f.write(b'x' * 8192)
+            if i:
+                os.link(self.sids[0].pathBackup('foo/shared'),
+                        sid.pathBackup('foo/shared'))
+            else:
+                with open(sid.pathBackup('foo/shared'), 'wb') as f:
+                    f.write(b'x' * 8192)
+            self.sids.append(sid)
+        self.fileSize = os.stat(self.sids[0].pathBackup('foo/own')).st_blocks * 512
+
+    def dirSize(self, sid):
+        return sum(os.stat(root).st_blocks * 512 for root, dirs, files in os.walk(sid.path()))
+
+    def test_footprint(self):
+        dirs = self.dirSize(self.sids[0])
+        self.assertTupleEqual(self.planner.footprint(self.sids[0], self.sids[1]),
+                              (dirs + self.fileSize, 4))
+        # shared file isn't linked into a newer snapshot
+        os.remove(self.sids[2].pathBackup('foo/shared'))
+        self.assertTupleEqual(self.planner.footprint(self.sids[1], self.sids[2]),
+                              (dirs + 2 * self.fileSize, 5))
+
+    def test_footprint_cached(self):
+        footprint = self.planner.footprint(self.sids[0], self.sids[1])
+        self.assertIsFile(self.sids[0].path(snapshots.SID.FOOTPRINT))
+        with patch.object(self.planner, 'scanLocal', return_value = (1, 1)) as scan:
+            self.assertTupleEqual(self.planner.footprint(self.sids[0], self.sids[1]),
+                                  footprint)
+            scan.assert_not_called()
+            # next snapshot changed
+            self.planner.footprint(self.sids[0], self.sids[2])
+            scan.assert_called_once_with(self.sids[0], self.sids[2])
+
+    def test_scanRemote(self):
+        def remoteFind(sid, printf):
+            if sid is self.sids[1]:
+                return iter([[b'd', b'10'], [b'f', b'11'], [b'f', b'12']])
+            return iter([[b'd', b'20', b'2', b'8'],
+                         [b'f', b'21', b'1', b'16'],
+                         [b'f', b'11', b'2', b'16'],
+                         [b'f', b'22', b'2', b'16']])
+        with patch.object(self.planner, 'remoteFind', side_effect = remoteFind):
+            self.assertTupleEqual(self.planner.scanRemote(self.sids[0], self.sids[1]),
+                                  ((8 + 16 + 16) * 512, 3))
+
+    def test_plan(self):
+        with patch.object(self.planner, 'footprint', return_value = (100, 2)):
+            self.assertListEqual(self.planner.plan(self.sids, size = 150),
+                                 self.sids[:2])
+            self.assertListEqual(self.planner.plan(self.sids, size = 100),
+                                 self.sids[:1])
+            self.assertListEqual(self.planner.plan(self.sids, inodes = 3),
+                                 self.sids[:2])
+            # never remove the last snapshot
+            self.assertListEqual(self.planner.plan(self.sids, size = 1000),
+                                 self.sids[:2])
+            # keep named snapshots
+            self.assertListEqual(self.planner.plan(self.sids, size = 100,
+                                                   keep = lambda sid: sid is self.sids[0]),
+                                 self.sids[1:2])
+
+    def test_plan_failed(self):
+        with patch.object(self.planner, 'footprint', side_effect = OSError()):
+            self.assertListEqual(self.planner.plan(self.sids, size = 1000),
+                                 self.sids[:1])
+
+    def test_freeSpace(self):
+        self.cfg.setMinFreeSpace(True, 10, self.cfg.DISK_UNIT_MB)
+        self.cfg.setMinFreeInodes(False, 2)
+        self.cfg.setRemoveOldSnapshots(False, 10, self.cfg.YEAR)
+        with patch.object(self.sn, 'statFreeSpaceLocal', return_value = 5) as stat, \
+             patch.object(freespace.FreeSpacePlanner, 'footprint', return_value = (3 * 1024 * 1024, 1)), \
+             patch.object(self.sn, 'createLastSnapshotSymlink'):
+            self.sn.freeSpace(None)
+        # remove both old snapshots at once without checking free space in between
+        self.assertEqual(stat.call_count, 1)
+        self.assertListEqual(snapshots.listSnapshots(self.cfg), self.sids[2:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import stat
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import permissionrestorer
+
+class TestPermissionRestorer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.root = os.fsencode(self.tmp.name)
+        os.makedirs(os.path.join(self.root, b'a', b'b'))
+        for name in (b'a/foo', b'a/b/bar'):
+            with open(os.path.join(self.root, name), 'wb'):
+                pass
+        self.messages = []
+        self.restorer = permissionrestorer.PermissionRestorer(self.report, workers = 4)
+
+    def tearDown(self):
+        for folder, dirs, files in os.walk(self.tmp.name):
+            os.chmod(folder, 0o700)
+        self.tmp.cleanup()
+
+    def report(self, ok, msg):
+        self.messages.append((ok, msg))
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def item(self, name, mode = None, uid = -1, gid = -1):
+        st = os.lstat(self.path(name))
+        if mode is None:
+            mode = st.st_mode
+        return (self.path(name), mode, uid, gid)
+
+    def test_unchanged(self):
+        with patch('os.chmod') as chmod, patch('os.chown') as chown:
+            self.restorer.restore([self.item(b'a/foo', uid = os.geteuid(), gid = os.getegid())],
+                                  [self.item(b'a')])
+            chmod.assert_not_called()
+            chown.assert_not_called()
+        self.assertListEqual(self.messages, [])
+        self.assertEqual(self.restorer.skipped, 2)
+
+    def test_chmod(self):
+        self.restorer.restore([self.item(b'a/foo', stat.S_IFREG | 0o600),
+                               self.item(b'a/b/bar', stat.S_IFREG | 0o640)],
+                              [self.item(b'a/b', stat.S_IFDIR | 0o750)])
+        self.assertEqual(stat.S_IMODE(os.stat(self.path(b'a/foo')).st_mode), 0o600)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path(b'a/b/bar')).st_mode), 0o640)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path(b'a/b')).st_mode), 0o750)
+        self.assertIn((True, 'chmod {} 100600'.format(self.path(b'a/foo').decode())), self.messages)
+        self.assertEqual(self.restorer.changed, 3)
+
+    def test_dirs_last(self):
+        order = []
+        chmod = os.chmod
+        def record(name, mode, dir_fd = None):
+            order.append(name)
+            chmod(name, mode, dir_fd = dir_fd)
+        with patch('os.chmod', side_effect = record):
+            self.restorer.restore([self.item(b'a/b/bar', stat.S_IFREG | 0o600)],
+                                  [self.item(b'a', stat.S_IFDIR | 0o750),
+                                   self.item(b'a/b', stat.S_IFDIR | 0o750)])
+        # files first, then folders deepest first
+        self.assertListEqual(order, [b'bar', b'b', b'a'])
+
+    def test_stream(self):
+        order = []
+        chmod = os.chmod
+        def record(name, mode, dir_fd = None):
+            order.append(name)
+            chmod(name, mode, dir_fd = dir_fd)
+        def items():
+            # sorted like fileinfo, folders first
+            yield self.item(b'a', stat.S_IFDIR | 0o750)
+            yield self.item(b'a/b', stat.S_IFDIR | 0o750)
+            yield self.item(b'a/b/bar', stat.S_IFREG | 0o600)
+            yield self.item(b'a/b', stat.S_IFDIR | 0o750)
+            yield self.item(b'a/foo', stat.S_IFREG | 0o600)
+        with patch.object(self.restorer, 'BATCH', 1), \
+             patch('os.chmod', side_effect = record):
+            self.restorer.restore(items())
+        # folders are held back, deduplicated and restored deepest first
+        self.assertCountEqual(order[:2], [b'bar', b'foo'])
+        self.assertListEqual(order[2:], [b'b', b'a'])
+        self.assertEqual(self.restorer.items, 4)
+
+    def test_missing(self):
+        item = self.item(b'a/foo', stat.S_IFREG | 0o600)
+        os.remove(self.path(b'a/foo'))
+        self.restorer.restore([item, (self.path(b'missing/foo'), 0o600, -1, -1)])
+        self.assertListEqual(self.messages, [])
+
+    def test_symlink(self):
+        os.symlink('foo', self.path(b'a/link'))
+        mode = os.stat(self.path(b'a/foo')).st_mode
+        self.restorer.restore([self.item(b'a/link', stat.S_IFLNK | 0o600)])
+        # target is untouched
+        self.assertEqual(os.stat(self.path(b'a/foo')).st_mode, mode)
+        self.assertListEqual(self.messages, [])
+
+    def test_chown_failed(self):
+        with patch('os.chown', side_effect = PermissionError()):
+            self.restorer.restore([self.item(b'a/foo', uid = os.geteuid() + 1, gid = os.getegid())])
+        self.assertListEqual(self.messages,
+                             [(False, 'chown {} {} : {}'.format(self.path(b'a/foo').decode(),
+                                                                os.geteuid() + 1, os.getegid()))])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import progress
+
+class TestProgress(generic.TestCaseCfg):
+    def setUp(self):
+        super(TestProgress, self).setUp()
+        self.publisher = progress.ProgressPublisher(self.cfg)
+        self.reader = progress.ProgressReader(self.cfg)
+        self.pg = progress.Progress(progress.RSYNC, 26, 517380, 14460000.0, 156, -1,
+                                    '517.38K', '14.46MB/s', '0:02:36')
+
+    def tearDown(self):
+        self.publisher.close()
+        self.reader.close()
+        super(TestProgress, self).tearDown()
+
+    def test_parseSize(self):
+        self.assertEqual(progress.parseSize('517.38K'), 517380)
+        self.assertEqual(progress.parseSize('517,38K'), 517380)
+        self.assertEqual(progress.parseSize('1,234,567'), 1234567)
+        self.assertEqual(progress.parseSize('14.46MB/s'), 14460000)
+        self.assertEqual(progress.parseSize('-449.39kB/s'), -449390)
+        self.assertEqual(progress.parseSize('foo'), 0)
+
+    def test_parseEta(self):
+        self.assertEqual(progress.parseEta('0:02:36'), 156)
+        self.assertEqual(progress.parseEta('??:??:??'), -1)
+
+    def test_fromRsync(self):
+        sn = snapshots.Snapshots(self.cfg)
+        m = sn.reRsyncProgress.match('    517.38K  26%   14.46MB/s    0:02:36')
+        self.assertEqual(progress.fromRsync(m), self.pg)
+        # lines after a transferred file show the run time instead of ETA
+        m = sn.reRsyncProgress.match('    517.38K  26%   14.46MB/s    0:00:53 (xfr#53, to-chk=169/452)')
+        pg = progress.fromRsync(m)
+        self.assertEqual(pg.files, 53)
+        self.assertEqual(pg.eta, -1)
+        self.assertEqual(pg.etaText, '')
+
+    def test_publish(self):
+        self.assertIsNone(self.reader.read())
+        self.publisher.update(self.pg)
+        self.assertEqual(self.reader.read(), self.pg)
+
+        os.remove(self.cfg.takeSnapshotProgressFile())
+        self.assertIsNone(self.reader.read())
+
+    def test_rate_limit(self):
+        self.publisher.update(self.pg)
+        newer = self.pg._replace(percent = 27)
+        self.publisher.update(newer)
+        # too early, still the old progress
+        self.assertEqual(self.reader.read(), self.pg)
+        self.publisher.flush()
+        self.assertEqual(self.reader.read(), newer)
+
+    def test_torn_record(self):
+        self.publisher.update(self.pg)
+        # writer is in the middle of an update
+        self.publisher.mmap[progress._SEQ_OFFSET] += 1
+        with patch.object(self.reader, 'RETRIES', 3):
+            self.assertIsNone(self.reader.read())
+
+    def test_filterRsyncProgress(self):
+        sn = snapshots.Snapshots(self.cfg)
+        self.assertEqual(sn.filterRsyncProgress('foo\n    517.38K  26%   14.46MB/s    0:02:36'),
+                         'foo')
+        self.assertEqual(self.reader.read(), self.pg)
+        sn.progressPublisher.close()
+
+if __name__ == '__main__':
+    unittest.main()
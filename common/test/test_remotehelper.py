@@ -0,0 +1,174 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import stat
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import remotehelper
+
+class LocalHelper(remotehelper.RemoteHelper):
+    """
+    Run the helper on localhost without ssh.
+    """
+    def command(self, size):
+        return [sys.executable, '-c',
+                'import sys;exec(sys.stdin.buffer.read({}))'.format(size)]
+
+class TestRemoteHelper(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestRemoteHelper, self).setUp()
+        self.helper = LocalHelper(self.cfg)
+
+    def tearDown(self):
+        self.helper.close()
+        super(TestRemoteHelper, self).tearDown()
+
+    def test_stat(self):
+        path = os.path.join(self.snapshotPath, 'foo')
+        with open(path, 'wb') as f:
+            f.write(b'bar')
+        st = os.stat(path)
+        ret = self.helper.stat([path, os.path.join(self.snapshotPath, 'missing')])
+        self.assertEqual(len(ret), 2)
+        self.assertTrue(stat.S_ISREG(ret[0][0]))
+        self.assertListEqual(ret[0][1:3], [3, st.st_mtime_ns])
+        self.assertIsNone(ret[1])
+
+    def test_listdir(self):
+        for name in ('foo', 'bar'):
+            os.mkdir(os.path.join(self.snapshotPath, name))
+        self.assertListEqual(self.helper.listdir(self.snapshotPath), ['bar', 'foo'])
+        with self.assertRaises(FileNotFoundError):
+            self.helper.listdir(os.path.join(self.snapshotPath, 'missing'))
+
+    def test_open(self):
+        path = os.path.join(self.snapshotPath, 'foo')
+        data = bytes(range(256)) * 4096
+        with open(path, 'wb') as f:
+            f.write(data)
+        with self.helper.open(path) as f:
+            self.assertEqual(f.read(), data)
+            f.seek(-10, os.SEEK_END)
+            self.assertEqual(f.read(), data[-10:])
+            f.seek(5)
+            self.assertEqual(f.read(3), data[5:8])
+        with self.assertRaises(FileNotFoundError):
+            self.helper.open(os.path.join(self.snapshotPath, 'missing'))
+
+    def test_snapshots(self):
+        sid1 = snapshots.SID('20151219-010324-123', self.cfg)
+        sid1.makeDirs()
+        sid1.name = 'foo'
+        sid2 = snapshots.SID('20151219-020324-123', self.cfg)
+        sid2.makeDirs()
+        sid2.failed = True
+        with open(sid2.path(snapshots.SID.TRANSFER), 'wt') as f:
+            f.write('{"version": 1, "changes": {}}')
+        sid3 = snapshots.SID('20151219-030324-123', self.cfg)
+        os.makedirs(sid3.path())
+        os.mkdir(os.path.join(self.snapshotPath, 'foo'))
+
+        ret = self.helper.snapshots(self.snapshotPath)
+        self.assertListEqual(ret['names'], [sid1.sid, sid2.sid, sid3.sid, 'foo'])
+        self.assertCountEqual(ret['entries'].keys(), [sid1.sid, sid2.sid, sid3.sid])
+        self.assertDictEqual(self.helper.entry(sid1, ret['entries'][sid1.sid]),
+                             {'name': 'foo', 'failed': False, 'lastChecked': sid1.displayID,
+                              'transfer': None})
+        self.assertTrue(ret['entries'][sid2.sid]['failed'])
+        self.assertDictEqual(ret['entries'][sid2.sid]['transfer'], {'version': 1, 'changes': {}})
+        self.assertFalse(ret['entries'][sid3.sid]['exists'])
+
+    def test_restart(self):
+        self.assertEqual(self.helper.version(), 1)
+        self.helper.proc.kill()
+        self.helper.proc.wait()
+        self.assertEqual(self.helper.version(), 1)
+
+    def test_catalog(self):
+        sid1 = snapshots.SID('20151219-010324-123', self.cfg)
+        sid1.makeDirs()
+        sid1.name = 'foo'
+        sid2 = snapshots.SID('20151219-020324-123', self.cfg)
+        sid2.makeDirs()
+        sid2.failed = True
+        d = snapshots.FileInfoDict()
+        d[b'/tmp']     = (123, b'foo', b'bar')
+        sid2.fileInfo = d
+
+        with patch('remotehelper.helper', return_value = self.helper), \
+             patch.object(self.cfg, 'sshSnapshotsFullPath', return_value = self.snapshotPath), \
+             patch('os.listdir') as listdir:
+            sids = snapshots.listSnapshots(self.cfg)
+            self.assertListEqual(sids, [sid2, sid1])
+            self.assertEqual(sids[1].name, 'foo')
+            self.assertTrue(sids[0].failed)
+            self.assertDictEqual(sids[0].fileInfo, d)
+            # nothing went through the local (sshfs) filesystem
+            listdir.assert_not_called()
+
+    def test_sid_batched(self):
+        sids = []
+        for i in range(3):
+            sid = snapshots.SID('20151219-0{}0324-123'.format(i + 1), self.cfg)
+            sid.makeDirs()
+            sids.append(sid)
+        sids[1].name = 'foo'
+        missing = snapshots.SID('20151219-090324-123', self.cfg)
+        self.cfg.remoteHelpers[('1', 'foo', 'localhost', '22')] = self.helper
+
+        with patch('remotehelper.helper', return_value = self.helper), \
+             patch.object(self.cfg, 'sshSnapshotsFullPath', return_value = self.snapshotPath), \
+             patch.object(self.helper, 'request', wraps = self.helper.request) as request:
+            for sid in sids:
+                sid = snapshots.SID(sid.sid, self.cfg)
+                self.assertTrue(sid.exists())
+                self.assertFalse(sid.failed)
+            self.assertEqual(snapshots.SID(sids[1].sid, self.cfg).name, 'foo')
+            self.assertFalse(missing.exists())
+            # one request for all snapshots
+            self.assertEqual(request.call_count, 1)
+
+            sids[0].failed = True
+            self.assertTrue(snapshots.SID(sids[0].sid, self.cfg).failed)
+            self.assertEqual(request.call_count, 2)
+
+    def test_close(self):
+        self.cfg.setSnapshotsMode('ssh')
+        with patch('remotehelper.RemoteHelper', LocalHelper):
+            helper = remotehelper.helper(self.cfg)
+        self.assertIsNotNone(helper.proc)
+        remotehelper.close(self.cfg,
+                           self.cfg.sshUser(),
+                           self.cfg.sshHost(),
+                           self.cfg.sshPort())
+        self.assertIsNone(helper.proc)
+        self.assertDictEqual(self.cfg.remoteHelpers, {})
+
+    def test_helper_unavailable(self):
+        self.cfg.setSnapshotsMode('ssh')
+        with patch.object(remotehelper.RemoteHelper, 'command', return_value = ['false']):
+            self.assertIsNone(remotehelper.helper(self.cfg))
+        self.assertIn(False, self.cfg.remoteHelpers.values())
+
+if __name__ == '__main__':
+    unittest.main()
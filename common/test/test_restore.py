@@ -21,6 +21,8 @@ import unittest
 import pwd
 import grp
 import stat
+import shutil
+from unittest import mock
 from tempfile import TemporaryDirectory
 from test import generic
 
@@ -152,6 +154,86 @@ class TestRestore(RestoreTestCase):
         with open(restoreFile, 'rt') as f:
             self.assertEqual(f.read(), 'fooooooooooooooooooo')
 
+class TestRestoreBatches(RestoreTestCase):
+    def setUp(self):
+        super(TestRestoreBatches, self).setUp()
+        self.root = self.sid.pathBackup()
+
+    def test_restoreBatches(self):
+        paths = ['/foo/a', '/foo/b', '/bar/c']
+        self.assertListEqual(self.sn.restoreBatches(self.sid, paths),
+                             [(self.root + '/', ['foo/a', 'foo/b', 'bar/c'], 0)])
+
+    def test_restoreBatches_restore_to(self):
+        paths = ['/foo/a', '/foo/b/', '/bar/c', '/d']
+        self.assertListEqual(self.sn.restoreBatches(self.sid, paths, '/tmp/dest'),
+                             [(self.root + '/foo/', ['a', 'b'], 4),
+                              (self.root + '/bar/', ['c'], 4),
+                              (self.root + '/', ['d'], 0)])
+
+    def test_restore_one_rsync(self):
+        cmds = []
+        def execute(cmd, **kwargs):
+            files_from = [i for i in cmd if i.startswith('--files-from=')][0][13:]
+            with open(files_from, 'rb') as f:
+                cmds.append((cmd, f.read()))
+            for path in paths:
+                os.makedirs(os.path.dirname(path), exist_ok = True)
+                shutil.copyfile(self.sid.pathBackup(path), path)
+            return mock.Mock(printable_cmd = ' '.join(cmd))
+        paths = [os.path.join(self.include.name, i) for i in ('test', 'foo/bar/baz')]
+        for path in paths:
+            self.prepairFileInfo(path)
+        with mock.patch('tools.Execute', side_effect = execute), \
+             mock.patch('tools.rsyncPrefix', return_value = ['rsync']):
+            self.sn.restore(self.sid, paths)
+        self.assertEqual(len(cmds), 1)
+        cmd, files = cmds[0]
+        self.assertIn('--from0', cmd)
+        self.assertEqual(cmd[-2], self.root + '/')
+        self.assertEqual(cmd[-1], '/')
+        self.assertListEqual(files.split(b'\0')[:-1],
+                             [os.fsencode(i.lstrip('/')) for i in paths])
+        for path in paths:
+            self.assertEqual(33260, os.stat(path).st_mode)
+
+    def test_restore_root_permissions_untouched(self):
+        restoreFile = os.path.join(self.include.name, 'test')
+        self.prepairFileInfo(restoreFile)
+        self.prepairFileInfo(self.include.name, mode = stat.S_IFDIR | 0o700)
+        self.prepairFileInfo('/', mode = stat.S_IFDIR | 0o700)
+        restored = []
+        def restore(items, dirs = ()):
+            restored.extend(i[0] for i in items)
+        with mock.patch('tools.Execute'), \
+             mock.patch('tools.rsyncPrefix', return_value = ['rsync']), \
+             mock.patch('permissionrestorer.PermissionRestorer.restore', side_effect = restore):
+            self.sn.restore(self.sid, restoreFile)
+        self.assertIn(os.fsencode(restoreFile), restored)
+        self.assertIn(os.fsencode(self.include.name), restored)
+        self.assertNotIn(b'/', restored)
+
+    def test_restore_folder_to_different_destination_permissions(self):
+        restoreFolder = os.path.join(self.include.name, 'foo')
+        for path in (restoreFolder, os.path.join(restoreFolder, 'bar')):
+            self.prepairFileInfo(path, mode = stat.S_IFDIR | 0o750)
+        self.prepairFileInfo(os.path.join(restoreFolder, 'bar', 'baz'))
+        # parent folder is not restored to the destination
+        self.prepairFileInfo(self.include.name, mode = stat.S_IFDIR | 0o555)
+        with TemporaryDirectory() as dest:
+            def execute(cmd, **kwargs):
+                shutil.copytree(self.sid.pathBackup(restoreFolder), os.path.join(dest, 'foo'))
+                return mock.Mock(printable_cmd = ' '.join(cmd))
+            with mock.patch('tools.Execute', side_effect = execute), \
+                 mock.patch('tools.rsyncPrefix', return_value = ['rsync']), \
+                 mock.patch('os.walk') as walk:
+                self.sn.restore(self.sid, restoreFolder, restore_to = dest)
+                walk.assert_not_called()
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.join(dest, 'foo')).st_mode), 0o750)
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.join(dest, 'foo', 'bar')).st_mode), 0o750)
+            self.assertEqual(os.stat(os.path.join(dest, 'foo', 'bar', 'baz')).st_mode, 33260)
+            self.assertNotEqual(stat.S_IMODE(os.stat(dest).st_mode), 0o555)
+
 class TestRestoreLocal(RestoreTestCase):
     """
     Tests which should run on local and ssh profile
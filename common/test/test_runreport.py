@@ -0,0 +1,199 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import json
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import runreport
+
+class TestParseRsyncStats(unittest.TestCase):
+    def test_stats(self):
+        self.assertTupleEqual(runreport.parseRsyncStats('Number of files: 3,456 (reg: 3,000, dir: 456)'),
+                              ('files', 3456))
+        self.assertTupleEqual(runreport.parseRsyncStats('Number of regular files transferred: 12'),
+                              ('transferred', 12))
+        # rsync < 3.1
+        self.assertTupleEqual(runreport.parseRsyncStats('Number of files transferred: 12'),
+                              ('transferred', 12))
+        self.assertTupleEqual(runreport.parseRsyncStats('Literal data: 1.234.567 bytes'),
+                              ('literal_data', 1234567))
+        self.assertTupleEqual(runreport.parseRsyncStats('Total bytes received: 42'),
+                              ('received', 42))
+
+    def test_summary(self):
+        self.assertTupleEqual(runreport.parseRsyncStats('sent 1,234 bytes  received 56 bytes  2,580.00 bytes/sec'),
+                              (None, None))
+        self.assertTupleEqual(runreport.parseRsyncStats('total size is 9,876  speedup is 7.66'),
+                              (None, None))
+
+    def test_no_stats(self):
+        for line in ('BACKINTIME: >f+++++++++ foo', 'rsync: failed', 'Number one', ''):
+            self.assertIsNone(runreport.parseRsyncStats(line))
+
+class TestTransferMetrics(unittest.TestCase):
+    def test_changeType(self):
+        for item, kind in (('>f+++++++++ foo', 'new'),
+                           ('cL+++++++++ link -> foo', 'new'),
+                           ('hf+++++++++ hardlink => foo', 'new'),
+                           ('>f.st...... foo', 'modified'),
+                           ('<f..t...... foo', 'modified'),
+                           ('cL..T...... link -> bar', 'modified'),
+                           ('.f...p..... foo', 'metadata'),
+                           ('.f....og... foo', 'metadata'),
+                           ('*deleting   foo', 'deleted'),
+                           ('*deleting   foo/', None),
+                           ('cd+++++++++ foo/', None),
+                           ('.d..t...... foo/', None),
+                           ('foo', None)):
+            self.assertEqual(runreport.changeType(item), kind, item)
+
+    def test_add(self):
+        metrics = runreport.TransferMetrics()
+        metrics.addChange('>f+++++++++ foo', 10)
+        metrics.addChange('>f+++++++++ bar', 5)
+        metrics.addChange('.f...p..... baz', 7)
+        metrics.addChange('cd+++++++++ foo/', 4096)
+        metrics.add('deleted')
+        metrics.addRsyncStat('total_size', 2 * 1024**3)
+        ret = metrics.toDict()
+        self.assertEqual(ret['changes']['new']['count'], 2)
+        self.assertEqual(ret['changes']['new']['size'], 15)
+        # metadata changes transfer nothing
+        self.assertEqual(ret['changes']['metadata']['size'], 0)
+        self.assertEqual(ret['changes']['deleted']['count'], 1)
+        self.assertEqual(runreport.formatTransfer(json.loads(json.dumps(ret))),
+                         '2 new, 0 modified (15 B), 1 metadata, 1 deleted of 2.0 GiB')
+
+    def test_merge(self):
+        first = runreport.TransferMetrics()
+        first.addChange('>f+++++++++ foo', 10)
+        first.add('deleted')
+        first.addRsyncStat('total_size', 100)
+        first.addRsyncStat('sent', 50)
+        with TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'transfer.json')
+            first.save(filename)
+
+            metrics = runreport.TransferMetrics()
+            self.assertTrue(metrics.merge(filename))
+            self.assertFalse(metrics.merge(os.path.join(tmp, 'missing')))
+        metrics.addChange('>f+++++++++ bar', 5)
+        metrics.addRsyncStat('total_size', 120)
+        metrics.addRsyncStat('sent', 20)
+        ret = metrics.toDict()
+        self.assertDictEqual(dict(ret['changes']['new']), {'count': 2, 'size': 15})
+        self.assertEqual(ret['changes']['deleted']['count'], 1)
+        self.assertEqual(ret['rsync']['sent'], 70)
+        # describes the source, only the last session counts
+        self.assertEqual(ret['rsync']['total_size'], 120)
+
+    def test_formatSize(self):
+        self.assertEqual(runreport.formatSize(1023), '1023 B')
+        self.assertEqual(runreport.formatSize(1536), '1.5 KiB')
+        self.assertEqual(runreport.formatSize(5 * 1024**4), '5120.0 GiB')
+
+class TestRunReport(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestRunReport, self).setUp()
+        self.historyFile = os.path.join(self.sharePath, 'runreport.history')
+        patcher = patch.object(self.cfg, 'runReportHistoryFile', return_value = self.historyFile)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.report = runreport.RunReport(self.cfg)
+
+    def test_phase(self):
+        for i in range(2):
+            with self.report.phase('rsync'):
+                with open(os.path.join(self.sharePath, 'foo'), 'wt') as f:
+                    f.write('x' * 1000)
+        with self.assertRaises(OSError):
+            with self.report.phase('rename'):
+                raise OSError()
+        self.assertListEqual(list(self.report.phases), ['rsync', 'rename'])
+        self.assertEqual(self.report.phases['rsync']['count'], 2)
+        self.assertGreater(self.report.phases['rsync']['wall'], 0)
+        self.assertEqual(self.report.phases['rename']['count'], 1)
+
+    def test_toDict(self):
+        for key, value in (('total_size', 1000), ('sent', 80), ('received', 20)):
+            self.report.addRsyncStat(key, value)
+        self.report.addRsyncStat('sent', 100)
+        self.report.result = 'ok'
+        report = self.report.toDict()
+        self.assertEqual(report['version'], runreport.RunReport.VERSION)
+        self.assertEqual(report['profile'], '1')
+        self.assertEqual(report['result'], 'ok')
+        self.assertEqual(report['rsync']['sent'], 180)
+        self.assertEqual(report['rsync']['speedup'], 5.0)
+        # must be serializable
+        json.dumps(report)
+
+    def test_save(self):
+        sid = snapshots.SID('20160422-215134-123', self.cfg)
+        sid.makeDirs()
+        with self.report.phase('rsync'):
+            pass
+        self.report.save(sid)
+        report = sid.runReport()
+        self.assertEqual(report['snapshot'], '20160422-215134-123')
+        self.assertIn('rsync', report['phases'])
+        self.assertIsNone(snapshots.SID('20160423-215134-123', self.cfg).runReport())
+
+    def test_history(self):
+        self.assertListEqual(runreport.history(self.cfg), [])
+        with patch.object(runreport.RunReport, 'HISTORY', 3):
+            for i in range(7):
+                self.report.result = str(i)
+                self.report.appendHistory()
+            reports = runreport.history(self.cfg)
+        # trimmed to HISTORY after growing beyond twice its size
+        self.assertListEqual([r['result'] for r in reports], ['4', '5', '6'])
+
+    def test_history_invalid(self):
+        self.report.appendHistory()
+        with open(self.historyFile, 'at') as f:
+            f.write('foo\n{"version": 0}\n')
+        self.assertEqual(len(runreport.history(self.cfg)), 1)
+
+class TestTrends(unittest.TestCase):
+    def report(self, wall, **phases):
+        return {'wall': wall,
+                'phases': {name: {'wall': value} for name, value in phases.items()}}
+
+    def test_trends(self):
+        reports = [self.report(10, rsync = 8)] * 2 + \
+                  [self.report(20, rsync = 16, dedup = 3)] * 2
+        self.assertListEqual(runreport.trends(reports, window = 2),
+                             [('total', 10, 20, 100),
+                              ('rsync', 8, 16, 100),
+                              ('dedup', None, 3, None)])
+
+    def test_trends_short(self):
+        self.assertListEqual(runreport.trends([self.report(5, rsync = 4)]),
+                             [('total', None, 5, None),
+                              ('rsync', None, 4, None)])
+
+if __name__ == '__main__':
+    unittest.main()
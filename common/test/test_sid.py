@@ -20,6 +20,7 @@ import sys
 import unittest
 import stat
 import re
+import bz2
 from datetime import date, datetime
 from test import generic
 from unittest.mock import patch
@@ -28,6 +29,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import configfile
 import snapshots
 import logger
+import changemanifest
 from snapshotlog import LogFilter, SnapshotLog
 
 class TestSID(generic.SnapshotsTestCase):
@@ -291,7 +293,7 @@ class TestSID(generic.SnapshotsTestCase):
         os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
         infoFile = os.path.join(self.snapshotPath,
                                 '20151219-010324-123',
-                                'fileinfo.bz2')
+                                'fileinfo.idx')
 
         d = snapshots.FileInfoDict()
         d[b'/tmp']     = (123, b'foo', b'bar')
@@ -304,6 +306,58 @@ class TestSID(generic.SnapshotsTestCase):
         sid2 = snapshots.SID('20151219-010324-123', self.cfg)
         self.assertDictEqual(sid2.fileInfo, d)
 
+    def test_fileInfo_legacy_bz2(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
+        with bz2.BZ2File(sid.path(sid.FILEINFO_BZ2), 'wb') as f:
+            f.write(b'123 foo bar /tmp\n')
+            f.write(b'456 asdf qwer /tmp/foo\n')
+
+        d = snapshots.FileInfoDict()
+        d[b'/tmp']     = (123, b'foo', b'bar')
+        d[b'/tmp/foo'] = (456, b'asdf', b'qwer')
+        self.assertDictEqual(sid.fileInfo, d)
+
+    def test_fileInfoFor(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
+        d = snapshots.FileInfoDict()
+        d[b'/tmp']         = (123, b'foo', b'bar')
+        d[b'/tmp/foo']     = (456, b'asdf', b'qwer')
+        d[b'/tmp/foo/bar'] = (789, b'asdf', b'qwer')
+        d[b'/tmp/foobar']  = (123, b'foo', b'bar')
+        d[b'/usr']         = (123, b'foo', b'bar')
+        sid.fileInfo = d
+
+        self.assertCountEqual(sid.fileInfoFor([b'/tmp/foo']).keys(),
+                              [b'/', b'/tmp', b'/tmp/foo', b'/tmp/foo/bar'])
+
+        # same result from legacy fileinfo.bz2
+        os.rename(sid.path(sid.FILEINFO), sid.path(sid.FILEINFO_BZ2))
+        with bz2.BZ2File(sid.path(sid.FILEINFO_BZ2), 'wb') as f:
+            for path, info in d.items():
+                f.write(b' '.join((str(info[0]).encode(), info[1], info[2], path)) + b'\n')
+        self.assertCountEqual(sid.fileInfoFor([b'/tmp/foo']).keys(),
+                              [b'/', b'/tmp', b'/tmp/foo', b'/tmp/foo/bar'])
+
+    def test_iterFileInfo(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
+        d = snapshots.FileInfoDict()
+        d[b'/tmp']         = (123, b'foo', b'bar')
+        d[b'/tmp/foo']     = (456, b'asdf', b'qwer')
+        d[b'/tmp/foo/bar'] = (789, b'asdf', b'qwer')
+        d[b'/tmp/foo.bar'] = (123, b'foo', b'bar')
+        d[b'/usr']         = (123, b'foo', b'bar')
+        sid.fileInfo = d
+
+        # nested paths are only yielded once
+        paths = [i[0] for i in sid.iterFileInfo([b'/tmp/foo/bar', b'/tmp/foo.bar', b'/tmp/foo/'])]
+        self.assertListEqual(paths, [b'/tmp', b'/tmp/foo', b'/tmp/foo/bar', b'/tmp/foo.bar'])
+        self.assertListEqual([i[0] for i in sid.iterFileInfo([b'/tmp/foo'], parents = False)],
+                             [b'/tmp/foo', b'/tmp/foo/bar'])
+        self.assertEqual(len(list(sid.iterFileInfo([b'/tmp', b'/']))), 6)
+
     @patch('logger.error')
     def test_fileInfoErrorRead(self, mock_logger):
         sid = snapshots.SID('20151219-010324-123', self.cfg)
@@ -360,6 +414,25 @@ class TestSID(generic.SnapshotsTestCase):
 
         self.assertEqual('\n'.join(sid.log(mode = LogFilter.CHANGES)), 'foo bar\n[C] baz')
 
+    def test_log_index(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
+        indexFile = os.path.join(self.snapshotPath,
+                                 '20151219-010324-123',
+                                 'takesnapshot.log.idx')
+
+        sid.setLog('\n'.join('[C] {}'.format(i) for i in range(2500)))
+        reader = sid.logReader()
+        self.assertEqual(reader.count(), 2500)
+        self.assertIsFile(indexFile)
+        self.assertListEqual(reader.page(2), ['[C] {}'.format(i) for i in range(2000, 2500)])
+        reader.close()
+
+        # index is dropped when the log is replaced
+        sid.setLog('foo')
+        self.assertNotExists(indexFile)
+        self.assertEqual(sid.logReader().count(), 1)
+
     def test_setLog_binary(self):
         sid = snapshots.SID('20151219-010324-123', self.cfg)
         os.makedirs(os.path.join(self.snapshotPath, '20151219-010324-123'))
@@ -439,6 +512,18 @@ class TestNewSnapshot(generic.SnapshotsTestCase):
         log.flush()
         self.assertTrue(new.hasChanges)
 
+    def test_hasChanges_manifest(self):
+        new = snapshots.NewSnapshot(self.cfg)
+        new.makeDirs()
+
+        writer = changemanifest.ChangeManifestWriter(new.path(new.CHANGES))
+        writer.close()
+        self.assertFalse(new.hasChanges)
+        writer = changemanifest.ChangeManifestWriter(new.path(new.CHANGES))
+        writer.add('foo', '>f+++++++++', 3)
+        writer.close()
+        self.assertTrue(new.hasChanges)
+
 class TestRootSnapshot(generic.SnapshotsTestCase):
     #TODO: add test with 'sid.path(use_mode=['ssh_encfs'])'
     def test_create(self):
@@ -0,0 +1,86 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import unittest
+from datetime import date, datetime
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import smartremove
+
+class TestSmartRemovePlanner(generic.SnapshotsTestCase):
+    def sid(self, sid, name = '', failed = False):
+        sid = snapshots.SID(sid, self.cfg)
+        sid.catalogEntry = {'name': name, 'failed': failed, 'lastChecked': 0}
+        return sid
+
+    def planner(self, *rules):
+        return smartremove.SmartRemovePlanner(self.cfg,
+                                              datetime(2016, 4, 24, 21, 51, 34),
+                                              *rules)
+
+    def test_buckets(self):
+        planner = self.planner(0, 2, 2, 2)
+        self.assertListEqual(list(planner.buckets(date(2016, 4, 24))),
+                             [('day', date(2016, 4, 24)),
+                              ('week', date(2016, 4, 17)),
+                              ('month', date(2016, 4, 1)),
+                              ('year', 2016)])
+        # weeks overlap on Sunday / Monday
+        self.assertListEqual(list(planner.buckets(date(2016, 4, 17))),
+                             [('week', date(2016, 4, 17)),
+                              ('week', date(2016, 4, 10)),
+                              ('month', date(2016, 4, 1)),
+                              ('year', 2016)])
+        self.assertListEqual(list(planner.buckets(date(2016, 2, 17))),
+                             [('year', 2016)])
+        self.assertListEqual(list(planner.buckets(date(2017, 2, 17))), [])
+
+    def test_plan(self):
+        sid1 = self.sid('20160424-215134-123')
+        sid2 = self.sid('20160423-030324-123')
+        sid3 = self.sid('20160422-030324-123', failed = True)
+        sid4 = self.sid('20160422-010324-123')
+        sid5 = self.sid('20160421-010324-123', name = 'foo')
+        sid6 = self.sid('20160420-010324-123', failed = True)
+        sid7 = self.sid('20150420-010324-123', failed = True)
+
+        plan = self.planner(2, 3, 0, 0).plan([sid7, sid3, sid1, sid5, sid2, sid6, sid4])
+        self.assertListEqual([sid for sid, keep, reasons in plan],
+                             [sid1, sid2, sid3, sid4, sid5, sid6, sid7])
+        self.assertListEqual([keep for sid, keep, reasons in plan],
+                             [True, True, False, True, True, False, True])
+        self.assertListEqual(plan[0][2], ['last snapshot',
+                                          'keep all for the last 2 days',
+                                          'first of day 2016-04-24',
+                                          'first of year 2016'])
+        self.assertListEqual(plan[2][2], ['failed and not needed for any interval'])
+        self.assertListEqual(plan[3][2], ['first of day 2016-04-22'])
+        self.assertListEqual(plan[4][2], ['has a name'])
+        self.assertListEqual(plan[6][2], ['first of year 2015 (all failed)'])
+
+    def test_removeList_named(self):
+        self.cfg.setDontRemoveNamedSnapshots(False)
+        sid1 = self.sid('20160424-215134-123')
+        sid2 = self.sid('20160424-010324-123', name = 'foo')
+        self.assertListEqual(self.planner(0, 0, 0, 0).removeList([sid1, sid2]), [sid2])
+
+if __name__ == '__main__':
+    unittest.main()
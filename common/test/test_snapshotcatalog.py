@@ -0,0 +1,132 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import shutil
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import snapshotcatalog
+
+class TestSnapshotCatalog(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestSnapshotCatalog, self).setUp()
+        for i in ('20151219-010324-123',
+                  '20151219-020324-123',
+                  '20151219-030324-123'):
+            os.makedirs(os.path.join(self.snapshotPath, i, 'backup'))
+        self.catalog = snapshotcatalog.SnapshotCatalog(self.cfg)
+
+    def test_create_catalog(self):
+        self.assertNotExists(self.catalog.fileName)
+        snapshots.listSnapshots(self.cfg)
+        self.assertIsFile(self.catalog.fileName)
+        data = self.catalog.load()
+        self.assertCountEqual(data['snapshots'].keys(), ['20151219-010324-123',
+                                                         '20151219-020324-123',
+                                                         '20151219-030324-123'])
+        self.assertEqual(data['stamp'], self.catalog.stamp())
+
+    def test_no_scan_if_unchanged(self):
+        snapshots.listSnapshots(self.cfg)
+        data = self.catalog.load()
+        data['racy'] = False
+        self.catalog.save(data)
+        with patch.object(snapshotcatalog.SnapshotCatalog, 'scan') as scan:
+            self.assertListEqual(snapshots.listSnapshots(self.cfg),
+                                 ['20151219-030324-123',
+                                  '20151219-020324-123',
+                                  '20151219-010324-123'])
+            scan.assert_not_called()
+
+    def test_out_of_band_change(self):
+        snapshots.listSnapshots(self.cfg)
+        shutil.rmtree(os.path.join(self.snapshotPath, '20151219-020324-123'))
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-040324-123', 'backup'))
+        self.assertListEqual(snapshots.listSnapshots(self.cfg),
+                             ['20151219-040324-123',
+                              '20151219-030324-123',
+                              '20151219-010324-123'])
+
+    def test_incomplete_snapshot_finished(self):
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-040324-123'))
+        self.assertNotIn('20151219-040324-123', snapshots.listSnapshots(self.cfg))
+        os.makedirs(os.path.join(self.snapshotPath, '20151219-040324-123', 'backup'))
+        self.assertIn('20151219-040324-123', snapshots.listSnapshots(self.cfg))
+
+    def test_metadata(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        sid.name = 'foo'
+        sid.failed = True
+        l = snapshots.listSnapshots(self.cfg)
+        self.assertEqual(l[-1].name, 'foo')
+        self.assertTrue(l[-1].failed)
+        self.assertEqual(l[-1].catalogEntry['name'], 'foo')
+
+        # changing name on a listed snapshot updates the catalog
+        l[-1].name = 'bar'
+        l[-1].failed = False
+        data = self.catalog.load()
+        self.assertEqual(data['snapshots']['20151219-010324-123']['name'], 'bar')
+        self.assertFalse(data['snapshots']['20151219-010324-123']['failed'])
+        self.assertEqual(snapshots.listSnapshots(self.cfg)[-1].name, 'bar')
+
+    def test_transfer_metrics(self):
+        sid = snapshots.SID('20151219-010324-123', self.cfg)
+        self.assertIsNone(sid.transferMetrics())
+        with open(sid.path(snapshots.SID.TRANSFER), 'wt') as f:
+            f.write('{"version": 1, "changes": {"new": {"count": 2, "size": 3}}}')
+        l = snapshots.listSnapshots(self.cfg)
+        self.assertEqual(l[-1].catalogEntry['transfer']['changes']['new']['count'], 2)
+        # listed snapshots don't read the file again
+        os.remove(sid.path(snapshots.SID.TRANSFER))
+        self.assertEqual(l[-1].transferMetrics()['changes']['new']['size'], 3)
+        self.assertIsNone(sid.transferMetrics())
+
+    def test_commit_remove(self):
+        snapshots.listSnapshots(self.cfg)
+        stamp = self.catalog.stamp()
+        sid = snapshots.SID('20151219-020324-123', self.cfg)
+        shutil.rmtree(sid.path())
+        self.catalog.commit(stamp, discard = (sid,))
+        data = self.catalog.load()
+        self.assertNotIn('20151219-020324-123', data['snapshots'])
+        self.assertNotIn('20151219-020324-123', data['names'])
+        self.assertEqual(data['stamp'], self.catalog.stamp())
+
+    def test_commit_outdated_catalog(self):
+        snapshots.listSnapshots(self.cfg)
+        data = self.catalog.load()
+        data['stamp'] = [0, 0]
+        self.catalog.save(data)
+        sid = snapshots.SID('20151219-020324-123', self.cfg)
+        stamp = self.catalog.stamp()
+        shutil.rmtree(sid.path())
+        self.catalog.commit(stamp, discard = (sid,))
+        self.assertEqual(self.catalog.load()['stamp'], [0, 0])
+
+    def test_other_destination(self):
+        snapshots.listSnapshots(self.cfg)
+        self.cfg.setSnapshotsMode('ssh')
+        self.assertIsNone(self.catalog.load())
+
+if __name__ == '__main__':
+    unittest.main()
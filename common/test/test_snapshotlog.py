@@ -19,6 +19,7 @@ import os
 import sys
 import unittest
 import re
+from unittest.mock import patch
 from test import generic
 from tempfile import TemporaryDirectory
 from datetime import datetime
@@ -73,6 +74,76 @@ class TestLogFilter(generic.TestCase):
         for line in (self.i,):
             self.assertIsNone(logFilter.filter(line))
 
+class TestLogReader(generic.TestCase):
+    def setUp(self):
+        super(TestLogReader, self).setUp()
+        self.tmp = TemporaryDirectory()
+        self.logFile = os.path.join(self.tmp.name, 'takesnapshot.log')
+        self.indexFile = self.logFile + '.idx'
+        self.lines = []
+        for i in range(2500):
+            self.lines.extend(('[I] info {}'.format(i),
+                               '[C] <f+++++++++ /foo/{}'.format(i),
+                               ''))
+        with open(self.logFile, 'wt') as f:
+            f.write('\n'.join(self.lines) + '\n')
+        self.changes = [line for line in self.lines if not line.startswith('[I]')]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        super(TestLogReader, self).tearDown()
+
+    def reader(self, **kwargs):
+        return snapshotlog.LogReader(lambda: open(self.logFile, 'rb'),
+                                     self.indexFile, [1], **kwargs)
+
+    def test_count(self):
+        reader = self.reader()
+        self.assertEqual(reader.count(), 7500)
+        self.assertEqual(reader.count(snapshotlog.LogFilter.CHANGES), 5000)
+        self.assertEqual(reader.count(snapshotlog.LogFilter.ERROR), 2500)
+        self.assertExists(self.indexFile)
+
+    def test_lines(self):
+        reader = self.reader()
+        self.assertListEqual(list(reader.lines()), self.lines)
+        self.assertListEqual(list(reader.lines(snapshotlog.LogFilter.CHANGES, start = 3333)),
+                             self.changes[3333:])
+
+    def test_page(self):
+        reader = self.reader()
+        for number in (2, 3, 0, 4):
+            self.assertListEqual(reader.page(number, snapshotlog.LogFilter.CHANGES),
+                                 self.changes[number * 1000:(number + 1) * 1000])
+        reader.close()
+
+    def test_search(self):
+        reader = self.reader()
+        self.assertEqual(reader.search('/FOO/1234', snapshotlog.LogFilter.CHANGES),
+                         self.changes.index('[C] <f+++++++++ /foo/1234'))
+        self.assertIsNone(reader.search('/foo/1234', snapshotlog.LogFilter.CHANGES, start = 3000))
+
+    def test_index_cached(self):
+        self.reader().count()
+        reader = self.reader()
+        with patch.object(reader, 'opener') as opener:
+            self.assertEqual(reader.count(), 7500)
+            opener.assert_not_called()
+        # different stamp means a new log
+        with open(self.logFile, 'wt') as f:
+            f.write('foo\n')
+        reader = snapshotlog.LogReader(lambda: open(self.logFile, 'rb'),
+                                       self.indexFile, [2])
+        self.assertEqual(reader.count(), 1)
+
+    def test_index_grow(self):
+        reader = self.reader(complete = False)
+        self.assertEqual(reader.count(), 7500)
+        with open(self.logFile, 'at') as f:
+            f.write('[C] new\n[C] incomplete')
+        self.assertEqual(reader.count(snapshotlog.LogFilter.CHANGES), 5001)
+        self.assertEqual(self.reader(complete = False).count(), 7501)
+
 class TestSnapshotLog(generic.SnapshotsTestCase):
     def setUp(self):
         super(TestSnapshotLog, self).setUp()
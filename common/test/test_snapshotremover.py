@@ -0,0 +1,122 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import stat
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import snapshots
+import snapshotremover
+
+class TestSnapshotRemover(generic.SnapshotsTestCase):
+    def setUp(self):
+        super(TestSnapshotRemover, self).setUp()
+        self.sids = []
+        for i in range(4):
+            sid = snapshots.SID('2016042{}-215134-123'.format(i), self.cfg)
+            sid.makeDirs('foo/bar')
+            with open(sid.pathBackup('foo/bar/own'), 'wb') as f:
+                f.write(b'x' * 8192)
+            if i:
+                os.link(self.sids[0].pathBackup('foo/shared'),
+                        sid.pathBackup('foo/shared'))
+            else:
+                with open(sid.pathBackup('foo/shared'), 'wb') as f:
+                    f.write(b'x' * 8192)
+            self.sids.append(sid)
+        self.fileSize = os.stat(self.sids[0].pathBackup('foo/shared')).st_blocks * 512
+
+    def folderSize(self, sid):
+        size = 0
+        for root, dirs, files in os.walk(sid.path()):
+            size += os.stat(root).st_blocks * 512
+        return size
+
+    def test_removeTree(self):
+        remover = snapshotremover.SnapshotRemover(self.cfg)
+        sid = self.sids[0]
+        dirs = self.folderSize(sid)
+        files, freed = remover.removeTree(sid.path())
+        self.assertNotExists(sid.path())
+        self.assertEqual(files, 2)
+        # shared file is still linked in other snapshots
+        self.assertEqual(freed, dirs + self.fileSize)
+        self.assertEqual(os.stat(self.sids[1].pathBackup('foo/shared')).st_nlink, 3)
+
+    def test_removeTree_read_only(self):
+        sid = self.sids[0]
+        for path in (sid.pathBackup(), sid.pathBackup('foo'), sid.pathBackup('foo/bar')):
+            os.chmod(path, stat.S_IRUSR | stat.S_IXUSR)
+        snapshotremover.SnapshotRemover(self.cfg).removeTree(sid.path())
+        self.assertNotExists(sid.path())
+
+    def test_remove_parallel(self):
+        dirs = sum(self.folderSize(sid) for sid in self.sids)
+        progress = []
+        remover = snapshotremover.SnapshotRemover(self.cfg,
+                                                  lambda sid, files, freed: progress.append(sid))
+        with patch.object(remover, 'deviceWorkers', return_value = 4):
+            freed = remover.remove(self.sids)
+        for sid in self.sids:
+            self.assertNotExists(sid.path())
+        # shared file is freed exactly once
+        self.assertEqual(freed, dirs + 5 * self.fileSize)
+        self.assertCountEqual(progress, self.sids)
+        self.assertCountEqual(remover.removed, self.sids)
+        self.assertListEqual(remover.errors, [])
+
+    def test_remove_error(self):
+        remover = snapshotremover.SnapshotRemover(self.cfg)
+        with patch.object(remover, 'removeTree',
+                          side_effect = [PermissionError(13, 'Permission denied'), (0, 0)]):
+            remover.remove(self.sids[:2])
+        self.assertListEqual(remover.removed, [self.sids[1]])
+        self.assertEqual(len(remover.errors), 1)
+        self.assertIs(remover.errors[0][0], self.sids[0])
+
+    def test_remove_missing(self):
+        missing = snapshots.SID('20160101-215134-123', self.cfg)
+        progress = []
+        remover = snapshotremover.SnapshotRemover(self.cfg,
+                                                  lambda sid, files, freed: progress.append(sid))
+        remover.remove([missing, self.sids[0]])
+        self.assertCountEqual(remover.removed, [missing, self.sids[0]])
+        self.assertCountEqual(progress, [missing, self.sids[0]])
+        self.assertListEqual(remover.errors, [])
+
+    def test_snapshots_remove_missing(self):
+        # backup() removes the new snapshot if nothing changed, even if it
+        # was never created
+        missing = snapshots.NewSnapshot(self.cfg)
+        self.assertNotExists(missing.path())
+        self.sn.remove(missing)
+        self.sn.removeMany([missing])
+
+    def test_removeMany(self):
+        progress = []
+        self.sn.removeMany(self.sids, lambda i, count: progress.append((i, count)))
+        for sid in self.sids:
+            self.assertNotExists(sid.path())
+        self.assertListEqual(progress, [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertListEqual(snapshots.listSnapshots(self.cfg), [])
+
+if __name__ == '__main__':
+    unittest.main()
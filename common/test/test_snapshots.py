@@ -33,6 +33,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import config
 import snapshots
 import tools
+import changemanifest
+import runreport
 
 CURRENTUID = os.geteuid()
 CURRENTUSER = pwd.getpwuid(CURRENTUID).pw_name
@@ -279,6 +281,49 @@ class TestSnapshots(generic.SnapshotsTestCase):
         self.assertListEqual(list(i2), ['--include=/',
                                         '--include=/**'])
 
+    def test_rsyncInclude_folder_files(self):
+        i1, i2 = self.sn.rsyncInclude([('/foo/bar', 2), ('/', 2)])
+        self.assertListEqual(list(i1), ['--include=/foo/bar/',
+                                        '--include=/foo/'])
+        self.assertListEqual(list(i2), ['--exclude=/foo/bar/*/',
+                                        '--include=/foo/bar/*',
+                                        '--exclude=/*/',
+                                        '--include=/*'])
+
+    def test_rsyncShards(self):
+        shards = self.sn.rsyncShards([('/foo', 0),
+                                      ('/foo/bar', 0),
+                                      ('/baz', 1),
+                                      ('/qwe', 0)], 2)
+        self.assertListEqual(shards, [[('/foo', 0), ('/qwe', 0)],
+                                      [('/baz', 1)]])
+
+        self.assertListEqual(self.sn.rsyncShards([('/foo', 0)], 1),
+                             [[('/foo', 0)]])
+
+    def test_rsyncShards_split_folder(self):
+        with TemporaryDirectory() as tmp:
+            for i in ('a', 'b', 'c'):
+                os.mkdir(os.path.join(tmp, i))
+            with open(os.path.join(tmp, 'file'), 'wt') as f:
+                pass
+            os.symlink('a', os.path.join(tmp, 'link'))
+
+            shards = self.sn.rsyncShards([(tmp, 0)], 2)
+            self.assertListEqual(shards, [[(os.path.join(tmp, 'a'), 0),
+                                           (os.path.join(tmp, 'c'), 0)],
+                                          [(os.path.join(tmp, 'b'), 0),
+                                           (tmp, 2)]])
+
+    def test_rsyncProtect(self):
+        self.assertListEqual(self.sn.rsyncProtect([('/foo', 0),
+                                                   ('/bar', 1),
+                                                   ('/baz', 2)]),
+                             ['--filter=P /foo',
+                              '--filter=P /foo/**',
+                              '--filter=P /bar',
+                              '--filter=P /baz/*'])
+
     def test_rsyncSuffix(self):
         suffix = self.sn.rsyncSuffix(includeFolders = [('/foo', 0),
                                                        ('/bar', 1),
@@ -339,6 +384,38 @@ class TestSnapshots(generic.SnapshotsTestCase):
         self.sn.rsyncCallback('foo', params)
         self.assertListEqual([True, True], params)
 
+    def test_rsyncCallback_stats(self):
+        params = [False, False]
+
+        for line in ('Number of regular files transferred: 1,234',
+                     'Literal data: 4,096 bytes',
+                     'sent 5,000 bytes  received 120 bytes  10.00 bytes/sec'):
+            self.sn.rsyncCallback(line, params)
+        self.assertListEqual([False, False], params)
+        self.assertDictEqual(dict(self.sn.runReport.rsync),
+                             {'transferred': 1234, 'literal_data': 4096})
+        # statistics are no status messages
+        self.assertFalse(os.path.exists(self.cfg.takeSnapshotMessageFile()))
+
+    def test_rsyncCallback_transferMetrics(self):
+        params = [False, False]
+        self.sn.transferMetrics = runreport.TransferMetrics()
+
+        for line in ('BACKINTIME: 3 >f+++++++++ foo/bar',
+                     'BACKINTIME: 5 >f.st...... foo/baz',
+                     'BACKINTIME: 7 .f...p..... foo/qux',
+                     'BACKINTIME: 4096 cd+++++++++ foo/',
+                     'BACKINTIME: 0 *deleting   foo/old',
+                     'Total file size: 1,000 bytes'):
+            self.sn.rsyncCallback(line, params)
+        metrics = self.sn.transferMetrics.toDict()
+        self.assertDictEqual({kind: dict(value) for kind, value in metrics['changes'].items()},
+                             {'new':      {'count': 1, 'size': 3},
+                              'modified': {'count': 1, 'size': 5},
+                              'metadata': {'count': 1, 'size': 0},
+                              'deleted':  {'count': 1, 'size': 0}})
+        self.assertEqual(metrics['rsync']['total_size'], 1000)
+
     def test_rsyncCallback_transfer(self):
         params = [False, False]
 
@@ -350,6 +427,29 @@ class TestSnapshots(generic.SnapshotsTestCase):
         with open(self.cfg.takeSnapshotLogFile(), 'rt') as f:
             self.assertEqual('[I] Take snapshot (rsync: BACKINTIME: <f+++++++++ /foo/bar)\n[C] <f+++++++++ /foo/bar\n', f.read())
 
+    def test_rsyncCallback_manifest(self):
+        params = [False, False]
+        manifest = os.path.join(self.snapshotPath, 'changes.idx')
+        self.sn.changeManifest = changemanifest.ChangeManifestWriter(manifest)
+
+        self.sn.rsyncCallback('BACKINTIME: 3 >f+++++++++ foo/bar', params)
+        self.assertListEqual([False, True], params)
+        # size is not part of the message
+        with open(self.cfg.takeSnapshotMessageFile(), 'rt') as f:
+            self.assertEqual('0\nTake snapshot (rsync: BACKINTIME: >f+++++++++ foo/bar)', f.read())
+        self.sn.rsyncCallback('BACKINTIME: 7 cL+++++++++ foo/link -> bar', params)
+        # folders are no changes
+        self.sn.rsyncCallback('BACKINTIME: 4096 cd+++++++++ foo/', params)
+        self.sn.snapshotLog.flush()
+        with open(self.cfg.takeSnapshotLogFile(), 'rt') as f:
+            self.assertIn('[C] >f+++++++++ foo/bar\n', f.read())
+
+        self.sn.changeManifest.close()
+        with changemanifest.ChangeManifestReader(manifest) as f:
+            self.assertListEqual(list(f.items()),
+                                 [(b'/foo/bar', ('>f+++++++++', 3)),
+                                  (b'/foo/link', ('cL+++++++++', 7))])
+
     def test_rsyncCallback_dir(self):
         params = [False, False]
 
@@ -543,7 +643,7 @@ user.size=.+''', re.MULTILINE))
         #TODO: add test for save permissions over SSH (and one SSH-test for path with spaces)
         infoFilePath = os.path.join(self.snapshotPath,
                                     '20151219-010324-123',
-                                    'fileinfo.bz2')
+                                    'fileinfo.idx')
 
         include = self.cfg.include()[0][0]
         with TemporaryDirectory(dir = include) as tmp:
@@ -565,6 +665,46 @@ user.size=.+''', re.MULTILINE))
             self.assertIn(tmp.encode(), fileInfo)
             self.assertIn(file_path.encode(), fileInfo)
 
+    def test_iterSnapshotTree(self):
+        for path in ('/foo/bar', '/foo.bar', '/foo/bar.baz'):
+            self.sid.makeDirs(path)
+        with open(self.sid.pathBackup('/foo/bar/file'), 'wt') as f:
+            f.write('bar')
+        os.symlink('bar', self.sid.pathBackup('/foo/link'))
+
+        paths = list(self.sn.iterSnapshotTree(self.sid))
+        self.assertListEqual(paths, [b'/foo',
+                                     b'/foo.bar',
+                                     b'/foo/bar',
+                                     b'/foo/bar.baz',
+                                     b'/foo/bar/baz',
+                                     b'/foo/bar/file'])
+        self.assertListEqual(paths, sorted(paths))
+
+    def test_linkSnapshot(self):
+        with TemporaryDirectory() as tmp:
+            for name in ('unchanged', 'changed', 'removed'):
+                path = os.path.join(tmp, name)
+                for root in ('', self.sid.pathBackup()):
+                    os.makedirs(root + tmp, exist_ok = True)
+                    with open(root + path, 'wt') as f:
+                        f.write(name)
+            os.remove(os.path.join(tmp, 'removed'))
+
+            new = snapshots.NewSnapshot(self.cfg)
+            new.makeDirs()
+            changed = [os.path.join(tmp, name).encode() for name in ('changed', 'removed')]
+            self.assertTrue(self.sn.linkSnapshot(self.sid, new, changed))
+
+            src = self.sid.pathBackup(tmp)
+            dst = new.pathBackup(tmp)
+            self.assertTrue(os.path.samefile(os.path.join(src, 'unchanged'),
+                                             os.path.join(dst, 'unchanged')))
+            self.assertNotExists(os.path.join(dst, 'changed'))
+            self.assertNotExists(os.path.join(dst, 'removed'))
+            self.assertIsFile(new.pathBackup(self.testFile))
+            self.assertFalse(os.path.samefile(src, dst))
+
     def test_collectPermission(self):
         # force permissions because different distributions will have different umask
         os.chmod(self.testDirFullPath, stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH | stat.S_IXOTH)
@@ -103,6 +103,21 @@ class TestSSH(generic.SSHTestCase):
     def test_benchmarkCipher(self):
         pass
 
+    def test_startMaster(self):
+        ssh = sshtools.SSH(cfg = self.cfg)
+        try:
+            self.assertTrue(ssh.startMaster())
+            self.assertTrue(ssh.masterRunning())
+            self.assertIn('ControlPath={}'.format(ssh.control_path),
+                          self.cfg.sshCommand(cmd = ['echo', 'foo']))
+            # starting again reuses the running master
+            self.assertTrue(ssh.startMaster())
+        finally:
+            ssh.stopMaster()
+        self.assertFalse(os.path.exists(ssh.control_path))
+        self.assertNotIn('ControlPath={}'.format(ssh.control_path),
+                         self.cfg.sshCommand(cmd = ['echo', 'foo']))
+
     def test_checkKnownHosts(self):
         ssh = sshtools.SSH(cfg = self.cfg)
         ssh.checkKnownHosts()
@@ -0,0 +1,130 @@
+# Back In Time
+# Copyright (C) 2008-2022 Oprea Dan, Bart de Koning, Richard Bailey, Germar Reitze
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest.mock import patch
+from test import generic
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import statusmessage
+
+class TestMessagePublisher(generic.TestCaseCfg):
+    def setUp(self):
+        super(TestMessagePublisher, self).setUp()
+        self.flushed = []
+        self.pub = statusmessage.MessagePublisher(self.cfg,
+                                                  lambda *args: self.flushed.append(args),
+                                                  interval = 60)
+
+    def tearDown(self):
+        self.pub.close()
+        super(TestMessagePublisher, self).tearDown()
+
+    def test_coalesce(self):
+        self.pub.publish(0, 'foo')
+        self.pub.publish(0, 'bar')
+        self.pub.publish(0, 'baz', 5)
+        self.assertListEqual(self.flushed, [(0, 'foo', -1)])
+        self.pub.flush()
+        self.assertListEqual(self.flushed, [(0, 'foo', -1), (0, 'baz', 5)])
+        # nothing pending
+        self.pub.flush()
+        self.assertEqual(len(self.flushed), 2)
+
+    def test_error(self):
+        self.pub.publish(0, 'foo')
+        self.pub.publish(0, 'bar')
+        self.pub.publish(1, 'error')
+        self.assertListEqual(self.flushed, [(0, 'foo', -1), (1, 'error', -1)])
+
+    def test_poll(self):
+        self.pub.interval = 0.1
+        self.pub.publish(0, 'foo')
+        self.pub.publish(0, 'bar')
+        self.pub.poll()
+        self.assertEqual(len(self.flushed), 1)
+        time.sleep(0.2)
+        self.pub.poll()
+        self.assertListEqual(self.flushed, [(0, 'foo', -1), (0, 'bar', -1)])
+
+    def test_timer_push_only(self):
+        sub = statusmessage.MessageSubscriber(self.cfg)
+        self.assertTrue(self.pub.listen())
+        self.assertTrue(sub.connect())
+        self.pub.interval = 0.1
+        callers = []
+        self.pub.callback = lambda *args: callers.append(threading.current_thread())
+        self.pub.publish(0, 'foo')
+        self.pub.publish(0, 'bar')
+        time.sleep(0.5)
+        # subscribers got the message from the timer
+        self.assertTupleEqual(sub.read(), (0, 'bar'))
+        # callback is still pending for the main thread
+        self.assertEqual(len(callers), 1)
+        self.pub.publish(0, 'baz')
+        self.assertListEqual(callers, [threading.current_thread()] * 2)
+        sub.close()
+
+    def test_clear(self):
+        self.pub.publish(0, 'foo')
+        self.pub.publish(0, 'bar')
+        self.pub.clear()
+        self.pub.close()
+        self.assertListEqual(self.flushed, [(0, 'foo', -1)])
+
+    def test_subscriber(self):
+        sub = statusmessage.MessageSubscriber(self.cfg)
+        self.assertIsNone(sub.read())
+        self.assertTrue(self.pub.listen())
+        self.assertExists(self.cfg.takeSnapshotMessageSocket())
+        self.assertIsNone(sub.read())
+        self.assertIsNotNone(sub.fileno())
+        self.pub.publish(0, 'foo')
+        self.pub.publish(0, 'bar')
+        self.pub.flush()
+        self.assertTupleEqual(sub.read(), (0, 'bar'))
+        # keep the last message
+        self.assertTupleEqual(sub.read(), (0, 'bar'))
+        self.pub.close()
+        self.assertNotExists(self.cfg.takeSnapshotMessageSocket())
+        self.assertIsNone(sub.read())
+        self.assertIsNone(sub.fileno())
+
+class TestSnapshotsMessage(generic.SnapshotsTestCase):
+    def test_takeSnapshotMessage_pushed(self):
+        self.sn.messagePublisher.listen()
+        try:
+            self.assertTrue(self.sn.messageSubscriber.connect())
+            self.sn.setTakeSnapshotMessage(0, 'foo')
+            self.sn.setTakeSnapshotMessage(0, 'bar')
+            # only the first message was written, the second one is pending
+            with open(self.cfg.takeSnapshotMessageFile(), 'rt') as f:
+                self.assertEqual(f.read(), '0\nfoo')
+            self.sn.messagePublisher.flush()
+            os.remove(self.cfg.takeSnapshotMessageFile())
+            with patch.object(self.sn, 'busy', return_value = True):
+                self.assertTupleEqual(self.sn.takeSnapshotMessage(), (0, 'bar'))
+        finally:
+            self.sn.messagePublisher.close()
+
+if __name__ == '__main__':
+    unittest.main()
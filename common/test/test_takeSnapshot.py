@@ -57,7 +57,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertTrue(sid1.canOpenPath(os.path.join(self.include.name, 'file with spaces')))
         self.assertExists(self.cfg.anacronSpoolFile())
         for f in ('config',
-                  'fileinfo.bz2',
+                  'fileinfo.idx',
                   'info',
                   'takesnapshot.log.bz2'):
             self.assertExists(sid1.path(f))
@@ -114,7 +114,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertTrue(sid1.canOpenPath(os.path.join(include, 'foo', 'bar', 'baz')))
         self.assertTrue(sid1.canOpenPath(os.path.join(include, 'test')))
         for f in ('config',
-                  'fileinfo.bz2',
+                  'fileinfo.idx',
                   'info',
                   'takesnapshot.log.bz2'):
             self.assertExists(sid1.path(f))
@@ -135,7 +135,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertFalse(sid1.canOpenPath(os.path.join(self.include.name, 'foo', 'bar', 'baz')))
         self.assertTrue(sid1.canOpenPath(os.path.join(self.include.name, 'test')))
         for f in ('config',
-                  'fileinfo.bz2',
+                  'fileinfo.idx',
                   'info',
                   'takesnapshot.log.bz2'):
             self.assertExists(sid1.path(f))
@@ -158,7 +158,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
         self.assertTrue(sid1.canOpenPath(os.path.join(self.include.name, 'test')))
         self.assertFalse(sid1.canOpenPath(exclude))
         for f in ('config',
-                  'fileinfo.bz2',
+                  'fileinfo.idx',
                   'info',
                   'takesnapshot.log.bz2'):
             self.assertExists(sid1.path(f))
@@ -178,7 +178,7 @@ class TestTakeSnapshot(generic.SnapshotsTestCase):
             self.assertTrue(sid1.canOpenPath(os.path.join(self.include.name, 'foo', 'bar', 'baz')))
             self.assertFalse(sid1.canOpenPath(os.path.join(self.include.name, 'test')))
             for f in ('config',
-                      'fileinfo.bz2',
+                      'fileinfo.idx',
                       'info',
                       'takesnapshot.log.bz2',
                       'failed'):
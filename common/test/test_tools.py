@@ -23,6 +23,7 @@ import gzip
 import stat
 import signal
 import unittest
+import hashlib
 from unittest.mock import patch
 from copy import deepcopy
 from tempfile import NamedTemporaryFile, TemporaryDirectory
@@ -759,6 +760,63 @@ class TestToolsUniquenessSet(generic.TestCase):
             self.assertTrue(uniqueness.check(t3))
             self.assertFalse(uniqueness.check(t4))
 
+    def test_check_stat(self):
+        with TemporaryDirectory() as d:
+            t1 = os.path.join(d, 'foo')
+            with open(t1, 'wt') as f:
+                f.write('bar')
+            st = os.stat(t1)
+
+            uniqueness = tools.UniquenessSet(dc = False,
+                                             follow_symlink = False,
+                                             list_equal_to = '')
+            with patch('os.stat') as stat:
+                self.assertTrue(uniqueness.check(t1, st))
+                self.assertFalse(uniqueness.check(t1, st))
+                stat.assert_not_called()
+
+    def test_prefetch(self):
+        with TemporaryDirectory() as d:
+            paths = [os.path.join(d, str(i)) for i in range(5)]
+            for path, data in zip(paths, ('bar', 'bar', 'baz', 'foobar', None)):
+                if data is None:
+                    os.link(paths[0], path)
+                    continue
+                with open(path, 'wt') as f:
+                    f.write(data)
+            items = [(path, os.stat(path)) for path in paths]
+
+            uniqueness = tools.UniquenessSet(dc = True,
+                                             follow_symlink = False,
+                                             list_equal_to = '')
+            with patch('tools.blake2sum', side_effect = tools.blake2sum) as blake2sum:
+                uniqueness.prefetch(items)
+                # only files with the same size, hardlinks only once
+                self.assertCountEqual([i[0][0] for i in blake2sum.call_args_list], paths[:3])
+                blake2sum.reset_mock()
+                self.assertListEqual([uniqueness.check(*item) for item in items],
+                                     [True, False, True, True, False])
+                blake2sum.assert_not_called()
+
+    def test_digestCache(self):
+        with TemporaryDirectory() as d:
+            path = os.path.join(d, 'foo')
+            with open(path, 'wt') as f:
+                f.write('bar')
+            st = os.stat(path)
+            cacheFile = os.path.join(d, 'cache')
+
+            cache = tools.DigestCache(cacheFile, maxEntries = 1)
+            self.assertIsNone(cache.get(st))
+            cache.set(st, tools.blake2sum(path))
+            cache.save()
+
+            cache = tools.DigestCache(cacheFile, maxEntries = 1)
+            self.assertEqual(cache.get(st), hashlib.blake2b(b'bar').hexdigest())
+            # drop least recently used entry
+            cache.set(os.stat(d), 'foo')
+            self.assertIsNone(cache.get(st))
+
     def test_checkEqual(self):
         with TemporaryDirectory() as d:
             for i in range(1, 5):
@@ -836,6 +894,45 @@ class TestToolsExecuteSubprocess(generic.TestCase):
         proc = tools.Execute(['true'])
         self.assertTrue(proc.pausable)
 
+class TestToolsExecuteBatched(generic.TestCase):
+    def test_callback(self):
+        lines = []
+        proc = tools.Execute(['seq', '100000'],
+                             callback = lambda x, y: lines.append((x, y)),
+                             user_data = 'foo',
+                             batched = True)
+        self.assertEqual(proc.run(), 0)
+        self.assertListEqual(lines, [(str(i), 'foo') for i in range(1, 100001)])
+        self.assertEqual(proc.lines, 100000)
+        self.assertGreaterEqual(proc.batches, 1)
+        self.assertGreater(proc.duration, 0)
+
+    def test_filters_bytes(self):
+        lines = []
+        proc = tools.Execute(['printf', 'foo\\nbar\\nbaz'],
+                             callback = lambda x, y: lines.append(x),
+                             filters = (lambda x: None if x == b'bar' else x,),
+                             conv_str = False,
+                             batched = True)
+        proc.run()
+        # last line without trailing newline is kept
+        self.assertListEqual(lines, [b'foo', b'baz'])
+
+    def test_returncode(self):
+        proc = tools.Execute(['sh', '-c', 'echo foo; exit 3'],
+                             callback = lambda x, y: None,
+                             batched = True)
+        self.assertEqual(proc.run(), 3)
+
+    def test_callback_error(self):
+        def c(x, y):
+            raise ValueError()
+        proc = tools.Execute(['seq', '1000000'], callback = c, batched = True)
+        with self.assertRaises(ValueError):
+            proc.run()
+        proc.currentProc.kill()
+        proc.currentProc.wait()
+
 class TestToolsExecuteOsSystem(generic.TestCase):
     # old method with os.system
     def test_returncode(self):
@@ -865,5 +962,19 @@ class TestToolsExecuteOsSystem(generic.TestCase):
         proc = tools.Execute('true')
         self.assertFalse(proc.pausable)
 
+class TestToolsExecuteGroup(generic.TestCase):
+    def test_returncode(self):
+        group = tools.ExecuteGroup([tools.Execute(['true']),
+                                    tools.Execute(['false'])])
+        self.assertListEqual(group.run(), [0, 1])
+
+    def test_callback(self):
+        lines = []
+        c = lambda x, y: lines.append((x, y))
+        group = tools.ExecuteGroup([tools.Execute(['echo', 'foo'], callback = c, user_data = 1),
+                                    tools.Execute(['echo', 'bar'], callback = c, user_data = 2)])
+        group.run()
+        self.assertCountEqual(lines, [('foo', 1), ('bar', 2)])
+
 if __name__ == '__main__':
     unittest.main()
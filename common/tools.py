@@ -32,9 +32,14 @@ except ImportError:
 import hashlib
 import ipaddress
 import atexit
+import threading
+import queue
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from distutils.version import StrictVersion
-from time import sleep
+from time import sleep, monotonic
 keyring = None
 keyring_warn = False
 try:
@@ -705,6 +710,30 @@ def md5sum(path):
             md5.update(data)
     return md5.hexdigest()
 
+def blake2sum(path, bufferSize = 1024 * 1024):
+    """
+    Calculate BLAKE2b checksum for file in ``path``. The file is read
+    unbuffered in large chunks. hashlib releases the GIL while hashing so
+    multiple files can be hashed in parallel threads.
+
+    Args:
+        path (str):         full path to file
+        bufferSize (int):   read this many bytes at once
+
+    Returns:
+        str:                BLAKE2b checksum of file
+    """
+    blake2 = hashlib.blake2b()
+    buf = bytearray(bufferSize)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering = 0) as f:
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            blake2.update(view[:size])
+    return blake2.hexdigest()
+
 def checkCronPattern(s):
     """
     Check if ``s`` is a valid cron pattern.
@@ -1361,77 +1390,266 @@ def fdDup(old, new_fd, mode = 'w'):
     except OSError as e:
         logger.debug('Failed to redirect {}: {}'.format(old, str(e)))
 
+class DigestCache(object):
+    """
+    Persistent cache for checksums of files calculated by
+    :py:class:`UniquenessSet`. Entries are keyed by device, inode, size and
+    mtime of the file. Files in snapshots never change so a checksum stays
+    valid as long as the inode exists. The least recently used entries are
+    dropped if there are more than ``maxEntries``.
+
+    Only use this for local filesystems which have stable inode numbers.
+
+    Args:
+        filename (str):     cache file
+        maxEntries (int):   maximum number of cached checksums
+    """
+    VERSION = 1
+    MAX_ENTRIES = 100000
+
+    def __init__(self, filename, maxEntries = MAX_ENTRIES):
+        self.filename = filename
+        self.maxEntries = maxEntries
+        self.cache = None
+        self.changed = False
+
+    def load(self):
+        self.cache = OrderedDict()
+        try:
+            with open(self.filename, 'rt') as f:
+                data = json.load(f)
+            if data['version'] == self.VERSION:
+                self.cache.update(data['entries'])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.debug('Failed to load digest cache {}: {}'.format(self.filename, str(e)), self)
+
+    def save(self):
+        """
+        Write the cache if it has changed.
+        """
+        if not self.changed:
+            return
+        tmp = self.filename + '.tmp'
+        try:
+            with open(tmp, 'wt') as f:
+                json.dump({'version': self.VERSION,
+                           'entries': list(self.cache.items())}, f)
+            os.replace(tmp, self.filename)
+            self.changed = False
+        except OSError as e:
+            logger.debug('Failed to save digest cache {}: {}'.format(self.filename, str(e)), self)
+
+    def key(self, st):
+        if st.st_mtime_ns is None:
+            return None
+        return '{}:{}:{}:{}'.format(st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get(self, st):
+        """
+        Cached checksum of a file.
+
+        Args:
+            st (os.stat_result):    stat of the file
+
+        Returns:
+            str:                    checksum or ``None``
+        """
+        if self.cache is None:
+            self.load()
+        key = self.key(st)
+        try:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        except KeyError:
+            return None
+
+    def set(self, st, digest):
+        """
+        Store the checksum of a file.
+
+        Args:
+            st (os.stat_result):    stat of the file
+            digest (str):           checksum
+        """
+        if self.cache is None:
+            self.load()
+        key = self.key(st)
+        if key is None:
+            return
+        self.cache[key] = digest
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.maxEntries:
+            self.cache.popitem(last = False)
+        self.changed = True
+
 class UniquenessSet:
     """
     Check for uniqueness or equality of files.
 
+    Deep check only needs checksums of files which have the same size as
+    another file with a different inode. Hardlinks are never hashed twice.
+    Use :py:func:`prefetch` to hash all files which will be needed in a
+    thread pool before calling :py:func:`check` for each file.
+
     Args:
         dc (bool):              if ``True`` use deep check which will compare
-                                files md5sums if they are of same size but no
-                                hardlinks (don't have the same inode).
+                                files BLAKE2 checksums if they are of same
+                                size but no hardlinks (don't have the same
+                                inode).
                                 If ``False`` use files size and mtime
         follow_symlink (bool):  if ``True`` check symlinks target instead of the
                                 link
         list_equal_to (str):    full path to file. If not empty only return
                                 equal files to the given path instead of
                                 unique files.
+        cache (DigestCache):    persistent cache for checksums
+        workers (int):          number of threads used by :py:func:`prefetch`
     """
-    def __init__(self, dc = False, follow_symlink = False, list_equal_to = ''):
+    WORKERS = 4
+
+    def __init__(self, dc = False, follow_symlink = False, list_equal_to = '',
+                 cache = None, workers = WORKERS):
         self.deep_check = dc
         self.follow_sym = follow_symlink
-        self._uniq_dict = {}      # if not self._uniq_dict[size] -> size already checked with md5sum
-        self._size_inode = set()  # if (size,inode) in self._size_inode -> path is a hlink
+        self.cache = cache
+        self.workers = workers
+        self._uniq_dict = {}      # if not self._uniq_dict[size] -> size already checked with checksum
+        self._size_inode = set()  # if (size,dev,inode) in self._size_inode -> path is a hlink
+        self._digests = {}        # (dev,inode) -> checksum
         self.list_equal_to = list_equal_to
         if list_equal_to:
             st = os.stat(list_equal_to)
             if self.deep_check:
-                self.reference = (st.st_size, md5sum(list_equal_to))
+                self.reference = (st.st_size, self.digest(list_equal_to, st))
             else:
                 self.reference = (st.st_size, int(st.st_mtime))
 
-    def check(self, input_path):
+    def digest(self, path, st = None):
+        """
+        Checksum of file ``path``. Each inode is hashed only once.
+
+        Args:
+            path (str):             full path to file
+            st (os.stat_result):    stat of ``path`` if already known
+
+        Returns:
+            str:                    BLAKE2 checksum
+        """
+        if st is None:
+            st = os.stat(path)
+        identity = (st.st_dev, st.st_ino)
+        try:
+            return self._digests[identity]
+        except KeyError:
+            pass
+        digest = None
+        if self.cache is not None:
+            digest = self.cache.get(st)
+        if digest is None:
+            digest = blake2sum(path)
+            if self.cache is not None:
+                self.cache.set(st, digest)
+        self._digests[identity] = digest
+        return digest
+
+    def prefetch(self, items):
+        """
+        Hash all files from ``items`` which need a checksum in
+        :py:func:`check` in parallel. Files are grouped by size first, only
+        sizes with more than one distinct inode (or the size of
+        ``list_equal_to``) need checksums.
+
+        Args:
+            items (list):   list of tuple (full path, os.stat_result)
+        """
+        if not self.deep_check:
+            return
+        sizes = {}
+        for path, st in items:
+            sizes.setdefault(st.st_size, {}).setdefault((st.st_dev, st.st_ino), (path, st))
+        todo = []
+        for size, identities in sizes.items():
+            if self.list_equal_to:
+                if size != self.reference[0]:
+                    continue
+            elif len(identities) < 2:
+                continue
+            for identity, (path, st) in identities.items():
+                if identity in self._digests:
+                    continue
+                digest = self.cache.get(st) if self.cache is not None else None
+                if digest is not None:
+                    self._digests[identity] = digest
+                else:
+                    todo.append((identity, path, st))
+        if not todo:
+            return
+        logger.debug('Hash {} files with {} threads'.format(len(todo), self.workers), self)
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = [(identity, st, executor.submit(blake2sum, path))
+                       for identity, path, st in todo]
+            for identity, st, future in futures:
+                try:
+                    digest = future.result()
+                except OSError as e:
+                    # check() will raise the error again
+                    logger.debug('Failed to hash {}: {}'.format(identity, str(e)), self)
+                    continue
+                self._digests[identity] = digest
+                if self.cache is not None:
+                    self.cache.set(st, digest)
+
+    def check(self, input_path, st = None):
         """
         Check file ``input_path`` for either uniqueness or equality
         (depending on ``list_equal_to`` from constructor).
 
         Args:
-            input_path (str):   full path to file
+            input_path (str):       full path to file
+            st (os.stat_result):    stat of ``input_path`` if already known.
+                                    Ignored if ``input_path`` is a symlink
+                                    which should be followed
 
         Returns:
-            bool:               ``True`` if file is unique and ``list_equal_to``
-                                is empty.
-                                Or ``True`` if file is equal to file in
-                                ``list_equal_to``
+            bool:                   ``True`` if file is unique and
+                                    ``list_equal_to`` is empty.
+                                    Or ``True`` if file is equal to file in
+                                    ``list_equal_to``
         """
         # follow symlinks ?
         path = input_path
         if self.follow_sym and os.path.islink(input_path):
             path = os.readlink(input_path)
+            st = None
 
         if self.list_equal_to:
-            return self.checkEqual(path)
+            return self.checkEqual(path, st)
         else:
-            return self.checkUnique(path)
+            return self.checkUnique(path, st)
 
-    def checkUnique(self, path):
+    def checkUnique(self, path, st = None):
         """
         Check file ``path`` for uniqueness and store a unique key for ``path``.
 
         Args:
-            path (str): full path to file
+            path (str):             full path to file
+            st (os.stat_result):    stat of ``path`` if already known
 
         Returns:
-            bool:       ``True`` if file is unique
+            bool:                   ``True`` if file is unique
         """
         # check
+        if st is None:
+            st = os.stat(path)
         if self.deep_check:
-            dum = os.stat(path)
-            size,inode  = dum.st_size, dum.st_ino
+            size = st.st_size
             # is it a hlink ?
-            if (size, inode) in self._size_inode:
+            if (size, st.st_dev, st.st_ino) in self._size_inode:
                 logger.debug("[deep test] : skip, it's a duplicate (size, inode)", self)
                 return False
-            self._size_inode.add((size,inode))
+            self._size_inode.add((size, st.st_dev, st.st_ino))
             if size not in self._uniq_dict:
                 # first item of that size
                 unique_key = size
@@ -1439,40 +1657,41 @@ class UniquenessSet:
             else:
                 prev = self._uniq_dict[size]
                 if prev:
-                    # store md5sum instead of previously stored size
-                    md5sum_prev = md5sum(prev)
+                    # store checksum instead of previously stored size
+                    digest_prev = self.digest(*prev)
                     self._uniq_dict[size] = None
-                    self._uniq_dict[md5sum_prev] = prev
-                    logger.debug("[deep test] : size duplicate, remove the size, store prev md5sum", self)
-                unique_key = md5sum(path)
-                logger.debug("[deep test] : store current md5sum ?", self)
+                    self._uniq_dict[digest_prev] = prev
+                    logger.debug("[deep test] : size duplicate, remove the size, store prev checksum", self)
+                unique_key = self.digest(path, st)
+                logger.debug("[deep test] : store current checksum ?", self)
         else:
             # store a tuple of (size, modification time)
-            obj  = os.stat(path)
-            unique_key = (obj.st_size, int(obj.st_mtime))
+            unique_key = (st.st_size, int(st.st_mtime))
         # store if not already present, then return True
         if unique_key not in self._uniq_dict:
             logger.debug(" >> ok, store !", self)
-            self._uniq_dict[unique_key] = path
+            self._uniq_dict[unique_key] = (path, st)
             return True
         logger.debug(" >> skip (it's a duplicate)", self)
         return False
 
-    def checkEqual(self, path):
+    def checkEqual(self, path, st = None):
         """
         Check if ``path`` is equal to the file in ``list_equal_to`` from
         constructor.
 
         Args:
-            path (str): full path to file
+            path (str):             full path to file
+            st (os.stat_result):    stat of ``path`` if already known
 
         Returns:
-            bool:       ``True`` if file is equal
+            bool:                   ``True`` if file is equal
         """
-        st = os.stat(path)
+        if st is None:
+            st = os.stat(path)
         if self.deep_check:
             if self.reference[0] == st.st_size:
-                return self.reference[1] == md5sum(path)
+                return self.reference[1] == self.digest(path, st)
             return False
         else:
             return self.reference == (st.st_size, int(st.st_mtime))
@@ -1889,11 +2108,22 @@ class Execute(object):
         conv_str (bool):    convert output to :py:class:`str` if True or keep it
                             as :py:class:`bytes` if False
         join_stderr (bool): join stderr to stdout
+        batched (bool):     read output in large chunks in a separate thread
+                            and hand complete lines over in batches. The
+                            command won't block on a full pipe while
+                            ``filters`` and ``callback`` are busy
 
     Note:
         Signals SIGTSTP and SIGCONT send to Python main process will be
         forwarded to the command. SIGHUP will kill the process.
+
+    After :py:func:`run` finished ``lines``, ``batches``, ``duration`` (total
+    runtime in seconds) and ``callbackTime`` (seconds spent in ``filters``
+    and ``callback``) can be used for profiling.
     """
+    CHUNK_SIZE = 256 * 1024
+    QUEUE_SIZE = 64
+
     def __init__(self,
                  cmd,
                  callback = None,
@@ -1901,7 +2131,8 @@ class Execute(object):
                  filters = (),
                  parent = None,
                  conv_str = True,
-                 join_stderr = True):
+                 join_stderr = True,
+                 batched = False):
         self.cmd = cmd
         self.callback = callback
         self.user_data = user_data
@@ -1909,6 +2140,11 @@ class Execute(object):
         self.currentProc = None
         self.conv_str = conv_str
         self.join_stderr = join_stderr
+        self.batched = batched
+        self.lines = 0
+        self.batches = 0
+        self.duration = 0.0
+        self.callbackTime = 0.0
         #we need to forward parent to have the correct class name in debug log
         if parent:
             self.parent = parent
@@ -1933,6 +2169,7 @@ class Execute(object):
         """
         ret_val = 0
         out = ''
+        start = monotonic()
 
         #backwards compatibility with old os.system and os.popen calls
         if isinstance(self.cmd, str):
@@ -1975,8 +2212,11 @@ class Execute(object):
             self.currentProc = subprocess.Popen(self.cmd,
                                                 stdout = subprocess.PIPE,
                                                 stderr = stderr)
-            if self.callback:
+            if self.callback and self.batched:
+                self.pump()
+            elif self.callback:
                 for line in self.currentProc.stdout:
+                    self.lines += 1
                     if self.conv_str:
                         line = line.decode().rstrip('\n')
                     else:
@@ -1999,6 +2239,13 @@ class Execute(object):
                 #signal only work in qt main thread
                 pass
 
+        self.duration = monotonic() - start
+        if self.batched:
+            logger.debug('Command "%s..." took %.3fs (%.3fs in callbacks) for %d lines in %d batches'
+                         %(self.printable_cmd[:min(16, len(self.printable_cmd))],
+                           self.duration, self.callbackTime, self.lines, self.batches),
+                         self.parent, 2)
+
         if ret_val != 0:
             msg = 'Command "%s" returns %s%s%s' %(self.printable_cmd, bcolors.WARNING, ret_val, bcolors.ENDC)
             if out:
@@ -2012,6 +2259,81 @@ class Execute(object):
 
         return ret_val
 
+    def reader(self, batches, stop):
+        """
+        Read output of the command in large chunks and put complete lines
+        into ``batches``. Runs in a separate thread started by
+        :py:func:`pump`. ``None`` is put into ``batches`` at the end.
+
+        Args:
+            batches (queue.Queue):      bounded queue for batches of lines
+                                        (:py:class:`bytes` without the
+                                        trailing newline)
+            stop (threading.Event):     stop reading if set
+        """
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout = 0.5)
+                    return
+                except queue.Full:
+                    pass
+
+        fd = self.currentProc.stdout.fileno()
+        rest = b''
+        try:
+            while not stop.is_set():
+                chunk = tempFailureRetry(os.read, fd, self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                end = chunk.rfind(b'\n')
+                if end < 0:
+                    rest += chunk
+                    continue
+                put(rest + chunk[:end])
+                rest = chunk[end + 1:]
+            if rest:
+                put(rest)
+        finally:
+            put(None)
+
+    def pump(self):
+        """
+        Dispatch output of the command read by :py:func:`reader` to
+        ``filters`` and ``callback``. Each batch is decoded and split into
+        lines at once.
+        """
+        batches = queue.Queue(maxsize = self.QUEUE_SIZE)
+        stop = threading.Event()
+        thread = threading.Thread(target = self.reader,
+                                  args = (batches, stop),
+                                  daemon = True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                t = monotonic()
+                if self.conv_str:
+                    lines = batch.decode().split('\n')
+                else:
+                    lines = batch.split(b'\n')
+                self.batches += 1
+                self.lines += len(lines)
+                for line in lines:
+                    for f in self.filters:
+                        line = f(line)
+                    if not line:
+                        continue
+                    self.callback(line, self.user_data)
+                self.callbackTime += monotonic() - t
+            thread.join()
+        finally:
+            # don't wait for the reader if a callback failed, it might be
+            # blocked reading from the still running command
+            stop.set()
+
     def pause(self, signum, frame):
         """
         Slot which will send ``SIGSTOP`` to the command. Is connected to
@@ -2038,6 +2360,91 @@ class Execute(object):
             logger.info('Kill process "%s"' %self.printable_cmd, self.parent, 2)
             return self.currentProc.kill()
 
+class ExecuteGroup(object):
+    """
+    Run multiple :py:class:`Execute` instances concurrently, each one in its
+    own thread. Callbacks and filters of all commands will be called while
+    holding the same lock so they don't need to be thread-safe.
+
+    Args:
+        procs (list):       :py:class:`Execute` instances
+        parent (instance):  instance of the calling method used only to proper
+                            format log messages
+
+    Note:
+        Signals SIGTSTP, SIGCONT and SIGHUP send to Python main process will be
+        forwarded to all commands like :py:class:`Execute` does.
+    """
+    def __init__(self, procs, parent = None):
+        self.procs = procs
+        self.lock = threading.Lock()
+        if parent:
+            self.parent = parent
+        else:
+            self.parent = self
+
+        for proc in self.procs:
+            if proc.callback:
+                proc.callback = self.locked(proc.callback)
+            proc.filters = tuple(self.locked(f) for f in proc.filters)
+
+    def locked(self, func):
+        def wrapper(*args):
+            with self.lock:
+                return func(*args)
+        return wrapper
+
+    def run(self):
+        """
+        Start all commands and wait until they are finished.
+
+        Returns:
+            list:   returncodes from all commands in the same order as ``procs``
+        """
+        ret_val = [None] * len(self.procs)
+
+        def worker(index, proc):
+            ret_val[index] = proc.run()
+
+        try:
+            #register signals for pause, resume and kill
+            signal.signal(signal.SIGTSTP, self.pause)
+            signal.signal(signal.SIGCONT, self.resume)
+            signal.signal(signal.SIGHUP, self.kill)
+        except ValueError:
+            #signal only work in qt main thread
+            pass
+
+        threads = [threading.Thread(target = worker, args = (index, proc))
+                   for index, proc in enumerate(self.procs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        try:
+            #reset signals to their default
+            signal.signal(signal.SIGTSTP, signal.SIG_DFL)
+            signal.signal(signal.SIGCONT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+        except ValueError:
+            #signal only work in qt main thread
+            pass
+
+        return ret_val
+
+    def pause(self, signum, frame):
+        for proc in self.procs:
+            proc.pause(signum, frame)
+
+    def resume(self, signum, frame):
+        for proc in self.procs:
+            proc.resume(signum, frame)
+
+    def kill(self, signum, frame):
+        for proc in self.procs:
+            proc.kill(signum, frame)
+
 class Daemon:
     """
     A generic daemon class.
@@ -67,6 +67,7 @@ class MainWindow(QMainWindow):
         self.qapp = qapp
         self.snapshots = snapshots.Snapshots(config)
         self.lastTakeSnapshotMessage = None
+        self.progressReader = progress.ProgressReader(self.config)
         self.tmpDirs = []
 
         #main toolbar
@@ -520,6 +521,9 @@ class MainWindow(QMainWindow):
         self.timerUpdateTakeSnapshot.timeout.connect(self.updateTakeSnapshot)
         self.timerUpdateTakeSnapshot.start()
 
+        # update status immediately when the running snapshot pushes a message
+        self.messageNotifier = None
+
         SetupCron(self).start()
 
     def closeEvent(self, event):
@@ -724,12 +728,11 @@ class MainWindow(QMainWindow):
 
             self.status.setText(message)
 
-        pg = progress.ProgressFile(self.config)
-        if pg.fileReadable():
+        pg = self.progressReader.read()
+        if pg is not None:
             self.progressBar.setVisible(True)
             self.progressBarDummy.setVisible(False)
-            pg.load()
-            self.progressBar.setValue(pg.intValue('percent'))
+            self.progressBar.setValue(pg.percent)
             message = ' | '.join(self.getProgressBarFormat(pg, message))
             self.status.setText(message)
         else:
@@ -739,13 +742,26 @@ class MainWindow(QMainWindow):
         #if not fake_busy:
         #	self.lastTakeSnapshotMessage = None
 
+        self.updateMessageNotifier()
+
+    def updateMessageNotifier(self):
+        fd = self.snapshots.messageSubscriber.fileno()
+        if self.messageNotifier is not None:
+            if self.messageNotifier.socket() == fd:
+                return
+            self.messageNotifier.setEnabled(False)
+            self.messageNotifier.deleteLater()
+            self.messageNotifier = None
+        if fd is not None:
+            self.messageNotifier = QSocketNotifier(fd, QSocketNotifier.Read, self)
+            self.messageNotifier.activated.connect(lambda fd: self.updateTakeSnapshot())
+
     def getProgressBarFormat(self, pg, message):
-        d = (('sent',   _('Sent:')), \
-             ('speed',  _('Speed:')),\
-             ('eta',    _('ETA:')))
-        yield '{}%'.format(pg.intValue('percent'))
-        for key, txt in d:
-            value = pg.strValue(key, '')
+        d = ((pg.sentText,  _('Sent:')), \
+             (pg.speedText, _('Speed:')),\
+             (pg.etaText,   _('ETA:')))
+        yield '{}%'.format(pg.percent)
+        for value, txt in d:
             if not value:
                 continue
             yield txt + ' ' + value
@@ -17,6 +17,8 @@
 
 
 import gettext
+import re
+from collections import OrderedDict
 
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
@@ -27,11 +29,109 @@ import snapshots
 import encfstools
 import snapshotlog
 import tools
+import logger
 import messagebox
 
 _=gettext.gettext
 
 
+class LogModel(QAbstractListModel):
+    """
+    List model for a snapshot log which only reads the pages of
+    :py:class:`snapshotlog.LogReader` that are currently visible.
+    """
+    CACHE_PAGES = 20
+
+    def __init__(self, parent):
+        super(LogModel, self).__init__(parent)
+        self.reader = None
+        self.mode = None
+        self.decode = None
+        self.header = []
+        self.rows = 0
+        self.pages = OrderedDict()
+        self.overrides = {}
+
+    def setLog(self, reader, mode, decode, header):
+        self.beginResetModel()
+        if self.reader is not None:
+            self.reader.close()
+        self.reader = reader
+        self.mode = mode
+        self.decode = decode
+        self.header = header.split('\n')[:-1] if header else []
+        self.pages.clear()
+        self.overrides.clear()
+        self.rows = len(self.header)
+        if reader is not None:
+            self.rows += reader.count(mode)
+        self.endResetModel()
+
+    def refresh(self):
+        """
+        Add lines which were appended to the log.
+        """
+        if self.reader is None:
+            return
+        rows = len(self.header) + self.reader.count(self.mode)
+        if rows <= self.rows:
+            return
+        # last page might have been incomplete
+        self.pages.pop((self.rows - len(self.header)) // self.reader.PAGE_SIZE, None)
+        self.beginInsertRows(QModelIndex(), self.rows, rows - 1)
+        self.rows = rows
+        self.endInsertRows()
+
+    def rowCount(self, parent = QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.rows
+
+    def data(self, index, role = Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return self.line(index.row())
+
+    def line(self, row):
+        if row in self.overrides:
+            return self.overrides[row]
+        if row < len(self.header):
+            return self.header[row]
+        row -= len(self.header)
+        number, offset = divmod(row, self.reader.PAGE_SIZE)
+        page = self.pages.get(number)
+        if page is None:
+            page = self.reader.page(number, self.mode, self.decode)
+            self.pages[number] = page
+            if len(self.pages) > self.CACHE_PAGES:
+                self.pages.popitem(last = False)
+        else:
+            self.pages.move_to_end(number)
+        if offset < len(page):
+            return page[offset]
+        return ''
+
+    def setLine(self, row, text):
+        self.overrides[row] = text
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def search(self, text, start):
+        """
+        Row of the next line containing ``text`` starting at ``start``.
+        """
+        text = text.lower()
+        for row in range(start, len(self.header)):
+            if text in self.header[row].lower():
+                return row
+        if self.reader is None:
+            return None
+        row = self.reader.search(text, self.mode, self.decode,
+                                 max(start - len(self.header), 0))
+        if row is None:
+            return None
+        return row + len(self.header)
+
 class LogViewDialog(QDialog):
     def __init__(self, parent, sid = None, systray = False):
         if systray:
@@ -99,12 +199,24 @@ class LogViewDialog(QDialog):
         self.comboFilter.addItem(_('Changes'), 2)
         self.comboFilter.addItem(_('Informations'), 3)
 
-        #text view
-        self.txtLogView = QPlainTextEdit(self)
-        self.txtLogView.setFont(QFont('Monospace'))
-        self.txtLogView.setReadOnly(True)
-        self.txtLogView.setLineWrapMode(QPlainTextEdit.NoWrap)
-        self.mainLayout.addWidget(self.txtLogView)
+        #search
+        layout = QHBoxLayout()
+        self.mainLayout.addLayout(layout)
+        layout.addWidget(QLabel(_('Find:')))
+        self.editSearch = QLineEdit(self)
+        self.editSearch.textEdited.connect(lambda text: self.search(0))
+        self.editSearch.returnPressed.connect(lambda: self.search(1))
+        layout.addWidget(self.editSearch, 1)
+
+        #log view
+        self.logModel = LogModel(self)
+        self.logView = QListView(self)
+        self.logView.setFont(QFont('Monospace'))
+        self.logView.setUniformItemSizes(True)
+        self.logView.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.logView.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.logView.setModel(self.logModel)
+        self.mainLayout.addWidget(self.logView)
 
         #
         self.mainLayout.addWidget(QLabel(_('[E] Error, [I] Information, [C] Change')))
@@ -131,8 +243,8 @@ class LogViewDialog(QDialog):
             self.watcher.addPath(log)
         self.watcher.fileChanged.connect(self.updateLog)
 
-        self.txtLogView.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.txtLogView.customContextMenuRequested.connect(self.contextMenuClicked)
+        self.logView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.logView.customContextMenuRequested.connect(self.contextMenuClicked)
 
     def cbDecodeChanged(self):
         if self.cbDecode.isChecked():
@@ -163,29 +275,40 @@ class LogViewDialog(QDialog):
     def comboFilterChanged(self, index):
         self.updateLog()
 
+    def selectedRows(self):
+        return sorted(index.row() for index in self.logView.selectionModel().selectedIndexes())
+
     def contextMenuClicked(self, point):
         menu = QMenu()
         clipboard = qttools.createQApplication().clipboard()
-        cursor = self.txtLogView.textCursor()
+        rows = self.selectedRows()
 
         btnCopy = menu.addAction(_('Copy'))
-        btnCopy.triggered.connect(lambda: clipboard.setText(cursor.selectedText()))
-        btnCopy.setEnabled(cursor.hasSelection())
+        btnCopy.triggered.connect(lambda: clipboard.setText(
+            '\n'.join(self.logModel.line(row) for row in rows)))
+        btnCopy.setEnabled(bool(rows))
 
         btnAddExclude = menu.addAction(_('Add to Exclude'))
         btnAddExclude.triggered.connect(self.btnAddExcludeClicked)
-        btnAddExclude.setEnabled(cursor.hasSelection())
+        btnAddExclude.setEnabled(len(rows) == 1)
 
         btnDecode = menu.addAction(_('Decode'))
         btnDecode.triggered.connect(self.btnDecodeClicked)
-        btnDecode.setEnabled(cursor.hasSelection())
+        btnDecode.setEnabled(bool(rows))
         btnDecode.setVisible(self.config.snapshotsMode() == 'ssh_encfs')
 
-        menu.exec_(self.txtLogView.mapToGlobal(point))
+        menu.exec_(self.logView.viewport().mapToGlobal(point))
 
     def btnAddExcludeClicked(self):
         exclude = self.config.exclude()
-        path = self.txtLogView.textCursor().selectedText().strip()
+        rows = self.selectedRows()
+        if not rows:
+            return
+        path = self.logModel.line(rows[0]).strip()
+        # propose only the path of change lines
+        m = re.match(r'^\[C\] .{11} (.*)', path)
+        if m:
+            path = m.group(1)
         if not path or path in exclude:
             return
         edit = QLineEdit(self)
@@ -201,10 +324,36 @@ class LogViewDialog(QDialog):
     def btnDecodeClicked(self):
         if not self.decode:
             self.decode = encfstools.Decode(self.config)
-        cursor = self.txtLogView.textCursor()
-        selection = cursor.selectedText().strip()
-        plain = self.decode.path(selection)
-        cursor.insertText(plain)
+        rows = self.selectedRows()
+        lines = [self.logModel.line(row) for row in rows]
+        self.decode.prefetchLog(lines)
+        for row, line in zip(rows, lines):
+            self.logModel.setLine(row, self.decode.log(line))
+
+    def search(self, offset):
+        """
+        Select the next line containing the search text. Called for every
+        change of the search text (``offset`` 0, stay on the current line if
+        it still matches) and on return (``offset`` 1, go to the next match).
+        """
+        text = self.editSearch.text()
+        if not text:
+            return
+        rows = self.selectedRows()
+        start = rows[0] + offset if rows else 0
+        row = self.logModel.search(text, start)
+        if row is None and start:
+            # wrap around
+            row = self.logModel.search(text, 0)
+        palette = self.editSearch.palette()
+        if row is None:
+            palette.setColor(QPalette.Base, QColor(255, 200, 200))
+        else:
+            palette.setColor(QPalette.Base, self.palette().color(QPalette.Base))
+            index = self.logModel.index(row)
+            self.logView.setCurrentIndex(index)
+            self.logView.scrollTo(index, QAbstractItemView.PositionAtCenter)
+        self.editSearch.setPalette(palette)
 
     def updateProfiles(self):
         current_profile_id = self.config.currentProfile()
@@ -249,25 +398,44 @@ class LogViewDialog(QDialog):
         if watchPath and self.sid is None:
             # remove path from watch to prevent multiple updates at the same time
             self.watcher.removePath(watchPath)
-            # append only new lines to txtLogView
+            # append only new lines to the view
             log = snapshotlog.SnapshotLog(self.config, self.comboProfiles.currentProfileID())
-            for line in log.get(mode = mode,
-                                decode = self.decode,
-                                skipLines = self.txtLogView.document().lineCount() - 1):
-                self.txtLogView.appendPlainText(line)
+            try:
+                reader = log.reader()
+            except OSError:
+                reader = None
+            if reader is not None and self.logModel.reader is not None \
+                    and reader.stamp == self.logModel.reader.stamp:
+                self.logModel.refresh()
+            else:
+                # log was replaced by a new snapshot
+                self.setLog(reader, mode)
 
             # re-add path to watch after 5sec delay
             alarm = tools.Alarm(callback = lambda: self.watcher.addPath(watchPath),
                                 overwrite = False)
             alarm.start(5)
+            return
 
-        elif self.sid is None:
-            log = snapshotlog.SnapshotLog(self.config, self.comboProfiles.currentProfileID())
-            self.txtLogView.setPlainText('\n'.join(log.get(mode = mode, decode = self.decode)))
-        else:
-            self.txtLogView.setPlainText('\n'.join(self.sid.log(mode, decode = self.decode)))
+        try:
+            if self.sid is None:
+                log = snapshotlog.SnapshotLog(self.config, self.comboProfiles.currentProfileID())
+                reader = log.reader()
+            else:
+                reader = self.sid.logReader()
+        except OSError as e:
+            logger.debug('Failed to open log: {}'.format(str(e)), self)
+            reader = None
+        self.setLog(reader, mode)
+
+    def setLog(self, reader, mode):
+        header = snapshotlog.LogFilter(mode, self.decode).header
+        if reader is None:
+            header = _('Failed to open log') + '\n'
+        self.logModel.setLog(reader, mode, self.decode, header)
 
     def closeEvent(self, event):
+        self.logModel.setLog(None, None, None, '')
         self.config.setIntValue('qt.logview.width', self.width())
         self.config.setIntValue('qt.logview.height', self.height())
         event.accept()
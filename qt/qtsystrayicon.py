@@ -73,6 +73,7 @@ class QtSysTrayIcon:
         self.menuStatusMessage = self.contextMenu.addAction(_('Done'))
         self.menuProgress = self.contextMenu.addAction('')
         self.menuProgress.setVisible(False)
+        self.progressReader = progress.ProgressReader(self.config)
         self.contextMenu.addSeparator()
 
         self.btnPause = self.contextMenu.addAction(icon.PAUSE, _('Pause snapshot process'))
@@ -168,10 +169,9 @@ class QtSysTrayIcon:
                                                                        ))
                 self.status_icon.setToolTip(message[1])
 
-        pg = progress.ProgressFile(self.config)
-        if pg.fileReadable():
-            pg.load()
-            percent = pg.intValue('percent')
+        pg = self.progressReader.read()
+        if pg is not None:
+            percent = pg.percent
             ## disable progressbar in icon until BiT has it's own icon
             ## fixes bug #902
             # if percent != self.progressBar.value():
@@ -186,11 +186,10 @@ class QtSysTrayIcon:
             self.menuProgress.setVisible(False)
 
     def getMenuProgress(self, pg):
-        d = (('sent',   _('Sent:')), \
-             ('speed',  _('Speed:')),\
-             ('eta',    _('ETA:')))
-        for key, txt in d:
-            value = pg.strValue(key, '')
+        d = ((pg.sentText,  _('Sent:')), \
+             (pg.speedText, _('Speed:')),\
+             (pg.etaText,   _('ETA:')))
+        for value, txt in d:
             if not value:
                 continue
             yield txt + ' ' + value
@@ -45,6 +45,7 @@ def registerBackintimePath(*path):
 
 registerBackintimePath('common')
 import snapshots
+import runreport
 
 def fontBold(font):
     font.setWeight(QFont.Bold)
@@ -352,7 +353,11 @@ class SnapshotItem(TimeLineItem):
         if sid.isRoot:
             self.setToolTip(0, _('This is NOT a snapshot but a live view of your local files'))
         else:
-            self.setToolTip(0, _('Last check %s') %sid.lastChecked)
+            toolTip = _('Last check %s') %sid.lastChecked
+            metrics = sid.transferMetrics()
+            if metrics:
+                toolTip += '\n' + runreport.formatTransfer(metrics)
+            self.setToolTip(0, toolTip)
 
     def updateText(self):
         sid = self.snapshotID()
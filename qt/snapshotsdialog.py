@@ -30,6 +30,7 @@ import restoredialog
 import messagebox
 import qttools
 import snapshots
+import changemanifest
 
 _=gettext.gettext
 
@@ -96,6 +97,8 @@ class SnapshotsDialog(QDialog):
 
         self.sid = sid
         self.path = path
+        self.changedSnapshots = None
+        self.filterThread = None
 
         self.setWindowIcon(icon.SNAPSHOTS)
         self.setWindowTitle(_('Snapshots'))
@@ -112,6 +115,11 @@ class SnapshotsDialog(QDialog):
         self.mainLayout.addWidget(self.cbOnlyDifferentSnapshots)
         self.cbOnlyDifferentSnapshots.stateChanged.connect(self.cbOnlyDifferentSnapshotsChanged)
 
+        #list snapshots which changed path only
+        self.cbOnlyChangedSnapshots = QCheckBox(_('List only snapshots which changed this item'), self)
+        self.mainLayout.addWidget(self.cbOnlyChangedSnapshots)
+        self.cbOnlyChangedSnapshots.stateChanged.connect(self.updateSnapshots)
+
         #list equal snapshots only
         layout = QHBoxLayout()
         self.mainLayout.addLayout(layout)
@@ -218,16 +226,59 @@ class SnapshotsDialog(QDialog):
             equal_to = equal_to_sid.pathBackup(self.path)
         else:
             equal_to = False
-        snapshotsFiltered = self.snapshots.filter(self.sid, self.path,
-                                self.snapshotsList,
+        if self.cbOnlyChangedSnapshots.isChecked():
+            self.changed = self.onlyChanged()
+        else:
+            self.changed = None
+
+        #add snapshots to timeline while they are checked in background
+        self.stopFilterThread()
+        self.filterThread = FilterSnapshotsThread(self,
                                 self.cbOnlyDifferentSnapshots.isChecked(),
                                 self.cbDeepCheck.isChecked(),
                                 equal_to)
-        for sid in snapshotsFiltered:
-            self.addSnapshot(sid)
+        self.filterThread.addSnapshot.connect(self.filteredSnapshot)
+        self.filterThread.finished.connect(self.filterFinished)
+        self.filterThread.start()
 
         self.updateToolbar()
 
+    def filteredSnapshot(self, sid):
+        if self.sender() is not self.filterThread:
+            #result of a previous filter
+            return
+        if self.changed is None or self.changed(sid):
+            self.addSnapshot(sid)
+
+    def filterFinished(self):
+        if self.sender() is self.filterThread:
+            self.timeLine.checkSelection()
+            self.updateToolbar()
+
+    def stopFilterThread(self):
+        if self.filterThread is not None:
+            self.filterThread.stop = True
+            self.filterThread.wait()
+            self.filterThread = None
+
+    def onlyChanged(self):
+        """
+        Look up which snapshots changed :py:attr:`path` in the change index.
+
+        Returns:
+            method:     called with a :py:class:`snapshots.SID`, returns
+                        ``False`` if the snapshot didn't change
+                        :py:attr:`path`. Snapshots without a change
+                        manifest are always listed.
+        """
+        if self.changedSnapshots is None:
+            with changemanifest.ChangeIndex(self.config) as index:
+                index.update(self.snapshotsList)
+                self.changedSnapshots = (index.coveredSnapshots(),
+                                         index.changedSnapshots(os.fsencode(self.path)))
+        covered, changed = self.changedSnapshots
+        return lambda sid: sid.isRoot or sid.sid not in covered or sid.sid in changed
+
     def UpdateComboEqualTo(self):
         self.comboEqualTo.clear()
         snapshotsFiltered = self.snapshots.filter(self.sid, self.path, self.snapshotsList)
@@ -398,6 +449,37 @@ class SnapshotsDialog(QDialog):
             self.sid = sid
         super(SnapshotsDialog, self).accept()
 
+    def done(self, r):
+        self.stopFilterThread()
+        super(SnapshotsDialog, self).done(r)
+
+class FilterSnapshotsThread(QThread):
+    """
+    check snapshots for the file in background and add matching snapshots
+    to timeline as soon as they are found
+    """
+    addSnapshot = pyqtSignal(snapshots.SID)
+    def __init__(self, parent, list_diff_only, flag_deep_check, list_equal_to):
+        self.sid = parent.sid
+        self.path = parent.path
+        self.snapshots = parent.snapshots
+        self.snapshotsList = list(parent.snapshotsList)
+        self.list_diff_only = list_diff_only
+        self.flag_deep_check = flag_deep_check
+        self.list_equal_to = list_equal_to
+        self.stop = False
+        super(FilterSnapshotsThread, self).__init__(parent)
+
+    def run(self):
+        for sid in self.snapshots.iterFilter(self.sid, self.path,
+                                             self.snapshotsList,
+                                             self.list_diff_only,
+                                             self.flag_deep_check,
+                                             self.list_equal_to):
+            if self.stop:
+                break
+            self.addSnapshot.emit(sid)
+
 class RemoveFileThread(QThread):
     """
     remove files in background thread so GUI will not freeze